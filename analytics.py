@@ -0,0 +1,191 @@
+"""
+Sujets abordés par les utilisatrices (signes de danger, alimentation, vaccination...) : les
+messages sont classés dans MongoDB avec les mots-clés du mode fallback ($regexMatch) et les
+totaux par jour et par intention fusionnés ($merge) dans la collection `analytics`.
+
+Chaque passage ne lit que les messages écrits depuis le précédent (filigrane) :
+- la fenêtre (`low`, `high`] est enregistrée avant le calcul et rejouée telle quelle après une
+  interruption ;
+- chaque document retient les fenêtres déjà comptées, une fenêtre rejouée n'est pas ajoutée deux fois ;
+- `high` reste `lag` secondes en arrière : les réponses en flux sont enregistrées après leur
+  horodatage (début de la requête), un message ne doit pas arriver derrière le filigrane.
+"""
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+STATE_ID = 'topics'
+# Fenêtres retenues par document : seules les dernières peuvent être rejouées
+APPLIED_WINDOWS = 20
+EPOCH = datetime(1970, 1, 1)
+
+
+def topic_day_key(day, intent=''):
+    """Identifiant du document d'un jour et d'une intention (les jours se suivent dans l'index _id)."""
+    return f"{day:%Y-%m-%d}:{intent}"
+
+
+def intent_expression(keywords_by_priority, default='inconnu', field='$text'):
+    """$switch équivalent à detect_intent : première intention dont un mot-clé apparaît dans `field`.
+
+    Les mots-clés consécutifs d'une même intention sont regroupés dans une seule expression.
+    """
+    groups = []
+    for keyword, intent in keywords_by_priority:
+        if groups and groups[-1][0] == intent:
+            groups[-1][1].append(keyword)
+        else:
+            groups.append((intent, [keyword]))
+    branches = [{"case": {"$regexMatch": {"input": field, "regex": '|'.join(map(re.escape, keywords)),
+                                          "options": "i"}},
+                 "then": intent}
+                for intent, keywords in groups]
+    return {"$switch": {"branches": branches, "default": default}}
+
+
+def rollup_stages(intent, window):
+    """Étapes communes : messages (un par document) -> totaux par jour et intention fusionnés."""
+    applied = {"$in": [window, {"$ifNull": ["$windows", []]}]}
+    return [
+        {"$project": {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}, "intent": intent}},
+        {"$group": {"_id": {"day": "$day", "intent": "$intent"}, "count": {"$sum": 1}}},
+        {"$project": {"_id": {"$concat": ["$_id.day", ":", "$_id.intent"]}, "day": "$_id.day",
+                      "intent": "$_id.intent", "count": 1, "windows": [window]}},
+        {"$merge": {
+            "into": "analytics",
+            "on": "_id",
+            "whenMatched": [{"$set": {
+                "count": {"$cond": [applied, "$count", {"$add": ["$count", "$$new.count"]}]},
+                "windows": {"$cond": [applied, "$windows", {"$slice": [
+                    {"$concatArrays": [{"$ifNull": ["$windows", []]}, "$$new.windows"]}, -APPLIED_WINDOWS]}]},
+            }}],
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def embedded_pipeline(low, high, intent, window):
+    """Messages utilisateur intégrés aux conversations modifiées depuis `low`."""
+    in_window = {"$and": [{"$gt": ["$$m.timestamp", low]}, {"$lte": ["$$m.timestamp", high]},
+                          {"$ne": ["$$m.user", "Bot"]}]}
+    return [
+        {"$match": {"date": {"$gt": low}, "messages": {"$exists": True}}},
+        {"$project": {"messages": {"$filter": {"input": "$messages", "as": "m", "cond": in_window}}}},
+        {"$unwind": "$messages"},
+        {"$replaceRoot": {"newRoot": "$messages"}},
+    ] + rollup_stages(intent, window)
+
+
+def collection_pipeline(low, high, intent, window):
+    """Messages utilisateur de la collection `messages` écrits dans la fenêtre."""
+    return [
+        {"$match": {"timestamp": {"$gt": low, "$lte": high}, "user": {"$ne": "Bot"}}},
+    ] + rollup_stages(intent, window)
+
+
+class TopicAnalytics:
+    """Passages incrémentaux de classement des messages, sous un bail pour qu'un seul tourne à la fois."""
+
+    def __init__(self, collection, conversations, messages, keywords_by_priority, lag=300.0, lease=600.0,
+                 interval=600.0):
+        self.collection = collection
+        self.conversations = conversations
+        self.messages = messages
+        self.intent = intent_expression(keywords_by_priority)
+        self.lag = lag
+        self.lease = lease
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "skipped": 0, "errors": 0}
+
+    def claim(self, now):
+        """Prendre le bail du prochain passage ; None si un autre passage est en cours. Retourne l'état."""
+        try:
+            return self.collection.find_one_and_update(
+                {"_id": STATE_ID, "$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lte": now}}]},
+                {"$set": {"lease_until": now + timedelta(seconds=self.lease)}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return None
+
+    def run_once(self, now):
+        """Classer les messages écrits depuis le dernier passage. Retourne la fenêtre traitée ou None."""
+        state = self.claim(now)
+        if state is None:
+            self._count("skipped")
+            return None
+        try:
+            # Fenêtre d'un passage interrompu : rejouée à l'identique
+            pending = state.get("pending")
+            if pending:
+                low, high = pending["low"], pending["high"]
+            else:
+                low, high = state.get("watermark", EPOCH), now - timedelta(seconds=self.lag)
+                if high <= low:
+                    return None
+                self.collection.update_one({"_id": STATE_ID}, {"$set": {"pending": {"low": low, "high": high}}})
+            window = f"{low:%Y%m%dT%H%M%S.%f}"
+            self.conversations.aggregate(embedded_pipeline(low, high, self.intent, f"embedded:{window}"))
+            self.messages.aggregate(collection_pipeline(low, high, self.intent, f"collection:{window}"))
+            self.collection.update_one({"_id": STATE_ID}, {"$set": {"watermark": high},
+                                                           "$unset": {"pending": ""}})
+            self._count("runs")
+            logger.info("Sujets analysés jusqu'au %s", high)
+            return low, high
+        finally:
+            self.collection.update_one({"_id": STATE_ID}, {"$unset": {"lease_until": ""}})
+
+    def topics(self, today, days=30):
+        """Nombre de messages par intention sur les `days` derniers jours, du plus fréquent au moins fréquent."""
+        first = today - timedelta(days=days - 1)
+        totals = {}
+        for doc in self.collection.find({"_id": {"$gte": topic_day_key(first), "$lt": topic_day_key(today, '~')}},
+                                        {"intent": 1, "count": 1}):
+            totals[doc["intent"]] = totals.get(doc["intent"], 0) + doc["count"]
+        return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+    def watermark(self):
+        state = self.collection.find_one({"_id": STATE_ID}, {"watermark": 1})
+        return state.get("watermark") if state else None
+
+    def start(self, clock):
+        """Passages toutes les `interval` secondes dans un thread ; `clock` retourne l'heure courante."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(clock,), name="analytics", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self, clock):
+        while not self._stop.is_set():
+            try:
+                self.run_once(clock())
+            except Exception as e:
+                logger.warning("Erreur de l'analyse des sujets : %s", e)
+                self._count("errors")
+            self._stop.wait(self.interval)
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
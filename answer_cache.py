@@ -0,0 +1,153 @@
+"""
+Cache sémantique des réponses Gemini pour les questions fréquentes.
+
+Les questions sont normalisées puis représentées par un vecteur SpaCy : une question
+proche d'une question déjà posée (similarité cosinus au-dessus du seuil, et mots
+porteurs de sens en commun) reçoit la réponse déjà générée au lieu d'un nouvel appel.
+
+Le cache est partagé par toutes les utilisatrices : une question qui cite un nombre (âge,
+terme, dose) ou une personne n'y est ni stockée ni cherchée, sa réponse lui est propre.
+"""
+import logging
+import re
+import threading
+import unicodedata
+
+import numpy as np
+from spacy.lang.fr.lex_attrs import like_num
+from spacy.lang.fr.stop_words import STOP_WORDS
+
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s'-]+")
+_SPACES_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\w+")
+# Articles reconnus comme nombres par like_num
+_ARTICLES = frozenset({"un", "une"})
+
+
+def normalize_question(question):
+    """Minuscules, ponctuation retirée, espaces normalisés (les accents sont conservés)."""
+    text = unicodedata.normalize('NFC', question).lower().replace("’", "'")
+    text = _PUNCTUATION_RE.sub(' ', text)
+    return _SPACES_RE.sub(' ', text).strip()
+
+
+def content_words(normalized):
+    return frozenset(w for w in _WORD_RE.findall(normalized) if w not in STOP_WORDS and len(w) > 1)
+
+
+def mentions_number(normalized):
+    """Vrai si la question contient un nombre, en chiffres ou en lettres (« 9 mois », « deux semaines »)."""
+    return any(like_num(w) and w not in _ARTICLES for w in _WORD_RE.findall(normalized))
+
+
+class SemanticAnswerCache:
+    """Cache LRU/TTL de réponses, interrogé par similarité de questions.
+
+    `embed` transforme un texte en vecteur (par ex. `lambda t: nlp(t).vector`).
+    Une erreur d'encodage n'empêche pas la recherche exacte.
+    `persons` (optionnel) retourne les personnes citées dans la question d'origine (entités PER).
+    """
+
+    def __init__(self, embed, threshold=0.85, min_overlap=0.6, maxsize=500, ttl=86400, persons=None):
+        self._embed = embed
+        self._persons = persons
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.personal = 0
+
+    def is_personal(self, question, normalized):
+        """Vrai si la question cite un nombre ou une personne ; dans le doute (NER en erreur), vrai."""
+        if mentions_number(normalized):
+            return True
+        if self._persons is None:
+            return False
+        try:
+            return bool(self._persons(question))
+        except Exception as e:
+            logger.warning("Détection des personnes impossible : %s", e)
+            return True
+
+    def _vector(self, normalized):
+        try:
+            vector = np.asarray(self._embed(normalized), dtype=np.float32)
+        except Exception as e:
+            logger.warning("Encodage de la question impossible : %s", e)
+            return None
+        norm = np.linalg.norm(vector) if vector.ndim == 1 else 0.0
+        if not norm:
+            return None
+        return vector / norm
+
+    def _count(self, hit, semantic=False):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.semantic_hits += semantic
+            else:
+                self.misses += 1
+
+    def lookup(self, question):
+        """Retourne la réponse en cache pour cette question, ou None."""
+        normalized = normalize_question(question)
+        if self.is_personal(question, normalized):
+            with self._lock:
+                self.personal += 1
+            return None
+        entry = self._entries.get(normalized)
+        if entry is not None:
+            self._count(True)
+            return entry["answer"]
+
+        vector = self._vector(normalized)
+        candidates = [(key, e) for key, e in self._entries.items() if e["vector"] is not None]
+        if vector is None or not candidates:
+            self._count(False)
+            return None
+
+        similarities = np.stack([e["vector"] for _, e in candidates]) @ vector
+        words = content_words(normalized)
+        for index in np.argsort(similarities)[::-1]:
+            if similarities[index] < self.threshold:
+                break
+            key, entry = candidates[index]
+            union = words | entry["words"]
+            if union and len(words & entry["words"]) / len(union) >= self.min_overlap:
+                self._entries.get(key)  # rafraîchir la position LRU
+                self._count(True, semantic=True)
+                return entry["answer"]
+
+        self._count(False)
+        return None
+
+    def store(self, question, answer):
+        normalized = normalize_question(question)
+        if not normalized or not answer or self.is_personal(question, normalized):
+            return
+        self._entries.set(normalized, {
+            "answer": answer,
+            "vector": self._vector(normalized),
+            "words": content_words(normalized),
+        })
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "personal": self.personal,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -1,11 +1,29 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session
-from pymongo import MongoClient
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, session, stream_with_context, g, abort
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
 from config import Config
+from cache import TTLCache
+from answer_cache import SemanticAnswerCache
+from indexes import INDEXES, ensure_indexes
+from notifications import NotificationQueue, FakeTransport, utcnow
+from reminders import ReminderScheduler, parse_fire_at, PENDING, EXPIRED
+from llm_scheduler import LLMScheduler, TokenBudget
+from resilience import ResilientCaller, CircuitBreaker, CircuitOpen
+import metrics
+import tracing
 import spacy
-from twilio.rest import Client
+from sms import SmsTransport
+from passwords import PasswordHasher
+from stats import StatsCounters
+from analytics import TopicAnalytics
+from exports import (MESSAGE_SORT, MESSAGE_FIELDS, EXPORT_FIELDS, PdfRenderer, iter_messages, text_chunks,
+                     zip_stream, file_chunks)
 from datetime import datetime
 import os
 import re
+import json
+import time
+import threading
 import logging
 from bson import ObjectId
 from bson.errors import InvalidId
@@ -14,18 +32,20 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 from dotenv import load_dotenv
-from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 from google import genai
 from google.genai import types
-import io
+import click
+import hmac
+from concurrent.futures.process import BrokenProcessPool
 
 load_dotenv()
 
-# Configuration du logging
+# Configuration du logging (identifiant de la requête en cours, voir tracing.py)
+tracing.install_log_request_id()
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s'
+    format='%(asctime)s [%(levelname)s] [%(request_id)s] %(message)s'
 )
 logger = logging.getLogger(__name__)
 
@@ -36,25 +56,119 @@ app.config.from_object(Config)
 # Initialisation de Flask-Mail
 mail = Mail(app)
 
-# Initialisation du rate limiter
+# Initialisation du rate limiter : compteurs partagés par tous les workers si
+# RATELIMIT_STORAGE_URI désigne un stockage commun (MongoDB). En cas de panne de ce
+# stockage, les limites sont appliquées en mémoire, par worker, jusqu'à son retour.
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"]
+    default_limits=["200 per day", "50 per hour"],
+    storage_uri=app.config['RATELIMIT_STORAGE_URI'],
+    storage_options=app.config['RATELIMIT_STORAGE_OPTIONS'],
+    strategy=app.config['RATELIMIT_STRATEGY'],
+    in_memory_fallback_enabled=True
 )
 
-# Connexion à MongoDB
-client = MongoClient(app.config['MONGO_URI'])
+# Traçage des requêtes : une requête sur TRACE_SAMPLE_RATE exportée (fichier JSONL ou collecteur OTLP)
+tracer = tracing.Tracer(
+    sample_rate=app.config['TRACE_SAMPLE_RATE'],
+    exporter=tracing.exporter_from_config(app.config['TRACE_EXPORTER'], app.config['TRACE_FILE'],
+                                          app.config['TRACE_OTLP_ENDPOINT'], app.config['TRACE_SERVICE_NAME'])
+)
+
+
+def mongo_client_options():
+    """Taille du groupe de connexions et délais du client MongoDB, lus dans la configuration."""
+    return {
+        "maxPoolSize": app.config['MONGO_MAX_POOL_SIZE'],
+        "minPoolSize": app.config['MONGO_MIN_POOL_SIZE'],
+        "maxIdleTimeMS": app.config['MONGO_MAX_IDLE_TIME_MS'],
+        "waitQueueTimeoutMS": app.config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+        "connectTimeoutMS": app.config['MONGO_CONNECT_TIMEOUT_MS'],
+        "serverSelectionTimeoutMS": app.config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+        "socketTimeoutMS": app.config['MONGO_SOCKET_TIMEOUT_MS'] or None,
+    }
+
+
+def create_mongo_client():
+    """Client MongoDB configuré (durée des commandes et attente des connexions sur /metrics, span par commande).
+
+    Aucune connexion avant la première commande (connect=False) : un client créé à l'import dans le
+    maître gunicorn n'ouvre rien tant qu'il ne sert pas.
+    """
+    return MongoClient(app.config['MONGO_URI'], connect=False,
+                       event_listeners=metrics.mongo_listeners() + [tracing.MongoCommandSpans(tracer)],
+                       **mongo_client_options())
+
+
+# Connexion à MongoDB : remplacée dans chaque worker gunicorn après le fork (init_mongo)
+client = create_mongo_client()
 db = client['chatbot']
 users_collection = db['users']
 reminders_collection = db['reminders']
 conversations_collection = db['conversations']
+messages_collection = db['messages']
+notifications_collection = db['notifications']
+
+# Hachage des mots de passe dans un groupe borné de processus (passwords.py)
+password_hasher = PasswordHasher(app.config['PASSWORD_HASH_METHOD'], workers=app.config['PASSWORD_HASH_WORKERS'],
+                                 timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+
+# Rendu des PDF exportés hors des threads de requêtes (exports.py)
+pdf_renderer = PdfRenderer(app.config['MONGO_URI'], database=db.name, workers=app.config['PDF_RENDER_WORKERS'],
+                           timeout=app.config['PDF_RENDER_TIMEOUT'], batch_size=app.config['EXPORT_BATCH_SIZE'])
+
+# Compteurs du panel d'administration, mis à jour à chaque écriture (stats.py)
+def _stats_sources():
+    """Requêtes de recalcul des totaux du panel d'administration."""
+    return {
+        "users": (users_collection, {}),
+        "users_confirmed": (users_collection, {"confirmed": True}),
+        "conversations": (conversations_collection, {}),
+        "reminders": (reminders_collection, {}),
+    }
+
+
+stats_counters = StatsCounters(db['stats'], _stats_sources(),
+                               reconcile_interval=app.config['STATS_RECONCILE_INTERVAL'])
 
 # Initialisation du serializer avec la clé secrète
 ts = URLSafeTimedSerializer(app.config["SECRET_KEY"])
 
-# Charger le modèle de SpaCy pour le français
-nlp = spacy.load('fr_core_news_sm')
+# Modèle SpaCy pour le français, chargé à la première utilisation (ou dans le
+# processus maître de gunicorn avant le fork, voir gunicorn_config.py)
+SPACY_MODEL = 'fr_core_news_sm'
+# Composants jamais lus : extract_user_data n'utilise que la NER (qui a son propre tok2vec)
+# et le cache sémantique les vecteurs du tok2vec partagé
+SPACY_EXCLUDED_COMPONENTS = ["morphologizer", "parser", "attribute_ruler", "lemmatizer"]
+# La NER n'a pas besoin du tok2vec partagé : inutile de le calculer pour l'extraction
+SPACY_NER_SKIPPED_COMPONENTS = ["tok2vec"]
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def get_nlp():
+    """Retourne le modèle SpaCy partagé, en le chargeant au premier appel."""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                started = time.perf_counter()
+                _nlp = spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDED_COMPONENTS)
+                logger.info("Modèle SpaCy chargé en %.0f ms (%s)",
+                            (time.perf_counter() - started) * 1000, ', '.join(_nlp.pipe_names))
+    return _nlp
+
+
+# Cache sémantique des réponses Gemini (questions posées hors contexte de conversation)
+answer_cache = SemanticAnswerCache(
+    embed=lambda text: get_nlp()(text).vector,
+    persons=lambda text: [ent for ent in get_nlp()(text, disable=SPACY_NER_SKIPPED_COMPONENTS).ents
+                          if ent.label_ == 'PER'],
+    threshold=app.config['ANSWER_CACHE_THRESHOLD'],
+    maxsize=app.config['ANSWER_CACHE_SIZE'],
+    ttl=app.config['ANSWER_CACHE_TTL']
+)
 
 # Configuration de Google Gemini (nouveau SDK google-genai)
 gemini_client = None
@@ -65,10 +179,51 @@ Tu réponds toujours en français, de manière bienveillante et accessible.
 Tu ne donnes jamais de diagnostic médical. Tu orientes vers un professionnel de santé si la situation semble grave.
 Tu gardes tes réponses concises (2-4 paragraphes maximum).
 Si la question n'est pas liée à la santé maternelle ou infantile, tu le signales poliment et proposes de répondre sur ces sujets."""
+# Nombre de messages d'historique transmis à Gemini
+GEMINI_HISTORY_MESSAGES = 10
+
+# Sessions de chat Gemini réutilisées d'un tour à l'autre (propres à chaque worker)
+gemini_sessions = TTLCache(maxsize=app.config['GEMINI_SESSION_CACHE_SIZE'], ttl=app.config['GEMINI_SESSION_TTL'])
+
+# Appels Gemini : plafond par worker, budget de jetons par utilisateur (compté dans le
+# stockage du rate limiter) et file équitable entre utilisateurs
+llm_scheduler = LLMScheduler(
+    max_in_flight=app.config['LLM_MAX_IN_FLIGHT'],
+    max_queue=app.config['LLM_MAX_QUEUE'],
+    max_wait=app.config['LLM_MAX_WAIT'],
+    budget=(TokenBudget(lambda: limiter.limiter, app.config['LLM_USER_TOKEN_BUDGET'])
+            if app.config['LLM_USER_TOKEN_BUDGET'] else None),
+    listener=metrics.LLMSchedulerMetrics()
+)
+
+# Appels Gemini bornés dans le temps, doublés au-delà du p95 et coupés par un disjoncteur
+# tant que le service échoue
+gemini_caller = ResilientCaller(
+    deadline=app.config['GEMINI_DEADLINE'],
+    hedge_after=app.config['GEMINI_HEDGE_AFTER'] if app.config['GEMINI_HEDGE_ENABLED'] else None,
+    breaker=CircuitBreaker(app.config['GEMINI_BREAKER_THRESHOLD'], app.config['GEMINI_BREAKER_RESET'])
+)
+
+# Nombre de conversations par utilisateur (optionnel dans /get_conversations)
+history_counts = TTLCache(maxsize=1000, ttl=app.config['HISTORY_COUNT_CACHE_TTL'])
+# Documents des utilisateurs connectés (g.user), invalidés à chaque modification du compte.
+# Les autres workers gardent l'ancienne version au plus USER_CACHE_TTL secondes.
+user_cache = TTLCache(maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+# Longueur de l'aperçu du dernier message stocké avec la conversation
+MESSAGE_PREVIEW_LENGTH = 80
+
+# Cache de contexte Gemini (prompt système) partagé par toutes les conversations
+_system_prompt_cache = {"name": None, "expires": 0.0, "retry_at": 0.0}
+_system_prompt_cache_lock = threading.Lock()
 
 if app.config.get('GEMINI_API_KEY'):
     try:
-        gemini_client = genai.Client(api_key=app.config['GEMINI_API_KEY'])
+        # Le timeout HTTP libère les threads des appels abandonnés après le délai maximal
+        gemini_client = genai.Client(
+            api_key=app.config['GEMINI_API_KEY'],
+            http_options=types.HttpOptions(timeout=int(app.config['GEMINI_DEADLINE'] * 1000),
+                                           base_url=app.config['GEMINI_API_BASE_URL'])
+        )
         logger.info("Google Gemini configuré avec succès (SDK google-genai)")
     except Exception as e:
         logger.warning("Impossible de configurer Gemini : %s", e)
@@ -80,6 +235,50 @@ EMAIL_REGEX = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
 PHONE_REGEX = re.compile(r'^\+?\d{8,15}$')
 
 
+def _metrics_route():
+    """Route de la requête telle que déclarée (/get_chat/<chat_id>), pour borner le nombre de séries."""
+    return request.url_rule.rule if request.url_rule else 'inconnue'
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+def start_trace():
+    """Identifiant de requête (repris de X-Request-ID) et trace si la requête est échantillonnée.
+
+    L'en-tête de débogage (Server-Timing) n'est honoré que pour les administrateurs ou en mode debug.
+    """
+    debug = bool(request.headers.get(tracing.DEBUG_HEADER)) and (app.debug or is_admin(current_user()))
+    g.trace = tracer.start(f"{request.method} {_metrics_route()}", request.headers.get('X-Request-ID'),
+                           request.headers.get('traceparent'), debug=debug, method=request.method,
+                           route=_metrics_route())
+
+
+@app.after_request
+def add_trace_headers(response):
+    response.headers.update(tracer.response_headers())
+    return response
+
+
+@app.teardown_request
+def finish_trace(error):
+    trace = g.pop('trace', None)
+    if trace is not None:
+        tracer.finish(trace, error)
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        metrics.HTTP_REQUEST_DURATION.labels(request.method, _metrics_route(), response.status_code).observe(
+            time.perf_counter() - started)
+    return response
+
+
 # En-têtes de sécurité sur toutes les réponses
 @app.after_request
 def set_security_headers(response):
@@ -104,9 +303,45 @@ def internal_server_error(e):
 
 @app.errorhandler(429)
 def too_many_requests(e):
+    metrics.RATE_LIMITED.labels(_metrics_route()).inc()
     return render_template('errors/429.html'), 429
 
 
+def current_user():
+    """Document de l'utilisateur connecté, chargé à la première demande de la requête (g.user).
+
+    Au plus une lecture MongoDB par requête, aucune si le document est dans `user_cache`.
+    """
+    if 'user' not in g:
+        g.user = _load_user(session.get('user_id'))
+    return g.user
+
+
+def is_admin(user):
+    return bool(user and user.get('is_admin', False))
+
+
+def _load_user(user_id):
+    if not user_id:
+        return None
+    user = user_cache.get(user_id)
+    if user is None:
+        try:
+            oid = ObjectId(user_id)
+        except InvalidId:
+            return None
+        user = users_collection.find_one({"_id": oid})
+        if user:
+            user_cache.set(user_id, user)
+    return user
+
+
+def _forget_user(user_id):
+    """Invalider le document en cache après une modification du compte."""
+    user_cache.pop(str(user_id))
+    g.pop('user', None)
+
+
 # Décorateur pour protéger les routes qui nécessitent une connexion
 def login_required(f):
     @wraps(f)
@@ -125,8 +360,7 @@ def admin_required(f):
         if 'user_id' not in session:
             flash('Veuillez vous connecter', 'error')
             return redirect(url_for('show_login_form'))
-        user = users_collection.find_one({"_id": ObjectId(session['user_id'])})
-        if not user or not user.get('is_admin', False):
+        if not is_admin(current_user()):
             flash('Accès réservé aux administrateurs', 'error')
             return redirect(url_for('home'))
         return f(*args, **kwargs)
@@ -182,16 +416,30 @@ def register_user():
     # Générer un token de confirmation
     token = ts.dumps(email, salt='email-confirm-key')
 
+    try:
+        password_hash = password_hasher.hash(password)
+    except (TimeoutError, BrokenProcessPool) as e:
+        logger.warning("Hachage du mot de passe impossible (%s), inscription : %s", type(e).__name__, username)
+        flash('Le serveur est très sollicité, réessayez dans un instant', 'error')
+        return redirect(url_for('show_register_form'))
+
     # Enregistrer l'utilisateur avec mot de passe haché (compte activé directement)
     new_user = {
         "username": username,
         "email": email,
-        "password": generate_password_hash(password),
+        "password": password_hash,
         "confirmed": True,
         "confirmation_token": token,
         "registration_date": datetime.now()
     }
-    users_collection.insert_one(new_user)
+    try:
+        users_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        # Index uniques sur l'email et le nom d'utilisateur (voir indexes.py)
+        flash('Cet email ou ce nom d\'utilisateur est déjà utilisé', 'error')
+        return redirect(url_for('show_register_form'))
+    stats_counters.record(new_user["registration_date"], totals={"users": 1, "users_confirmed": 1},
+                          daily={"signups": 1})
     logger.info("Nouvel utilisateur inscrit : %s", username)
 
     flash('Votre compte a été créé avec succès. Vous pouvez vous connecter.', 'success')
@@ -216,7 +464,10 @@ def confirm_email(token):
     user = users_collection.find_one({'email': email})
 
     if user and not user['confirmed']:
-        users_collection.update_one({'_id': user['_id']}, {'$set': {'confirmed': True}})
+        result = users_collection.update_one({'_id': user['_id'], 'confirmed': False}, {'$set': {'confirmed': True}})
+        if result.modified_count:
+            stats_counters.record(datetime.now(), totals={"users_confirmed": 1})
+        _forget_user(user['_id'])
         flash('Votre compte a été activé avec succès. Vous pouvez maintenant vous connecter.', 'success')
     else:
         flash('Votre compte est déjà activé. Vous pouvez vous connecter.', 'success')
@@ -239,7 +490,15 @@ def login():
 
     user = users_collection.find_one({'username': username, 'confirmed': True})
 
-    if user and check_password_hash(user['password'], password):
+    try:
+        valid = user is not None and password_hasher.verify(user['password'], password)
+    except (TimeoutError, BrokenProcessPool) as e:
+        logger.warning("Vérification du mot de passe impossible (%s) pour : %s", type(e).__name__, username)
+        flash('Le serveur est très sollicité, réessayez dans un instant', 'error')
+        return redirect(url_for('show_login_form'))
+
+    if valid:
+        _upgrade_password_hash(user, password)
         session['user_id'] = str(user['_id'])
         session['username'] = user['username']
         session.permanent = True
@@ -252,6 +511,20 @@ def login():
         return redirect(url_for('show_login_form'))
 
 
+def _upgrade_password_hash(user, password):
+    """Recalculer après une connexion réussie un hachage créé avec d'anciens paramètres."""
+    if not password_hasher.needs_rehash(user['password']):
+        return
+    try:
+        # Condition sur l'ancien hachage : un changement de mot de passe simultané l'emporte
+        users_collection.update_one({'_id': user['_id'], 'password': user['password']},
+                                    {'$set': {'password': password_hasher.hash(password)}})
+        _forget_user(user['_id'])
+        logger.info("Hachage du mot de passe mis à jour (%s) : %s", password_hasher.method, user['username'])
+    except Exception as e:
+        logger.warning("Mise à jour du hachage impossible pour %s : %s", user['username'], e)
+
+
 # Route pour la déconnexion
 @app.route('/logout')
 def logout():
@@ -287,7 +560,7 @@ def forgot_password():
         try:
             send_reset_email(user['username'], email, reset_link)
         except Exception:
-            logger.warning("Échec de l'envoi de l'email de réinitialisation pour %s", email)
+            logger.warning("Impossible de mettre en file l'email de réinitialisation pour %s", email)
 
     flash('Si un compte existe avec cet email, un lien de réinitialisation a été envoyé.', 'success')
     return redirect(url_for('show_forgot_password'))
@@ -316,10 +589,20 @@ def reset_password(token):
         flash('Les mots de passe ne correspondent pas', 'error')
         return render_template('reset_password.html', token=token)
 
-    users_collection.update_one(
+    try:
+        password_hash = password_hasher.hash(password)
+    except (TimeoutError, BrokenProcessPool) as e:
+        logger.warning("Hachage du mot de passe impossible (%s), réinitialisation : %s", type(e).__name__, email)
+        flash('Le serveur est très sollicité, réessayez dans un instant', 'error')
+        return render_template('reset_password.html', token=token)
+
+    user = users_collection.find_one_and_update(
         {'email': email},
-        {'$set': {'password': generate_password_hash(password)}}
+        {'$set': {'password': password_hash}},
+        projection={'_id': 1}
     )
+    if user:
+        _forget_user(user['_id'])
     logger.info("Mot de passe réinitialisé pour : %s", email)
     flash('Votre mot de passe a été réinitialisé avec succès. Vous pouvez vous connecter.', 'success')
     return redirect(url_for('show_login_form'))
@@ -327,8 +610,10 @@ def reset_password(token):
 
 # Fonction pour envoyer l'email de confirmation
 def send_confirmation_email(username, email, confirmation_link):
-    msg = Message('Activation de votre compte', sender=app.config['MAIL_DEFAULT_SENDER'], recipients=[email])
-    msg.body = f"""Bonjour {username},
+    notification_queue.enqueue('email', {
+        "subject": 'Activation de votre compte',
+        "recipients": [email],
+        "body": f"""Bonjour {username},
 
 Veuillez cliquer sur le lien ci-dessous pour activer votre compte :
 
@@ -336,13 +621,16 @@ Veuillez cliquer sur le lien ci-dessous pour activer votre compte :
 
 Cordialement,
 L'équipe de votre site."""
-    mail.send(msg)
+    })
 
 
 # Fonction pour envoyer l'email de réinitialisation
 def send_reset_email(username, email, reset_link):
-    msg = Message('Réinitialisation de votre mot de passe', sender=app.config['MAIL_DEFAULT_SENDER'], recipients=[email])
-    msg.body = f"""Bonjour {username},
+    """Mettre en file l'email de réinitialisation du mot de passe."""
+    notification_queue.enqueue('email', {
+        "subject": 'Réinitialisation de votre mot de passe',
+        "recipients": [email],
+        "body": f"""Bonjour {username},
 
 Vous avez demandé la réinitialisation de votre mot de passe.
 Cliquez sur le lien ci-dessous (valide 1 heure) :
@@ -353,7 +641,7 @@ Si vous n'avez pas fait cette demande, ignorez cet email.
 
 Cordialement,
 L'équipe de votre site."""
-    mail.send(msg)
+    })
 
 
 # Route pour afficher la page de questions
@@ -364,9 +652,8 @@ def show_ask_form():
 
 
 # Fonction pour extraire les données utilisateur
-def extract_user_data(user_message):
-    """Extraire les informations utilisateur (nom, âge, grossesse) à partir du message."""
-    doc = nlp(user_message)
+def _user_data_from_doc(doc, user_message):
+    """Extraire nom et semaines de grossesse d'un document SpaCy déjà analysé."""
     user_data = {}
 
     for ent in doc.ents:
@@ -390,85 +677,359 @@ def extract_user_data(user_message):
     return user_data
 
 
+def extract_user_data(user_message):
+    """Extraire les informations utilisateur (nom, âge, grossesse) à partir du message."""
+    nlp = get_nlp()
+    with metrics.NER_DURATION.time(), tracer.span('spacy.ner'):
+        doc = nlp(user_message, disable=SPACY_NER_SKIPPED_COMPONENTS)
+    return _user_data_from_doc(doc, user_message)
+
+
+def extract_user_data_batch(items, batch_size=256, n_process=1):
+    """Version par lots de extract_user_data, via `nlp.pipe`.
+
+    `items` est un itérable de couples (message, contexte) ; produit des couples
+    (données utilisateur, contexte) dans le même ordre.
+    """
+    docs = get_nlp().pipe(items, as_tuples=True, batch_size=batch_size, n_process=n_process,
+                          disable=SPACY_NER_SKIPPED_COMPONENTS)
+    for doc, context in docs:
+        yield _user_data_from_doc(doc, doc.text), context
+
+
+# Construire le contexte Gemini à partir de l'historique
+def _gemini_history(conversation_history):
+    """Convertit les derniers messages de la conversation au format du SDK google-genai."""
+    history = []
+    for msg in conversation_history[-GEMINI_HISTORY_MESSAGES:]:
+        role = "user" if msg.get("user") != "Bot" else "model"
+        history.append(types.Content(
+            role=role,
+            parts=[types.Part.from_text(text=msg.get("text", ""))]
+        ))
+    return history
+
+
+def _cached_system_prompt():
+    """Nom du cache de contexte Gemini contenant le prompt système, ou None.
+
+    Gemini impose une taille minimale aux contenus mis en cache : en cas de refus,
+    le prompt est envoyé avec chaque requête et la création n'est retentée qu'après le TTL.
+    """
+    now = time.time()
+    with _system_prompt_cache_lock:
+        if _system_prompt_cache["name"] and _system_prompt_cache["expires"] > now + 60:
+            return _system_prompt_cache["name"]
+        if _system_prompt_cache["retry_at"] > now:
+            return None
+
+        ttl = app.config['GEMINI_CONTEXT_CACHE_TTL']
+        try:
+            cached = gemini_client.caches.create(
+                model=GEMINI_MODEL,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=GEMINI_SYSTEM_PROMPT,
+                    ttl=f"{ttl}s"
+                )
+            )
+            _system_prompt_cache.update(name=cached.name, expires=now + ttl)
+            return cached.name
+        except Exception as e:
+            logger.info("Cache de contexte Gemini indisponible, prompt système envoyé en ligne : %s", e)
+            _system_prompt_cache.update(name=None, retry_at=now + ttl)
+            return None
+
+
+def _gemini_config():
+    cached_content = _cached_system_prompt()
+    if cached_content:
+        return types.GenerateContentConfig(cached_content=cached_content)
+    return types.GenerateContentConfig(system_instruction=GEMINI_SYSTEM_PROMPT)
+
+
+def _create_gemini_chat(conversation_history):
+    """Crée une session de chat Gemini contenant les derniers messages de la conversation."""
+    return gemini_client.chats.create(
+        model=GEMINI_MODEL,
+        config=_gemini_config(),
+        history=_gemini_history(conversation_history)
+    )
+
+
+def _acquire_gemini_session(conversation_id, conversation_history):
+    """Retourne la session Gemini de la conversation, en la reconstruisant si besoin.
+
+    La session en cache n'est réutilisée que si le dernier message connu correspond
+    à celui stocké en base : si un autre worker a traité un tour entre-temps,
+    la session est reconstruite depuis MongoDB. Elle est retirée du cache
+    pendant son utilisation pour qu'un seul thread l'utilise à la fois.
+    Au-delà de GEMINI_HISTORY_MESSAGES messages, elle est reconstruite sur les derniers :
+    Gemini reçoit le même contexte quel que soit le worker qui sert le tour.
+    """
+    last_timestamp = conversation_history[-1].get("timestamp") if conversation_history else None
+    session_entry = gemini_sessions.pop(conversation_id) if conversation_id else None
+    if (session_entry and session_entry["last_timestamp"] == last_timestamp
+            and session_entry["history"] <= GEMINI_HISTORY_MESSAGES):
+        session_entry["reused"] = True
+        return session_entry
+    return _new_gemini_session(conversation_history)
+
+
+def _new_gemini_session(conversation_history):
+    """Nouvelle session Gemini reconstruite depuis les derniers messages de la conversation."""
+    history = conversation_history[-GEMINI_HISTORY_MESSAGES:]
+    return {
+        "chat": _create_gemini_chat(history),
+        "history": len(history),
+        "history_bytes": sum(len(msg.get("text", "").encode('utf-8')) for msg in history),
+        "last_timestamp": conversation_history[-1].get("timestamp") if conversation_history else None,
+        "reused": False
+    }
+
+
+def _send_gemini_message(session_entry, user_message):
+    return session_entry, session_entry["chat"].send_message(user_message)
+
+
+def _hedged_gemini_call(ticket, send):
+    """Requête doublée comptée par l'ordonnanceur comme un appel à part (créneau et jetons).
+
+    Lève HedgeRefused si le plafond ou le budget est atteint : seul le premier essai continue.
+    """
+    hedge = llm_scheduler.acquire_hedge(ticket)
+    tokens = None
+    try:
+        result = send()
+        tokens = gemini_tokens_used(result[1])
+        return result
+    finally:
+        llm_scheduler.release(hedge, tokens)
+
+
+def _release_gemini_session(conversation_id, session_entry, user_message, response_text, timestamp):
+    """Remettre la session en cache après un tour réussi."""
+    session_entry["history"] += 2
+    session_entry["history_bytes"] += len(user_message.encode('utf-8')) + len(response_text.encode('utf-8'))
+    # MongoDB ne conserve les dates qu'à la milliseconde
+    if timestamp:
+        timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+    session_entry["last_timestamp"] = timestamp
+    if conversation_id:
+        gemini_sessions.set(conversation_id, session_entry)
+
+
+def _log_gemini_turn(session_entry, user_message, started):
+    """Journaliser la taille approximative de la requête envoyée et la latence du tour."""
+    payload = session_entry["history_bytes"] + len(user_message.encode('utf-8'))
+    if not _system_prompt_cache["name"]:
+        payload += len(GEMINI_SYSTEM_PROMPT.encode('utf-8'))
+    logger.info(
+        "Gemini : %d octets envoyés (%d messages d'historique, session %s) en %.0f ms",
+        payload, session_entry["history"], "réutilisée" if session_entry["reused"] else "reconstruite",
+        (time.perf_counter() - started) * 1000
+    )
+
+
+def estimate_gemini_tokens(user_message, conversation_history):
+    """Coût estimé d'un tour (≈ 4 caractères par jeton) : historique transmis, message et réponse."""
+    chars = len(user_message) + sum(len(msg.get("text", "")) for msg in conversation_history[-GEMINI_HISTORY_MESSAGES:])
+    return chars // 4 + app.config['LLM_RESPONSE_TOKENS']
+
+
+def gemini_tokens_used(response):
+    """Jetons facturés pour une réponse Gemini (usage_metadata), ou None s'ils sont inconnus."""
+    total = getattr(getattr(response, 'usage_metadata', None), 'total_token_count', None)
+    return total if isinstance(total, int) else None
+
+
 # Générer une réponse avec Gemini (nouveau SDK google-genai)
-def get_gemini_response(user_message, conversation_history):
-    """Appelle l'API Gemini avec le contexte de conversation."""
+@tracer.wrap('gemini')
+def get_gemini_response(user_message, conversation_history, conversation_id=None, timestamp=None, user_id=None):
+    """Appelle l'API Gemini avec le contexte de conversation (None : utiliser le fallback)."""
     if not gemini_client:
         return None
+    if not gemini_caller.available():
+        metrics.GEMINI_CALLS.labels('unary', 'circuit_open').inc()
+        return None
 
+    ticket = llm_scheduler.acquire(user_id or 'anonyme', estimate_gemini_tokens(user_message, conversation_history))
+    if not ticket:
+        metrics.GEMINI_CALLS.labels('unary', 'refused').inc()
+        return None
+    tokens = None
+    started = time.perf_counter()
     try:
-        # Construire l'historique pour Gemini (format nouveau SDK)
-        history = []
-        for msg in conversation_history[-10:]:  # Max 10 derniers messages
-            role = "user" if msg.get("user") != "Bot" else "model"
-            history.append(types.Content(
-                role=role,
-                parts=[types.Part.from_text(text=msg.get("text", ""))]
-            ))
-
-        chat = gemini_client.chats.create(
-            model=GEMINI_MODEL,
-            config=types.GenerateContentConfig(
-                system_instruction=GEMINI_SYSTEM_PROMPT
-            ),
-            history=history
+        current = _acquire_gemini_session(conversation_id, conversation_history)
+        # La requête doublée utilise sa propre session : une session n'est jamais partagée entre deux appels
+        session_entry, response = gemini_caller.call(
+            lambda: _send_gemini_message(current, user_message),
+            lambda: _hedged_gemini_call(ticket, lambda: _send_gemini_message(
+                _new_gemini_session(conversation_history), user_message))
         )
-        response = chat.send_message(user_message)
+        tokens = gemini_tokens_used(response)
+        metrics.observe_gemini('unary', started=started)
+        _log_gemini_turn(session_entry, user_message, started)
+        _release_gemini_session(conversation_id, session_entry, user_message, response.text or "", timestamp)
+        if response.text:
+            metrics.CHAT_ANSWERS.labels('gemini').inc()
         return response.text
+    except CircuitOpen as e:
+        metrics.observe_gemini('unary', e)
+        return None
     except Exception as e:
+        metrics.observe_gemini('unary', e, started)
         logger.warning("Erreur Gemini : %s", e)
         return None
+    finally:
+        llm_scheduler.release(ticket, tokens)
 
 
-# Route pour démarrer une nouvelle conversation
-@app.route('/new_chat', methods=['POST'])
-@login_required
-def new_chat():
-    session.pop('conversation_id', None)
-    return jsonify({"message": "Nouvelle conversation démarrée"})
+def get_gemini_response_stream(user_message, conversation_history, conversation_id=None, timestamp=None,
+                               user_id=None):
+    """Générateur des fragments de texte de la réponse Gemini, au fil de leur arrivée.
 
+    Ne produit rien si Gemini n'est pas configuré, saturé ou échoue avant le premier fragment ;
+    une erreur en cours de flux est propagée : les fragments déjà produits forment une réponse tronquée.
+    """
+    if not gemini_client:
+        return
+    if not gemini_caller.available():
+        metrics.GEMINI_CALLS.labels('stream', 'circuit_open').inc()
+        return
+
+    ticket = llm_scheduler.acquire(user_id or 'anonyme', estimate_gemini_tokens(user_message, conversation_history))
+    if not ticket:
+        metrics.GEMINI_CALLS.labels('stream', 'refused').inc()
+        return
+    tokens = None
+    chunks = []
+    started = time.perf_counter()
+    try:
+        session_entry = _acquire_gemini_session(conversation_id, conversation_history)
+        with tracer.span('gemini', mode='stream'):
+            for chunk in gemini_caller.stream(lambda: session_entry["chat"].send_message_stream(user_message)):
+                # Le dernier fragment porte le total de la réponse
+                tokens = gemini_tokens_used(chunk) or tokens
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+        metrics.observe_gemini('stream', started=started)
+        _log_gemini_turn(session_entry, user_message, started)
+        _release_gemini_session(conversation_id, session_entry, user_message, ''.join(chunks), timestamp)
+        if chunks:
+            metrics.CHAT_ANSWERS.labels('gemini').inc()
+    except CircuitOpen as e:
+        metrics.observe_gemini('stream', e)
+        return
+    except Exception as e:
+        metrics.observe_gemini('stream', e, started)
+        logger.warning("Erreur Gemini (flux) : %s", e)
+        if chunks:
+            raise
+    finally:
+        llm_scheduler.release(ticket, tokens)
 
-# API pour interagir avec le chatbot
-@app.route('/chat', methods=['POST'])
-@login_required
-@limiter.limit("30 per minute")
-def chat():
-    data = request.json
+
+@tracer.wrap('answer_cache')
+def get_cached_answer(user_message, conversation_history):
+    """Réponse déjà générée pour une question similaire, seulement en début de conversation.
+
+    Dès qu'il y a un historique, la réponse dépend du contexte : le cache est ignoré.
+    """
+    if conversation_history or not app.config['ANSWER_CACHE_ENABLED']:
+        return None
+    answer = answer_cache.lookup(user_message)
+    if answer:
+        metrics.CHAT_ANSWERS.labels('cache').inc()
+        logger.info("Réponse servie depuis le cache sémantique (%s)", answer_cache.stats())
+    return answer
+
+
+def cache_answer(user_message, conversation_history, answer):
+    if not conversation_history and app.config['ANSWER_CACHE_ENABLED']:
+        answer_cache.store(user_message, answer)
+
+
+@tracer.wrap('fallback')
+def get_fallback_response(user_message):
+    """Réponse locale (règles + SpaCy) utilisée quand Gemini ne répond pas."""
+    metrics.CHAT_ANSWERS.labels('fallback').inc()
+    user_data = extract_user_data(user_message)
+    return handle_user_message(user_data, user_message)
+
+
+def _validate_chat_message(data):
+    """Valider le message reçu par l'API de chat. Retourne (message, message d'erreur)."""
     if not data or 'message' not in data:
-        return jsonify({"error": "Message requis"}), 400
+        return None, "Message requis"
 
     user_message = data['message']
 
     # Validation de la longueur du message
     if not isinstance(user_message, str) or len(user_message) > 2000:
-        return jsonify({"error": "Le message ne doit pas dépasser 2000 caractères"}), 400
+        return None, "Le message ne doit pas dépasser 2000 caractères"
 
     user_message = user_message.strip()
     if not user_message:
-        return jsonify({"error": "Message requis"}), 400
+        return None, "Message requis"
+    return user_message, None
 
-    now = datetime.now()
-    conversation_id = session.get('conversation_id')
-    conversation_history = []
 
-    # Récupérer la conversation existante si elle existe
-    if conversation_id:
-        try:
-            existing = conversations_collection.find_one({"_id": ObjectId(conversation_id)})
-            if existing and existing.get("user_id") == session.get('user_id'):
-                conversation_history = existing.get("messages", [])
-        except Exception:
-            session.pop('conversation_id', None)
+def _separate_messages():
+    """Vrai si les messages sont stockés dans la collection `messages`."""
+    return app.config['MESSAGES_STORAGE'] == 'collection'
 
-    # Générer la réponse : Gemini en priorité, fallback local
-    response_message = get_gemini_response(user_message, conversation_history)
-    if not response_message:
-        user_data = extract_user_data(user_message)
-        response_message = handle_user_message(user_data, user_message)
 
-    # Construire les documents de messages
+def _message_documents(conversation_oid, messages):
+    """Documents de la collection `messages` pour des messages d'une conversation."""
+    return [dict(msg, conversation_id=conversation_oid) for msg in messages]
+
+
+def _recent_messages(conversation_oid, limit):
+    """Les `limit` derniers messages d'une conversation dans la collection `messages`."""
+    cursor = messages_collection.find({"conversation_id": conversation_oid}, MESSAGE_FIELDS)
+    recent = list(cursor.sort([(field, -1) for field, _ in MESSAGE_SORT]).limit(limit))
+    return recent[::-1]
+
+
+def _conversation_messages(conversation):
+    """Tous les messages d'une conversation, dans l'ordre chronologique.
+
+    En mode `collection`, les messages encore intégrés au document (conversations
+    antérieures au changement de mode, pas encore migrées) précèdent ceux de la collection.
+    """
+    messages = conversation.get("messages", [])
+    if not _separate_messages():
+        return messages
+    stored = messages_collection.find({"conversation_id": conversation["_id"]}, MESSAGE_FIELDS).sort(MESSAGE_SORT)
+    return messages + list(stored)
+
+
+@tracer.wrap('history.load')
+def _load_conversation_history(conversation_id):
+    """Récupérer les derniers messages de la conversation en cours si elle appartient à l'utilisateur."""
+    if not conversation_id:
+        return []
+    try:
+        oid = ObjectId(conversation_id)
+        existing = conversations_collection.find_one(
+            {"_id": oid},
+            {"user_id": 1, "messages": {"$slice": -GEMINI_HISTORY_MESSAGES}}
+        )
+        if existing and existing.get("user_id") == session.get('user_id'):
+            messages = existing.get("messages", [])
+            if _separate_messages():
+                messages = (messages + _recent_messages(oid, GEMINI_HISTORY_MESSAGES))[-GEMINI_HISTORY_MESSAGES:]
+            return messages
+    except Exception:
+        session.pop('conversation_id', None)
+    return []
+
+
+def _build_chat_messages(username, user_message, response_message, now):
+    """Construire les documents des messages utilisateur et bot d'un échange."""
     user_msg = {
-        "user": session.get('username', 'Inconnu'),
+        "user": username,
         "text": user_message,
         "timestamp": now
     }
@@ -477,125 +1038,313 @@ def chat():
         "text": response_message,
         "timestamp": now
     }
+    return [user_msg, bot_msg]
 
-    if conversation_id:
-        # Ajouter les messages à la conversation existante
-        conversations_collection.update_one(
-            {"_id": ObjectId(conversation_id)},
-            {"$push": {"messages": {"$each": [user_msg, bot_msg]}},
-             "$set": {"date": now}}
-        )
-    else:
-        # Créer une nouvelle conversation
-        chat_title = generate_chat_title([], user_message)
-        result = conversations_collection.insert_one({
-            "title": chat_title,
-            "date": now,
-            "user_id": session.get('user_id'),
-            "messages": [user_msg, bot_msg]
-        })
-        session['conversation_id'] = str(result.inserted_id)
 
-    return jsonify({"message": response_message})
+def _message_preview(msg):
+    """Aperçu du dernier message, stocké dans la conversation pour la liste de l'historique."""
+    text = msg.get("text", "")
+    if len(text) > MESSAGE_PREVIEW_LENGTH:
+        text = text[:MESSAGE_PREVIEW_LENGTH - 1].rstrip() + "…"
+    return {"user": msg.get("user", "Inconnu"), "text": text}
 
 
-def handle_user_message(user_data, message):
-    """Gérer les différentes requêtes de l'utilisateur en fonction du contexte."""
-    message_lower = message.lower()
-
-    pregnancy_keywords = [
-        "symptômes", "alimentation", "exercices",
-        "signes de danger", "soins prénatals", "soins postnataux",
-        "visites médicales", "nutriments", "yoga prénatal",
-        "visites prénatales", "tests de dépistage", "préparations pour l'accouchement",
-        "soins du nouveau-né", "allaitement", "alimentation du bébé", "reprise après l'accouchement",
-        "nutrition des enfants", "aliments solides", "alimentation équilibrée"
-    ]
-    personalized_suggestions_keywords = [
-        "trimestre", "âge de l'enfant", "âge", "nouveau-né", "bébé", "enfant"
-    ]
+def _new_conversation_document(user_id, user_message, now, messages):
+    """Document d'une nouvelle conversation, titrée d'après le premier message."""
+    document = {
+        "title": generate_chat_title([], user_message),
+        "date": now,
+        "user_id": user_id,
+        "message_count": len(messages),
+        "last_message": _message_preview(messages[-1]) if messages else None
+    }
+    if not _separate_messages():
+        document["messages"] = messages
+    return document
 
-    if any(keyword in message_lower for keyword in pregnancy_keywords):
-        return pregnancy_info(user_data, message_lower)
 
-    if any(keyword in message_lower for keyword in personalized_suggestions_keywords):
-        return personalized_suggestions(user_data, message_lower)
+def _append_messages_update(messages, now):
+    """Mise à jour MongoDB ajoutant des messages à une conversation existante."""
+    update = {"$set": {"date": now, "last_message": _message_preview(messages[-1])},
+              "$inc": {"message_count": len(messages)}}
+    if not _separate_messages():
+        update["$push"] = {"messages": {"$each": messages}}
+    return update
 
-    return "Je ne suis pas sûr de comprendre. Pouvez-vous reformuler? Vous pouvez me poser des questions sur : les symptômes, l'alimentation, les exercices, les soins prénatals, les soins postnataux, les vaccinations, la nutrition des enfants, etc."
 
+@tracer.wrap('history.create')
+def _create_conversation(user_id, user_message, now, messages):
+    """Créer une nouvelle conversation et retourner son identifiant."""
+    result = conversations_collection.insert_one(
+        _new_conversation_document(user_id, user_message, now, messages)
+    )
+    if _separate_messages() and messages:
+        messages_collection.insert_many(_message_documents(result.inserted_id, messages))
+    history_counts.pop(user_id)
+    return str(result.inserted_id)
+
+
+def _record_chat_stats(now, new_conversation=False):
+    """Compteurs du panel admin d'un échange (routes Flask et ASGI), et de la conversation qu'il a ouverte."""
+    stats_counters.record(now, totals={"conversations": 1} if new_conversation else None, daily={"chats": 1})
+
+
+@tracer.wrap('history.append')
+def _append_messages(conversation_id, messages, now):
+    """Ajouter des messages à une conversation existante."""
+    oid = ObjectId(conversation_id)
+    if _separate_messages():
+        messages_collection.insert_many(_message_documents(oid, messages))
+    conversations_collection.update_one(
+        {"_id": oid},
+        _append_messages_update(messages, now)
+    )
 
-def pregnancy_info(user_data, message):
-    """Fournir des informations sur la grossesse, les soins prénatals et postnataux, et la nutrition des enfants."""
-    name = user_data.get('name', 'utilisatrice')
-    weeks_pregnant = user_data.get('weeks_pregnant', None)
 
-    if "symptômes" in message:
-        if weeks_pregnant:
-            return f"Bonjour {name}, à {weeks_pregnant} semaines de grossesse, les symptômes courants incluent les nausées, la fatigue, les maux de tête, et les douleurs dans le bas du dos. Consultez un médecin si vous ressentez des douleurs sévères, des saignements ou une diminution des mouvements du bébé."
-        return "Les symptômes courants de la grossesse incluent les nausées, la fatigue, les maux de tête et les douleurs dans le bas du dos. Consultez un médecin si vous ressentez des douleurs sévères ou des saignements."
+# Route pour démarrer une nouvelle conversation
+@app.route('/new_chat', methods=['POST'])
+@login_required
+def new_chat():
+    session.pop('conversation_id', None)
+    return jsonify({"message": "Nouvelle conversation démarrée"})
 
-    if "alimentation équilibrée" in message:
-        return "Une alimentation équilibrée pour les enfants doit inclure des légumes, fruits, protéines maigres, produits laitiers et céréales complètes."
 
-    if "alimentation du bébé" in message:
-        return "L'allaitement est recommandé pendant les premiers mois. Si vous ne pouvez pas allaiter, parlez-en à votre médecin pour choisir un lait infantile adapté."
+# API pour interagir avec le chatbot
+@app.route('/chat', methods=['POST'])
+@login_required
+@limiter.limit("30 per minute")
+def chat():
+    user_message, error = _validate_chat_message(request.json)
+    if error:
+        return jsonify({"error": error}), 400
 
-    if "alimentation" in message:
-        return "Pendant la grossesse, il est essentiel d'avoir une alimentation équilibrée. Consommez des fruits, légumes, protéines maigres, céréales complètes, et produits laitiers. Limitez les aliments trop gras ou trop sucrés et évitez l'alcool et le tabac."
+    started = time.perf_counter()
+    now = datetime.now()
+    conversation_id = session.get('conversation_id')
 
-    if "exercices" in message:
-        return "Des exercices légers comme la marche, le yoga prénatal, et la natation sont recommandés. Évitez les sports intenses ou les activités à risque. Consultez votre médecin avant de commencer un programme d'exercices."
+    # Récupérer la conversation existante si elle existe
+    conversation_history = _load_conversation_history(conversation_id)
 
-    if "tests de dépistage" in message:
-        return "Les tests de dépistage prénatals incluent les échographies, les tests de dépistage de la trisomie et des anomalies génétiques."
+    # Générer la réponse : cache, puis Gemini, puis fallback local
+    response_message = get_cached_answer(user_message, conversation_history)
+    if not response_message:
+        response_message = get_gemini_response(user_message, conversation_history, conversation_id, now,
+                                                session.get('user_id'))
+        if response_message:
+            cache_answer(user_message, conversation_history, response_message)
+        else:
+            response_message = get_fallback_response(user_message)
 
-    if "préparations pour l'accouchement" in message:
-        return "Il est conseillé de suivre des cours de préparation à l'accouchement, de préparer une valise pour l'hôpital, et de discuter d'un plan de naissance avec votre médecin."
+    messages = _build_chat_messages(session.get('username', 'Inconnu'), user_message, response_message, now)
 
-    if "soins prénatals" in message or "visites prénatales" in message:
-        return "Il est recommandé de planifier une visite prénatale toutes les 4 semaines pendant les premiers mois de grossesse, puis tous les 15 jours à partir du 7ème mois. Ces visites incluent des échographies, des tests de dépistage, et des bilans sanguins."
+    if conversation_id:
+        # Ajouter les messages à la conversation existante
+        _append_messages(conversation_id, messages, now)
+    else:
+        # Créer une nouvelle conversation
+        session['conversation_id'] = _create_conversation(session.get('user_id'), user_message, now, messages)
+    _record_chat_stats(now, new_conversation=not conversation_id)
+
+    logger.info("Réponse /chat prête en %.0f ms", (time.perf_counter() - started) * 1000)
+    return jsonify({"message": response_message})
 
-    if "soins postnataux" in message:
-        return "Après l'accouchement, surveillez votre santé et celle de votre bébé. Consultez votre médecin pour des conseils sur l'allaitement et la reprise de vos activités."
 
-    if "soins du nouveau-né" in message:
-        return "Les soins du nouveau-né incluent la surveillance du poids, l'allaitement, le nettoyage du cordon ombilical et la vaccination."
+def _sse_event(payload):
+    """Formater un événement Server-Sent Events."""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
-    if "allaitement" in message:
-        return "L'allaitement est recommandé pendant les premiers mois. Si vous ne pouvez pas allaiter, parlez-en à votre médecin pour choisir un lait infantile adapté."
 
-    if "reprise après l'accouchement" in message:
-        return "La reprise après l'accouchement peut inclure des exercices doux, mais il est important d'attendre l'approbation de votre médecin avant de reprendre des activités intenses."
+# API de chat en flux (Server-Sent Events) : le texte est envoyé au fur et à mesure
+@app.route('/chat_stream', methods=['POST'])
+@login_required
+@limiter.limit("30 per minute")
+def chat_stream():
+    user_message, error = _validate_chat_message(request.json)
+    if error:
+        return jsonify({"error": error}), 400
 
-    if "nutrition des enfants" in message:
-        return "Une bonne nutrition est essentielle pour le développement des enfants. Assurez-vous de leur donner des repas équilibrés, riches en légumes, fruits, et protéines."
+    started = time.perf_counter()
+    now = datetime.now()
+    username = session.get('username', 'Inconnu')
+    conversation_id = session.get('conversation_id')
+    conversation_history = _load_conversation_history(conversation_id)
+    user_id = session.get('user_id')
 
-    if "aliments solides" in message:
-        return "L'introduction des aliments solides commence généralement à 6 mois. Commencez par des purées de légumes, fruits et céréales pour bébés."
+    # La conversation est créée avant le flux : le cookie de session part avec les en-têtes
+    new_conversation = not conversation_id
+    if new_conversation:
+        conversation_id = _create_conversation(user_id, user_message, now, [])
+        session['conversation_id'] = conversation_id
+
+    def generate():
+        chunks = []
+        cached = get_cached_answer(user_message, conversation_history)
+        stream = [cached] if cached else get_gemini_response_stream(user_message, conversation_history,
+                                                                    conversation_id, now, user_id)
+        interrupted = False
+        try:
+            for chunk in stream:
+                if not chunks:
+                    logger.info("Premier fragment /chat_stream en %.0f ms", (time.perf_counter() - started) * 1000)
+                chunks.append(chunk)
+                yield _sse_event({"delta": chunk})
+        except Exception:
+            # Flux coupé après les premiers fragments : la réponse affichée est tronquée
+            interrupted = True
+            yield _sse_event({"error": "La réponse a été interrompue. Veuillez reposer votre question."})
+
+        response_message = ''.join(chunks)
+        if response_message and not cached and not interrupted:
+            cache_answer(user_message, conversation_history, response_message)
+        if not response_message:
+            response_message = get_fallback_response(user_message)
+            yield _sse_event({"delta": response_message})
+
+        # Persister la réponse une fois le flux terminé (marquée incomplète s'il a été coupé)
+        messages = _build_chat_messages(username, user_message, response_message, now)
+        if interrupted:
+            messages[-1]["incomplete"] = True
+        _append_messages(conversation_id, messages, now)
+        _record_chat_stats(now, new_conversation)
+        logger.info("Flux /chat_stream terminé en %.0f ms", (time.perf_counter() - started) * 1000)
+        yield _sse_event({"done": True})
+
+    response = app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-    if "signes de danger" in message:
-        return "Les signes de danger pendant la grossesse incluent : saignements vaginaux, maux de tête sévères, vision floue, douleurs abdominales intenses, fièvre élevée, et diminution des mouvements du bébé. Consultez immédiatement un médecin."
 
-    return "Je peux vous fournir des informations sur la grossesse, les soins prénatals, postnataux, ou la nutrition des enfants. De quoi avez-vous besoin ?"
+# Mots-clés du mode fallback (sans Gemini)
+PREGNANCY_KEYWORDS = [
+    "symptômes", "alimentation", "exercices",
+    "signes de danger", "soins prénatals", "soins postnataux",
+    "visites médicales", "nutriments", "yoga prénatal",
+    "visites prénatales", "tests de dépistage", "préparations pour l'accouchement",
+    "soins du nouveau-né", "allaitement", "alimentation du bébé", "reprise après l'accouchement",
+    "nutrition des enfants", "aliments solides", "alimentation équilibrée"
+]
+PERSONALIZED_SUGGESTIONS_KEYWORDS = [
+    "trimestre", "âge de l'enfant", "âge", "nouveau-né", "bébé", "enfant"
+]
+
+# Intentions reconnues, par ordre de priorité dans chaque groupe : (intention, mots-clés)
+PREGNANCY_INTENTS = [
+    ("symptomes", ["symptômes"]),
+    ("alimentation_equilibree", ["alimentation équilibrée"]),
+    ("alimentation_bebe", ["alimentation du bébé"]),
+    ("alimentation", ["alimentation"]),
+    ("exercices", ["exercices"]),
+    ("tests_depistage", ["tests de dépistage"]),
+    ("preparation_accouchement", ["préparations pour l'accouchement"]),
+    ("soins_prenatals", ["soins prénatals", "visites prénatales"]),
+    ("soins_postnataux", ["soins postnataux"]),
+    ("soins_nouveau_ne", ["soins du nouveau-né"]),
+    ("allaitement", ["allaitement"]),
+    ("reprise_accouchement", ["reprise après l'accouchement"]),
+    ("nutrition_enfants", ["nutrition des enfants"]),
+    ("aliments_solides", ["aliments solides"]),
+    ("signes_danger", ["signes de danger"]),
+]
+PERSONALIZED_INTENTS = [
+    ("trimestre", ["trimestre"]),
+    ("nouveau_ne", ["nouveau-né"]),
+    ("bebe", ["bébé"]),
+    ("enfant", ["enfant"]),
+]
+
+
+def _symptoms_response(user_data):
+    weeks_pregnant = user_data.get('weeks_pregnant', None)
+    if weeks_pregnant:
+        name = user_data.get('name', 'utilisatrice')
+        return f"Bonjour {name}, à {weeks_pregnant} semaines de grossesse, les symptômes courants incluent les nausées, la fatigue, les maux de tête, et les douleurs dans le bas du dos. Consultez un médecin si vous ressentez des douleurs sévères, des saignements ou une diminution des mouvements du bébé."
+    return "Les symptômes courants de la grossesse incluent les nausées, la fatigue, les maux de tête et les douleurs dans le bas du dos. Consultez un médecin si vous ressentez des douleurs sévères ou des saignements."
 
 
-def personalized_suggestions(user_data, message):
-    """Fournir des suggestions en fonction de la durée de la grossesse ou de l'âge de l'enfant."""
+def _trimester_response(user_data):
     weeks_pregnant = user_data.get('weeks_pregnant', 0)
-    if "trimestre" in message:
-        if weeks_pregnant <= 12:
-            return "Premier trimestre : Il est recommandé de suivre une alimentation riche en acide folique et de planifier votre première visite prénatale."
-        if 13 <= weeks_pregnant <= 26:
-            return "Deuxième trimestre : Continuez à suivre vos visites prénatales. Vous pouvez commencer à préparer l'arrivée du bébé."
-        if weeks_pregnant >= 27:
-            return "Troisième trimestre : Assurez-vous que tout est prêt pour l'accouchement. Faites des exercices doux et suivez les conseils de votre médecin."
-    if "nouveau-né" in message:
-        return "Pour un nouveau-né, il est important de suivre des horaires réguliers d'allaitement ou de biberon et de surveiller son sommeil."
-    if "bébé" in message:
-        return "Pour un bébé de 6 mois, vous pouvez commencer à introduire des aliments solides en petites quantités, tout en continuant l'allaitement."
-    if "enfant" in message:
-        return "Assurez-vous que votre enfant mange équilibré, avec des fruits, des légumes, et des protéines. Encouragez également l'activité physique quotidienne."
-    return "Je peux vous fournir des conseils basés sur la durée de votre grossesse ou l'âge de votre enfant."
+    if weeks_pregnant <= 12:
+        return "Premier trimestre : Il est recommandé de suivre une alimentation riche en acide folique et de planifier votre première visite prénatale."
+    if weeks_pregnant <= 26:
+        return "Deuxième trimestre : Continuez à suivre vos visites prénatales. Vous pouvez commencer à préparer l'arrivée du bébé."
+    return "Troisième trimestre : Assurez-vous que tout est prêt pour l'accouchement. Faites des exercices doux et suivez les conseils de votre médecin."
+
+
+# Réponses du mode fallback : texte fixe ou fonction des données utilisateur
+FALLBACK_RESPONSES = {
+    "symptomes": _symptoms_response,
+    "alimentation_equilibree": "Une alimentation équilibrée pour les enfants doit inclure des légumes, fruits, protéines maigres, produits laitiers et céréales complètes.",
+    "alimentation_bebe": "L'allaitement est recommandé pendant les premiers mois. Si vous ne pouvez pas allaiter, parlez-en à votre médecin pour choisir un lait infantile adapté.",
+    "alimentation": "Pendant la grossesse, il est essentiel d'avoir une alimentation équilibrée. Consommez des fruits, légumes, protéines maigres, céréales complètes, et produits laitiers. Limitez les aliments trop gras ou trop sucrés et évitez l'alcool et le tabac.",
+    "exercices": "Des exercices légers comme la marche, le yoga prénatal, et la natation sont recommandés. Évitez les sports intenses ou les activités à risque. Consultez votre médecin avant de commencer un programme d'exercices.",
+    "tests_depistage": "Les tests de dépistage prénatals incluent les échographies, les tests de dépistage de la trisomie et des anomalies génétiques.",
+    "preparation_accouchement": "Il est conseillé de suivre des cours de préparation à l'accouchement, de préparer une valise pour l'hôpital, et de discuter d'un plan de naissance avec votre médecin.",
+    "soins_prenatals": "Il est recommandé de planifier une visite prénatale toutes les 4 semaines pendant les premiers mois de grossesse, puis tous les 15 jours à partir du 7ème mois. Ces visites incluent des échographies, des tests de dépistage, et des bilans sanguins.",
+    "soins_postnataux": "Après l'accouchement, surveillez votre santé et celle de votre bébé. Consultez votre médecin pour des conseils sur l'allaitement et la reprise de vos activités.",
+    "soins_nouveau_ne": "Les soins du nouveau-né incluent la surveillance du poids, l'allaitement, le nettoyage du cordon ombilical et la vaccination.",
+    "allaitement": "L'allaitement est recommandé pendant les premiers mois. Si vous ne pouvez pas allaiter, parlez-en à votre médecin pour choisir un lait infantile adapté.",
+    "reprise_accouchement": "La reprise après l'accouchement peut inclure des exercices doux, mais il est important d'attendre l'approbation de votre médecin avant de reprendre des activités intenses.",
+    "nutrition_enfants": "Une bonne nutrition est essentielle pour le développement des enfants. Assurez-vous de leur donner des repas équilibrés, riches en légumes, fruits, et protéines.",
+    "aliments_solides": "L'introduction des aliments solides commence généralement à 6 mois. Commencez par des purées de légumes, fruits et céréales pour bébés.",
+    "signes_danger": "Les signes de danger pendant la grossesse incluent : saignements vaginaux, maux de tête sévères, vision floue, douleurs abdominales intenses, fièvre élevée, et diminution des mouvements du bébé. Consultez immédiatement un médecin.",
+    "grossesse": "Je peux vous fournir des informations sur la grossesse, les soins prénatals, postnataux, ou la nutrition des enfants. De quoi avez-vous besoin ?",
+    "trimestre": _trimester_response,
+    "nouveau_ne": "Pour un nouveau-né, il est important de suivre des horaires réguliers d'allaitement ou de biberon et de surveiller son sommeil.",
+    "bebe": "Pour un bébé de 6 mois, vous pouvez commencer à introduire des aliments solides en petites quantités, tout en continuant l'allaitement.",
+    "enfant": "Assurez-vous que votre enfant mange équilibré, avec des fruits, des légumes, et des protéines. Encouragez également l'activité physique quotidienne.",
+    "suggestions": "Je peux vous fournir des conseils basés sur la durée de votre grossesse ou l'âge de votre enfant.",
+    "inconnu": "Je ne suis pas sûr de comprendre. Pouvez-vous reformuler? Vous pouvez me poser des questions sur : les symptômes, l'alimentation, les exercices, les soins prénatals, les soins postnataux, les vaccinations, la nutrition des enfants, etc.",
+}
+
+
+def _build_intent_index():
+    """Associe chaque mot-clé à son rang (groupe, priorité) et à son intention.
+
+    Les mots-clés sans réponse dédiée orientent vers la réponse générale de leur groupe
+    ("grossesse" ou "suggestions"), classée après les intentions précises.
+    """
+    index = {}
+    groups = [
+        (PREGNANCY_KEYWORDS, PREGNANCY_INTENTS, "grossesse"),
+        (PERSONALIZED_SUGGESTIONS_KEYWORDS, PERSONALIZED_INTENTS, "suggestions"),
+    ]
+    for group_rank, (keywords, intents, general_intent) in enumerate(groups):
+        for keyword in keywords:
+            index.setdefault(keyword, ((group_rank, len(intents)), general_intent))
+        for priority, (intent, intent_keywords) in enumerate(intents):
+            for keyword in intent_keywords:
+                index[keyword] = ((group_rank, priority), intent)
+    return index
+
+
+# Mots-clés triés par priorité : le premier présent dans le message détermine l'intention.
+# La recherche de sous-chaîne native (en C) est plus rapide ici qu'une expression
+# régulière combinée ou un automate écrit en Python, y compris sur les messages longs.
+FALLBACK_INTENT_INDEX = _build_intent_index()
+FALLBACK_KEYWORDS_BY_PRIORITY = tuple(
+    (keyword, intent)
+    for keyword, (rank, intent) in sorted(FALLBACK_INTENT_INDEX.items(), key=lambda item: item[1][0])
+)
+
+# Sujets des messages classés par lots dans MongoDB avec les mêmes mots-clés (analytics.py)
+topic_analytics = TopicAnalytics(db['analytics'], conversations_collection, messages_collection,
+                                 FALLBACK_KEYWORDS_BY_PRIORITY, lag=app.config['ANALYTICS_LAG'],
+                                 interval=app.config['ANALYTICS_INTERVAL'])
+
+
+def detect_intent(message_lower):
+    """Retourne l'intention la plus prioritaire présente dans le message."""
+    for keyword, intent in FALLBACK_KEYWORDS_BY_PRIORITY:
+        if keyword in message_lower:
+            return intent
+    return "inconnu"
+
+
+def handle_user_message(user_data, message):
+    """Gérer les différentes requêtes de l'utilisateur en fonction du contexte."""
+    response = FALLBACK_RESPONSES[detect_intent(message.lower())]
+    return response(user_data) if callable(response) else response
 
 
 # Route pour afficher la page de Rappel
@@ -605,16 +1354,27 @@ def show_add_reminder_form():
     return render_template('add_reminder.html')
 
 
-def save_appointment(user_data, appointment_date, reminder_date, reminder_time):
-    """Enregistrer un rappel de rendez-vous ou vaccination dans MongoDB."""
+def save_appointment(user_data, appointment_date, reminder_date, reminder_time, reminder_type='rappel'):
+    """Enregistrer un rappel de rendez-vous ou vaccination dans MongoDB, envoyé par SMS à `fire_at` (UTC).
+
+    Lève ValueError si la date ou l'heure est invalide.
+    """
+    fire_at = parse_fire_at(reminder_date, reminder_time, app.config['REMINDER_TIMEZONE'])
     reminders_collection.insert_one({
         "name": user_data.get("name"),
         "phone_number": user_data.get("phone_number"),
         "appointment_date": appointment_date,
         "reminder_date": reminder_date,
         "reminder_time": reminder_time,
-        "type": "rappel"
+        "type": "rappel",
+        "reminder_type": reminder_type,
+        "message": f"Bonjour {user_data.get('name')}, rappel : votre rendez-vous ({reminder_type}) "
+                   f"est prévu le {appointment_date}.",
+        "fire_at": fire_at,
+        "status": PENDING
     })
+    stats_counters.record(datetime.now(), totals={"reminders": 1}, daily={"reminders": 1})
+    return fire_at
 
 
 @app.route('/set_reminder', methods=['POST'])
@@ -636,38 +1396,97 @@ def set_reminder():
     if not PHONE_REGEX.match(phone_clean):
         return jsonify({'message': 'Erreur: Format de numéro de téléphone invalide.'}), 400
 
-    save_appointment({
-        'name': name,
-        'phone_number': phone_number,
-    }, reminder_date, reminder_date, reminder_time)
+    try:
+        save_appointment({
+            'name': name,
+            'phone_number': phone_number,
+        }, reminder_date, reminder_date, reminder_time, reminder_type)
+    except ValueError:
+        return jsonify({'message': 'Erreur: Date ou heure invalide.'}), 400
 
     message = f"Bonjour {name}, votre rappel de {reminder_type} est fixé pour le {reminder_date} à {reminder_time}."
-    sms_sent = send_sms(phone_number, message)
+    sms_queued = send_sms(phone_number, message)
 
-    if sms_sent:
-        return jsonify({'message': 'Rappel enregistré et SMS envoyé avec succès!'})
+    if sms_queued:
+        return jsonify({'message': 'Rappel enregistré, le SMS de confirmation va être envoyé.'})
     return jsonify({'message': 'Rappel enregistré, mais le SMS n\'a pas pu être envoyé. Vérifiez le numéro de téléphone.'})
 
 
-def send_sms(to, message):
-    """Envoyer un SMS via Twilio. Retourne True si envoyé, False sinon."""
-    account_sid = Config.TWILIO_ACCOUNT_SID
-    auth_token = Config.TWILIO_AUTH_TOKEN
-    twilio_number = Config.TWILIO_PHONE_NUMBER
+# Client Twilio partagé par les threads du processus (connexions réutilisées, débit limité)
+sms_transport = SmsTransport(
+    Config.TWILIO_ACCOUNT_SID,
+    Config.TWILIO_AUTH_TOKEN,
+    Config.TWILIO_PHONE_NUMBER,
+    rate=app.config['TWILIO_SEND_RATE'],
+    pool_size=app.config['TWILIO_POOL_SIZE'],
+    base_url=app.config['TWILIO_API_BASE_URL']
+)
+
+
+@tracer.wrap('twilio.sms', root=True)
+def deliver_sms(payload):
+    """Envoyer un SMS via Twilio (lève une exception en cas d'échec)."""
+    sms_transport.send(payload["to"], payload["body"])
+
+
+@tracer.wrap('smtp.email', root=True)
+def deliver_email(payload):
+    """Envoyer un email via Flask-Mail (lève une exception en cas d'échec)."""
+    msg = Message(payload["subject"], sender=app.config['MAIL_DEFAULT_SENDER'], recipients=payload["recipients"])
+    msg.body = payload["body"]
+    with app.app_context():
+        mail.send(msg)
+
 
+def send_sms(to, message):
+    """Mettre un SMS en file d'envoi. Retourne True si enregistré, False sinon."""
     try:
-        twilio_client = Client(account_sid, auth_token)
-        twilio_client.messages.create(
-            body=message,
-            from_=twilio_number,
-            to=to
-        )
+        notification_queue.enqueue('sms', {"to": to, "body": message})
         return True
     except Exception as e:
-        logger.error("Erreur d'envoi SMS : %s", e)
+        logger.error("Impossible de mettre le SMS en file : %s", e)
         return False
 
 
+if app.config['NOTIFICATION_TRANSPORT'] == 'fake':
+    _fake_transport = FakeTransport(latency=0.05)
+    NOTIFICATION_TRANSPORTS = {"sms": _fake_transport, "email": _fake_transport}
+else:
+    NOTIFICATION_TRANSPORTS = {"sms": deliver_sms, "email": deliver_email}
+# Durée des envois exposée sur /metrics
+NOTIFICATION_TRANSPORTS = {channel: metrics.timed_transport(channel, transport)
+                           for channel, transport in NOTIFICATION_TRANSPORTS.items()}
+
+# File d'envoi des notifications : les threads démarrent au premier envoi
+# ou dans chaque worker gunicorn (post_fork, voir gunicorn_config.py)
+notification_queue = NotificationQueue(
+    notifications_collection,
+    NOTIFICATION_TRANSPORTS,
+    workers=app.config['NOTIFICATION_WORKERS'],
+    max_attempts=app.config['NOTIFICATION_MAX_ATTEMPTS'],
+    backoff_base=app.config['NOTIFICATION_BACKOFF_BASE']
+)
+
+
+def dispatch_reminders(reminders):
+    """Mettre en file les SMS des rappels dus (un seul envoi par rappel, même si le lot est rejoué)."""
+    notification_queue.enqueue_many(
+        'sms',
+        [{"to": r["phone_number"], "body": r["message"]} for r in reminders],
+        keys=[f"reminder:{r['_id']}" for r in reminders]
+    )
+
+
+# Planificateur des rappels : démarré dans chaque worker gunicorn (post_fork), la
+# réclamation atomique des lots évite les doublons entre workers
+reminder_scheduler = ReminderScheduler(
+    reminders_collection,
+    dispatch_reminders,
+    batch_size=app.config['REMINDER_BATCH_SIZE'],
+    poll_interval=app.config['REMINDER_POLL_INTERVAL']
+)
+
+
 # Route pour la page de contact conseiller
 @app.route('/contact', methods=['GET'])
 @login_required
@@ -699,10 +1518,10 @@ def contact_advisor():
         return jsonify({"error": "Format de numéro de téléphone invalide"}), 400
 
     advisor_phone = app.config.get('ADVISOR_PHONE_NUMBER')
-    sms_sent = send_sms(advisor_phone, f"Message de {name} ({phone_number}, {email}): {message}")
+    sms_queued = send_sms(advisor_phone, f"Message de {name} ({phone_number}, {email}): {message}")
 
-    if sms_sent:
-        return jsonify({"message": "Message envoyé au conseiller avec succès"}), 200
+    if sms_queued:
+        return jsonify({"message": "Message transmis au conseiller, il va le recevoir par SMS"}), 200
     return jsonify({"message": "Votre message a été enregistré, mais le SMS au conseiller n'a pas pu être envoyé. Il sera contacté par un autre moyen."}), 200
 
 
@@ -720,6 +1539,11 @@ def get_history():
     total_pages = max(1, (total + per_page - 1) // per_page)
 
     history = conversations_collection.find(query).sort("date", -1).skip((page - 1) * per_page).limit(per_page)
+    if _separate_messages():
+        history = list(history)
+        stored = _messages_by_conversation([chat["_id"] for chat in history])
+        for chat in history:
+            chat["messages"] = chat.get("messages", []) + stored.get(chat["_id"], [])
     history_list = []
     for chat in history:
         chat_dict = {
@@ -739,6 +1563,81 @@ def get_history():
     return jsonify({"history": history_list, "page": page, "total_pages": total_pages})
 
 
+def _encode_history_cursor(chat):
+    """Curseur de pagination : position (date, _id) de la dernière conversation renvoyée."""
+    return f"{chat['date'].isoformat()}_{chat['_id']}"
+
+
+def _decode_history_cursor(cursor):
+    date, _, oid = cursor.partition('_')
+    return datetime.fromisoformat(date), ObjectId(oid)
+
+
+# Liste légère de l'historique : métadonnées seulement, pagination par curseur sur (date, _id)
+@app.route('/get_conversations', methods=['GET'])
+@login_required
+def get_conversations():
+    user_id = session.get('user_id')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 50)
+
+    query = {"user_id": user_id}
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            date, oid = _decode_history_cursor(cursor)
+        except (ValueError, InvalidId):
+            return jsonify({"error": "Curseur invalide"}), 400
+        query["$or"] = [{"date": {"$lt": date}}, {"date": date, "_id": {"$lt": oid}}]
+
+    # Une conversation de plus que demandé : indique s'il reste une page suivante
+    chats = list(conversations_collection.find(
+        query,
+        {"title": 1, "date": 1, "last_message": 1, "messages": {"$slice": -1}}
+    ).sort([("date", -1), ("_id", -1)]).limit(limit + 1))
+    has_more = len(chats) > limit
+    chats = chats[:limit]
+
+    conversations = []
+    for chat in chats:
+        # Conversations antérieures à l'aperçu stocké : dernier message du tableau intégré
+        last_message = chat.get("last_message")
+        if last_message is None and chat.get("messages"):
+            last_message = _message_preview(chat["messages"][-1])
+        conversations.append({
+            "id": str(chat["_id"]),
+            "title": chat.get("title", "Sans titre"),
+            "date": chat["date"].strftime('%Y-%m-%d %H:%M:%S'),
+            "last_message": last_message
+        })
+
+    result = {
+        "conversations": conversations,
+        "next_cursor": _encode_history_cursor(chats[-1]) if has_more else None
+    }
+    if request.args.get('with_total', 'false').lower() == 'true':
+        total = history_counts.get(user_id)
+        if total is None:
+            total = conversations_collection.count_documents({"user_id": user_id})
+            history_counts.set(user_id, total)
+        result["total"] = total
+    return jsonify(result)
+
+
+def _messages_by_conversation(conversation_ids):
+    """Messages de plusieurs conversations (collection `messages`) en une seule requête."""
+    grouped = {}
+    if not conversation_ids:
+        return grouped
+    cursor = messages_collection.find(
+        {"conversation_id": {"$in": conversation_ids}},
+        dict(MESSAGE_FIELDS, conversation_id=1)
+    ).sort(MESSAGE_SORT)
+    for msg in cursor:
+        grouped.setdefault(msg.pop("conversation_id"), []).append(msg)
+    return grouped
+
+
+@tracer.wrap('chat_title')
 def generate_chat_title(messages, user_message):
     """Génère un titre pour le chat en fonction du message utilisateur."""
     first_message = user_message
@@ -781,7 +1680,7 @@ def get_chat(chat_id):
                 "text": msg.get("text", ""),
                 "timestamp": msg.get("timestamp", datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
             }
-            for msg in chat.get("messages", [])
+            for msg in _conversation_messages(chat)
         ]
     }
     return jsonify(chat_dict)
@@ -791,7 +1690,7 @@ def get_chat(chat_id):
 @app.route('/profile', methods=['GET'])
 @login_required
 def show_profile():
-    user = users_collection.find_one({"_id": ObjectId(session['user_id'])})
+    user = current_user()
     if not user:
         flash('Utilisateur non trouvé', 'error')
         return redirect(url_for('home'))
@@ -802,7 +1701,7 @@ def show_profile():
 @login_required
 @limiter.limit("5 per minute")
 def update_profile():
-    user = users_collection.find_one({"_id": ObjectId(session['user_id'])})
+    user = current_user()
     if not user:
         flash('Utilisateur non trouvé', 'error')
         return redirect(url_for('home'))
@@ -835,6 +1734,7 @@ def update_profile():
             {'_id': user['_id']},
             {'$set': {'username': new_username, 'email': new_email}}
         )
+        _forget_user(user['_id'])
         session['username'] = new_username
         flash('Informations mises à jour avec succès', 'success')
 
@@ -843,22 +1743,30 @@ def update_profile():
         new_password = request.form.get('new_password', '')
         confirm_password = request.form.get('confirm_password', '')
 
-        if not check_password_hash(user['password'], current_password):
-            flash('Mot de passe actuel incorrect', 'error')
-            return redirect(url_for('show_profile'))
-
-        if len(new_password) < 8:
-            flash('Le nouveau mot de passe doit contenir au moins 8 caractères', 'error')
-            return redirect(url_for('show_profile'))
-
-        if new_password != confirm_password:
-            flash('Les nouveaux mots de passe ne correspondent pas', 'error')
+        try:
+            if not password_hasher.verify(user['password'], current_password):
+                flash('Mot de passe actuel incorrect', 'error')
+                return redirect(url_for('show_profile'))
+
+            if len(new_password) < 8:
+                flash('Le nouveau mot de passe doit contenir au moins 8 caractères', 'error')
+                return redirect(url_for('show_profile'))
+
+            if new_password != confirm_password:
+                flash('Les nouveaux mots de passe ne correspondent pas', 'error')
+                return redirect(url_for('show_profile'))
+
+            password_hash = password_hasher.hash(new_password)
+        except (TimeoutError, BrokenProcessPool) as e:
+            logger.warning("Hachage du mot de passe impossible (%s) pour : %s", type(e).__name__, user['username'])
+            flash('Le serveur est très sollicité, réessayez dans un instant', 'error')
             return redirect(url_for('show_profile'))
 
         users_collection.update_one(
             {'_id': user['_id']},
-            {'$set': {'password': generate_password_hash(new_password)}}
+            {'$set': {'password': password_hash}}
         )
+        _forget_user(user['_id'])
         flash('Mot de passe modifié avec succès', 'success')
 
     return redirect(url_for('show_profile'))
@@ -874,7 +1782,7 @@ def export_chat(chat_id):
         flash('Identifiant de chat invalide', 'error')
         return redirect(url_for('show_ask_form'))
 
-    chat = conversations_collection.find_one({"_id": oid})
+    chat = conversations_collection.find_one({"_id": oid}, EXPORT_FIELDS)
     if not chat or chat.get("user_id") != session.get('user_id'):
         flash('Conversation non trouvée', 'error')
         return redirect(url_for('show_ask_form'))
@@ -886,86 +1794,67 @@ def export_chat(chat_id):
     return export_chat_txt(chat)
 
 
-def export_chat_txt(chat):
-    """Exporter une conversation en fichier texte."""
-    output = io.StringIO()
-    title = chat.get('title', 'Conversation')
-    date = chat['date'].strftime('%Y-%m-%d %H:%M')
-    output.write(f"{'='*50}\n")
-    output.write(f"  {title}\n")
-    output.write(f"  Date: {date}\n")
-    output.write(f"{'='*50}\n\n")
-
-    for msg in chat.get('messages', []):
-        user = msg.get('user', 'Inconnu')
-        text = msg.get('text', '')
-        timestamp = msg.get('timestamp', datetime.now()).strftime('%H:%M')
-        output.write(f"[{timestamp}] {user}:\n{text}\n\n")
-
-    content = output.getvalue()
-    response = app.response_class(content, mimetype='text/plain; charset=utf-8')
-    response.headers['Content-Disposition'] = f'attachment; filename="conversation_{chat["_id"]}.txt"'
+def _export_messages(chat):
+    """Messages d'une conversation lus par lots au fil de l'export."""
+    return iter_messages(conversations_collection, messages_collection, chat["_id"], _separate_messages(),
+                         app.config['EXPORT_BATCH_SIZE'])
+
+
+def _attachment(chunks, mimetype, filename):
+    """Réponse en flux téléchargée sous le nom `filename`."""
+    response = app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
     return response
 
 
+def export_chat_txt(chat):
+    """Exporter une conversation en fichier texte, envoyé au fil de la lecture des messages."""
+    return _attachment(text_chunks(chat, _export_messages(chat)), 'text/plain; charset=utf-8',
+                       f'conversation_{chat["_id"]}.txt')
+
+
 def export_chat_pdf(chat):
-    """Exporter une conversation en fichier PDF."""
+    """Exporter une conversation en fichier PDF, rendu par un processus du groupe de rendu."""
     try:
-        from fpdf import FPDF
+        import fpdf  # noqa: F401
     except ImportError:
         flash('Export PDF non disponible (fpdf2 non installé)', 'error')
         return redirect(url_for('show_ask_form'))
 
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    pdf.set_font('Helvetica', 'B', 16)
-    title = chat.get('title', 'Conversation')
-    safe_title = title.encode('latin-1', 'replace').decode('latin-1')
-    pdf.cell(0, 10, safe_title, ln=True, align='C')
-
-    pdf.set_font('Helvetica', '', 10)
-    date = chat['date'].strftime('%Y-%m-%d %H:%M')
-    pdf.cell(0, 8, f"Date: {date}", ln=True, align='C')
-    pdf.ln(10)
-    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-    pdf.ln(5)
-
-    for msg in chat.get('messages', []):
-        user = msg.get('user', 'Inconnu')
-        text = msg.get('text', '')
-        timestamp = msg.get('timestamp', datetime.now()).strftime('%H:%M')
-
-        if user == 'Bot':
-            pdf.set_font('Helvetica', 'B', 10)
-            pdf.set_text_color(0, 150, 199)
-        else:
-            pdf.set_font('Helvetica', 'B', 10)
-            pdf.set_text_color(233, 30, 140)
-
-        safe_user = user.encode('latin-1', 'replace').decode('latin-1')
-        pdf.cell(0, 6, f"[{timestamp}] {safe_user}:", ln=True)
-        pdf.set_font('Helvetica', '', 9)
-        pdf.set_text_color(51, 51, 51)
-        safe_text = text.encode('latin-1', 'replace').decode('latin-1')
-        pdf.multi_cell(0, 5, safe_text)
-        pdf.ln(3)
-
-    pdf_bytes = pdf.output()
-    response = app.response_class(pdf_bytes, mimetype='application/pdf')
-    response.headers['Content-Disposition'] = f'attachment; filename="conversation_{chat["_id"]}.pdf"'
-    return response
+    try:
+        path = pdf_renderer.render(chat, _separate_messages(), _export_messages(chat))
+    except (TimeoutError, BrokenProcessPool) as e:
+        logger.warning("Rendu PDF impossible (%s) pour la conversation %s", type(e).__name__, chat["_id"])
+        flash('Le serveur est très sollicité, réessayez dans un instant', 'error')
+        return redirect(url_for('show_ask_form'))
+    except Exception as e:
+        logger.error("Rendu PDF impossible pour la conversation %s : %s", chat["_id"], e)
+        flash("Erreur lors de l'export PDF, réessayez plus tard", 'error')
+        return redirect(url_for('show_ask_form'))
+    return _attachment(file_chunks(path), 'application/pdf', f'conversation_{chat["_id"]}.pdf')
+
+
+# Export de toutes les conversations de l'utilisateur (fichiers texte dans une archive ZIP)
+@app.route('/export_chats')
+@login_required
+@limiter.limit("5 per minute")
+def export_chats():
+    conversations = conversations_collection.find({"user_id": session.get('user_id')}, EXPORT_FIELDS)
+    conversations = conversations.sort("date", -1).batch_size(app.config['EXPORT_BATCH_SIZE'])
+    entries = ((f'conversation_{chat["_id"]}.txt', chat['date'], text_chunks(chat, _export_messages(chat)))
+               for chat in conversations)
+    return _attachment(zip_stream(entries), 'application/zip', f'conversations_{datetime.now():%Y%m%d}.zip')
 
 
 # Panel d'administration
 @app.route('/admin')
 @admin_required
 def admin_panel():
-    total_users = users_collection.count_documents({})
-    total_confirmed = users_collection.count_documents({"confirmed": True})
-    total_conversations = conversations_collection.count_documents({})
-    total_reminders = reminders_collection.count_documents({})
+    # Compteurs tenus à jour à l'écriture : durée d'affichage indépendante du volume des collections
+    now = datetime.now()
+    totals = stats_counters.totals(now)
+    daily = stats_counters.daily(now.date(), app.config['STATS_DAYS'])
+    topics = topic_analytics.topics(now.date(), app.config['STATS_DAYS'])
 
     recent_users = list(users_collection.find().sort("registration_date", -1).limit(20))
     users_list = []
@@ -979,14 +1868,281 @@ def admin_panel():
         })
 
     stats = {
-        "total_users": total_users,
-        "total_confirmed": total_confirmed,
-        "total_conversations": total_conversations,
-        "total_reminders": total_reminders
+        "total_users": totals["users"],
+        "total_confirmed": totals["users_confirmed"],
+        "total_conversations": totals["conversations"],
+        "total_reminders": totals["reminders"]
     }
-    return render_template('admin.html', stats=stats, users=users_list)
+    return render_template('admin.html', stats=stats, daily=daily, topics=topics,
+                           topics_watermark=topic_analytics.watermark(), users=users_list,
+                           llm=llm_scheduler.stats(), gemini=gemini_caller.stats())
+
+
+# Métriques Prometheus (tous les workers en mode multiprocessus, voir metrics.py)
+@app.route('/metrics')
+@limiter.exempt
+def metrics_endpoint():
+    if not metrics.ENABLED:
+        abort(404)
+    token = app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return app.response_class("Non autorisé\n", status=401, mimetype='text/plain')
+    body, content_type = metrics.render()
+    return app.response_class(body, content_type=content_type)
+
+
+def init_mongo():
+    """Nouveau client MongoDB pour le processus courant, rattaché aux collections et aux tâches de fond.
+
+    Appelé dans chaque worker gunicorn après le fork (post_fork) : avec preload_app, le client du
+    maître (connexions ouvertes par init_indexes, threads de surveillance) n'est pas sûr après un fork.
+    """
+    global client, db, users_collection, reminders_collection, conversations_collection, messages_collection, \
+        notifications_collection
+    client = create_mongo_client()
+    db = client['chatbot']
+    users_collection = db['users']
+    reminders_collection = db['reminders']
+    conversations_collection = db['conversations']
+    messages_collection = db['messages']
+    notifications_collection = db['notifications']
+    notification_queue.collection = notifications_collection
+    reminder_scheduler.collection = reminders_collection
+    stats_counters.collection = db['stats']
+    stats_counters.sources = _stats_sources()
+    topic_analytics.collection = db['analytics']
+    topic_analytics.conversations = conversations_collection
+    topic_analytics.messages = messages_collection
+    return client
+
+
+# Commandes d'administration (flask --app app <commande>)
+def init_indexes():
+    """Créer les index MongoDB au démarrage du serveur, sans l'empêcher de démarrer en cas d'échec."""
+    if not app.config['MONGO_ENSURE_INDEXES']:
+        return
+    try:
+        ensure_indexes(db)
+        logger.info("Index MongoDB vérifiés")
+    except PyMongoError as e:
+        logger.warning("Impossible de créer les index MongoDB : %s", e)
+
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Créer les index MongoDB déclarés dans indexes.py."""
+    for collection, names in ensure_indexes(db).items():
+        click.echo(f"{collection} : {', '.join(names)}")
+        missing = [m.document["name"] for m in INDEXES[collection] if m.document["name"] not in names]
+        if missing:
+            click.echo(f"{collection} : non créés (voir le journal) : {', '.join(missing)}", err=True)
+
+
+def backfill_user_data(batch_size=256, n_process=1, write_batch=1000, limit=None):
+    """Analyser par lots les messages utilisateur stockés et y enregistrer `user_data`.
+
+    Seuls les messages sans champ `user_data` sont traités : la commande peut être
+    relancée ou interrompue sans refaire le travail déjà fait.
+    Retourne le nombre de messages analysés.
+    """
+    pending = {"user": {"$ne": "Bot"}, "user_data": {"$exists": False}}
+    cursor = conversations_collection.find({"messages": {"$elemMatch": pending}},
+                                           {"messages.user": 1, "messages.text": 1, "messages.user_data": 1})
+    if limit:
+        cursor = cursor.limit(limit)
+
+    def pending_messages():
+        for conversation in cursor:
+            for index, msg in enumerate(conversation.get("messages", [])):
+                if msg.get("user") != "Bot" and "user_data" not in msg:
+                    yield msg.get("text", ""), (conversations_collection, conversation["_id"], f"messages.{index}.user_data")
+        if _separate_messages():
+            stored = messages_collection.find(pending, {"text": 1})
+            if limit:
+                stored = stored.limit(limit)
+            for msg in stored:
+                yield msg.get("text", ""), (messages_collection, msg["_id"], "user_data")
+
+    processed = 0
+    operations = {}
+    for user_data, (collection, document_id, field) in extract_user_data_batch(pending_messages(), batch_size, n_process):
+        batch = operations.setdefault(collection, [])
+        batch.append(UpdateOne({"_id": document_id}, {"$set": {field: user_data}}))
+        processed += 1
+        if len(batch) >= write_batch:
+            collection.bulk_write(batch, ordered=False)
+            operations[collection] = []
+    for collection, batch in operations.items():
+        if batch:
+            collection.bulk_write(batch, ordered=False)
+    return processed
+
+
+@app.cli.command('backfill-user-data')
+@click.option('--batch-size', default=256, show_default=True, help="Taille des lots nlp.pipe")
+@click.option('--n-process', default=1, show_default=True, help="Processus SpaCy en parallèle")
+@click.option('--limit', default=0, help="Nombre maximal de conversations (0 = toutes)")
+def backfill_user_data_command(batch_size, n_process, limit):
+    """Extraire nom et semaines de grossesse des messages déjà stockés."""
+    started = time.perf_counter()
+    processed = backfill_user_data(batch_size=batch_size, n_process=n_process, limit=limit or None)
+    elapsed = time.perf_counter() - started
+    click.echo(f"{processed} messages analysés en {elapsed:.1f} s ({processed / elapsed if elapsed else 0:.0f} messages/s)")
+
+
+def migrate_messages(limit=None):
+    """Déplacer les messages intégrés aux conversations vers la collection `messages`.
+
+    Les messages copiés portent leur position d'origine (`legacy_index`) : une conversation
+    dont la migration a été interrompue est recopiée sans doublon au passage suivant,
+    sans toucher aux messages écrits depuis le changement de mode.
+    Retourne le nombre de conversations et de messages migrés.
+    """
+    messages_collection.create_indexes(INDEXES["messages"])
+    cursor = conversations_collection.find({"messages": {"$exists": True}}, {"messages": 1})
+    if limit:
+        cursor = cursor.limit(limit)
+
+    migrated_conversations = migrated_messages = 0
+    for conversation in cursor:
+        oid = conversation["_id"]
+        messages = conversation.get("messages", [])
+        messages_collection.delete_many({"conversation_id": oid, "legacy_index": {"$exists": True}})
+        if messages:
+            messages_collection.insert_many([
+                dict(msg, conversation_id=oid, legacy_index=index) for index, msg in enumerate(messages)
+            ])
+        conversations_collection.update_one({"_id": oid}, {
+            "$unset": {"messages": ""},
+            "$set": {"message_count": messages_collection.count_documents({"conversation_id": oid})}
+        })
+        migrated_conversations += 1
+        migrated_messages += len(messages)
+    return migrated_conversations, migrated_messages
+
+
+@app.cli.command('migrate-messages')
+@click.option('--limit', default=0, help="Nombre maximal de conversations (0 = toutes)")
+def migrate_messages_command(limit):
+    """Passer les conversations existantes au stockage des messages en collection séparée."""
+    if not _separate_messages():
+        raise click.ClickException("Définir MESSAGES_STORAGE=collection avant de migrer les messages")
+    started = time.perf_counter()
+    conversations, messages = migrate_messages(limit=limit or None)
+    click.echo(f"{conversations} conversations ({messages} messages) migrées en {time.perf_counter() - started:.1f} s")
+
+
+@app.cli.command('notifications-worker')
+@click.option('--workers', default=None, type=int, help="Threads d'envoi (défaut : NOTIFICATION_WORKERS)")
+def notifications_worker_command(workers):
+    """Traiter la file des notifications dans un processus dédié."""
+    if workers is not None:
+        notification_queue.workers = workers
+    notification_queue.start()
+    click.echo(f"File de notifications démarrée ({notification_queue.workers} threads), Ctrl+C pour arrêter")
+    try:
+        while True:
+            time.sleep(60)
+            click.echo(f"notifications : {notification_queue.stats()}")
+    except KeyboardInterrupt:
+        notification_queue.stop()
+
+
+@app.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    """Recalculer les compteurs du panel d'administration depuis les collections."""
+    for name, count in stats_counters.reconcile(datetime.now()).items():
+        click.echo(f"{name} : {count}")
+
+
+@app.cli.command('analyze-topics')
+def analyze_topics_command():
+    """Classer par sujet les messages écrits depuis le dernier passage."""
+    window = topic_analytics.run_once(datetime.now())
+    if window is None:
+        click.echo("Rien à analyser (ou passage déjà en cours)")
+    else:
+        click.echo(f"Messages du {window[0]} au {window[1]} analysés")
+    for intent, count in topic_analytics.topics(datetime.now().date()):
+        click.echo(f"{intent} : {count}")
+
+
+def normalize_reminders(now=None):
+    """Calculer `fire_at` pour les rappels enregistrés avant le planificateur.
+
+    Les rappels dont la date est passée sont marqués expirés plutôt qu'envoyés en retard.
+    Retourne le nombre de rappels programmés et expirés.
+    """
+    now = now or utcnow()
+    scheduled = expired = 0
+    for reminder in reminders_collection.find({"fire_at": {"$exists": False}}):
+        try:
+            fire_at = parse_fire_at(reminder.get("reminder_date"), reminder.get("reminder_time"),
+                                    app.config['REMINDER_TIMEZONE'])
+        except (TypeError, ValueError):
+            fire_at = None
+        status = PENDING if fire_at and fire_at > now else EXPIRED
+        reminder_type = reminder.get("reminder_type") or reminder.get("type") or "rappel"
+        update = {"status": status,
+                  "message": f"Bonjour {reminder.get('name')}, rappel : votre rendez-vous ({reminder_type}) "
+                             f"est prévu le {reminder.get('appointment_date')}."}
+        if fire_at:
+            update["fire_at"] = fire_at
+        reminders_collection.update_one({"_id": reminder["_id"]}, {"$set": update})
+        if status == PENDING:
+            scheduled += 1
+        else:
+            expired += 1
+    return scheduled, expired
+
+
+@app.cli.command('normalize-reminders')
+def normalize_reminders_command():
+    """Programmer les rappels existants (calcul de fire_at en UTC)."""
+    scheduled, expired = normalize_reminders()
+    click.echo(f"{scheduled} rappels programmés, {expired} rappels expirés")
+
+
+@app.cli.command('dispatch-reminders')
+@click.option('--loop', is_flag=True, help="Continuer à scruter les rappels dus (sinon un seul passage)")
+def dispatch_reminders_command(loop):
+    """Envoyer les rappels dus."""
+    if loop:
+        reminder_scheduler.start()
+        click.echo("Planificateur de rappels démarré, Ctrl+C pour arrêter")
+        try:
+            while True:
+                time.sleep(60)
+                click.echo(f"rappels : {reminder_scheduler.stats()}")
+        except KeyboardInterrupt:
+            reminder_scheduler.stop()
+    else:
+        click.echo(f"{reminder_scheduler.run_once()} rappels mis en file d'envoi")
+
+
+@app.cli.command('send-campaign')
+@click.argument('numbers_file', type=click.File('r'))
+@click.option('--message', required=True, help="Texte du SMS envoyé à chaque numéro")
+@click.option('--concurrency', default=None, type=int, help="Envois simultanés (défaut : TWILIO_POOL_SIZE)")
+def send_campaign_command(numbers_file, message, concurrency):
+    """Envoyer un SMS à une liste de numéros (un par ligne), par exemple pour une campagne de vaccination."""
+    numbers = [line.strip() for line in numbers_file if PHONE_REGEX.match(line.strip().replace(' ', ''))]
+    started = time.perf_counter()
+    results = sms_transport.send_many([(number, message) for number in numbers], concurrency=concurrency)
+    elapsed = time.perf_counter() - started
+    failed = [r for r in results if r["error"]]
+    click.echo(f"{len(results) - len(failed)}/{len(results)} SMS envoyés en {elapsed:.1f} s")
+    for result in failed:
+        click.echo(f"échec {result['to']} : {result['error']}")
+    click.echo(f"statistiques : {sms_transport.stats()}")
 
 
 # Lancer l'application
 if __name__ == "__main__":
+    if app.config['REMINDER_SCHEDULER_ENABLED']:
+        reminder_scheduler.start()
+    if app.config['STATS_RECONCILE_INTERVAL']:
+        stats_counters.start(datetime.now)
+    if app.config['ANALYTICS_INTERVAL']:
+        topic_analytics.start(datetime.now)
     app.run(debug=app.config.get('DEBUG', False))
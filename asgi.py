@@ -0,0 +1,360 @@
+"""
+Point d'entrée ASGI : la route POST /chat est servie en asynchrone (Motor + google-genai aio),
+toutes les autres routes sont déléguées à l'application Flask, dans un groupe de threads du worker.
+Un seul processus peut ainsi garder des centaines de conversations en attente de Gemini.
+Usage: GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn_config.py asgi:app
+"""
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.cookies import SimpleCookie
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from bson import ObjectId
+from itsdangerous import BadSignature
+from limits import parse
+from motor.motor_asyncio import AsyncIOMotorClient
+from werkzeug.http import dump_cookie
+
+import app as chatbot
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+flask_app = chatbot.app
+
+# Threads des routes déléguées à Flask (créés à la première requête, donc après le fork)
+_wsgi_executor = ThreadPoolExecutor(max_workers=flask_app.config['ASGI_WSGI_THREADS'],
+                                    thread_name_prefix='wsgi')
+
+
+class _WsgiInstance(WsgiToAsgiInstance):
+    """Requête déléguée à Flask, exécutée dans `_wsgi_executor`.
+
+    WsgiToAsgi passe par un `sync_to_async` sensible au thread : toutes les routes déléguées
+    partageraient un seul thread, et un flux /chat_stream bloquerait la connexion, l'historique
+    et les exports du worker jusqu'à sa fin.
+    """
+
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False,
+                                 executor=_wsgi_executor)
+
+
+class _WsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _WsgiInstance(self.wsgi_application)(scope, receive, send)
+
+
+wsgi_app = _WsgiToAsgi(flask_app)
+
+CHAT_RATE_LIMIT = parse("30 per minute")
+
+# Client Motor créé à la première requête, dans la boucle d'événements du worker (après le fork),
+# avec la même taille de groupe et les mêmes délais que le client synchrone
+_motor_client = None
+
+
+def get_database():
+    global _motor_client
+    if _motor_client is None:
+        _motor_client = AsyncIOMotorClient(flask_app.config['MONGO_URI'], event_listeners=metrics.mongo_listeners(),
+                                           **chatbot.mongo_client_options())
+    return _motor_client['chatbot']
+
+
+def get_conversations_collection():
+    return get_database()['conversations']
+
+
+def get_messages_collection():
+    return get_database()['messages']
+
+
+def _load_session(headers):
+    """Décoder le cookie de session Flask (signé) à partir des en-têtes ASGI."""
+    cookie_header = headers.get(b'cookie', b'').decode('latin-1')
+    morsel = SimpleCookie(cookie_header).get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not morsel:
+        return {}
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        return dict(serializer.loads(morsel.value, max_age=max_age))
+    except BadSignature:
+        return {}
+
+
+def _session_cookie(session_data):
+    """En-tête Set-Cookie équivalent à celui produit par Flask pour cette session."""
+    interface = flask_app.session_interface
+    serializer = interface.get_signing_serializer(flask_app)
+    expires = None
+    if session_data.get('_permanent'):
+        expires = datetime.now(timezone.utc) + flask_app.permanent_session_lifetime
+    return dump_cookie(
+        flask_app.config['SESSION_COOKIE_NAME'],
+        serializer.dumps(session_data),
+        expires=expires,
+        path=interface.get_cookie_path(flask_app),
+        domain=interface.get_cookie_domain(flask_app),
+        secure=interface.get_cookie_secure(flask_app),
+        httponly=interface.get_cookie_httponly(flask_app),
+        samesite=interface.get_cookie_samesite(flask_app),
+    )
+
+
+async def _send_response(send, response):
+    """Envoyer une réponse Werkzeug construite hors du cycle WSGI."""
+    chatbot.set_security_headers(response)
+    response.headers.update(chatbot.tracer.response_headers())
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                    for k, v in response.headers.to_wsgi_list()],
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+def _json_response(payload, status=200):
+    return flask_app.response_class(
+        json.dumps(payload, ensure_ascii=False), status=status, mimetype='application/json'
+    )
+
+
+async def _read_body(receive, limit=None):
+    """Corps de la requête, ou None dès qu'il dépasse `limit` octets (MAX_CONTENT_LENGTH, comme Flask)."""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if limit is not None and len(body) > limit:
+            return None
+        if not message.get('more_body'):
+            return body
+
+
+async def _recent_messages(conversation_oid):
+    """Version asynchrone de `app._recent_messages` (collection `messages`)."""
+    limit = chatbot.GEMINI_HISTORY_MESSAGES
+    cursor = get_messages_collection().find({"conversation_id": conversation_oid}, chatbot.MESSAGE_FIELDS)
+    recent = await cursor.sort([(field, -1) for field, _ in chatbot.MESSAGE_SORT]).limit(limit).to_list(limit)
+    return recent[::-1]
+
+
+async def get_gemini_response_async(user_message, conversation_history, user_id=None):
+    """Version asynchrone de `get_gemini_response` (client google-genai `aio`)."""
+    gemini_client = chatbot.gemini_client
+    if not gemini_client:
+        return None
+    if not chatbot.gemini_caller.available():
+        metrics.GEMINI_CALLS.labels('unary', 'circuit_open').inc()
+        return None
+
+    scheduler = chatbot.llm_scheduler
+    ticket = await scheduler.acquire_async(user_id or 'anonyme',
+                                           chatbot.estimate_gemini_tokens(user_message, conversation_history))
+    if not ticket:
+        metrics.GEMINI_CALLS.labels('unary', 'refused').inc()
+        return None
+    tokens = None
+    started = time.perf_counter()
+
+    async def attempt():
+        chat = gemini_client.aio.chats.create(
+            model=chatbot.GEMINI_MODEL,
+            config=chatbot._gemini_config(),
+            history=chatbot._gemini_history(conversation_history)
+        )
+        return await chat.send_message(user_message)
+
+    async def hedge():
+        # Requête doublée comptée comme un appel à part (créneau et jetons), comme _hedged_gemini_call
+        extra = await asyncio.to_thread(scheduler.acquire_hedge, ticket)
+        hedge_tokens = None
+        try:
+            response = await attempt()
+            hedge_tokens = chatbot.gemini_tokens_used(response)
+            return response
+        finally:
+            # Essai perdant annulé : le créneau est rendu quand même
+            await asyncio.shield(asyncio.to_thread(scheduler.release, extra, hedge_tokens))
+
+    try:
+        # Délai maximal, requête doublée au-delà du p95 et disjoncteur partagés avec les routes Flask
+        with chatbot.tracer.span('gemini'):
+            response = await chatbot.gemini_caller.call_async(attempt, hedge)
+        tokens = chatbot.gemini_tokens_used(response)
+        metrics.observe_gemini('unary', started=started)
+        if response.text:
+            metrics.CHAT_ANSWERS.labels('gemini').inc()
+        return response.text
+    except chatbot.CircuitOpen as e:
+        metrics.observe_gemini('unary', e)
+        return None
+    except Exception as e:
+        metrics.observe_gemini('unary', e, started)
+        logger.warning("Erreur Gemini (async) : %s", e)
+        return None
+    finally:
+        # Le budget peut être compté dans MongoDB : hors de la boucle d'événements
+        await asyncio.to_thread(scheduler.release, ticket, tokens)
+
+
+async def _hit_rate_limit(client_ip):
+    """Compter une requête /chat ; faux si la limite est atteinte.
+
+    Un stockage partagé (MongoDB) est interrogé hors de la boucle d'événements ; s'il est
+    injoignable, la requête est laissée passer, comme pour les routes Flask. Avec 'memory://',
+    la limite est propre au worker (voir RATELIMIT_STORAGE_URI dans config.py).
+    """
+    strategy = chatbot.limiter.limiter
+    if flask_app.config['RATELIMIT_STORAGE_URI'].startswith('memory://'):
+        return strategy.hit(CHAT_RATE_LIMIT, 'asgi_chat', client_ip)
+    try:
+        return await asyncio.to_thread(strategy.hit, CHAT_RATE_LIMIT, 'asgi_chat', client_ip)
+    except Exception as e:
+        logger.warning("Stockage du rate limiter indisponible : %s", e)
+        return True
+
+
+async def chat(scope, receive, send):
+    """Équivalent asynchrone de la route Flask `chat`."""
+    headers = dict(scope.get('headers', []))
+    session_data = _load_session(headers)
+    if 'user_id' not in session_data:
+        response = flask_app.response_class(status=302)
+        response.headers['Location'] = '/login'
+        return await _send_response(send, response)
+
+    client_ip = (scope.get('client') or ('127.0.0.1', 0))[0]
+    if chatbot.limiter.enabled and not await _hit_rate_limit(client_ip):
+        metrics.RATE_LIMITED.labels('/chat').inc()
+        return await _send_response(send, _json_response({"error": "Trop de requêtes"}, 429))
+
+    body = await _read_body(receive, flask_app.config['MAX_CONTENT_LENGTH'])
+    if body is None:
+        return await _send_response(send, _json_response({"error": "Requête trop volumineuse"}, 413))
+    try:
+        data = json.loads(body or b'null')
+    except ValueError:
+        data = None
+    user_message, error = chatbot._validate_chat_message(data if isinstance(data, dict) else None)
+    if error:
+        return await _send_response(send, _json_response({"error": error}, 400))
+
+    started = time.perf_counter()
+    now = datetime.now()
+    conversations = get_conversations_collection()
+    conversation_id = session_data.get('conversation_id')
+    conversation_history = []
+    session_modified = False
+
+    # Récupérer la conversation existante si elle existe (Motor ne propage pas le contexte
+    # de la trace à ses threads : les commandes sont couvertes par un span explicite)
+    if conversation_id:
+        try:
+            with chatbot.tracer.span('history.load'):
+                oid = ObjectId(conversation_id)
+                existing = await conversations.find_one(
+                    {"_id": oid},
+                    {"user_id": 1, "messages": {"$slice": -chatbot.GEMINI_HISTORY_MESSAGES}}
+                )
+                if existing and existing.get("user_id") == session_data.get('user_id'):
+                    conversation_history = existing.get("messages", [])
+                    if chatbot._separate_messages():
+                        conversation_history = (conversation_history + await _recent_messages(oid))[-chatbot.GEMINI_HISTORY_MESSAGES:]
+        except Exception:
+            session_data.pop('conversation_id', None)
+            conversation_id = None
+            session_modified = True
+
+    # Générer la réponse : cache, Gemini puis fallback local (SpaCy hors de la boucle)
+    response_message = await asyncio.to_thread(chatbot.get_cached_answer, user_message, conversation_history)
+    if not response_message:
+        response_message = await get_gemini_response_async(user_message, conversation_history,
+                                                           session_data.get('user_id'))
+        if response_message:
+            await asyncio.to_thread(chatbot.cache_answer, user_message, conversation_history, response_message)
+        else:
+            response_message = await asyncio.to_thread(chatbot.get_fallback_response, user_message)
+
+    messages = chatbot._build_chat_messages(session_data.get('username', 'Inconnu'), user_message, response_message, now)
+
+    if conversation_id:
+        with chatbot.tracer.span('history.append'):
+            oid = ObjectId(conversation_id)
+            if chatbot._separate_messages():
+                await get_messages_collection().insert_many(chatbot._message_documents(oid, messages))
+            await conversations.update_one({"_id": oid}, chatbot._append_messages_update(messages, now))
+    else:
+        with chatbot.tracer.span('history.create'):
+            result = await conversations.insert_one(
+                chatbot._new_conversation_document(session_data.get('user_id'), user_message, now, messages)
+            )
+            if chatbot._separate_messages():
+                await get_messages_collection().insert_many(chatbot._message_documents(result.inserted_id, messages))
+        chatbot.history_counts.pop(session_data.get('user_id'))
+        session_data['conversation_id'] = str(result.inserted_id)
+        session_modified = True
+
+    await asyncio.to_thread(chatbot._record_chat_stats, now, not conversation_id)
+
+    response = _json_response({"message": response_message})
+    if session_modified:
+        response.headers['Set-Cookie'] = _session_cookie(session_data)
+    logger.info("Réponse /chat (async) prête en %.0f ms", (time.perf_counter() - started) * 1000)
+    await _send_response(send, response)
+
+
+async def _timed_chat(scope, receive, send):
+    """Servir `chat` en mesurant et traçant sa durée comme les routes Flask (metrics.py, tracing.py)."""
+    started = time.perf_counter()
+    status = []
+    headers = dict(scope.get('headers', []))
+    debug = bool(headers.get(tracing.DEBUG_HEADER.lower().encode('latin-1'))) and (
+        flask_app.debug or chatbot.is_admin(
+            await asyncio.to_thread(chatbot._load_user, _load_session(headers).get('user_id'))))
+    trace = chatbot.tracer.start('POST /chat', (headers.get(b'x-request-id') or b'').decode('latin-1'),
+                                 (headers.get(b'traceparent') or b'').decode('latin-1'), debug=debug,
+                                 method='POST', route='/chat')
+
+    async def send_and_record_status(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        await send(message)
+
+    error = None
+    try:
+        await chat(scope, receive, send_and_record_status)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        chatbot.tracer.finish(trace, error)
+        metrics.HTTP_REQUEST_DURATION.labels('POST', '/chat', status[0] if status else 500).observe(
+            time.perf_counter() - started)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await asyncio.to_thread(chatbot.init_indexes)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] == 'http' and scope['path'] == '/chat' and scope['method'] == 'POST':
+        return await _timed_chat(scope, receive, send)
+    return await wsgi_app(scope, receive, send)
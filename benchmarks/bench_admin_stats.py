@@ -0,0 +1,79 @@
+"""
+Benchmark du panel d'administration : durée de lecture des totaux selon la taille des collections,
+count_documents à chaque affichage (ancienne méthode) contre compteurs tenus à jour (stats.py),
+et coût d'une réconciliation complète.
+Utilise MONGO_URI si un serveur répond, sinon mongomock (chiffres indicatifs seulement).
+Usage: python -m benchmarks.bench_admin_stats [--sizes 1000 10000 100000] [--repeat 20]
+"""
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime
+
+from benchmarks.bench_message_storage import connect
+from stats import StatsCounters
+
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+COLLECTIONS = ('bench_users', 'bench_conversations', 'bench_reminders', 'bench_stats')
+
+
+def seed(db, size):
+    """`size` utilisateurs (90 % confirmés), autant de conversations et un rappel pour dix utilisateurs."""
+    for name in COLLECTIONS:
+        db[name].drop()
+    db.bench_users.insert_many([{"username": f"u{i}", "confirmed": i % 10 != 0} for i in range(size)])
+    db.bench_conversations.insert_many([{"title": f"c{i}"} for i in range(size)])
+    db.bench_reminders.insert_many([{"name": f"r{i}"} for i in range(size // 10)])
+
+
+def count_on_read(db):
+    """Ancienne méthode : quatre comptages à chaque affichage."""
+    return {"users": db.bench_users.count_documents({}),
+            "users_confirmed": db.bench_users.count_documents({"confirmed": True}),
+            "conversations": db.bench_conversations.count_documents({}),
+            "reminders": db.bench_reminders.count_documents({})}
+
+
+def timed(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    db, backend = connect(os.environ['MONGO_URI'])
+    print(f"base : {backend}\n")
+    print(f"{'documents':>10}{'comptages':>14}{'compteurs':>14}{'série 30 j':>14}{'réconciliation':>16}")
+    try:
+        for size in args.sizes:
+            seed(db, size)
+            counters = StatsCounters(db.bench_stats, {
+                "users": (db.bench_users, {}),
+                "users_confirmed": (db.bench_users, {"confirmed": True}),
+                "conversations": (db.bench_conversations, {}),
+                "reminders": (db.bench_reminders, {}),
+            })
+            now = datetime.now()
+            reconcile_ms = timed(lambda: counters.reconcile(now), 1)
+            assert counters.totals(now) == count_on_read(db)
+            old_ms = timed(lambda: count_on_read(db), args.repeat)
+            new_ms = timed(lambda: counters.totals(now), args.repeat)
+            daily_ms = timed(lambda: counters.daily(now.date()), args.repeat)
+            print(f"{size:>10}{old_ms:>12.2f}ms{new_ms:>12.2f}ms{daily_ms:>12.2f}ms{reconcile_ms:>14.1f}ms")
+    finally:
+        for name in COLLECTIONS:
+            db[name].drop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark du cache sémantique des réponses : latence p50 et nombre d'appels Gemini
+sur un flux de questions fréquentes (distribution de Zipf, avec reformulations).
+Usage: python -m benchmarks.bench_answer_cache [--questions 500] [--latency 0.8]
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from unittest.mock import patch
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+# Tous les tours sont envoyés à Gemini : pas de budget de jetons (llm_scheduler.py)
+os.environ.setdefault('LLM_USER_TOKEN_BUDGET', '')
+
+from tests.fakes import FakeGeminiClient  # noqa: E402
+
+# Questions fréquentes et leurs reformulations, de la plus à la moins demandée
+TOP_QUESTIONS = [
+    ["Quels sont les signes de danger pendant la grossesse ?",
+     "quels sont les signes de danger pendant la grossesse",
+     "Signes de danger pendant la grossesse ?"],
+    ["Quelle alimentation pendant la grossesse ?",
+     "alimentation pendant la grossesse",
+     "Alimentation pendant la grossesse ?"],
+    ["Quand faire vacciner mon bébé ?", "quand faire vacciner mon bébé"],
+    ["Comment bien allaiter mon bébé ?", "comment bien allaiter mon bébé ?!"],
+    ["Quels exercices pendant la grossesse ?", "exercices pendant la grossesse"],
+    ["Quand commencer les aliments solides ?", "quand commencer les aliments solides"],
+]
+
+
+def workload(count, seed=42):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(TOP_QUESTIONS))]
+    for _ in range(count):
+        variants = rng.choices(TOP_QUESTIONS, weights=weights)[0]
+        yield rng.choice(variants)
+
+
+def run(chatbot, questions):
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        answer = chatbot.get_cached_answer(question, [])
+        if not answer:
+            answer = chatbot.get_gemini_response(question, [])
+            chatbot.cache_answer(question, [], answer)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.8, help="latence simulée de Gemini (s)")
+    args = parser.parse_args()
+
+    import app as chatbot
+    chatbot.logger.disabled = True
+
+    print(f"{'cache':<8}{'p50':>10}{'p95':>10}{'appels Gemini':>16}")
+    for enabled in (False, True):
+        chatbot.answer_cache.clear()
+        chatbot.app.config['ANSWER_CACHE_ENABLED'] = enabled
+        fake = FakeGeminiClient(first_chunk_delay=args.latency)
+        with patch.object(chatbot, 'gemini_client', fake):
+            latencies = run(chatbot, workload(args.questions))
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        print(f"{'oui' if enabled else 'non':<8}{statistics.median(latencies):>8.1f}ms{p95:>8.1f}ms{len(fake.sent_messages):>16}")
+    print("statistiques du cache :", chatbot.answer_cache.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark du temps jusqu'au premier octet (TTFB) : /chat (bloquant) vs /chat_stream (SSE).
+Gemini est remplacé par un faux client qui simule la latence de génération.
+Usage: python -m benchmarks.bench_chat_ttfb [--runs 10] [--first-chunk-delay 0.3] [--chunk-delay 0.05]
+"""
+import argparse
+import os
+import statistics
+import time
+from unittest.mock import MagicMock, patch
+
+from bson import ObjectId
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+# Tous les tours sont envoyés à Gemini : pas de budget de jetons (llm_scheduler.py)
+os.environ.setdefault('LLM_USER_TOKEN_BUDGET', '')
+
+from tests.fakes import FakeGeminiClient  # noqa: E402
+
+
+def measure(client, path, runs):
+    """Retourne les TTFB et durées totales (ms) de `runs` requêtes sur `path`."""
+    ttfb, total = [], []
+    for _ in range(runs):
+        with client.session_transaction() as sess:
+            sess['user_id'] = str(ObjectId())
+            sess['username'] = 'bench'
+        started = time.perf_counter()
+        response = client.post(path, json={'message': 'Quels sont les signes de danger ?'}, buffered=False)
+        first = None
+        for chunk in response.response:
+            if first is None and chunk:
+                first = time.perf_counter()
+        end = time.perf_counter()
+        response.close()
+        ttfb.append(((first or end) - started) * 1000)
+        total.append((end - started) * 1000)
+    return ttfb, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--first-chunk-delay', type=float, default=0.3)
+    parser.add_argument('--chunk-delay', type=float, default=0.05)
+    args = parser.parse_args()
+
+    import app as app_module
+
+    fake = FakeGeminiClient(
+        reply="Les signes de danger incluent les saignements et la fièvre. " * 4,
+        chunk_size=20,
+        first_chunk_delay=args.first_chunk_delay,
+        chunk_delay=args.chunk_delay,
+    )
+    conversations = MagicMock()
+    conversations.insert_one.return_value.inserted_id = ObjectId()
+    app_module.limiter.enabled = False
+
+    with patch.object(app_module, 'gemini_client', fake), \
+         patch.object(app_module, 'conversations_collection', conversations):
+        client = app_module.app.test_client()
+        print(f"{'endpoint':<14}{'TTFB p50':>12}{'TTFB max':>12}{'total p50':>12}")
+        for path in ('/chat', '/chat_stream'):
+            ttfb, total = measure(client, path, args.runs)
+            print(f"{path:<14}{statistics.median(ttfb):>10.0f}ms{max(ttfb):>10.0f}ms{statistics.median(total):>10.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
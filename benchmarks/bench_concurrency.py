@@ -0,0 +1,124 @@
+"""
+Benchmark de débit des conversations simultanées : WSGI (gthread) vs ASGI (asgi:app).
+Gemini est simulé avec une latence fixe et MongoDB par des collections en mémoire,
+pour mesurer uniquement la capacité du modèle d'exécution à garder des appels en vol.
+Mesure /chat (servi en asynchrone par asgi.py) et /chat_stream (délégué à Flask, utilisé par
+la page de chat), puis le temps de réponse d'autres pages (/login) pendant les flux.
+Usage: python -m benchmarks.bench_concurrency [--chats 200] [--latency 1.0] [--threads 4] [--pages 20]
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from bson import ObjectId
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+# Mesure du modèle d'exécution seul : ni budget de jetons ni plafond d'appels Gemini
+os.environ.setdefault('LLM_USER_TOKEN_BUDGET', '')
+os.environ.setdefault('LLM_MAX_IN_FLIGHT', '100000')
+# Même question pour toutes les conversations : le cache sémantique répondrait à la place de Gemini
+os.environ.setdefault('ANSWER_CACHE_ENABLED', 'False')
+
+from tests.fakes import FakeGeminiClient  # noqa: E402
+
+
+def run_wsgi(chatbot, chats, threads, path='/chat', pages=0):
+    """Simule un déploiement gthread : `threads` requêtes au plus en parallèle.
+
+    Retourne les statuts des conversations et les durées (s) des `pages` requêtes GET /login
+    envoyées pendant qu'elles sont en cours.
+    """
+    def one_chat(_):
+        client = chatbot.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = str(ObjectId())
+            sess['username'] = 'bench'
+        response = client.post(path, json={'message': 'Bonjour'})
+        response.get_data()
+        return response.status_code
+
+    def one_page(submitted):
+        # Durée mesurée depuis l'envoi : l'attente d'un thread libre est comprise
+        chatbot.app.test_client().get('/login')
+        return time.perf_counter() - submitted
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        chat_results = pool.map(one_chat, range(chats))
+        page_results = [pool.submit(one_page, time.perf_counter()) for _ in range(pages)]
+        return list(chat_results), [future.result() for future in page_results]
+
+
+def run_asgi(asgi, chats, path='/chat', pages=0):
+    """Toutes les conversations sont lancées en même temps sur un seul processus (voir run_wsgi)."""
+    import httpx
+
+    flask_app = asgi.flask_app
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+    async def one_chat(client):
+        cookies = {flask_app.config['SESSION_COOKIE_NAME']: serializer.dumps(
+            {'user_id': str(ObjectId()), 'username': 'bench'})}
+        response = await client.post(path, json={'message': 'Bonjour'}, cookies=cookies)
+        return response.status_code
+
+    async def one_page(client):
+        # Laisser les conversations démarrer avant de demander la page
+        await asyncio.sleep(0.1)
+        started = time.perf_counter()
+        await client.get('/login')
+        return time.perf_counter() - started
+
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+            results = await asyncio.gather(*(one_chat(client) for _ in range(chats)),
+                                           *(one_page(client) for _ in range(pages)))
+        return list(results[:chats]), list(results[chats:])
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chats', type=int, default=200, help="nombre de conversations simultanées")
+    parser.add_argument('--latency', type=float, default=1.0, help="latence simulée de Gemini (s)")
+    parser.add_argument('--threads', type=int, default=4, help="threads WSGI (workers x threads)")
+    parser.add_argument('--pages', type=int, default=20, help="requêtes GET /login pendant les conversations")
+    args = parser.parse_args()
+
+    import app as chatbot
+    import asgi
+
+    chatbot.limiter.enabled = False
+    fake = FakeGeminiClient(first_chunk_delay=args.latency)
+
+    sync_conversations = MagicMock()
+    sync_conversations.insert_one.return_value.inserted_id = ObjectId()
+    async_conversations = MagicMock()
+    async_conversations.find_one = AsyncMock(return_value=None)
+    async_conversations.update_one = AsyncMock()
+    async_conversations.insert_one = AsyncMock(return_value=MagicMock(inserted_id=ObjectId()))
+
+    with patch.object(chatbot, 'gemini_client', fake), \
+         patch.object(chatbot, 'conversations_collection', sync_conversations), \
+         patch.object(chatbot.stats_counters, 'collection', MagicMock()), \
+         patch.object(asgi, 'get_conversations_collection', return_value=async_conversations):
+        print(f"{'mode':<8}{'route':<14}{'chats':>8}{'durée':>10}{'chats/s':>10}{'/login max':>12}")
+        for path in ('/chat', '/chat_stream'):
+            for mode in ('wsgi', 'asgi'):
+                started = time.perf_counter()
+                if mode == 'wsgi':
+                    statuses, pages = run_wsgi(chatbot, args.chats, args.threads, path, args.pages)
+                else:
+                    statuses, pages = run_asgi(asgi, args.chats, path, args.pages)
+                elapsed = time.perf_counter() - started
+                assert all(status == 200 for status in statuses), statuses
+                slowest = f"{max(pages) * 1000:.0f} ms" if pages else "-"
+                print(f"{mode:<8}{path:<14}{args.chats:>8}{elapsed:>9.1f}s{args.chats / elapsed:>10.1f}{slowest:>12}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark des exports : pic de mémoire Python (tracemalloc) et durée de l'export texte d'une
+conversation selon sa longueur, document complet chargé puis fichier construit en mémoire
+(ancienne méthode) contre lecture par lots et envoi en flux, puis archive ZIP de toutes les
+conversations d'un utilisateur et rendu PDF dans le thread de la requête ou le groupe de processus.
+Utilise MONGO_URI si un serveur répond, sinon mongomock (chiffres indicatifs seulement ;
+le groupe de processus PDF n'est mesuré qu'avec un serveur).
+Usage: python -m benchmarks.bench_exports [--lengths 100 1000 10000] [--batch-size 200]
+"""
+import argparse
+import io
+import os
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.bench_message_storage import BOT_TEXT, connect
+from exports import PdfRenderer, file_chunks, iter_messages, text_chunks, zip_stream
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+
+def seed(db, length, user_id='bench-user'):
+    start = datetime(2024, 1, 1)
+    messages = [{"user": "Bot" if i % 2 else "bench", "text": BOT_TEXT if i % 2 else f"Question {i}",
+                 "timestamp": start + timedelta(minutes=i)} for i in range(length)]
+    return db.conversations.insert_one({"title": f"Conversation de {length} messages", "date": start,
+                                        "user_id": user_id, "messages": messages}).inserted_id
+
+
+def export_in_memory(db, oid):
+    """Ancienne méthode : document complet chargé, fichier construit dans un StringIO."""
+    chat = db.conversations.find_one({"_id": oid})
+    output = io.StringIO()
+    output.write(f"{'='*50}\n  {chat['title']}\n  Date: {chat['date']:%Y-%m-%d %H:%M}\n{'='*50}\n\n")
+    for msg in chat["messages"]:
+        output.write(f"[{msg['timestamp']:%H:%M}] {msg['user']}:\n{msg['text']}\n\n")
+    return len(output.getvalue().encode('utf-8'))
+
+
+def export_streamed(db, oid, batch_size):
+    chat = db.conversations.find_one({"_id": oid}, {"title": 1, "date": 1})
+    messages = iter_messages(db.conversations, db.messages, oid, False, batch_size)
+    return sum(len(chunk) for chunk in text_chunks(chat, messages))
+
+
+def measured(function, *args):
+    """Durée (ms), pic de mémoire allouée (Ko) et résultat d'un appel."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = function(*args)
+    elapsed = (time.perf_counter() - started) * 1000
+    peak = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lengths', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--pdf-workers', type=int, default=2)
+    args = parser.parse_args()
+
+    db, backend = connect(os.environ['MONGO_URI'])
+    print(f"base : {backend}\n")
+    ids = []
+    try:
+        print(f"{'messages':>9}{'taille':>10}{'en mémoire':>22}{'en flux':>22}")
+        for length in args.lengths:
+            oid = seed(db, length)
+            ids.append(oid)
+            old_ms, old_peak, size = measured(export_in_memory, db, oid)
+            new_ms, new_peak, _ = measured(export_streamed, db, oid, args.batch_size)
+            print(f"{length:>9}{size / 1024:>8.0f}Ko{old_ms:>9.1f}ms{old_peak:>9.0f}Ko"
+                  f"{new_ms:>9.1f}ms{new_peak:>9.0f}Ko")
+
+        def archive():
+            chats = db.conversations.find({"user_id": 'bench-user'}, {"title": 1, "date": 1})
+            entries = ((f"conversation_{c['_id']}.txt", c['date'],
+                        text_chunks(c, iter_messages(db.conversations, db.messages, c['_id'], False,
+                                                     args.batch_size)))
+                       for c in chats.batch_size(args.batch_size))
+            return sum(len(chunk) for chunk in zip_stream(entries))
+
+        zip_ms, zip_peak, zip_size = measured(archive)
+        print(f"\nZIP des {len(ids)} conversations : {zip_size / 1024:.0f} Ko en {zip_ms:.0f} ms, "
+              f"pic {zip_peak:.0f} Ko")
+
+        # Mise en page fpdf2 coûteuse en CPU (et très ralentie par tracemalloc) : durée seule
+        chat = db.conversations.find_one({"_id": ids[0]}, {"title": 1, "date": 1})
+        inline = PdfRenderer(os.environ['MONGO_URI'], database=db.name, workers=0, batch_size=args.batch_size)
+        started = time.perf_counter()
+        path = inline.render(chat, False, iter_messages(db.conversations, db.messages, chat['_id'], False))
+        pdf_ms = (time.perf_counter() - started) * 1000
+        pdf_size = sum(len(chunk) for chunk in file_chunks(path))
+        print(f"PDF de {args.lengths[0]} messages ({pdf_size / 1024:.0f} Ko) dans le thread : {pdf_ms:.0f} ms")
+        if backend != 'mongomock':
+            pool = PdfRenderer(os.environ['MONGO_URI'], database=db.name, workers=args.pdf_workers,
+                               batch_size=args.batch_size)
+            os.remove(pool.render(chat, False, None))  # démarrage des processus
+            pool_ms, pool_peak, path = measured(pool.render, chat, False, None)
+            os.remove(path)
+            pool.shutdown()
+            print(f"PDF dans le groupe de processus : {pool_ms:.0f} ms, pic {pool_peak:.0f} Ko dans le worker")
+    finally:
+        db.conversations.delete_many({"_id": {"$in": ids}})
+
+
+if __name__ == '__main__':
+    main()
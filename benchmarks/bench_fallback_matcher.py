@@ -0,0 +1,103 @@
+"""
+Micro-benchmark du mode fallback : table d'intentions construite à l'import vs
+recherche séquentielle des mots-clés dans des listes reconstruites à chaque appel
+(implémentation précédente, reproduite ci-dessous pour comparaison).
+Vérifie aussi que les deux implémentations donnent les mêmes réponses.
+Usage: python -m benchmarks.bench_fallback_matcher [--repeat 20000]
+"""
+import argparse
+import os
+import timeit
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+MESSAGES = [
+    "Bonjour, je suis enceinte de 20 semaines, quels sont les symptômes normaux ?",
+    "Quelle alimentation du bébé après la naissance ?",
+    "Je voudrais des conseils pour l'alimentation équilibrée de mes enfants",
+    "Est-ce que le yoga prénatal est conseillé ?",
+    "Quels sont les signes de danger ?",
+    "Mon bébé a 6 mois, que faire ?",
+    "Je suis au deuxième trimestre",
+    "Quel est l'âge de l'enfant pour les vaccins ?",
+    "Il fait chaud aujourd'hui à Ouagadougou et je me sens un peu fatiguée depuis ce matin.",
+    "Les soins du nouveau-né et l'allaitement",
+    # Messages longs (limite de 2000 caractères) : mot-clé en fin de message ou absent
+    ("Je me sens fatiguée depuis quelques jours et je voudrais savoir " * 30)[:1950] + " signes de danger",
+    ("Je me sens fatiguée depuis quelques jours et je voudrais savoir " * 30)[:1950],
+]
+
+
+def legacy_handle_user_message(user_data, message):
+    """Implémentation précédente : listes reconstruites et balayées à chaque appel."""
+    message_lower = message.lower()
+    pregnancy_keywords = [
+        "symptômes", "alimentation", "exercices",
+        "signes de danger", "soins prénatals", "soins postnataux",
+        "visites médicales", "nutriments", "yoga prénatal",
+        "visites prénatales", "tests de dépistage", "préparations pour l'accouchement",
+        "soins du nouveau-né", "allaitement", "alimentation du bébé", "reprise après l'accouchement",
+        "nutrition des enfants", "aliments solides", "alimentation équilibrée"
+    ]
+    personalized_suggestions_keywords = [
+        "trimestre", "âge de l'enfant", "âge", "nouveau-né", "bébé", "enfant"
+    ]
+    if any(keyword in message_lower for keyword in pregnancy_keywords):
+        return legacy_pregnancy_info(user_data, message_lower)
+    if any(keyword in message_lower for keyword in personalized_suggestions_keywords):
+        return legacy_personalized_suggestions(user_data, message_lower)
+    return "inconnu"
+
+
+def legacy_pregnancy_info(user_data, message):
+    weeks_pregnant = user_data.get('weeks_pregnant', None)
+    ordered = [
+        ("symptômes", "symptomes"), ("alimentation équilibrée", "alimentation_equilibree"),
+        ("alimentation du bébé", "alimentation_bebe"), ("alimentation", "alimentation"),
+        ("exercices", "exercices"), ("tests de dépistage", "tests_depistage"),
+        ("préparations pour l'accouchement", "preparation_accouchement"),
+        ("soins prénatals", "soins_prenatals"), ("visites prénatales", "soins_prenatals"),
+        ("soins postnataux", "soins_postnataux"), ("soins du nouveau-né", "soins_nouveau_ne"),
+        ("allaitement", "allaitement"), ("reprise après l'accouchement", "reprise_accouchement"),
+        ("nutrition des enfants", "nutrition_enfants"), ("aliments solides", "aliments_solides"),
+        ("signes de danger", "signes_danger"),
+    ]
+    for keyword, intent in ordered:
+        if keyword in message:
+            return (intent, weeks_pregnant) if intent == "symptomes" else intent
+    return "grossesse"
+
+
+def legacy_personalized_suggestions(user_data, message):
+    weeks_pregnant = user_data.get('weeks_pregnant', 0)
+    if "trimestre" in message:
+        return ("trimestre", weeks_pregnant)
+    for keyword, intent in (("nouveau-né", "nouveau_ne"), ("bébé", "bebe"), ("enfant", "enfant")):
+        if keyword in message:
+            return intent
+    return "suggestions"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20000)
+    args = parser.parse_args()
+
+    import app as chatbot
+
+    # Équivalence des intentions détectées
+    for message in MESSAGES:
+        legacy = legacy_handle_user_message({}, message)
+        legacy_intent = legacy[0] if isinstance(legacy, tuple) else legacy
+        assert chatbot.detect_intent(message.lower()) == legacy_intent, message
+
+    calls = args.repeat * len(MESSAGES)
+    for label, function in (("séquentiel (avant)", legacy_handle_user_message),
+                            ("table d'intentions", chatbot.handle_user_message)):
+        elapsed = timeit.timeit(lambda: [function({}, m) for m in MESSAGES], number=args.repeat)
+        print(f"{label:<22}{elapsed / calls * 1e6:>8.2f} µs/message")
+
+
+if __name__ == '__main__':
+    main()
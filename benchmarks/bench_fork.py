@@ -0,0 +1,132 @@
+"""
+Test de résistance au fork : gunicorn (preload_app) avec plusieurs workers recyclés très souvent
+(--max-requests), pendant que des utilisateurs simulés enchaînent GET /get_history. Chaque worker
+ouvre son propre client MongoDB après le fork (init_mongo) : aucune requête ne doit échouer ni rester
+bloquée, et le journal ne doit contenir aucun avertissement « MongoClient opened before fork ».
+Affiche débit, latences, requêtes lentes, workers démarrés et attente des connexions MongoDB (/metrics).
+Usage: python -m benchmarks.bench_fork [--workers 4] [--threads 4] [--users 40] [--duration 20]
+       [--max-requests 200] [--pool-size 5] [--mongo mongodb://localhost:27017|mongomock]
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+import requests
+
+from benchmarks.bench_load import ROOT, cleanup, drive, free_port, report, seed, summarize, wait_ready
+
+FORK_WARNING = 'opened before fork'
+
+
+def pool_checkouts(base_url):
+    """Attentes de connexion MongoDB de tous les workers, par résultat : (nombre, durée moyenne en ms)."""
+    try:
+        from prometheus_client.parser import text_string_to_metric_families
+    except ImportError:
+        return {}
+    response = requests.get(f"{base_url}/metrics", timeout=5)
+    if response.status_code != 200:
+        return {}
+    totals = {}
+    for family in text_string_to_metric_families(response.text):
+        if family.name != 'mongodb_pool_checkout_seconds':
+            continue
+        for sample in family.samples:
+            outcome = sample.labels.get('outcome')
+            if sample.name.endswith('_count'):
+                totals.setdefault(outcome, [0, 0.0])[0] += sample.value
+            elif sample.name.endswith('_sum'):
+                totals.setdefault(outcome, [0, 0.0])[1] += sample.value
+    return {outcome: (int(count), total / count * 1000 if count else 0.0) for outcome, (count, total) in totals.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--users', type=int, default=40, help="utilisateurs simulés (un compte chacun)")
+    parser.add_argument('--conversations', type=int, default=20, help="conversations par utilisateur")
+    parser.add_argument('--length', type=int, default=10, help="messages par conversation")
+    parser.add_argument('--duration', type=float, default=20, help="durée mesurée (s)")
+    parser.add_argument('--warmup', type=float, default=3, help="échauffement non mesuré (s)")
+    parser.add_argument('--max-requests', type=int, default=200, help="requêtes avant le recyclage d'un worker")
+    parser.add_argument('--pool-size', type=int, default=5, help="MONGO_MAX_POOL_SIZE par worker")
+    parser.add_argument('--slow-ms', type=float, default=2000, help="seuil d'une requête bloquée (ms)")
+    parser.add_argument('--mongo', default='mongodb://localhost:27017', help="URI d'un mongod de test ou 'mongomock'")
+    args = parser.parse_args()
+    # Attributs lus par bench_load.drive
+    args.chat_turns, args.think_time = 1, 0.0
+
+    os.environ.update({
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'loadtest-secret-key'),
+        'MONGO_URI': args.mongo if args.mongo != 'mongomock' else 'mongodb://localhost:27017',
+        'LOADTEST_USERS': str(args.users),
+        'LOADTEST_CONVERSATIONS': str(args.conversations),
+        'LOADTEST_LENGTH': str(args.length),
+    })
+    db = None
+    if args.mongo != 'mongomock':
+        import app as chatbot
+        db = chatbot.db
+        cleanup(db, args.users)
+        seed(db, args.users, args.conversations, args.length)
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as prometheus_dir, \
+         tempfile.NamedTemporaryFile('w+', suffix='.log', delete=False) as log:
+        env = dict(
+            os.environ, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS=str(args.workers),
+            GUNICORN_THREADS=str(args.threads), GUNICORN_ACCESS_LOG=os.devnull, GUNICORN_LOG_LEVEL='info',
+            PROMETHEUS_MULTIPROC_DIR=prometheus_dir, MONGO_MAX_POOL_SIZE=str(args.pool_size),
+            RATELIMIT_ENABLED='False', REMINDER_SCHEDULER_ENABLED='False', NOTIFICATION_TRANSPORT='fake',
+            SPACY_PRELOAD='False',
+        )
+        entry = 'wsgi:app'
+        if args.mongo == 'mongomock':
+            entry, env['ANALYTICS_INTERVAL'] = 'benchmarks.load_app:app', '0'
+        process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py',
+                                    '--max-requests', str(args.max_requests), '--max-requests-jitter', '20', entry],
+                                   cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            if not wait_ready(base_url, process):
+                log.seek(0)
+                raise SystemExit(f"gunicorn n'a pas démarré :\n{log.read()[-3000:]}")
+            results = drive(base_url, args, {'history': 1})
+            checkouts = pool_checkouts(base_url)
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        log.seek(0)
+        journal = log.read()
+    if db is not None:
+        cleanup(db, args.users)
+
+    summary = summarize(results, args.duration)
+    report(summary)
+    samples = results['history']
+    # 599 : connexion gardée ouverte par le client et fermée par un worker recyclé (rien à voir avec MongoDB)
+    reset = sum(1 for status, _ in samples if status == 599)
+    failed = sum(1 for status, _ in samples if 400 <= status < 599)
+    slow = sum(1 for _, ms in samples if ms >= args.slow_ms)
+    booted = journal.count('Booting worker')
+    warnings = journal.count(FORK_WARNING)
+    print(f"\nworkers démarrés : {booted} ({args.workers} au départ, recyclés toutes les ~{args.max_requests} "
+          f"requêtes)\nrequêtes en échec : {failed}, connexions coupées au recyclage : {reset}, "
+          f"au-delà de {args.slow_ms:.0f} ms : {slow}, avertissements de fork PyMongo : {warnings}")
+    for outcome, (count, mean_ms) in sorted(checkouts.items()):
+        print(f"connexions MongoDB prises ({outcome}) : {count}, attente moyenne {mean_ms:.2f} ms")
+    print(f"journal gunicorn : {log.name}")
+    if failed or slow or warnings:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark des appels Gemini face à un service dégradé (faux client à pannes injectées) :
+quelques appels très lents, quelques erreurs, et une panne totale (appels bloqués) au milieu
+de la série, à débit de requêtes constant. Compare l'appel direct (sans timeout) au délai
+maximal, au hedging et au disjoncteur : latence de la réponse (Gemini ou fallback) et part des
+réponses venues de Gemini. Comme dans app.py, le timeout HTTP du client vaut le délai maximal.
+Usage: python -m benchmarks.bench_gemini_resilience [--requests 1000] [--rate 100] [--deadline 0.5]
+"""
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+# Tous les tours sont envoyés à Gemini : pas de budget de jetons (llm_scheduler.py)
+os.environ.setdefault('LLM_USER_TOKEN_BUDGET', '')
+os.environ.setdefault('LLM_MAX_IN_FLIGHT', '100000')
+
+from resilience import CircuitBreaker, ResilientCaller  # noqa: E402
+from tests.fakes import FlakyGeminiClient  # noqa: E402
+
+
+def run(chatbot, caller, args, timeout):
+    """Requêtes envoyées à débit fixe (`--rate` par seconde), quelle que soit la durée des précédentes."""
+    fake = FlakyGeminiClient(latency=args.latency, slow_rate=args.slow_rate, slow_delay=args.slow_delay,
+                             error_rate=args.error_rate, seed=42, timeout=timeout)
+    duration = args.requests / args.rate
+    # Panne totale pendant 20 % de la série, au milieu
+    outage = (0.4 * duration, 0.6 * duration)
+    begin = time.perf_counter()
+
+    def one(i):
+        time.sleep(max(0.0, begin + i / args.rate - time.perf_counter()))
+        started = time.perf_counter()
+        in_outage = outage[0] <= started - begin < outage[1]
+        fake.outage = 'hang' if in_outage else None
+        answer = chatbot.get_gemini_response("Quels vaccins pour mon bébé ?", [], user_id=f"u{i}")
+        if answer is None:
+            chatbot.get_fallback_response("Quels vaccins pour mon bébé ?")
+        return in_outage, answer is not None, (time.perf_counter() - started) * 1000
+
+    with patch.object(chatbot, 'gemini_client', fake), \
+         patch.object(chatbot, 'gemini_caller', caller), \
+         patch.object(chatbot, 'get_fallback_response', return_value="Réponse locale"):
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            return list(pool.map(one, range(args.requests)))
+
+
+def report(label, results, caller):
+    latencies = [ms for _, _, ms in results]
+    normal = [ms for in_outage, _, ms in results if not in_outage]
+    outage = [ms for in_outage, _, ms in results if in_outage]
+    cuts = statistics.quantiles(latencies, n=100)
+    answered = sum(1 for _, ok, _ in results if ok)
+    stats = caller.stats()
+    print(f"{label:<30}{statistics.median(latencies):>6.0f}ms{cuts[94]:>7.0f}ms{cuts[98]:>7.0f}ms"
+          f"{statistics.quantiles(normal, n=100)[98]:>12.0f}ms{statistics.median(outage):>11.0f}ms"
+          f"{100 * answered / len(results):>8.0f}%"
+          f"{stats['hedged']:>9}{stats['short_circuited']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=100, help="requêtes par seconde")
+    parser.add_argument('--threads', type=int, default=256, help="requêtes simultanées au plus")
+    parser.add_argument('--latency', type=float, default=0.05, help="durée normale d'un appel (s)")
+    parser.add_argument('--slow-rate', type=float, default=0.05, help="part des appels très lents")
+    parser.add_argument('--slow-delay', type=float, default=2.0, help="durée d'un appel très lent ou bloqué (s)")
+    parser.add_argument('--error-rate', type=float, default=0.02)
+    parser.add_argument('--deadline', type=float, default=0.5, help="délai maximal d'un appel (s)")
+    parser.add_argument('--hedge-after', type=float, default=0.15, help="délai avant hedging sans mesures (s)")
+    args = parser.parse_args()
+
+    import app as chatbot
+
+    # Un thread par requête en vol, plus les requêtes doublées
+    workers = 2 * args.threads
+    scenarios = [
+        ("appel direct", ResilientCaller(deadline=3600, max_workers=workers)),
+        ("délai maximal", ResilientCaller(deadline=args.deadline, max_workers=workers)),
+        ("délai + hedging", ResilientCaller(deadline=args.deadline, hedge_after=args.hedge_after,
+                                            max_workers=workers)),
+        ("délai + hedging + disjoncteur", ResilientCaller(
+            deadline=args.deadline, hedge_after=args.hedge_after, max_workers=workers,
+            breaker=CircuitBreaker(failure_threshold=5, reset_timeout=0.5))),
+    ]
+    print(f"{'mode':<30}{'p50':>8}{'p95':>9}{'p99':>9}{'p99 hors panne':>16}{'p50 en panne':>13}{'Gemini':>9}{'doublées':>9}"
+          f"{'coupées':>9}")
+    for label, caller in scenarios:
+        report(label, run(chatbot, caller, args, None if caller.deadline > 60 else args.deadline), caller)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark des sessions Gemini par conversation : coût de préparation par tour et
+taille approximative des requêtes, avec et sans réutilisation de session / cache de contexte.
+Usage: python -m benchmarks.bench_gemini_sessions [--conversations 200] [--turns 10]
+"""
+import argparse
+import logging
+import os
+import re
+import statistics
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+# Tous les tours sont envoyés à Gemini : pas de budget de jetons (llm_scheduler.py)
+os.environ.setdefault('LLM_USER_TOKEN_BUDGET', '')
+
+from tests.fakes import FakeGeminiClient  # noqa: E402
+
+PAYLOAD_RE = re.compile(r"Gemini : (\d+) octets")
+
+
+class PayloadHandler(logging.Handler):
+    """Récupère les tailles de requête journalisées par `_log_gemini_turn`."""
+
+    def __init__(self):
+        super().__init__()
+        self.sizes = []
+
+    def emit(self, record):
+        match = PAYLOAD_RE.match(record.getMessage())
+        if match:
+            self.sizes.append(int(match.group(1)))
+
+
+def run(chatbot, conversations, turns, reuse):
+    durations = []
+    start = datetime(2026, 1, 1)
+    for c in range(conversations):
+        conversation_id = f"conv-{c}"
+        history = []
+        for t in range(turns):
+            if not reuse:
+                chatbot.gemini_sessions.clear()
+            now = start + timedelta(minutes=t)
+            message = f"Question {t} sur l'alimentation pendant la grossesse ?"
+            began = time.perf_counter()
+            answer = chatbot.get_gemini_response(message, history[-chatbot.GEMINI_HISTORY_MESSAGES:], conversation_id, now)
+            durations.append((time.perf_counter() - began) * 1e6)
+            history += [{"user": "bench", "text": message, "timestamp": now},
+                        {"user": "Bot", "text": answer, "timestamp": now}]
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--conversations', type=int, default=200)
+    parser.add_argument('--turns', type=int, default=10)
+    args = parser.parse_args()
+
+    import app as chatbot
+
+    handler = PayloadHandler()
+    chatbot.logger.addHandler(handler)
+    chatbot.logger.propagate = False
+
+    print(f"{'mode':<28}{'µs/tour p50':>14}{'octets/tour':>14}")
+    for label, reuse, context_cache in (
+        ("reconstruction à chaque tour", False, False),
+        ("session réutilisée", True, False),
+        ("session + cache de contexte", True, True),
+    ):
+        chatbot.gemini_sessions.clear()
+        chatbot._system_prompt_cache.update(name=None, expires=0.0, retry_at=0.0)
+        handler.sizes.clear()
+        fake = FakeGeminiClient(reply="Mangez équilibré et hydratez-vous bien.", context_cache=context_cache)
+        with patch.object(chatbot, 'gemini_client', fake):
+            durations = run(chatbot, args.conversations, args.turns, reuse)
+        print(f"{label:<28}{statistics.median(durations):>14.0f}{statistics.mean(handler.sizes):>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
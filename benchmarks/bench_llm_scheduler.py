@@ -0,0 +1,113 @@
+"""
+Benchmark de l'ordonnanceur des appels Gemini : quelques utilisateurs très actifs (requêtes
+en continu) et de nombreux utilisateurs occasionnels partagent un quota de jetons du fournisseur.
+Sans ordonnanceur, les utilisateurs actifs épuisent le quota et les autres passent au fallback ;
+avec, chaque utilisateur a son budget et la file sert les utilisateurs à tour de rôle.
+Usage: python -m benchmarks.bench_llm_scheduler [--duration 3] [--heavy 3] [--light 20] [--latency 0.1]
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+
+from llm_scheduler import LLMScheduler, TokenBudget
+
+TOKENS_PER_CALL = 600
+
+
+class ProviderQuota:
+    """Quota de jetons du projet Gemini : au-delà, les appels échouent (erreur 429)."""
+
+    def __init__(self, tokens):
+        self.remaining = tokens
+        self._lock = threading.Lock()
+
+    def consume(self, tokens):
+        with self._lock:
+            if self.remaining < tokens:
+                return False
+            self.remaining -= tokens
+            return True
+
+
+def simulate(scheduler, args):
+    quota = ProviderQuota(args.quota)
+    results = {"lourd": [], "occasionnel": []}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def one_request(user_id, kind):
+        started = time.perf_counter()
+        ticket = scheduler.acquire(user_id, TOKENS_PER_CALL) if scheduler else True
+        served = bool(ticket) and quota.consume(TOKENS_PER_CALL)
+        # Appel Gemini, ou réponse locale (SpaCy + règles) en cas de refus
+        time.sleep(args.latency if served else args.fallback_latency)
+        if scheduler and ticket:
+            scheduler.release(ticket, TOKENS_PER_CALL if served else 0)
+        with lock:
+            results[kind].append((served, (time.perf_counter() - started) * 1000))
+
+    def heavy(user_id):
+        while time.perf_counter() < deadline:
+            one_request(user_id, "lourd")
+
+    def light(user_id):
+        # Premier message décalé, puis un message toutes les `interval` secondes
+        time.sleep(args.interval * int(user_id[1:]) / args.light)
+        while time.perf_counter() < deadline:
+            one_request(user_id, "occasionnel")
+            time.sleep(args.interval)
+
+    threads = [threading.Thread(target=heavy, args=(f"h{i}",)) for i in range(args.heavy)
+               for _ in range(args.heavy_threads)]
+    threads += [threading.Thread(target=light, args=(f"l{i}",)) for i in range(args.light)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(label, results):
+    for kind, outcomes in results.items():
+        latencies = [ms for _, ms in outcomes]
+        served = sum(1 for ok, _ in outcomes if ok)
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{label:<18}{kind:<13}{len(outcomes):>9}{served:>8}{100 * served / len(outcomes):>9.0f}%"
+              f"{statistics.median(latencies):>9.0f}ms{p95:>8.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--heavy', type=int, default=3, help="utilisateurs très actifs")
+    parser.add_argument('--heavy-threads', type=int, default=4, help="requêtes simultanées par utilisateur actif")
+    parser.add_argument('--light', type=int, default=20, help="utilisateurs occasionnels")
+    parser.add_argument('--interval', type=float, default=0.5, help="délai entre deux messages occasionnels (s)")
+    parser.add_argument('--latency', type=float, default=0.1, help="durée d'un appel Gemini (s)")
+    parser.add_argument('--fallback-latency', type=float, default=0.01, help="durée d'une réponse locale (s)")
+    parser.add_argument('--quota', type=int, default=300 * TOKENS_PER_CALL, help="quota de jetons du fournisseur")
+    parser.add_argument('--max-in-flight', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'ordonnanceur':<18}{'utilisateur':<13}{'requêtes':>9}{'Gemini':>8}{'% Gemini':>10}"
+          f"{'p50':>11}{'p95':>10}")
+    report("aucun", simulate(None, args))
+
+    # Budget par utilisateur : une part équitable du quota
+    budget = f"{args.quota // (args.heavy + args.light)} per hour"
+    strategy = FixedWindowRateLimiter(MemoryStorage())
+    scheduler = LLMScheduler(max_in_flight=args.max_in_flight, max_wait=1.0,
+                             budget=TokenBudget(lambda: strategy, budget))
+    report("plafond + budget", simulate(scheduler, args))
+    stats = scheduler.stats()
+    print(f"\nfile : profondeur max {stats['max_queue_depth']}, attente p50 {stats.get('wait_p50_ms', 0):.0f} ms, "
+          f"p95 {stats.get('wait_p95_ms', 0):.0f} ms ; refus saturé/attente/budget : "
+          f"{stats['busy']}/{stats['timeout']}/{stats['budget']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+"""
+Test de charge : l'application tourne sous gunicorn (workers et threads de gunicorn_config.py)
+contre un mongod local ou mongomock, avec des serveurs Gemini et Twilio factices (tests/fakes.py).
+Des utilisateurs simulés, connectés chacun avec son compte et ses conversations, enchaînent
+un mélange de requêtes (/chat, /get_history, /get_chat, /export_chat, /login...) en boucle fermée.
+Affiche débit et latences p50/p95/p99 par route, et compare aux références enregistrées dans
+benchmarks/baselines.json pour le même scénario : une régression fait échouer la commande.
+Les références dépendent de la machine : les régénérer avec --save-baseline.
+Usage: python -m benchmarks.bench_load [--users 20] [--conversations 20] [--length 20] [--duration 30]
+       [--mongo mongomock|mongodb://localhost:27017] [--mix chat=40,history=20,...] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+from bson import ObjectId
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, 'benchmarks', 'baselines.json')
+
+PASSWORD = 'loadtest-password'
+DEFAULT_MIX = 'chat=40,history=20,get_chat=15,export=10,export_pdf=5,login=5,contact=5'
+QUESTIONS = [
+    "Quels sont les signes de danger pendant la grossesse ?",
+    "Que doit manger un bébé de 8 mois ?",
+    "Je suis enceinte de 20 semaines, quels examens faire ?",
+    "Quand faire les vaccins de mon enfant ?",
+    "Comment soulager les nausées du premier trimestre ?",
+]
+ANSWER = ("Pendant la grossesse, consultez rapidement un agent de santé en cas de saignements, de fièvre, "
+          "de maux de tête violents ou de gonflement du visage. Les visites prénatales permettent de suivre "
+          "votre santé et celle du bébé. ") * 2
+
+
+def user_id(i):
+    return ObjectId(f"10ad7e57{i:016x}")
+
+
+def conversation_id(i, j):
+    return ObjectId(f"c0{i:011x}{j:011x}")
+
+
+def seed(db, users, conversations, length):
+    """Créer les comptes loadtest<i> et leurs conversations de `length` messages.
+
+    Les identifiants sont déterministes : le client de charge les connaît sans lire la base
+    (avec mongomock, la base n'existe que dans les workers).
+    """
+    import app as chatbot
+    from werkzeug.security import generate_password_hash
+
+    password = generate_password_hash(PASSWORD, chatbot.password_hasher.method)
+    now = datetime.now()
+    db.users.insert_many([{
+        "_id": user_id(i), "username": f"loadtest{i}", "email": f"loadtest{i}@example.com",
+        "password": password, "confirmed": True, "registration_date": now,
+    } for i in range(users)])
+    for i in range(users):
+        documents, stored = [], []
+        for j in range(conversations):
+            started = now - timedelta(days=j + 1)
+            messages = []
+            for k in range(0, length, 2):
+                messages += chatbot._build_chat_messages(f"loadtest{i}", QUESTIONS[(j + k) % len(QUESTIONS)],
+                                                         ANSWER, started + timedelta(minutes=k))
+            messages = messages[:length]
+            document = chatbot._new_conversation_document(str(user_id(i)), messages[0]["text"], started, messages)
+            document["_id"] = conversation_id(i, j)
+            documents.append(document)
+            if chatbot._separate_messages():
+                stored += chatbot._message_documents(document["_id"], messages)
+        db.conversations.insert_many(documents)
+        if stored:
+            db.messages.insert_many(stored)
+
+
+def cleanup(db, users):
+    """Supprimer les comptes de charge et leurs conversations (mongod partagé)."""
+    ids = [str(user_id(i)) for i in range(users)]
+    conversations = [c["_id"] for c in db.conversations.find({"user_id": {"$in": ids}}, {"_id": 1})]
+    db.messages.delete_many({"conversation_id": {"$in": conversations}})
+    db.conversations.delete_many({"_id": {"$in": conversations}})
+    db.users.delete_many({"username": {"$regex": r"^loadtest\d+$"}})
+
+
+class VirtualUser:
+    """Utilisateur simulé : une session HTTP (cookies, connexions gardées ouvertes) et ses conversations."""
+
+    def __init__(self, base_url, index, conversations, chat_turns):
+        self.base_url = base_url
+        self.index = index
+        self.conversations = [str(conversation_id(index, j)) for j in range(conversations)]
+        self.chat_turns = chat_turns
+        self.turns = 0
+        self.http = requests.Session()
+        self.random = random.Random(index)
+
+    def login(self):
+        response = self.http.post(f"{self.base_url}/login", data={'username': f"loadtest{self.index}",
+                                                                  'password': PASSWORD},
+                                  allow_redirects=False)
+        # Succès : redirection hors de la page de connexion ; échec : formulaire réaffiché
+        if response.status_code == 302 and '/login' not in response.headers.get('Location', ''):
+            return 200
+        return 401
+
+    def chat(self):
+        if self.turns >= self.chat_turns:
+            self.http.post(f"{self.base_url}/new_chat")
+            self.turns = 0
+        self.turns += 1
+        return self.http.post(f"{self.base_url}/chat", json={'message': self.random.choice(QUESTIONS)}).status_code
+
+    def history(self):
+        return self.http.get(f"{self.base_url}/get_history", params={'page': 1, 'per_page': 20}).status_code
+
+    def conversations_page(self):
+        return self.http.get(f"{self.base_url}/get_conversations", params={'limit': 20}).status_code
+
+    def get_chat(self):
+        return self.http.get(f"{self.base_url}/get_chat/{self.random.choice(self.conversations)}").status_code
+
+    def export(self, export_format='txt'):
+        response = self.http.get(f"{self.base_url}/export_chat/{self.random.choice(self.conversations)}",
+                                 params={'format': export_format}, allow_redirects=False)
+        # Une redirection signale une conversation introuvable ou un export impossible
+        return 500 if response.status_code == 302 else response.status_code
+
+    def export_pdf(self):
+        return self.export('pdf')
+
+    def contact(self):
+        return self.http.post(f"{self.base_url}/contact_advisor", json={
+            'phone_number': '+22670000000', 'name': f"loadtest{self.index}",
+            'email': f"loadtest{self.index}@example.com", 'message': "Question sur la vaccination",
+        }).status_code
+
+
+ACTIONS = {
+    'chat': VirtualUser.chat,
+    'history': VirtualUser.history,
+    'conversations': VirtualUser.conversations_page,
+    'get_chat': VirtualUser.get_chat,
+    'export': VirtualUser.export,
+    'export_pdf': VirtualUser.export_pdf,
+    'login': VirtualUser.login,
+    'contact': VirtualUser.contact,
+}
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        if name not in ACTIONS:
+            raise SystemExit(f"action inconnue dans --mix : {name} (disponibles : {', '.join(ACTIONS)})")
+        weights[name] = float(weight)
+    return weights
+
+
+def drive(base_url, args, weights):
+    """Boucle fermée : chaque utilisateur enchaîne les actions tirées selon `weights` pendant `duration` s.
+
+    Retourne, par action, les couples (statut, latence ms) mesurés après l'échauffement.
+    """
+    results = {name: [] for name in weights}
+    lock = threading.Lock()
+    names, chances = list(weights), list(weights.values())
+    started = time.perf_counter()
+    measure_from = started + args.warmup
+    stop_at = measure_from + args.duration
+
+    def run(index):
+        user = VirtualUser(base_url, index, args.conversations, args.chat_turns)
+        user.login()
+        while time.perf_counter() < stop_at:
+            name = user.random.choices(names, chances)[0]
+            t0 = time.perf_counter()
+            try:
+                status = ACTIONS[name](user)
+            except requests.RequestException:
+                status = 599
+            t1 = time.perf_counter()
+            if t0 >= measure_from:
+                with lock:
+                    results[name].append((status, (t1 - t0) * 1000))
+            if args.think_time:
+                time.sleep(user.random.expovariate(1 / args.think_time))
+        user.http.close()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(args.users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(results, duration):
+    summary = {}
+    everything = []
+    for name, samples in results.items():
+        if not samples:
+            continue
+        everything += samples
+        summary[name] = _stats(samples, duration)
+    if everything:
+        summary['total'] = _stats(everything, duration)
+    return summary
+
+
+def _stats(samples, duration):
+    latencies = [ms for _, ms in samples]
+    errors = sum(1 for status, _ in samples if status >= 400)
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {"requests": len(samples), "rps": round(len(samples) / duration, 2),
+            "error_rate": round(errors / len(samples), 4), "p50_ms": round(statistics.median(latencies), 2),
+            "p95_ms": round(cuts[94], 2), "p99_ms": round(cuts[98], 2)}
+
+
+def report(summary):
+    print(f"{'route':<12}{'requêtes':>10}{'req/s':>9}{'erreurs':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in summary.items():
+        print(f"{name:<12}{stats['requests']:>10}{stats['rps']:>9.1f}{stats['error_rate']:>9.1%}"
+              f"{stats['p50_ms']:>8.1f}ms{stats['p95_ms']:>8.1f}ms{stats['p99_ms']:>8.1f}ms")
+
+
+def regressions(summary, baseline, tolerance, min_requests=200):
+    """Écarts au-delà de la tolérance : latence p95 plus haute, débit plus bas, plus d'erreurs.
+
+    Latence et débit ne sont comparés que pour les routes mesurées au moins `min_requests` fois :
+    en dessous, le p95 varie d'une exécution à l'autre bien au-delà de la tolérance.
+    """
+    problems = []
+    for name, reference in baseline.items():
+        current = summary.get(name)
+        if current is None:
+            continue
+        if min(current['requests'], reference['requests']) >= min_requests:
+            if current['p95_ms'] > reference['p95_ms'] * (1 + tolerance):
+                problems.append(f"{name} : p95 {current['p95_ms']:.1f} ms (référence {reference['p95_ms']:.1f} ms)")
+            if current['rps'] < reference['rps'] * (1 - tolerance):
+                problems.append(f"{name} : {current['rps']:.1f} req/s (référence {reference['rps']:.1f} req/s)")
+        if current['error_rate'] > reference['error_rate'] + 0.01:
+            problems.append(f"{name} : {current['error_rate']:.1%} d'erreurs "
+                            f"(référence {reference['error_rate']:.1%})")
+    return problems
+
+
+def scenario_key(args, weights):
+    mix = ','.join(f"{name}={weight:g}" for name, weight in weights.items())
+    mongo = 'mongomock' if args.mongo == 'mongomock' else 'mongod'
+    return (f"users={args.users} conversations={args.conversations} length={args.length} "
+            f"workers={args.workers} threads={args.threads} mongo={mongo} storage={args.storage} mix={mix}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            if requests.get(f"{base_url}/login", timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20, help="utilisateurs simulés (un compte chacun)")
+    parser.add_argument('--conversations', type=int, default=20, help="conversations par utilisateur")
+    parser.add_argument('--length', type=int, default=20, help="messages par conversation")
+    parser.add_argument('--chat-turns', type=int, default=5, help="tours /chat avant une nouvelle conversation")
+    parser.add_argument('--duration', type=float, default=30, help="durée mesurée (s)")
+    parser.add_argument('--warmup', type=float, default=5, help="échauffement non mesuré (s)")
+    parser.add_argument('--think-time', type=float, default=0.0, help="pause moyenne entre deux requêtes (s)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="poids des actions : " + ', '.join(ACTIONS))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--mongo', default='mongomock', help="'mongomock' ou URI d'un mongod de test")
+    parser.add_argument('--storage', default='embedded', choices=['embedded', 'collection'])
+    parser.add_argument('--gemini-latency', type=float, default=0.2, help="temps de réponse du faux Gemini (s)")
+    parser.add_argument('--twilio-latency', type=float, default=0.05, help="temps de réponse du faux Twilio (s)")
+    parser.add_argument('--tolerance', type=float, default=0.3, help="écart toléré par rapport à la référence")
+    parser.add_argument('--min-requests', type=int, default=200,
+                        help="mesures minimales d'une route pour comparer sa latence et son débit")
+    parser.add_argument('--save-baseline', action='store_true', help="enregistrer ce résultat comme référence")
+    args = parser.parse_args()
+    weights = parse_mix(args.mix)
+
+    # Configuration partagée par ce processus (remplissage de la base) et les workers gunicorn
+    os.environ.update({
+        'SECRET_KEY': os.environ.get('SECRET_KEY', 'loadtest-secret-key'),
+        'MONGO_URI': args.mongo if args.mongo != 'mongomock' else 'mongodb://localhost:27017',
+        'MESSAGES_STORAGE': args.storage,
+        'LOADTEST_USERS': str(args.users),
+        'LOADTEST_CONVERSATIONS': str(args.conversations),
+        'LOADTEST_LENGTH': str(args.length),
+    })
+    db = None
+    if args.mongo != 'mongomock':
+        import app as chatbot
+        db = chatbot.db
+        cleanup(db, args.users)
+        seed(db, args.users, args.conversations, args.length)
+
+    from tests.fakes import FakeGeminiServer, FakeTwilioServer
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with FakeGeminiServer(reply=ANSWER, latency=args.gemini_latency) as gemini, \
+         FakeTwilioServer(latency=args.twilio_latency) as twilio, \
+         tempfile.NamedTemporaryFile('w+', suffix='.log', delete=False) as log:
+        env = dict(
+            os.environ, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS=str(args.workers),
+            GUNICORN_THREADS=str(args.threads), GUNICORN_ACCESS_LOG=os.devnull, GUNICORN_LOG_LEVEL='warning',
+            GEMINI_API_KEY='loadtest', GEMINI_API_BASE_URL=gemini.url, LLM_USER_TOKEN_BUDGET='',
+            TWILIO_ACCOUNT_SID='AC' + '0' * 32, TWILIO_AUTH_TOKEN='loadtest', TWILIO_PHONE_NUMBER='+15550000000',
+            TWILIO_API_BASE_URL=twilio.url, TWILIO_SEND_RATE='1000', RATELIMIT_ENABLED='False',
+            REMINDER_SCHEDULER_ENABLED='False',
+        )
+        entry = 'wsgi:app'
+        if args.mongo == 'mongomock':
+            # Les processus de rendu PDF ont leur propre connexion : invisibles pour mongomock
+            entry, env['PDF_RENDER_WORKERS'] = 'benchmarks.load_app:app', '0'
+            env['ANALYTICS_INTERVAL'] = '0'
+        process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', entry],
+                                   cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            if not wait_ready(base_url, process):
+                log.seek(0)
+                raise SystemExit(f"gunicorn n'a pas démarré :\n{log.read()[-3000:]}")
+            results = drive(base_url, args, weights)
+        finally:
+            # Arrêt rapide (SIGINT) : inutile d'attendre la fin gracieuse des workers
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        print(f"scénario : {scenario_key(args, weights)}")
+        print(f"Gemini factice : {gemini.requests} appels, Twilio factice : {len(twilio.messages)} SMS, "
+              f"journal gunicorn : {log.name}\n")
+    if db is not None:
+        cleanup(db, args.users)
+
+    summary = summarize(results, args.duration)
+    report(summary)
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES, encoding='utf-8') as f:
+            baselines = json.load(f)
+    key = scenario_key(args, weights)
+    if args.save_baseline:
+        baselines[key] = summary
+        with open(BASELINES, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, ensure_ascii=False, sort_keys=True)
+            f.write('\n')
+        print(f"\nréférence enregistrée dans {os.path.relpath(BASELINES, ROOT)}")
+    elif key not in baselines:
+        print("\naucune référence pour ce scénario (--save-baseline pour l'enregistrer)")
+    else:
+        problems = regressions(summary, baselines[key], args.tolerance, args.min_requests)
+        if problems:
+            print(f"\nrégressions (tolérance {args.tolerance:.0%}) :")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"\naucune régression par rapport à la référence (tolérance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark du stockage des messages : tableau intégré à la conversation ('embedded') vs
+collection `messages` séparée ('collection'), en fonction de la longueur de la conversation.
+Mesure l'ajout d'un échange, le chargement de l'historique transmis à Gemini, la lecture
+complète (get_chat / export) et la taille du document conversation.
+Utilise MONGO_URI si un serveur répond, sinon mongomock (chiffres indicatifs seulement).
+Usage: python -m benchmarks.bench_message_storage [--lengths 10 100 1000 5000] [--repeat 20]
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import bson
+
+from indexes import ensure_indexes
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+BOT_TEXT = ("Pendant la grossesse, mangez des repas variés : céréales, légumineuses, légumes verts, "
+            "fruits, poisson ou viande, et buvez beaucoup d'eau. ") * 3
+
+
+def connect(uri):
+    from pymongo import MongoClient
+    from pymongo.errors import ServerSelectionTimeoutError
+    client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+        return client['chatbot_bench'], uri
+    except ServerSelectionTimeoutError:
+        import mongomock
+        return mongomock.MongoClient()['chatbot_bench'], 'mongomock'
+
+
+def seed(chatbot, length):
+    """Créer une conversation de `length` messages avec le mode de stockage courant."""
+    start = datetime(2024, 1, 1)
+    messages = []
+    for i in range(0, length, 2):
+        messages += chatbot._build_chat_messages('bench', f"Question {i}", BOT_TEXT, start + timedelta(minutes=i))
+    return chatbot._create_conversation('bench-user', 'Question 0', start, messages[:length])
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lengths', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    import app as chatbot
+    db, backend = connect(chatbot.app.config['MONGO_URI'])
+    print(f"base : {backend}")
+    conversations, messages = db['conversations'], db['messages']
+    ensure_indexes(db, ['messages'])
+
+    print(f"{'mode':<12}{'messages':>10}{'ajout':>10}{'historique':>12}{'lecture':>10}{'document':>12}")
+    with patch.object(chatbot, 'conversations_collection', conversations), \
+         patch.object(chatbot, 'messages_collection', messages), \
+         chatbot.app.test_request_context():
+        chatbot.session['user_id'] = 'bench-user'
+        for length in args.lengths:
+            for mode in ('embedded', 'collection'):
+                chatbot.app.config['MESSAGES_STORAGE'] = mode
+                conversations.delete_many({})
+                messages.delete_many({})
+                conversation_id = seed(chatbot, length)
+                oid = bson.ObjectId(conversation_id)
+
+                def read_all():
+                    return list(chatbot._conversation_messages(conversations.find_one({"_id": oid})))
+
+                history_ms = timed(lambda: chatbot._load_conversation_history(conversation_id), args.repeat)
+                read_ms = timed(read_all, args.repeat)
+                append_ms = timed(lambda: chatbot._append_messages(
+                    conversation_id, chatbot._build_chat_messages('bench', "Merci", BOT_TEXT, datetime.now()),
+                    datetime.now()), args.repeat)
+                size_kb = len(bson.encode(conversations.find_one({"_id": oid}))) / 1024
+                print(f"{mode:<12}{length:>10}{append_ms:>8.2f}ms{history_ms:>10.2f}ms"
+                      f"{read_ms:>8.2f}ms{size_kb:>10.1f}Ko")
+
+
+if __name__ == '__main__':
+    main()
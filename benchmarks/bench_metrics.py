@@ -0,0 +1,97 @@
+"""
+Benchmark des métriques Prometheus : surcoût par requête de l'instrumentation (route GET /login)
+sans métriques, avec les valeurs en mémoire du processus et en mode multiprocessus (fichiers
+partagés par les workers gunicorn), puis durée d'une lecture de /metrics après `--workers` workers.
+Usage: python -m benchmarks.bench_metrics [--requests 3000] [--workers 4]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+METRICS = ['HTTP_REQUEST_DURATION', 'GEMINI_CALLS', 'GEMINI_CALL_DURATION', 'CHAT_ANSWERS', 'NER_DURATION',
+           'MONGO_COMMAND_DURATION', 'NOTIFICATION_SEND_DURATION', 'RATE_LIMITED']
+
+
+def latencies(requests, disabled=False):
+    """Latences (ms) de GET /login, route sans accès à MongoDB."""
+    import app as chatbot
+    import metrics
+
+    with ExitStack() as stack:
+        if disabled:
+            for name in METRICS:
+                stack.enter_context(patch.object(metrics, name, metrics._NoopMetric()))
+        chatbot.limiter.enabled = False
+        client = chatbot.app.test_client()
+        for _ in range(100):
+            client.get('/login')
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            client.get('/login')
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples
+
+
+def scrape_ms(runs=20):
+    import metrics
+    started = time.perf_counter()
+    for _ in range(runs):
+        body, _ = metrics.render()
+    return (time.perf_counter() - started) * 1000 / runs, len(body)
+
+
+def child(args):
+    """Exécuté dans un processus dont PROMETHEUS_MULTIPROC_DIR est défini avant l'import des métriques."""
+    samples = latencies(args.requests)
+    print(json.dumps({"samples": samples}))
+
+
+def report(label, samples, baseline=None):
+    mean = statistics.mean(samples)
+    extra = f"{(mean - baseline) * 1000:>+10.0f}µs" if baseline is not None else f"{'':>12}"
+    print(f"{label:<22}{statistics.median(samples):>8.3f}ms{mean:>9.3f}ms"
+          f"{statistics.quantiles(samples, n=100)[98]:>9.3f}ms{extra}")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--workers', type=int, default=4, help="workers simulés en mode multiprocessus")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    print(f"{'métriques':<22}{'p50':>10}{'moyenne':>11}{'p99':>11}{'surcoût':>12}")
+    baseline = report("aucune", latencies(args.requests, disabled=True))
+    report("mémoire du processus", latencies(args.requests), baseline)
+    memory_scrape, memory_size = scrape_ms()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory)
+        command = [sys.executable, '-m', 'benchmarks.bench_metrics', '--child', '--requests', str(args.requests)]
+        runs = [json.loads(subprocess.run(command, env=env, check=True, capture_output=True, text=True)
+                           .stdout.strip().splitlines()[-1])["samples"] for _ in range(args.workers)]
+        report("multiprocessus", runs[0], baseline)
+
+        with patch.dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory):
+            shared_scrape, shared_size = scrape_ms()
+
+    print(f"\nlecture de /metrics : {memory_scrape:.2f} ms ({memory_size} octets) en mémoire, "
+          f"{shared_scrape:.2f} ms ({shared_size} octets) pour {args.workers} workers en multiprocessus")
+
+
+if __name__ == '__main__':
+    main()
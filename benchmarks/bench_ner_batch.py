@@ -0,0 +1,51 @@
+"""
+Benchmark de l'extraction NER : message par message (`extract_user_data`) vs par lots
+(`extract_user_data_batch`, nlp.pipe), avec un ou plusieurs processus.
+Usage: python -m benchmarks.bench_ner_batch [--messages 5000] [--n-process 1 2 4]
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+SAMPLES = [
+    "Je m'appelle Awa Traoré et je suis enceinte de 12 semaines",
+    "Bonjour, mon bébé a 3 mois, que doit-il manger ?",
+    "Quels sont les signes de danger pendant la grossesse ?",
+    "Je suis Mariam, à 30 semaines j'ai souvent mal au dos, est-ce normal ?",
+    "Quand faut-il faire vacciner un nouveau-né au Burkina Faso ?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--n-process', type=int, nargs='+', default=[1, 2])
+    args = parser.parse_args()
+
+    import app as chatbot
+    chatbot.get_nlp()
+    messages = [SAMPLES[i % len(SAMPLES)] for i in range(args.messages)]
+
+    def report(label, elapsed):
+        rate = len(messages) / elapsed
+        print(f"{label:<26}{rate:>10.0f} msg/s   1 M messages ≈ {1_000_000 / rate / 60:.0f} min")
+
+    started = time.perf_counter()
+    for message in messages:
+        chatbot.extract_user_data(message)
+    report("un par un", time.perf_counter() - started)
+
+    for n_process in args.n_process:
+        started = time.perf_counter()
+        items = ((message, i) for i, message in enumerate(messages))
+        for _ in chatbot.extract_user_data_batch(items, batch_size=args.batch_size, n_process=n_process):
+            pass
+        report(f"nlp.pipe ({n_process} processus)", time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
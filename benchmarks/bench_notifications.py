@@ -0,0 +1,86 @@
+"""
+Benchmark de la file de notifications, hors ligne (transport factice, collection en mémoire) :
+latence p50/p99 de /contact_advisor avec envoi dans la requête (comportement précédent)
+vs mise en file, puis débit d'envoi de la file selon le nombre de threads.
+Usage: python -m benchmarks.bench_notifications [--requests 200] [--latency 0.3] [--jobs 500]
+"""
+import argparse
+import logging
+import os
+import statistics
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+from notifications import FakeTransport, NotificationQueue  # noqa: E402
+from tests.fakes import InMemoryCollection  # noqa: E402
+
+CONTACT = {'phone_number': '+22670000000', 'name': 'Awa', 'email': 'awa@example.com',
+           'message': 'Bonjour, j\'ai besoin de conseils pour mon bébé'}
+
+
+def route_latencies(chatbot, count):
+    client = chatbot.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = '507f1f77bcf86cd799439011'
+        sess['username'] = 'bench'
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        client.post('/contact_advisor', json=CONTACT)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def wait_drained(queue, total, timeout=300):
+    deadline = time.monotonic() + timeout
+    while sum(queue.stats()[k] for k in ('sent', 'failed')) < total and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.3, help="latence simulée de Twilio (s)")
+    parser.add_argument('--jobs', type=int, default=500)
+    parser.add_argument('--failure-rate', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    import app as chatbot
+    chatbot.logger.disabled = True
+    logging.getLogger('notifications').disabled = True
+    chatbot.limiter.enabled = False
+
+    print(f"{'/contact_advisor':<18}{'p50':>10}{'p99':>10}")
+    transport = FakeTransport(latency=args.latency)
+    queue = NotificationQueue(InMemoryCollection(), {"sms": transport, "email": transport}, workers=4)
+    inline = SimpleNamespace(enqueue=lambda channel, payload: transport(payload))
+    for label, sender in (("envoi direct", inline), ("mise en file", queue)):
+        with patch.object(chatbot, 'notification_queue', sender):
+            latencies = route_latencies(chatbot, args.requests)
+        p99 = statistics.quantiles(latencies, n=100)[-1]
+        print(f"{label:<18}{statistics.median(latencies):>8.1f}ms{p99:>8.1f}ms")
+    queue.stop()
+
+    print(f"\n{args.jobs} envois, latence {args.latency * 1000:.0f} ms, {args.failure_rate:.0%} d'échecs (1 réessai)")
+    print(f"{'threads':<10}{'durée':>10}{'envois/s':>10}{'réessais':>10}")
+    for workers in args.workers:
+        transport = FakeTransport(latency=args.latency, failure_rate=args.failure_rate, seed=1)
+        queue = NotificationQueue(InMemoryCollection(), {"sms": transport}, workers=workers,
+                                  backoff_base=0, max_attempts=2, poll_interval=0.01)
+        started = time.perf_counter()
+        for i in range(args.jobs):
+            queue.enqueue('sms', {"to": f"+2267{i:07d}", "body": "Campagne de vaccination"})
+        wait_drained(queue, args.jobs)
+        elapsed = time.perf_counter() - started
+        queue.stop()
+        stats = queue.stats()
+        print(f"{workers:<10}{elapsed:>9.2f}s{stats['sent'] / elapsed:>10.0f}{stats['retried']:>10}")
+
+
+if __name__ == '__main__':
+    main()
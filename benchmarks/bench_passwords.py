@@ -0,0 +1,87 @@
+"""
+Benchmark du hachage des mots de passe : débit de POST /login (MongoDB simulé) selon la méthode
+et le coût du hachage, vérification dans le thread de la requête ou dans le groupe de processus,
+et latence d'une route légère (GET /login) servie pendant la vague de connexions.
+Usage: python -m benchmarks.bench_passwords [--threads 4] [--duration 3] [--workers 2]
+       [--methods scrypt:16384:8:1 scrypt pbkdf2:sha256:600000 pbkdf2]
+"""
+import argparse
+import logging
+import os
+import statistics
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from bson import ObjectId
+from werkzeug.security import generate_password_hash
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+PASSWORD = 'motdepasse-bench'
+
+
+def run(chatbot, threads, duration):
+    """`threads` clients enchaînent les connexions pendant `duration` s pendant qu'un autre lit GET /login."""
+    stop_at = time.perf_counter() + duration
+    logins, light = [], []
+    lock = threading.Lock()
+
+    def login_loop():
+        client = chatbot.app.test_client()
+        while time.perf_counter() < stop_at:
+            response = client.post('/login', data={'username': 'bench', 'password': PASSWORD})
+            assert response.location.endswith('/'), "connexion refusée"
+            with lock:
+                logins.append(1)
+
+    def light_loop():
+        client = chatbot.app.test_client()
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            client.get('/login')
+            light.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.01)
+
+    workers = [threading.Thread(target=login_loop) for _ in range(threads)] + [threading.Thread(target=light_loop)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(logins) / duration, statistics.median(light), statistics.quantiles(light, n=100)[94]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=4, help="connexions simultanées")
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--workers', type=int, default=2, help="processus du groupe de hachage")
+    parser.add_argument('--methods', nargs='+',
+                        default=['scrypt:16384:8:1', 'scrypt', 'pbkdf2:sha256:600000', 'pbkdf2'])
+    args = parser.parse_args()
+
+    import app as chatbot
+    from passwords import PasswordHasher
+
+    chatbot.limiter.enabled = False
+    logging.disable(logging.INFO)
+    users = MagicMock()
+    print(f"{'méthode':<24}{'exécution':<12}{'connexions/s':>14}{'GET p50':>11}{'GET p95':>11}")
+    with patch.object(chatbot, 'users_collection', users):
+        for method in args.methods:
+            users.find_one.return_value = {'_id': ObjectId(), 'username': 'bench', 'confirmed': True,
+                                           'password': generate_password_hash(PASSWORD, method)}
+            for workers in (0, args.workers):
+                hasher = PasswordHasher(method, workers=workers)
+                if workers:
+                    hasher.verify(users.find_one.return_value['password'], PASSWORD)  # démarrage des processus
+                with patch.object(chatbot, 'password_hasher', hasher):
+                    rate, p50, p95 = run(chatbot, args.threads, args.duration)
+                hasher.shutdown()
+                label = f"{workers} processus" if workers else "thread"
+                print(f"{hasher.method:<24}{label:<12}{rate:>14.1f}{p50:>9.1f}ms{p95:>9.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark du rate limiter : surcoût par requête d'une route limitée selon le stockage des
+compteurs (aucune limite, mémoire du worker, MongoDB partagé) et exactitude de la limite quand
+plusieurs workers et threads frappent la même clé en même temps.
+Le stockage MongoDB est ignoré si le serveur (MONGO_URI) est injoignable.
+Usage: python -m benchmarks.bench_rate_limit [--requests 2000] [--workers 4] [--threads 8]
+"""
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+from flask_limiter import Limiter
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+STRATEGIES = ['fixed-window', 'sliding-window-counter', 'moving-window']
+
+
+def make_worker(storage_uri, strategy, limit):
+    """Application minimale avec une route limitée, comme /chat dans app.py."""
+    worker = Flask(__name__)
+    limiter = Limiter(app=worker, key_func=lambda: '10.0.0.1', storage_uri=storage_uri or 'memory://',
+                      storage_options={'database_name': 'chatbot_limits_bench'}, strategy=strategy,
+                      enabled=storage_uri is not None)
+
+    @worker.route('/chat', methods=['POST'])
+    @limiter.limit(limit)
+    def chat():
+        return 'ok'
+
+    if storage_uri:
+        limiter.reset()
+    client = worker.test_client()
+    # L'application ne garde qu'une référence faible au Limiter
+    client.limiter = limiter
+    return client
+
+
+def overhead(storage_uri, strategy, requests):
+    """Latences (ms) de `requests` requêtes sur une route dont la limite n'est jamais atteinte."""
+    client = make_worker(storage_uri, strategy, f"{requests * 10} per minute")
+    for _ in range(50):
+        client.post('/chat')
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.post('/chat')
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def accepted(storage_uri, strategy, workers, threads, limit, attempts):
+    """Requêtes acceptées quand `workers` applications × `threads` threads visent la même limite."""
+    clients = [make_worker(storage_uri, strategy, f"{limit} per minute") for _ in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers * threads) as executor:
+        statuses = executor.map(lambda i: clients[i % workers].post('/chat').status_code, range(attempts))
+        return sum(status == 200 for status in statuses)
+
+
+def mongo_available(uri):
+    client = MongoClient(uri, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4, help="applications (workers gunicorn) simulées")
+    parser.add_argument('--threads', type=int, default=8, help="threads par worker")
+    parser.add_argument('--limit', type=int, default=30)
+    args = parser.parse_args()
+
+    mongo_uri = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
+    storages = [('mémoire', 'memory://')]
+    if mongo_available(mongo_uri):
+        storages.append(('mongodb', mongo_uri))
+    else:
+        print(f"MongoDB injoignable ({mongo_uri}) : stockage partagé ignoré\n")
+
+    baseline = statistics.median(overhead(None, 'fixed-window', args.requests))
+    print(f"{'stockage':<10}{'stratégie':<24}{'p50':>9}{'p99':>9}{'surcoût':>10}"
+          f"{'acceptées':>11} / {args.limit}")
+    print(f"{'aucun':<10}{'-':<24}{baseline:>7.3f}ms{'':>9}{'':>10}")
+    for label, uri in storages:
+        for strategy in STRATEGIES:
+            latencies = overhead(uri, strategy, args.requests)
+            p50 = statistics.median(latencies)
+            p99 = statistics.quantiles(latencies, n=100)[98]
+            ok = accepted(uri, strategy, args.workers, args.threads, args.limit,
+                          args.limit * (args.workers + 1))
+            print(f"{label:<10}{strategy:<24}{p50:>7.3f}ms{p99:>7.3f}ms{p50 - baseline:>8.3f}ms{ok:>11}")
+    if len(storages) == 1:
+        print(f"\nEn mémoire, chaque worker applique sa propre limite : jusqu'à {args.workers} × {args.limit}"
+              " requêtes acceptées par minute sur un serveur à plusieurs workers.")
+
+
+if __name__ == '__main__':
+    main()
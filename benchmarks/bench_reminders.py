@@ -0,0 +1,77 @@
+"""
+Benchmark du planificateur de rappels : durée d'un passage selon le nombre de rappels
+en attente (non dus), pour un nombre fixe de rappels dus.
+Avec un serveur MongoDB (MONGO_URI), affiche aussi les documents examinés par la requête
+des rappels dus (explain) : ce nombre doit suivre les rappels dus, pas le total.
+Sans serveur, une collection en mémoire sans index est utilisée (durées indicatives).
+Usage: python -m benchmarks.bench_reminders [--pending 10000 100000 300000] [--due 1000]
+"""
+import argparse
+import os
+import time
+from datetime import timedelta
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+from indexes import ensure_indexes  # noqa: E402
+from notifications import utcnow  # noqa: E402
+from reminders import PENDING, ReminderScheduler  # noqa: E402
+from tests.fakes import InMemoryCollection  # noqa: E402
+
+
+def connect(uri):
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+    client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        return None
+    db = client['chatbot_bench']
+    ensure_indexes(db, ['reminders'])
+    return db['reminders']
+
+
+def seed(collection, pending, due, now):
+    later, past = now + timedelta(days=30), now - timedelta(minutes=1)
+    documents = [{"phone_number": "+22670000000", "message": "Rappel", "status": PENDING,
+                  "fire_at": past if i < due else later} for i in range(pending + due)]
+    for start in range(0, len(documents), 10000):
+        collection.insert_many(documents[start:start + 10000])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pending', type=int, nargs='+', default=[10000, 100000, 300000])
+    parser.add_argument('--due', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    collection = connect(os.environ['MONGO_URI'])
+    print(f"base : {'MongoDB' if collection is not None else 'mémoire (sans index)'}")
+    print(f"{'en attente':>12}{'dus':>8}{'passage':>12}{'docs examinés':>16}")
+    for pending in args.pending:
+        now = utcnow()
+        if collection is not None:
+            collection.delete_many({})
+            target = collection
+        else:
+            target = InMemoryCollection()
+        seed(target, pending, args.due, now)
+
+        examined = '-'
+        if collection is not None:
+            plan = collection.find({"status": PENDING, "fire_at": {"$lte": now}}, {"_id": 1}) \
+                .sort("fire_at", 1).limit(args.batch_size).explain()
+            examined = plan["executionStats"]["totalDocsExamined"] if "executionStats" in plan else '-'
+
+        scheduler = ReminderScheduler(target, lambda batch: None, batch_size=args.batch_size)
+        started = time.perf_counter()
+        dispatched = scheduler.run_once(now)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{pending:>12}{dispatched:>8}{elapsed:>10.0f}ms{examined:>16}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark de l'envoi des SMS contre un serveur Twilio factice local : client Twilio créé à
+chaque envoi (comportement précédent) vs client partagé (connexions réutilisées), puis envoi
+groupé `send_many` selon la concurrence. `--connect-delay` simule le coût TCP + TLS d'une
+nouvelle connexion, que le serveur local en HTTP ne paie pas.
+Usage: python -m benchmarks.bench_sms [--messages 200] [--latency 0.05] [--connect-delay 0.1]
+"""
+import argparse
+import statistics
+import time
+
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+from sms import SmsTransport
+from tests.fakes import FakeTwilioServer
+
+ACCOUNT_SID = 'AC' + '0' * 32
+
+
+def legacy_send(server, to, body):
+    """Implémentation précédente : nouveau client (et nouvelle connexion) à chaque SMS."""
+    client = Client(ACCOUNT_SID, 'token', http_client=TwilioHttpClient(pool_connections=False))
+    client.api.base_url = server.url
+    client.messages.create(body=body, from_='+15550000000', to=to)
+
+
+def report(label, latencies, elapsed, connections):
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    print(f"{label:<26}{len(latencies) / elapsed:>8.1f}/s{statistics.median(latencies):>9.1f}ms"
+          f"{p95:>9.1f}ms{connections:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help="temps de réponse de l'API (s)")
+    parser.add_argument('--connect-delay', type=float, default=0.1, help="coût d'une nouvelle connexion (s)")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[4, 16])
+    args = parser.parse_args()
+    numbers = [f"+2267{i:07d}" for i in range(args.messages)]
+
+    print(f"{'mode':<26}{'débit':>10}{'p50':>11}{'p95':>11}{'connexions':>12}")
+    sequential = numbers[:max(1, args.messages // 4)]
+    with FakeTwilioServer(latency=args.latency, connect_delay=args.connect_delay) as server:
+        latencies = []
+        started = time.perf_counter()
+        for number in sequential:
+            t0 = time.perf_counter()
+            legacy_send(server, number, "Rappel de vaccination")
+            latencies.append((time.perf_counter() - t0) * 1000)
+        report("client par SMS", latencies, time.perf_counter() - started, server.connections)
+
+    with FakeTwilioServer(latency=args.latency, connect_delay=args.connect_delay) as server:
+        transport = SmsTransport(ACCOUNT_SID, 'token', '+15550000000', rate=10000, base_url=server.url)
+        latencies = []
+        started = time.perf_counter()
+        for number in sequential:
+            t0 = time.perf_counter()
+            transport.send(number, "Rappel de vaccination")
+            latencies.append((time.perf_counter() - t0) * 1000)
+        report("client partagé", latencies, time.perf_counter() - started, server.connections)
+
+    for concurrency in args.concurrency:
+        with FakeTwilioServer(latency=args.latency, connect_delay=args.connect_delay) as server:
+            transport = SmsTransport(ACCOUNT_SID, 'token', '+15550000000', rate=10000,
+                                     pool_size=concurrency, base_url=server.url)
+            started = time.perf_counter()
+            results = transport.send_many([(n, "Campagne de vaccination") for n in numbers])
+            report(f"send_many ({concurrency} simultanés)", [r["latency_ms"] for r in results],
+                   time.perf_counter() - started, server.connections)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark du chargement SpaCy : import de l'application, chargement du modèle,
+mémoire résidente (RSS) et temps par appel de `extract_user_data`,
+pipeline complet vs pipeline allégé (composants exclus).
+Chaque mesure est faite dans un processus neuf.
+Usage: python -m benchmarks.bench_spacy_load [--calls 200]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+PROBE = r'''
+import json, os, sys, time
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+
+started = time.perf_counter()
+import app
+import_s = time.perf_counter() - started
+rss_import = rss_mb()
+
+if sys.argv[1] == 'complet':
+    app.SPACY_EXCLUDED_COMPONENTS = []
+started = time.perf_counter()
+app.get_nlp()
+load_s = time.perf_counter() - started
+
+messages = ["Je m'appelle Awa Traoré et je suis enceinte de 12 semaines",
+            "Bonjour, mon bébé a 3 mois, que doit-il manger ?"]
+calls = int(sys.argv[2])
+started = time.perf_counter()
+for i in range(calls):
+    app.extract_user_data(messages[i % len(messages)])
+per_call_ms = (time.perf_counter() - started) / calls * 1000
+print(json.dumps({"import_s": import_s, "rss_import": rss_import, "load_s": load_s,
+                  "rss": rss_mb(), "per_call_ms": per_call_ms, "pipes": app.get_nlp().pipe_names}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'pipeline':<10}{'import app':>12}{'RSS import':>12}{'chargement':>12}{'RSS':>10}{'ms/appel':>10}  composants")
+    for variant in ('complet', 'allégé'):
+        output = subprocess.run([sys.executable, '-c', PROBE, variant, str(args.calls)],
+                                capture_output=True, text=True, check=True).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{variant:<10}{r['import_s']:>11.2f}s{r['rss_import']:>10.0f}Mo{r['load_s']:>11.2f}s"
+              f"{r['rss']:>8.0f}Mo{r['per_call_ms']:>10.2f}  {', '.join(r['pipes'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark de l'analyse des sujets : parcours complet des conversations classées en Python
+(detect_intent sur chaque message) contre passages incrémentaux (analytics.py), premier passage
+puis passage après l'ajout de quelques nouveaux échanges.
+Les passages utilisent $merge : mesurés seulement si MONGO_URI désigne un serveur (pas avec mongomock).
+Usage: python -m benchmarks.bench_topics [--conversations 2000] [--length 20] [--new 100]
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.bench_message_storage import BOT_TEXT, connect
+
+os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key')
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_bench')
+
+QUESTIONS = ["Quels sont les signes de danger ?", "Que manger pendant la grossesse ? alimentation",
+             "Quand faire les visites prénatales ?", "Conseils pour l'allaitement", "Mon bébé a de la fièvre",
+             "Bonjour"]
+
+
+def seed(db, conversations, length, start):
+    random.seed(0)
+    db.conversations.insert_many([{
+        "title": f"c{i}", "date": start + timedelta(minutes=i),
+        "messages": [{"user": "Bot" if j % 2 else "bench", "text": BOT_TEXT if j % 2 else random.choice(QUESTIONS),
+                      "timestamp": start + timedelta(minutes=i)} for j in range(length)],
+    } for i in range(conversations)])
+
+
+def full_scan(db, detect_intent):
+    """Approche sans filigrane : tous les messages relus et classés à chaque calcul."""
+    counts = {}
+    for conversation in db.conversations.find({}, {"messages": 1}):
+        for msg in conversation.get("messages", []):
+            if msg["user"] != "Bot":
+                intent = detect_intent(msg["text"].lower())
+                counts[intent] = counts.get(intent, 0) + 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--length', type=int, default=20)
+    parser.add_argument('--new', type=int, default=100, help="échanges ajoutés avant le passage incrémental")
+    args = parser.parse_args()
+
+    import app as chatbot
+    from analytics import TopicAnalytics
+
+    db, backend = connect(os.environ['MONGO_URI'])
+    print(f"base : {backend}\n")
+    for name in ('conversations', 'messages', 'analytics'):
+        db[name].drop()
+    start = datetime.now() - timedelta(days=10)
+    try:
+        seed(db, args.conversations, args.length, start)
+        started = time.perf_counter()
+        counts = full_scan(db, chatbot.detect_intent)
+        print(f"parcours complet : {sum(counts.values())} messages en {(time.perf_counter() - started) * 1000:.0f} ms")
+        if backend == 'mongomock':
+            print("passages incrémentaux non mesurés ($merge indisponible dans mongomock)")
+            return
+
+        analytics = TopicAnalytics(db.analytics, db.conversations, db.messages,
+                                   chatbot.FALLBACK_KEYWORDS_BY_PRIORITY, lag=0)
+        now = datetime.now()
+        started = time.perf_counter()
+        analytics.run_once(now)
+        print(f"premier passage : {(time.perf_counter() - started) * 1000:.0f} ms")
+        assert dict(analytics.topics(now.date(), days=30)) == counts
+
+        later = now + timedelta(seconds=1)
+        db.messages.insert_many([{"conversation_id": None, "user": "bench", "text": random.choice(QUESTIONS),
+                                  "timestamp": later} for _ in range(args.new)])
+        started = time.perf_counter()
+        analytics.run_once(later + timedelta(seconds=1))
+        print(f"passage après {args.new} nouveaux messages : {(time.perf_counter() - started) * 1000:.0f} ms")
+    finally:
+        for name in ('conversations', 'messages', 'analytics'):
+            db[name].drop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+"""
+Point d'entrée WSGI des tests de charge sans mongod : MongoDB est remplacé par mongomock et
+rempli (comptes loadtest<i> et leurs conversations, voir bench_load.seed) dans le processus
+maître de gunicorn. Chaque worker en reçoit une copie au fork : les écritures d'un worker
+(nouveaux messages) ne sont pas vues par les autres. L'analyse des sujets ($merge) n'y est pas lancée.
+Usage: gunicorn -c gunicorn_config.py benchmarks.load_app:app (lancé par benchmarks.bench_load)
+"""
+import os
+
+import mongomock
+import pymongo
+
+# Un seul client simulé : celui que chaque worker recrée après le fork (init_mongo) garde les données
+_client = mongomock.MongoClient()
+pymongo.MongoClient = lambda *args, **kwargs: _client
+
+from app import app, db  # noqa: E402
+from benchmarks.bench_load import seed  # noqa: E402
+
+with app.app_context():
+    seed(db, int(os.getenv('LOADTEST_USERS', 20)), int(os.getenv('LOADTEST_CONVERSATIONS', 20)),
+         int(os.getenv('LOADTEST_LENGTH', 20)))
@@ -0,0 +1,74 @@
+"""
+Cache mémoire borné (LRU) avec expiration (TTL), partagé par les threads d'un worker.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Cache LRU thread-safe dont les entrées expirent après `ttl` secondes.
+
+    Les compteurs `hits` / `misses` / `evictions` permettent de suivre son efficacité.
+    """
+
+    def __init__(self, maxsize=1000, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= self._clock():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self._clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Retire et retourne l'entrée (si elle n'a pas expiré)."""
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None or item[1] <= self._clock():
+                self.misses += 1
+                return default
+            self.hits += 1
+            return item[0]
+
+    def items(self):
+        """Entrées non expirées, de la moins à la plus récemment utilisée."""
+        now = self._clock()
+        with self._lock:
+            return [(key, value) for key, (value, expires) in self._data.items() if expires > now]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -16,17 +16,140 @@ class Config:
 
     # Base de données
     MONGO_URI = os.getenv('MONGO_URI')
+    # Création des index (indexes.py) au démarrage du serveur
+    MONGO_ENSURE_INDEXES = os.getenv('MONGO_ENSURE_INDEXES', 'True').lower() == 'true'
+
+    # Client MongoDB (un par worker gunicorn, créé après le fork) : connexions du groupe, fermeture des
+    # connexions inactives, attente d'une connexion libre, délais de connexion, de sélection du serveur
+    # et de lecture (0 : aucun), en millisecondes
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 20))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 60000))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 0))
+    # Stockage des messages : 'embedded' (tableau dans la conversation) ou 'collection'
+    # (collection `messages` séparée, voir `flask --app app migrate-messages`)
+    MESSAGES_STORAGE = os.getenv('MESSAGES_STORAGE', 'embedded')
+
+    # Compteurs du rate limiter : 'memory://' (propres à chaque worker) ou stockage partagé
+    # par tous les workers et serveurs, p. ex. 'mongodb://mongo:27017' (compteurs incrémentés
+    # atomiquement et expirés par un index TTL, dans la base `limits`).
+    # Avec 'memory://', chaque processus compte de son côté : sous gunicorn avec N workers, une
+    # adresse IP peut envoyer jusqu'à N fois la limite (30 x N /chat par minute) ; gunicorn_config.py
+    # le signale au démarrage. Utiliser un stockage partagé dès que GUNICORN_WORKERS > 1.
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
+    # 'fixed-window' (un compteur par fenêtre), 'sliding-window-counter' ou 'moving-window'
+    RATELIMIT_STRATEGY = os.getenv('RATELIMIT_STRATEGY', 'fixed-window')
+    # Stockage injoignable : abandonner vite plutôt que bloquer la requête 30 s
+    RATELIMIT_STORAGE_OPTIONS = {'serverSelectionTimeoutMS': 1000, 'connectTimeoutMS': 1000}
+    # Désactivable pour les tests de charge (tous les utilisateurs simulés partagent une adresse IP)
+    RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'True').lower() == 'true'
 
     # Twilio
     TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
     TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
+    # Débit maximal d'envoi (SMS/s, par processus) et connexions HTTP gardées ouvertes
+    TWILIO_SEND_RATE = float(os.getenv('TWILIO_SEND_RATE', 10))
+    TWILIO_POOL_SIZE = int(os.getenv('TWILIO_POOL_SIZE', 10))
+    # URL de l'API (serveur Twilio factice pour les tests de charge), par défaut l'API réelle
+    TWILIO_API_BASE_URL = os.getenv('TWILIO_API_BASE_URL')
 
     # Numéro du conseiller médical
     ADVISOR_PHONE_NUMBER = os.getenv('ADVISOR_PHONE_NUMBER', '+22654125637')
 
+    # File d'envoi des SMS et emails (notifications.py)
+    NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', 2))
+    NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 5))
+    NOTIFICATION_BACKOFF_BASE = float(os.getenv('NOTIFICATION_BACKOFF_BASE', 30))
+    # 'live' (Twilio et SMTP) ou 'fake' (transport local, pour les tests de charge hors ligne)
+    NOTIFICATION_TRANSPORT = os.getenv('NOTIFICATION_TRANSPORT', 'live')
+
+    # Rappels programmés (reminders.py) : fuseau des dates saisies, taille des lots, scrutation
+    REMINDER_TIMEZONE = os.getenv('REMINDER_TIMEZONE', 'Africa/Ouagadougou')
+    REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', 500))
+    REMINDER_POLL_INTERVAL = float(os.getenv('REMINDER_POLL_INTERVAL', 30))
+    REMINDER_SCHEDULER_ENABLED = os.getenv('REMINDER_SCHEDULER_ENABLED', 'True').lower() == 'true'
+
     # Google Gemini API
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+    # Sessions de chat Gemini gardées en mémoire par conversation
+    GEMINI_SESSION_CACHE_SIZE = int(os.getenv('GEMINI_SESSION_CACHE_SIZE', 500))
+    GEMINI_SESSION_TTL = int(os.getenv('GEMINI_SESSION_TTL', 1800))
+    # Durée de vie du cache de contexte (prompt système) côté Gemini
+    GEMINI_CONTEXT_CACHE_TTL = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL', 3600))
+    # URL de l'API (serveur Gemini factice pour les tests de charge), par défaut l'API réelle
+    GEMINI_API_BASE_URL = os.getenv('GEMINI_API_BASE_URL')
+    # Appels Gemini (resilience.py) : délai maximal (s), requête doublée quand la première dépasse
+    # le p95 des latences observées (GEMINI_HEDGE_AFTER s tant qu'il y a trop peu de mesures),
+    # disjoncteur ouvert après N échecs consécutifs puis sondé toutes les GEMINI_BREAKER_RESET s
+    GEMINI_DEADLINE = float(os.getenv('GEMINI_DEADLINE', 15))
+    GEMINI_HEDGE_ENABLED = os.getenv('GEMINI_HEDGE_ENABLED', 'True').lower() == 'true'
+    GEMINI_HEDGE_AFTER = float(os.getenv('GEMINI_HEDGE_AFTER', 5))
+    GEMINI_BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', 5))
+    GEMINI_BREAKER_RESET = float(os.getenv('GEMINI_BREAKER_RESET', 30))
+
+    # Ordonnanceur des appels Gemini (llm_scheduler.py) : appels simultanés par worker, file
+    # d'attente et attente maximale (s) avant le fallback local
+    LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', 8))
+    LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', 32))
+    LLM_MAX_WAIT = float(os.getenv('LLM_MAX_WAIT', 2.0))
+    # Budget de jetons par utilisateur (vide pour le désactiver) et réponse estimée par appel
+    LLM_USER_TOKEN_BUDGET = os.getenv('LLM_USER_TOKEN_BUDGET', '30000 per hour')
+    LLM_RESPONSE_TOKENS = int(os.getenv('LLM_RESPONSE_TOKENS', 512))
+
+    # Cache sémantique des réponses aux questions fréquentes (premier message d'une conversation)
+    ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'True').lower() == 'true'
+    ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', 500))
+    ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', 86400))
+    ANSWER_CACHE_THRESHOLD = float(os.getenv('ANSWER_CACHE_THRESHOLD', 0.85))
+
+    # Traçage des requêtes (tracing.py) : part des requêtes tracées et export ('' : aucun, 'file' : TRACE_FILE
+    # en JSONL, 'otlp' : collecteur OpenTelemetry en OTLP/HTTP). Sans export, seul l'en-tête de débogage trace.
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.01))
+    TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', '')
+    TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+    TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+    TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'chatbot')
+
+    # Jeton exigé par /metrics (en-tête « Authorization: Bearer <jeton> »), vide : accès libre
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+    # Hachage des mots de passe (passwords.py) : méthode Werkzeug et coût, p. ex. 'scrypt' (= scrypt:32768:8:1),
+    # 'scrypt:16384:8:1' ou 'pbkdf2:sha256:600000'. Les anciens hachages sont recalculés à la connexion.
+    # Calculs dans PASSWORD_HASH_WORKERS processus par worker (0 : dans le thread de la requête).
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+    # Exports : messages lus par lots de EXPORT_BATCH_SIZE ; PDF rendus dans PDF_RENDER_WORKERS processus
+    # par worker gunicorn (0 : dans le thread de la requête), abandonnés après PDF_RENDER_TIMEOUT s
+    EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 200))
+    PDF_RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS', 2))
+    PDF_RENDER_TIMEOUT = float(os.getenv('PDF_RENDER_TIMEOUT', 120))
+
+    # Cache des documents utilisateur (g.user) par worker : taille et durée de vie (s)
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 1000))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+
+    # Compteurs du panel d'administration (stats.py) : recalcul complet toutes les STATS_RECONCILE_INTERVAL s
+    # par un seul worker (0 : jamais, sauf `flask --app app reconcile-stats`), jours affichés dans le graphique
+    STATS_RECONCILE_INTERVAL = float(os.getenv('STATS_RECONCILE_INTERVAL', 3600))
+    STATS_DAYS = int(os.getenv('STATS_DAYS', 30))
+
+    # Analyse des sujets des messages (analytics.py) : passage toutes les ANALYTICS_INTERVAL s par un seul
+    # worker (0 : jamais, sauf `flask --app app analyze-topics`), messages de plus de ANALYTICS_LAG s seulement
+    ANALYTICS_INTERVAL = float(os.getenv('ANALYTICS_INTERVAL', 600))
+    ANALYTICS_LAG = float(os.getenv('ANALYTICS_LAG', 300))
+
+    # Durée de cache du nombre de conversations affiché dans l'historique (par worker)
+    HISTORY_COUNT_CACHE_TTL = int(os.getenv('HISTORY_COUNT_CACHE_TTL', 300))
+
+    # Point d'entrée ASGI (asgi.py) : threads par worker pour les routes déléguées à Flask, dont
+    # /chat_stream qui garde son thread jusqu'à la fin de la réponse
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 40))
 
     # Sécurité des sessions
     SESSION_COOKIE_HTTPONLY = True
@@ -0,0 +1,257 @@
+"""
+Exports des conversations envoyés en flux : les messages sont lus dans MongoDB par lots
+(pages `$slice` du tableau intégré, puis curseur de la collection `messages`), de sorte que
+la mémoire reste constante quelle que soit la longueur de la conversation. Les fichiers texte
+et l'archive ZIP de toutes les conversations sont produits au fil de l'envoi ; les PDF sont
+rendus dans un groupe de processus, dans un fichier temporaire envoyé ensuite par morceaux.
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+# Collection `messages` (MESSAGES_STORAGE=collection) : un document par message,
+# lu dans l'ordre chronologique grâce à l'index déclaré dans indexes.py
+MESSAGE_SORT = [("timestamp", 1), ("_id", 1)]
+MESSAGE_FIELDS = {"_id": 0, "user": 1, "text": 1, "timestamp": 1}
+
+# Champs de la conversation utiles à l'export (les messages sont lus à part, par lots)
+EXPORT_FIELDS = {"title": 1, "date": 1, "user_id": 1}
+
+# Taille des morceaux envoyés au client
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_messages(conversations, messages, conversation_id, separate, batch_size=200):
+    """Messages d'une conversation dans l'ordre chronologique, lus par lots de `batch_size`.
+
+    Le tableau intégré est parcouru par pages `$slice` ; en mode `collection` (`separate`),
+    les messages intégrés pas encore migrés précèdent ceux de la collection `messages`.
+    """
+    skip = 0
+    while True:
+        page = conversations.find_one({"_id": conversation_id},
+                                      {"_id": 1, "messages": {"$slice": [skip, batch_size]}})
+        batch = (page or {}).get("messages", [])
+        yield from batch
+        if len(batch) < batch_size:
+            break
+        skip += batch_size
+    if separate:
+        cursor = messages.find({"conversation_id": conversation_id}, MESSAGE_FIELDS)
+        yield from cursor.sort(MESSAGE_SORT).batch_size(batch_size)
+
+
+def _chunked(parts, size=CHUNK_SIZE):
+    """Regrouper des fragments de texte en morceaux d'environ `size` octets."""
+    buffer, length = [], 0
+    for part in parts:
+        data = part.encode('utf-8')
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def text_chunks(conversation, messages):
+    """Fichier texte d'une conversation, en morceaux d'octets produits au fil des messages."""
+    def lines():
+        date = conversation['date'].strftime('%Y-%m-%d %H:%M')
+        yield f"{'='*50}\n  {conversation.get('title', 'Conversation')}\n  Date: {date}\n{'='*50}\n\n"
+        for msg in messages:
+            user = msg.get('user', 'Inconnu')
+            timestamp = msg.get('timestamp', datetime.now()).strftime('%H:%M')
+            yield f"[{timestamp}] {user}:\n{msg.get('text', '')}\n\n"
+
+    return _chunked(lines())
+
+
+class _ZipBuffer:
+    """Sortie de ZipFile sans `seek` ni `tell` : les octets écrits sont repris par `drain`."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def zip_stream(entries):
+    """Archive ZIP produite en flux à partir de (nom, date, morceaux d'octets).
+
+    Sortie non repositionnable : tailles et CRC suivent chaque fichier (descripteur de
+    données) ; seul le répertoire central, une entrée par fichier, reste en mémoire.
+    """
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, date, chunks in entries:
+            info = zipfile.ZipInfo(name, date_time=max(date, datetime(1980, 1, 1)).timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w', force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def file_chunks(path, size=CHUNK_SIZE):
+    """Contenu d'un fichier temporaire par morceaux, supprimé une fois envoyé (ou la connexion fermée)."""
+    try:
+        with open(path, 'rb') as f:
+            while chunk := f.read(size):
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def _latin1(text):
+    return text.encode('latin-1', 'replace').decode('latin-1')
+
+
+def render_pdf(conversation, messages, path):
+    """Écrire dans `path` le PDF d'une conversation, messages lus au fil de la mise en page."""
+    from fpdf import FPDF
+    from fpdf.enums import XPos, YPos
+
+    next_line = {'new_x': XPos.LMARGIN, 'new_y': YPos.NEXT}
+
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
+
+    pdf.set_font('Helvetica', 'B', 16)
+    pdf.cell(0, 10, _latin1(conversation.get('title', 'Conversation')), align='C', **next_line)
+
+    pdf.set_font('Helvetica', '', 10)
+    date = conversation['date'].strftime('%Y-%m-%d %H:%M')
+    pdf.cell(0, 8, f"Date: {date}", align='C', **next_line)
+    pdf.ln(10)
+    pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+    pdf.ln(5)
+
+    for msg in messages:
+        user = msg.get('user', 'Inconnu')
+        timestamp = msg.get('timestamp', datetime.now()).strftime('%H:%M')
+
+        pdf.set_font('Helvetica', 'B', 10)
+        if user == 'Bot':
+            pdf.set_text_color(0, 150, 199)
+        else:
+            pdf.set_text_color(233, 30, 140)
+
+        pdf.cell(0, 6, f"[{timestamp}] {_latin1(user)}:", **next_line)
+        pdf.set_font('Helvetica', '', 9)
+        pdf.set_text_color(51, 51, 51)
+        pdf.multi_cell(0, 5, _latin1(msg.get('text', '')))
+        pdf.ln(3)
+
+    pdf.output(path)
+
+
+# Connexion MongoDB propre à chaque processus de rendu (ouverte par _init_worker)
+_worker_db = None
+
+
+def _init_worker(mongo_uri, database):
+    global _worker_db
+    from pymongo import MongoClient
+    _worker_db = MongoClient(mongo_uri)[database]
+
+
+def render_pdf_file(conversation, messages, directory=None):
+    """Rendre le PDF dans un fichier temporaire créé ici, supprimé si le rendu échoue. Retourne son chemin."""
+    fd, path = tempfile.mkstemp(prefix='export_', suffix='.pdf', dir=directory)
+    os.close(fd)
+    try:
+        render_pdf(conversation, messages, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def _render_stored(conversation, separate, batch_size, directory):
+    messages = iter_messages(_worker_db['conversations'], _worker_db['messages'], conversation['_id'],
+                             separate, batch_size)
+    return render_pdf_file(conversation, messages, directory)
+
+
+def _discard_rendered(future):
+    """Supprimer le PDF d'un rendu abandonné par sa requête, une fois le processus de rendu terminé."""
+    if not future.cancelled() and future.exception() is None:
+        os.remove(future.result())
+
+
+class PdfRenderer:
+    """Rendu des PDF dans `workers` processus (0 : dans le thread de la requête).
+
+    La mise en page fpdf2, en Python pur, garderait le GIL et ralentirait les autres threads
+    du worker gunicorn. Chaque processus, lancé à la première demande (méthode 'spawn' : le
+    processus parent a des threads), lit les messages avec sa propre connexion MongoDB et crée
+    lui-même le fichier temporaire (dans `directory`) : il ne le supprime qu'en cas d'échec.
+    """
+
+    def __init__(self, mongo_uri, database='chatbot', workers=2, timeout=120.0, batch_size=200, directory=None):
+        self.mongo_uri = mongo_uri
+        self.database = database
+        self.workers = workers
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.directory = directory
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=(self.mongo_uri, self.database))
+            return self._executor
+
+    def render(self, conversation, separate, messages):
+        """Chemin d'un fichier temporaire contenant le PDF (à supprimer par l'appelant).
+
+        `messages` (itérable paresseux) n'est lu que pour un rendu dans le thread appelant.
+        """
+        if not self.workers:
+            return render_pdf_file(conversation, messages, self.directory)
+        future = self._pool().submit(_render_stored, conversation, separate, self.batch_size, self.directory)
+        try:
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            # Processus de rendu tué (mémoire, signal) : un nouveau groupe à la prochaine demande
+            with self._lock:
+                self._executor = None
+            raise
+        except BaseException:
+            # Délai dépassé ou requête interrompue : rendu retiré de la file, ou son fichier
+            # supprimé quand le processus aura fini de l'écrire
+            if not future.cancel():
+                future.add_done_callback(_discard_rendered)
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -2,9 +2,18 @@
 Configuration Gunicorn pour le déploiement en production.
 Usage: gunicorn -c gunicorn_config.py wsgi:app
 """
+import glob
 import multiprocessing
 import os
 
+# Métriques Prometheus agrégées entre workers (metrics.py) : chaque processus écrit ses valeurs
+# dans ce répertoire, vidé ici au démarrage du maître (avant le chargement de l'application)
+prometheus_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if prometheus_dir:
+    os.makedirs(prometheus_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(prometheus_dir, "*.db")):
+        os.remove(stale)
+
 # Adresse et port (Render fournit la variable PORT)
 port = os.getenv("PORT", "8000")
 bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{port}")
@@ -12,8 +21,8 @@ bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{port}")
 # Nombre de workers (limité à 2 pour les tiers gratuits type Render)
 workers = int(os.getenv("WEB_CONCURRENCY", os.getenv("GUNICORN_WORKERS", 2)))
 
-# Type de worker
-worker_class = "gthread"
+# Type de worker (uvicorn.workers.UvicornWorker pour le point d'entrée asgi:app)
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
 
 # Threads par worker
 threads = int(os.getenv("GUNICORN_THREADS", 2))
@@ -35,3 +44,45 @@ max_requests_jitter = 50
 
 # Préchargement de l'application
 preload_app = True
+
+
+def when_ready(server):
+    """Charger le modèle SpaCy dans le maître : les workers le partagent après le fork.
+    Fermer le client MongoDB du maître (index créés au chargement de wsgi.py) : les workers
+    n'en héritent aucune connexion et ouvrent chacun le leur (post_fork).
+    Signaler des limites de débit comptées en mémoire, donc multipliées par le nombre de workers."""
+    from app import app, client, get_nlp
+    if os.getenv("SPACY_PRELOAD", "True").lower() == "true":
+        get_nlp()
+    client.close()
+    if (workers > 1 and app.config['RATELIMIT_ENABLED']
+            and app.config['RATELIMIT_STORAGE_URI'].startswith('memory://')):
+        server.log.warning("RATELIMIT_STORAGE_URI=memory:// avec %d workers : chaque worker compte ses "
+                           "propres requêtes, les limites sont multipliées par %d (définir un stockage partagé)",
+                           workers, workers)
+
+
+def post_fork(server, worker):
+    """Ouvrir le client MongoDB du worker, puis démarrer les threads de la file de notifications,
+    du planificateur de rappels, de la réconciliation des compteurs et de l'analyse des sujets
+    (les threads ne survivent pas au fork)."""
+    from datetime import datetime
+    from app import app, init_mongo, notification_queue, reminder_scheduler, stats_counters, topic_analytics
+    init_mongo()
+    notification_queue.start()
+    if app.config['REMINDER_SCHEDULER_ENABLED']:
+        reminder_scheduler.start()
+    if app.config['STATS_RECONCILE_INTERVAL']:
+        stats_counters.start(datetime.now)
+    if app.config['ANALYTICS_INTERVAL']:
+        topic_analytics.start(datetime.now)
+
+
+def child_exit(server, worker):
+    """Retirer des métriques les valeurs instantanées d'un worker arrêté (les compteurs restent)."""
+    if prometheus_dir:
+        try:
+            from prometheus_client import multiprocess
+        except ImportError:
+            return
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,68 @@
+"""
+Index MongoDB requis par les requêtes de l'application.
+Créés au démarrage du serveur (MONGO_ENSURE_INDEXES) ou avec `flask --app app ensure-indexes`.
+"""
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Index de la collection `messages` : messages d'une conversation dans l'ordre chronologique
+MESSAGES_INDEX = [("conversation_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)]
+
+INDEXES = {
+    "users": [
+        # Inscription, connexion, mot de passe oublié et confirmation de l'email
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("username", ASCENDING)], unique=True),
+        # Derniers inscrits du panel d'administration
+        IndexModel([("registration_date", DESCENDING)]),
+    ],
+    "conversations": [
+        # Historique d'un utilisateur, du plus récent au plus ancien (pagination par curseur)
+        IndexModel([("user_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)]),
+        # Conversations modifiées depuis le dernier passage de l'analyse des sujets (analytics.py)
+        IndexModel([("date", ASCENDING)]),
+    ],
+    "messages": [
+        IndexModel(MESSAGES_INDEX),
+        # Messages écrits depuis le dernier passage de l'analyse des sujets
+        IndexModel([("timestamp", ASCENDING)]),
+    ],
+    "reminders": [
+        IndexModel([("reminder_date", ASCENDING)]),
+        # Rappels dus (planificateur, voir reminders.py)
+        IndexModel([("status", ASCENDING), ("fire_at", ASCENDING)]),
+    ],
+    "notifications": [
+        # Réclamation du prochain envoi dû (ou dont le bail a expiré)
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)]),
+        # Envois identifiés (un rappel n'est mis en file qu'une fois)
+        IndexModel([("key", ASCENDING)], unique=True, partialFilterExpression={"key": {"$exists": True}}),
+    ],
+}
+
+
+def ensure_indexes(db, collections=None):
+    """Créer les index déclarés qui n'existent pas encore (opération idempotente).
+
+    Chaque index est créé séparément : un index refusé (doublons existants pour un index
+    unique, options en conflit) est journalisé sans empêcher la création des suivants.
+    Seule une panne de connexion interrompt l'opération.
+    Retourne, pour chaque collection, les noms des index créés ou déjà présents.
+    """
+    created = {}
+    for name, models in INDEXES.items():
+        if collections is not None and name not in collections:
+            continue
+        created[name] = []
+        for model in models:
+            try:
+                created[name] += db[name].create_indexes([model])
+            except ConnectionFailure:
+                raise
+            except PyMongoError as e:
+                logger.error("Index %s.%s non créé : %s", name, model.document["name"], e)
+    return created
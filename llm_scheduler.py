@@ -0,0 +1,261 @@
+"""
+Ordonnancement des appels Gemini : nombre d'appels simultanés plafonné par worker, budget de
+jetons par utilisateur et file d'attente équitable (tourniquet pondéré par `user_id`), pour
+qu'une poignée d'utilisateurs très actifs n'épuise pas le quota au détriment des autres.
+Quand le modèle est saturé, chaque requête reçoit vite une décision (attendre brièvement son
+tour ou passer au fallback local) au lieu d'attendre l'expiration de l'appel.
+"""
+import asyncio
+import logging
+import math
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+
+from limits import parse
+
+logger = logging.getLogger(__name__)
+
+# Motifs de refus : file pleine ou attente estimée trop longue, attente dépassée, budget épuisé
+BUSY, TIMEOUT, BUDGET = 'busy', 'timeout', 'budget'
+
+
+class HedgeRefused(Exception):
+    """Pas de créneau libre ou de budget pour une requête doublée : seul le premier essai continue."""
+
+
+class TokenBudget:
+    """Budget de jetons par utilisateur (`limit`, p. ex. '30000 per hour').
+
+    Compté par un limiteur de la bibliothèque limits, retourné par `strategy()` : le budget est
+    partagé entre workers si le stockage du rate limiter l'est. Stockage injoignable : pas de refus.
+    """
+
+    def __init__(self, strategy, limit):
+        self.strategy = strategy
+        self.item = parse(limit)
+
+    def allows(self, user_id, tokens):
+        try:
+            return self.strategy().test(self.item, 'llm_tokens', user_id, cost=tokens)
+        except Exception as e:
+            logger.warning("Budget de jetons indisponible : %s", e)
+            return True
+
+    def charge(self, user_id, tokens):
+        try:
+            self.strategy().hit(self.item, 'llm_tokens', user_id, cost=max(0, tokens))
+        except Exception as e:
+            logger.warning("Budget de jetons indisponible : %s", e)
+
+
+class Ticket:
+    """Demande d'appel d'un utilisateur ; `wait` : temps passé dans la file (s)."""
+
+    def __init__(self, user_id, tokens, weight, requested, on_grant=None):
+        self.user_id = user_id
+        self.tokens = tokens
+        self.weight = max(1, int(weight))
+        self.requested = requested
+        self.started = requested
+        self.wait = 0.0
+        self.granted = False
+        self.event = threading.Event()
+        self.on_grant = on_grant
+
+    def grant(self, now):
+        self.granted = True
+        self.started = now
+        self.wait = now - self.requested
+        self.event.set()
+        if self.on_grant:
+            self.on_grant()
+
+
+class LLMScheduler:
+    """Plafond d'appels simultanés (par processus), file équitable et budget de jetons.
+
+    Les utilisateurs en attente sont servis à tour de rôle, `weight` demandes de suite chacun.
+    `acquire` retourne un ticket à rendre avec `release`, ou None : utiliser le fallback.
+    `listener` (optionnel, voir metrics.LLMSchedulerMetrics) reçoit chaque décision et l'occupation.
+    """
+
+    def __init__(self, max_in_flight=8, max_queue=32, max_wait=2.0, budget=None, clock=time.monotonic,
+                 listener=None):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.budget = budget
+        self.clock = clock
+        self.listener = listener
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        # user_id -> tickets en attente, dans l'ordre du tourniquet ; crédits restants du tour
+        self._queues = OrderedDict()
+        self._credits = {}
+        self._durations = deque(maxlen=100)
+        self._waits = deque(maxlen=1000)
+        self._stats = {"admitted": 0, "queued": 0, "max_queue_depth": 0, BUSY: 0, TIMEOUT: 0, BUDGET: 0,
+                       "hedged": 0, "hedge_refused": 0}
+
+    def acquire(self, user_id, tokens=0, weight=1):
+        """Obtenir un créneau d'appel, en attendant au plus `max_wait` secondes."""
+        if self.budget and not self.budget.allows(user_id, tokens):
+            return self._reject(user_id, BUDGET)
+        ticket = Ticket(user_id, tokens, weight, self.clock())
+        admitted = self._admit_or_queue(ticket)
+        if admitted is not False:
+            return admitted
+        ticket.event.wait(self.max_wait)
+        return self._after_wait(ticket)
+
+    async def acquire_async(self, user_id, tokens=0, weight=1):
+        """Équivalent de `acquire` pour la boucle d'événements (l'attente ne bloque aucun thread)."""
+        if self.budget and not await asyncio.to_thread(self.budget.allows, user_id, tokens):
+            return self._reject(user_id, BUDGET)
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        ticket = Ticket(user_id, tokens, weight, self.clock(), on_grant=notify)
+        admitted = self._admit_or_queue(ticket)
+        if admitted is not False:
+            return admitted
+        try:
+            await asyncio.wait_for(asyncio.shield(granted), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        return self._after_wait(ticket)
+
+    def acquire_hedge(self, ticket):
+        """Créneau supplémentaire pour la requête doublée de `ticket`, sans attente.
+
+        Compté comme un appel à part (plafond et budget de l'utilisateur) ; à rendre avec `release`.
+        Lève HedgeRefused si aucun créneau n'est libre ou si le budget ne couvre pas un second appel.
+        """
+        if self.budget and not self.budget.allows(ticket.user_id, ticket.tokens):
+            self._hedge_refused()
+        hedge = Ticket(ticket.user_id, ticket.tokens, 1, self.clock())
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._queued:
+                self._in_flight += 1
+                hedge.grant(hedge.requested)
+                self._decide("hedged")
+                self._changed()
+                return hedge
+        self._hedge_refused()
+
+    def _hedge_refused(self):
+        with self._lock:
+            self._decide("hedge_refused")
+        raise HedgeRefused("pas de créneau libre pour la requête doublée")
+
+    def release(self, ticket, tokens=None):
+        """Rendre le créneau ; `tokens` : jetons réellement consommés (à défaut, l'estimation)."""
+        with self._lock:
+            self._in_flight -= 1
+            self._durations.append(self.clock() - ticket.started)
+            self._dispatch()
+            self._changed()
+        if self.budget:
+            self.budget.charge(ticket.user_id, ticket.tokens if tokens is None else tokens)
+
+    def _admit_or_queue(self, ticket):
+        """Ticket admis tout de suite, False s'il est mis en file, None s'il est refusé."""
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._queued:
+                self._in_flight += 1
+                ticket.grant(ticket.requested)
+                self._record_admission(ticket)
+                self._changed()
+                return ticket
+            queued = self._queued
+            if queued >= self.max_queue or self._expected_wait(queued + 1) > self.max_wait:
+                self._decide(BUSY)
+            else:
+                queue = self._queues.get(ticket.user_id)
+                if queue is None:
+                    queue = self._queues[ticket.user_id] = deque()
+                    self._credits[ticket.user_id] = ticket.weight
+                queue.append(ticket)
+                self._queued += 1
+                self._decide("queued")
+                self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queued)
+                self._changed()
+                return False
+        logger.info("Gemini saturé (%d demandes en attente) : fallback pour %s", queued, ticket.user_id)
+        return None
+
+    def _after_wait(self, ticket):
+        with self._lock:
+            if not ticket.granted:
+                queue = self._queues[ticket.user_id]
+                queue.remove(ticket)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[ticket.user_id]
+                    del self._credits[ticket.user_id]
+                self._decide(TIMEOUT)
+                self._changed()
+                return None
+            self._record_admission(ticket)
+            return ticket
+
+    def _dispatch(self):
+        """Attribuer les créneaux libres aux utilisateurs en attente, à tour de rôle."""
+        now = self.clock()
+        while self._in_flight < self.max_in_flight and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self._queued -= 1
+            self._in_flight += 1
+            self._credits[user_id] -= 1
+            if not queue:
+                del self._queues[user_id]
+                del self._credits[user_id]
+            elif self._credits[user_id] <= 0:
+                self._queues.move_to_end(user_id)
+                self._credits[user_id] = queue[0].weight
+            ticket.grant(now)
+
+    def _expected_wait(self, position):
+        """Attente estimée (s) pour la `position`-ième demande en file, d'après les derniers appels."""
+        if not self._durations:
+            return 0.0
+        return statistics.fmean(self._durations) * math.ceil(position / self.max_in_flight)
+
+    def _record_admission(self, ticket):
+        self._decide("admitted", ticket.wait)
+        self._waits.append(ticket.wait * 1000)
+
+    def _decide(self, decision, wait=None):
+        """Compter une décision (verrou tenu) et la signaler au `listener`."""
+        self._stats[decision] += 1
+        if self.listener:
+            self.listener.decision(decision, wait)
+
+    def _changed(self):
+        """Signaler l'occupation (verrou tenu) après un changement d'appels en cours ou de file."""
+        if self.listener:
+            self.listener.occupancy(self._in_flight, self._queued)
+
+    def _reject(self, user_id, reason):
+        with self._lock:
+            self._decide(reason)
+        logger.info("Appel Gemini refusé (%s) pour %s : fallback", reason, user_id)
+        return None
+
+    def stats(self):
+        """Appels en cours, profondeur de la file, compteurs de décisions et attente (ms)."""
+        with self._lock:
+            stats = dict(self._stats, in_flight=self._in_flight, queue_depth=self._queued,
+                         users_waiting=len(self._queues))
+            waits = list(self._waits)
+        if len(waits) >= 2:
+            cuts = statistics.quantiles(waits, n=100)
+            stats.update(wait_p50_ms=statistics.median(waits), wait_p95_ms=cuts[94], wait_p99_ms=cuts[98])
+        return stats
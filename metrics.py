@@ -0,0 +1,236 @@
+"""
+Métriques Prometheus exposées sur /metrics : latence des routes, des appels Gemini, de la NER
+SpaCy, des commandes MongoDB, de l'attente d'une connexion MongoDB libre et des envois SMS/email,
+réponses de secours, refus du rate limiter, file et décisions de l'ordonnanceur Gemini.
+prometheus_client est optionnel : sans lui, les métriques ne font rien et /metrics répond 404.
+Sous gunicorn, PROMETHEUS_MULTIPROC_DIR (défini avant le démarrage) fait agréger les valeurs de
+tous les workers à chaque lecture (voir gunicorn_config.py).
+"""
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+from resilience import CircuitOpen, DeadlineExceeded
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                                   generate_latest, multiprocess)
+except ImportError:
+    Counter = Gauge = Histogram = None
+
+ENABLED = Counter is not None
+
+# Seuils des histogrammes (s) : Gemini est borné par GEMINI_DEADLINE, la NER et MongoDB sont rapides
+GEMINI_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 12, 15, 20, 30)
+NER_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+# Attente d'une connexion du groupe : quasi nulle tant qu'il n'est pas saturé, bornée par MONGO_WAIT_QUEUE_TIMEOUT_MS
+POOL_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SEND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 15, 30)
+# Attente d'un créneau Gemini : bornée par LLM_MAX_WAIT
+LLM_WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+
+
+class _NoopMetric:
+    """Métrique sans effet quand prometheus_client n'est pas installé."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def set(self, value):
+        pass
+
+    def time(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    if not ENABLED:
+        return _NoopMetric()
+    return kind(name, documentation, labelnames, **kwargs)
+
+
+HTTP_REQUEST_DURATION = _metric(
+    Histogram, 'http_request_duration_seconds',
+    "Durée de traitement des requêtes HTTP (jusqu'aux en-têtes pour les réponses en flux)",
+    ['method', 'route', 'status'])
+GEMINI_CALLS = _metric(
+    Counter, 'gemini_calls_total',
+    "Appels Gemini par résultat (ok, error, deadline, circuit_open, refused)", ['mode', 'outcome'])
+GEMINI_CALL_DURATION = _metric(
+    Histogram, 'gemini_call_duration_seconds', "Durée des appels Gemini effectués",
+    ['mode', 'outcome'], buckets=GEMINI_BUCKETS)
+CHAT_ANSWERS = _metric(
+    Counter, 'chat_answers_total', "Réponses du chatbot par origine (cache, gemini, fallback)", ['source'])
+NER_DURATION = _metric(
+    Histogram, 'spacy_ner_duration_seconds', "Durée de la NER SpaCy dans extract_user_data",
+    buckets=NER_BUCKETS)
+MONGO_COMMAND_DURATION = _metric(
+    Histogram, 'mongodb_command_duration_seconds', "Durée des commandes MongoDB par collection",
+    ['collection', 'command', 'outcome'], buckets=MONGO_BUCKETS)
+MONGO_POOL_CHECKOUT_DURATION = _metric(
+    Histogram, 'mongodb_pool_checkout_seconds',
+    "Attente d'une connexion du groupe MongoDB (ok, timeout, poolClosed, connectionError)",
+    ['outcome'], buckets=POOL_BUCKETS)
+MONGO_POOL_CONNECTIONS = _metric(
+    Counter, 'mongodb_pool_connections_total', "Connexions MongoDB ouvertes (created) et fermées (closed)",
+    ['event'])
+NOTIFICATION_SEND_DURATION = _metric(
+    Histogram, 'notification_send_duration_seconds', "Durée des envois de SMS et d'emails",
+    ['channel', 'outcome'], buckets=SEND_BUCKETS)
+RATE_LIMITED = _metric(
+    Counter, 'rate_limit_rejections_total', "Requêtes refusées par le rate limiter (429)", ['route'])
+LLM_SCHEDULER_DECISIONS = _metric(
+    Counter, 'llm_scheduler_decisions_total',
+    "Décisions de l'ordonnanceur Gemini (admitted, queued, busy, timeout, budget, hedged, hedge_refused)",
+    ['decision'])
+LLM_SCHEDULER_WAIT = _metric(
+    Histogram, 'llm_scheduler_wait_seconds', "Attente d'un créneau Gemini des appels admis",
+    buckets=LLM_WAIT_BUCKETS)
+# Somme des workers vivants en mode multiprocessus
+LLM_SCHEDULER_IN_FLIGHT = _metric(
+    Gauge, 'llm_scheduler_in_flight', "Appels Gemini en cours", multiprocess_mode='livesum')
+LLM_SCHEDULER_QUEUE_DEPTH = _metric(
+    Gauge, 'llm_scheduler_queue_depth', "Demandes d'appel Gemini en attente d'un créneau",
+    multiprocess_mode='livesum')
+
+
+def observe_gemini(mode, error=None, started=None):
+    """Compter un appel Gemini terminé (`error` : exception levée, None si réussi).
+
+    `started` (time.perf_counter()) : durée observée, sauf si l'appel n'a pas été tenté.
+    """
+    if error is None:
+        outcome = 'ok'
+    elif isinstance(error, CircuitOpen):
+        outcome = 'circuit_open'
+    elif isinstance(error, DeadlineExceeded):
+        outcome = 'deadline'
+    else:
+        outcome = 'error'
+    GEMINI_CALLS.labels(mode, outcome).inc()
+    if started is not None and outcome != 'circuit_open':
+        GEMINI_CALL_DURATION.labels(mode, outcome).observe(time.perf_counter() - started)
+
+
+def timed_transport(channel, transport):
+    """Transport de la file de notifications dont chaque envoi est chronométré."""
+    def send(payload):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = transport(payload)
+            outcome = 'ok'
+            return result
+        finally:
+            NOTIFICATION_SEND_DURATION.labels(channel, outcome).observe(time.perf_counter() - started)
+    return send
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Durée des commandes MongoDB, par collection (nom lu dans l'événement de début)."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        target = event.command.get('collection' if event.command_name == 'getMore' else event.command_name)
+        # Commandes d'administration (hello, ping, endSessions...) : pas de collection
+        if isinstance(target, str):
+            with self._lock:
+                self._pending[(event.connection_id, event.request_id)] = target
+
+    def succeeded(self, event):
+        self._observe(event, 'ok')
+
+    def failed(self, event):
+        self._observe(event, 'error')
+
+    def _observe(self, event, outcome):
+        with self._lock:
+            collection = self._pending.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            MONGO_COMMAND_DURATION.labels(collection, event.command_name, outcome).observe(
+                event.duration_micros / 1e6)
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Attente des connexions prises dans le groupe (checkout) et connexions ouvertes ou fermées."""
+
+    def connection_checked_out(self, event):
+        if event.duration is not None:
+            MONGO_POOL_CHECKOUT_DURATION.labels('ok').observe(event.duration)
+
+    def connection_check_out_failed(self, event):
+        if event.duration is not None:
+            MONGO_POOL_CHECKOUT_DURATION.labels(event.reason).observe(event.duration)
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.labels('created').inc()
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.labels('closed').inc()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+class LLMSchedulerMetrics:
+    """Écouteur de llm_scheduler.LLMScheduler : décisions, attente des appels admis et occupation."""
+
+    def decision(self, decision, wait=None):
+        LLM_SCHEDULER_DECISIONS.labels(decision).inc()
+        if wait is not None:
+            LLM_SCHEDULER_WAIT.observe(wait)
+
+    def occupancy(self, in_flight, queued):
+        LLM_SCHEDULER_IN_FLIGHT.set(in_flight)
+        LLM_SCHEDULER_QUEUE_DEPTH.set(queued)
+
+
+def mongo_listeners():
+    """Écouteurs à passer à MongoClient(event_listeners=...) : aucun sans prometheus_client."""
+    return [MongoCommandMetrics(), MongoPoolMetrics()] if ENABLED else []
+
+
+def render():
+    """Corps et type de la réponse /metrics (valeurs de tous les workers en mode multiprocessus)."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,199 @@
+"""
+File d'envoi des notifications (SMS, email) persistée dans MongoDB.
+Les routes enregistrent un travail et répondent aussitôt ; un groupe de threads le réclame
+de façon atomique, l'envoie et le réessaie avec un délai exponentiel en cas d'échec.
+Un travail réclamé par un worker arrêté brutalement redevient disponible après `lease` secondes.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+QUEUED, PROCESSING, SENT, FAILED = 'queued', 'processing', 'sent', 'failed'
+
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class FakeTransport:
+    """Transport local (NOTIFICATION_TRANSPORT=fake) : simule la latence et les échecs du fournisseur."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, payload):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._random.random() < self.failure_rate:
+                raise ConnectionError("échec simulé du fournisseur")
+            self.sent.append(payload)
+
+
+class NotificationQueue:
+    """File de travaux d'envoi dans une collection MongoDB, traitée par un groupe de threads.
+
+    `transports` associe chaque canal ('sms', 'email') à une fonction d'envoi qui lève
+    une exception en cas d'échec.
+    """
+
+    def __init__(self, collection, transports, workers=2, max_attempts=5, backoff_base=30.0,
+                 backoff_max=3600.0, lease=120.0, poll_interval=1.0):
+        self.collection = collection
+        self.transports = transports
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"enqueued": 0, "sent": 0, "retried": 0, "failed": 0}
+
+    def enqueue(self, channel, payload, run_at=None):
+        """Enregistrer un envoi et retourner l'identifiant du travail."""
+        if channel not in self.transports:
+            raise ValueError(f"Canal de notification inconnu : {channel}")
+        now = utcnow()
+        result = self.collection.insert_one({
+            "channel": channel,
+            "payload": payload,
+            "status": QUEUED,
+            "attempts": 0,
+            "run_at": run_at or now,
+            "created_at": now,
+        })
+        self._count("enqueued")
+        self.start()
+        self._wakeup.set()
+        return result.inserted_id
+
+    def enqueue_many(self, channel, payloads, keys=None):
+        """Enregistrer plusieurs envois en une écriture.
+
+        `keys` identifie chaque envoi (index unique) : un envoi déjà en file n'est pas dupliqué,
+        ce qui permet de rejouer un lot sans risque. Retourne le nombre d'envois ajoutés.
+        """
+        if channel not in self.transports:
+            raise ValueError(f"Canal de notification inconnu : {channel}")
+        now = utcnow()
+        jobs = [{"channel": channel, "payload": payload, "status": QUEUED, "attempts": 0,
+                 "run_at": now, "created_at": now} for payload in payloads]
+        for job, key in zip(jobs, keys or []):
+            job["key"] = key
+        if not jobs:
+            return 0
+        try:
+            inserted = len(self.collection.insert_many(jobs, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+            inserted = e.details["nInserted"]
+        self._count("enqueued", inserted)
+        self.start()
+        self._wakeup.set()
+        return inserted
+
+    def claim(self):
+        """Réclamer le prochain travail dû, ou un travail dont le bail a expiré.
+
+        Le champ `run_at` d'un travail en cours porte la fin de son bail : une seule
+        requête indexée sur (status, run_at) couvre les deux cas.
+        """
+        now = utcnow()
+        return self.collection.find_one_and_update(
+            {"status": {"$in": [QUEUED, PROCESSING]}, "run_at": {"$lte": now}},
+            {"$set": {"status": PROCESSING, "run_at": now + timedelta(seconds=self.lease),
+                      "claim": uuid.uuid4().hex},
+             "$inc": {"attempts": 1}},
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def backoff(self, attempts):
+        """Délai avant la tentative suivante : exponentiel, plafonné, avec gigue."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def process(self, job):
+        """Envoyer un travail réclamé et enregistrer le résultat (si le bail est toujours détenu)."""
+        owned = {"_id": job["_id"], "claim": job["claim"]}
+        try:
+            self.transports[job["channel"]](job["payload"])
+        except Exception as e:
+            if job["attempts"] >= self.max_attempts:
+                logger.error("Notification %s abandonnée après %d tentatives : %s", job["_id"], job["attempts"], e)
+                self.collection.update_one(owned, {"$set": {"status": FAILED, "last_error": str(e)}})
+                self._count("failed")
+            else:
+                retry_at = utcnow() + timedelta(seconds=self.backoff(job["attempts"]))
+                self.collection.update_one(owned, {"$set": {"status": QUEUED, "run_at": retry_at, "last_error": str(e)}})
+                self._count("retried")
+            return False
+        result = self.collection.update_one(owned, {"$set": {"status": SENT, "sent_at": utcnow()}})
+        if not result.matched_count:
+            # Bail expiré pendant l'envoi : un autre worker a repris le travail (envoi au moins une fois)
+            logger.warning("Notification %s envoyée après expiration de son bail", job["_id"])
+            return False
+        self._count("sent")
+        return True
+
+    def process_one(self):
+        """Traiter un travail dû. Retourne False s'il n'y en avait aucun."""
+        job = self.claim()
+        if job is None:
+            return False
+        self.process(job)
+        return True
+
+    def start(self):
+        """Démarrer les threads d'envoi (sans effet s'ils tournent déjà ou si `workers` vaut 0)."""
+        with self._lock:
+            if self._threads or self.workers <= 0:
+                return
+            self._stop.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"notifications-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        self._stop.set()
+        self._wakeup.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.process_one():
+                    continue
+            except Exception as e:
+                logger.warning("Erreur de la file de notifications : %s", e)
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,83 @@
+"""
+Hachage des mots de passe (Werkzeug) dans un groupe borné de processus, avec un algorithme
+et un coût configurables. Les hachages créés avec d'autres paramètres restent vérifiables ;
+`needs_rehash` signale ceux à recalculer après une connexion réussie.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+def normalize_method(method):
+    """Paramètres complets tels que Werkzeug les enregistre en tête du hachage.
+
+    'scrypt' -> 'scrypt:32768:8:1', 'pbkdf2' -> 'pbkdf2:sha256:<itérations par défaut>'.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Méthode de hachage inconnue : {method}")
+
+
+class PasswordHasher:
+    """Hachage et vérification dans `workers` processus (0 : dans le thread appelant).
+
+    scrypt et pbkdf2 relâchent le GIL mais occupent un cœur (et 32 Mo pour scrypt par défaut)
+    pendant des centaines de millisecondes : le groupe borne le nombre de calculs simultanés
+    par worker gunicorn, les demandes suivantes attendent leur tour (au plus `timeout` s).
+    Processus lancés à la première demande, méthode 'spawn' (le processus parent a des threads).
+    """
+
+    def __init__(self, method='scrypt', workers=2, timeout=10.0):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        future = self._pool().submit(function, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # Demande abandonnée : retirée de la file si aucun processus ne l'a encore prise
+            future.cancel()
+            raise
+        except BrokenProcessPool:
+            # Processus tué (mémoire, signal) : un nouveau groupe à la prochaine demande
+            with self._lock:
+                self._executor = None
+            raise
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Vrai si le hachage a été créé avec d'autres paramètres que ceux configurés."""
+        return pwhash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,125 @@
+"""
+Envoi des rappels à leur date. Chaque rappel porte `fire_at` (UTC), indexé avec son statut.
+À chaque passage, les rappels dus sont réclamés par lots (update_many avec un jeton de
+réclamation) puis confiés à la file d'envoi des notifications : plusieurs workers ou serveurs
+peuvent tourner en même temps sans envoyer deux fois le même rappel, et chaque passage ne lit
+que les rappels dus, quel que soit le nombre de rappels en attente.
+"""
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from notifications import utcnow
+
+logger = logging.getLogger(__name__)
+
+PENDING, CLAIMED, DISPATCHED, EXPIRED = 'pending', 'claimed', 'dispatched', 'expired'
+
+
+def parse_fire_at(reminder_date, reminder_time, tz, default_time='08:00'):
+    """Date ('AAAA-MM-JJ') et heure ('HH:MM') locales saisies → datetime UTC naïf. Lève ValueError."""
+    local = datetime.strptime(f"{reminder_date} {reminder_time or default_time}", "%Y-%m-%d %H:%M")
+    return local.replace(tzinfo=ZoneInfo(tz)).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class ReminderScheduler:
+    """Réclame les rappels dus par lots et les passe à `dispatch` (liste de documents).
+
+    `dispatch` lève une exception en cas d'échec : les rappels restent alors réclamés et
+    redeviennent disponibles à l'expiration du bail (`lease` secondes).
+    """
+
+    def __init__(self, collection, dispatch, batch_size=500, lease=300.0, poll_interval=30.0):
+        self.collection = collection
+        self.dispatch = dispatch
+        self.batch_size = batch_size
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"ticks": 0, "claimed": 0, "dispatched": 0, "errors": 0}
+
+    def release_expired(self, now):
+        """Remettre en attente les rappels réclamés par un passage interrompu."""
+        return self.collection.update_many(
+            {"status": CLAIMED, "lease_until": {"$lte": now}},
+            {"$set": {"status": PENDING}, "$unset": {"claim": ""}}
+        ).modified_count
+
+    def claim_batch(self, now):
+        """Réclamer au plus `batch_size` rappels dus ; seuls ceux marqués de notre jeton sont retournés."""
+        ids = [r["_id"] for r in self.collection.find(
+            {"status": PENDING, "fire_at": {"$lte": now}}, {"_id": 1}
+        ).sort("fire_at", 1).limit(self.batch_size)]
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        self.collection.update_many(
+            {"_id": {"$in": ids}, "status": PENDING},
+            {"$set": {"status": CLAIMED, "claim": token, "lease_until": now + timedelta(seconds=self.lease)}}
+        )
+        # Un autre passage concurrent a pu réclamer une partie du lot entre-temps
+        return list(self.collection.find({"_id": {"$in": ids}, "claim": token}))
+
+    def run_once(self, now=None):
+        """Envoyer tous les rappels dus. Retourne le nombre de rappels transmis."""
+        now = now or utcnow()
+        self.release_expired(now)
+        dispatched = 0
+        while True:
+            batch = self.claim_batch(now)
+            if not batch:
+                break
+            self._count("claimed", len(batch))
+            try:
+                self.dispatch(batch)
+            except Exception as e:
+                logger.error("Échec de l'envoi de %d rappels : %s", len(batch), e)
+                self._count("errors")
+                break
+            ids = [r["_id"] for r in batch]
+            self.collection.update_many(
+                {"_id": {"$in": ids}, "claim": batch[0]["claim"]},
+                {"$set": {"status": DISPATCHED, "dispatched_at": utcnow()}}
+            )
+            dispatched += len(batch)
+            if len(batch) < self.batch_size:
+                break
+        self._count("ticks")
+        self._count("dispatched", dispatched)
+        return dispatched
+
+    def start(self):
+        """Démarrer la boucle de scrutation dans un thread (sans effet si elle tourne déjà)."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="reminders", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning("Erreur du planificateur de rappels : %s", e)
+            self._stop.wait(self.poll_interval)
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
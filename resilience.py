@@ -0,0 +1,285 @@
+"""
+Appels résilients vers un service externe (Gemini) : délai maximal par requête, requête doublée
+(hedging) quand la première dépasse le p95 des latences observées, et disjoncteur qui renvoie
+directement vers le fallback tant que le service échoue, puis le sonde pour détecter son retour.
+La latence d'un appel reste ainsi bornée même quand le service ralentit ou ne répond plus.
+"""
+import asyncio
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Fin d'un flux lu fragment par fragment dans le pool de threads
+_END = object()
+
+
+class DeadlineExceeded(TimeoutError):
+    """L'appel n'a pas abouti avant son délai maximal."""
+
+
+class CircuitOpen(Exception):
+    """Le disjoncteur est ouvert : le service n'est pas appelé."""
+
+
+class CircuitBreaker:
+    """Disjoncteur : ouvert après `failure_threshold` échecs consécutifs.
+
+    Après `reset_timeout` secondes, une seule requête de sonde passe (demi-ouvert) :
+    son succès referme le circuit, son échec le rouvre pour `reset_timeout` secondes.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "short_circuited": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def available(self):
+        """Vrai si un appel pourrait passer (sans réserver la sonde du mode demi-ouvert)."""
+        return self.state != OPEN
+
+    def allow(self):
+        """Autoriser un appel ; en demi-ouvert, un seul appel de sonde à la fois."""
+        with self._lock:
+            if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._probing = False
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._stats["short_circuited"] += 1
+            return False
+
+    def abandon(self):
+        """Appel autorisé puis abandonné sans résultat : libérer la sonde éventuelle."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info("Disjoncteur refermé : le service répond de nouveau")
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                logger.warning("Disjoncteur ouvert après %d échecs : fallback pendant %.0f s",
+                               self._failures, self.reset_timeout)
+                self._state = OPEN
+                self._opened_at = self.clock()
+                self._probing = False
+                self._stats["opened"] += 1
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            return dict(self._stats, state=state, consecutive_failures=self._failures)
+
+
+class ResilientCaller:
+    """Exécute des appels bloquants avec délai maximal, hedging et disjoncteur.
+
+    `hedge_after` : délai (s) avant la seconde requête tant qu'il y a trop peu de mesures ;
+    ensuite le quantile `hedge_quantile` des dernières latences réussies. None : pas de hedging.
+    Les appels tournent dans un pool de threads : un appel bloqué au-delà du délai continue
+    en arrière-plan (le client HTTP doit avoir son propre timeout) mais ne bloque plus la requête.
+    """
+
+    def __init__(self, deadline=15.0, hedge_after=None, hedge_quantile=0.95, breaker=None,
+                 max_workers=32, clock=time.monotonic):
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.hedge_quantile = hedge_quantile
+        self.breaker = breaker
+        self.clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resilient")
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "succeeded": 0, "failed": 0, "deadline_exceeded": 0,
+                       "hedged": 0, "hedge_won": 0, "short_circuited": 0}
+
+    def available(self):
+        """Faux tant que le disjoncteur est ouvert : passer directement au fallback."""
+        if self.breaker is None or self.breaker.available():
+            return True
+        self._count("short_circuited")
+        return False
+
+    def hedge_delay(self):
+        """Délai avant la requête doublée : quantile des latences récentes, ou `hedge_after`."""
+        with self._lock:
+            latencies = list(self._latencies)
+        if len(latencies) < 20:
+            return min(self.hedge_after, self.deadline)
+        cut = statistics.quantiles(latencies, n=100)[round(self.hedge_quantile * 100) - 1]
+        return min(cut, self.deadline)
+
+    def call(self, attempt, hedge=None):
+        """Résultat de `attempt()`, ou de `hedge()` (essai indépendant) s'il arrive le premier.
+
+        Lève CircuitOpen, DeadlineExceeded ou l'erreur de l'essai.
+        """
+        self._begin()
+        hedge = hedge if self.hedge_after is not None else None
+        started = self.clock()
+        hedge_at = started + self.hedge_delay() if hedge else None
+        futures = {self._executor.submit(attempt): False}
+        try:
+            while True:
+                remaining = started + self.deadline - self.clock()
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"pas de réponse après {self.deadline:.1f} s")
+                timeout = remaining if hedge_at is None else min(remaining, max(0.0, hedge_at - self.clock()))
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    is_hedge = futures.pop(future)
+                    if future.exception() is None:
+                        self._succeeded(started, is_hedge)
+                        return future.result()
+                    # Un essai en erreur (et non lent) n'est pas doublé : l'erreur remonte
+                    if not futures:
+                        raise future.exception()
+                if hedge_at is not None and self.clock() >= hedge_at:
+                    futures[self._executor.submit(hedge)] = True
+                    hedge_at = None
+                    self._count("hedged")
+        except Exception as e:
+            self._failed(e)
+            raise
+        except BaseException:
+            # Requête abandonnée par le client : ni succès ni échec du service
+            if self.breaker:
+                self.breaker.abandon()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+    async def call_async(self, attempt, hedge=None):
+        """Équivalent de `call` pour des coroutines (`attempt()` et `hedge()` en retournent une)."""
+        self._begin()
+        hedge = hedge if self.hedge_after is not None else None
+        started = self.clock()
+        hedge_at = started + self.hedge_delay() if hedge else None
+        tasks = {asyncio.ensure_future(attempt()): False}
+        try:
+            while True:
+                remaining = started + self.deadline - self.clock()
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"pas de réponse après {self.deadline:.1f} s")
+                timeout = remaining if hedge_at is None else min(remaining, max(0.0, hedge_at - self.clock()))
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    is_hedge = tasks.pop(task)
+                    if task.exception() is None:
+                        self._succeeded(started, is_hedge)
+                        return task.result()
+                    if not tasks:
+                        raise task.exception()
+                if hedge_at is not None and self.clock() >= hedge_at:
+                    tasks[asyncio.ensure_future(hedge())] = True
+                    hedge_at = None
+                    self._count("hedged")
+        except Exception as e:
+            self._failed(e)
+            raise
+        except BaseException:
+            # Requête abandonnée par le client : ni succès ni échec du service
+            if self.breaker:
+                self.breaker.abandon()
+            raise
+        finally:
+            # Contrairement aux threads, les essais asynchrones perdants sont annulés
+            for task in tasks:
+                task.cancel()
+
+    def stream(self, start):
+        """Fragments de l'itérable retourné par `start()`, chacun attendu au plus `deadline` secondes.
+
+        Pas de hedging (le texte est déjà envoyé au client) ; le disjoncteur compte le flux entier.
+        """
+        self._begin()
+        try:
+            iterator = iter(start())
+            while True:
+                chunk = self.run(lambda: next(iterator, _END), self.deadline)
+                if chunk is _END:
+                    break
+                yield chunk
+        except Exception as e:
+            self._failed(e)
+            raise
+        except BaseException:
+            if self.breaker:
+                self.breaker.abandon()
+            raise
+        self._succeeded(None, False)
+
+    def run(self, fn, timeout):
+        """Exécuter `fn()` avec un délai maximal, sans hedging ni disjoncteur (fragments d'un flux)."""
+        future = self._executor.submit(fn)
+        done, _ = wait([future], timeout=timeout)
+        if not done:
+            future.cancel()
+            raise DeadlineExceeded(f"pas de réponse après {timeout:.1f} s")
+        return future.result()
+
+    def _begin(self):
+        if self.breaker and not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpen("service indisponible (disjoncteur ouvert)")
+        self._count("calls")
+
+    def _succeeded(self, started, is_hedge):
+        with self._lock:
+            if started is not None:
+                self._latencies.append(self.clock() - started)
+            self._stats["succeeded"] += 1
+            self._stats["hedge_won"] += is_hedge
+        if self.breaker:
+            self.breaker.record_success()
+
+    def _failed(self, error):
+        self._count("deadline_exceeded" if isinstance(error, DeadlineExceeded) else "failed")
+        if self.breaker:
+            self.breaker.record_failure()
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        """Compteurs d'appels, latence p95 (ms) et état du disjoncteur."""
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = list(self._latencies)
+        if len(latencies) >= 2:
+            stats["p95_ms"] = statistics.quantiles(latencies, n=20)[-1] * 1000
+        if self.breaker:
+            stats["breaker"] = self.breaker.stats()
+        return stats
@@ -0,0 +1,129 @@
+"""
+Envoi des SMS via Twilio avec un client partagé par tous les threads du processus :
+connexions HTTP persistantes (keep-alive) réutilisées d'un envoi à l'autre, débit limité
+par un seau à jetons (limite du fournisseur) et envoi groupé à concurrence bornée.
+"""
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+
+class TokenBucket:
+    """Seau à jetons : `rate` jetons par seconde, au plus `capacity` d'avance."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Prendre un jeton, en attendant si nécessaire. Retourne le temps d'attente (s)."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Le jeton est réservé tout de suite : les threads suivants attendent leur tour
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+class SmsTransport:
+    """Client Twilio partagé et thread-safe.
+
+    Le client (et sa session HTTP) est créé au premier envoi, donc après le fork des
+    workers gunicorn. Utilisable directement comme transport de la file de notifications.
+    """
+
+    def __init__(self, account_sid, auth_token, from_number, rate=10.0, burst=None,
+                 pool_size=10, timeout=15.0, base_url=None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.base_url = base_url
+        self.bucket = TokenBucket(rate, burst)
+        self._client = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._stats = {"sent": 0, "failed": 0, "throttled_s": 0.0}
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    http_client = TwilioHttpClient(pool_connections=True, timeout=self.timeout)
+                    # Autant de connexions gardées ouvertes que d'envois simultanés possibles
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    http_client.session.mount("https://", adapter)
+                    http_client.session.mount("http://", adapter)
+                    client = Client(self.account_sid, self.auth_token, http_client=http_client)
+                    if self.base_url:
+                        client.api.base_url = self.base_url
+                    self._client = client
+        return self._client
+
+    def send(self, to, body):
+        """Envoyer un SMS et retourner son identifiant Twilio (lève une exception en cas d'échec)."""
+        waited = self.bucket.acquire()
+        started = time.perf_counter()
+        try:
+            message = self.client.messages.create(body=body, from_=self.from_number, to=to)
+        except Exception:
+            self._record("failed", waited, started)
+            raise
+        self._record("sent", waited, started)
+        return message.sid
+
+    def __call__(self, payload):
+        self.send(payload["to"], payload["body"])
+
+    def send_many(self, messages, concurrency=None):
+        """Envoyer une série de SMS (`(numéro, texte)`) avec au plus `concurrency` envois simultanés.
+
+        Les échecs n'interrompent pas l'envoi : retourne, dans l'ordre, un résultat par message
+        (`to`, `sid` ou `error`, `latency_ms`).
+        """
+        def send_one(message):
+            to, body = message
+            result = {"to": to, "sid": None, "error": None}
+            started = time.perf_counter()
+            try:
+                result["sid"] = self.send(to, body)
+            except Exception as e:
+                result["error"] = str(e)
+            result["latency_ms"] = (time.perf_counter() - started) * 1000
+            return result
+
+        with ThreadPoolExecutor(max_workers=min(concurrency or self.pool_size, self.pool_size)) as executor:
+            return list(executor.map(send_one, messages))
+
+    def _record(self, outcome, waited, started):
+        with self._lock:
+            self._stats[outcome] += 1
+            self._stats["throttled_s"] += waited
+            self._latencies.append((time.perf_counter() - started) * 1000)
+
+    def stats(self):
+        """Compteurs d'envoi et latence par message (ms) sur les 1000 derniers envois."""
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = list(self._latencies)
+        if len(latencies) >= 2:
+            cuts = statistics.quantiles(latencies, n=100)
+            stats.update(p50_ms=statistics.median(latencies), p95_ms=cuts[94], p99_ms=cuts[98])
+        return stats
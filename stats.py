@@ -0,0 +1,139 @@
+"""
+Compteurs du panel d'administration, tenus à jour à chaque écriture plutôt que recalculés
+(count_documents parcourt tout l'index) à chaque affichage. La collection `stats` contient :
+
+- le document des totaux (`_id: "totals"`), incrémenté avec $inc ;
+- un document par jour (`_id: "day:AAAA-MM-JJ"`) : inscriptions, échanges et rappels du jour.
+
+Les totaux sont recalculés périodiquement (réconciliation) pour corriger les écarts laissés
+par une écriture perdue ; un seul worker s'en charge à chaque période (réclamation atomique).
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+TOTALS_ID = 'totals'
+DAILY_FIELDS = ('signups', 'chats', 'reminders')
+
+
+def day_key(day):
+    """Identifiant du document d'un jour (date ou datetime)."""
+    return f"day:{day:%Y-%m-%d}"
+
+
+class StatsCounters:
+    """Compteurs incrémentaux et séries quotidiennes dans `collection`.
+
+    `sources` associe chaque total à la requête qui le recalcule :
+    {"users": (users_collection, {}), "users_confirmed": (users_collection, {"confirmed": True}), ...}.
+    """
+
+    def __init__(self, collection, sources, reconcile_interval=3600.0):
+        self.collection = collection
+        self.sources = sources
+        self.reconcile_interval = reconcile_interval
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"reconciled": 0, "errors": 0}
+
+    def record(self, now, totals=None, daily=None):
+        """Incrémenter des totaux et les compteurs du jour de `now` ($inc atomiques, documents créés au besoin).
+
+        Une panne de MongoDB ne fait pas échouer la requête : l'écart est corrigé par la réconciliation.
+        """
+        try:
+            if totals:
+                self.collection.update_one({"_id": TOTALS_ID}, {"$inc": totals}, upsert=True)
+            if daily:
+                self.collection.update_one({"_id": day_key(now)},
+                                           {"$inc": daily, "$setOnInsert": {"date": f"{now:%Y-%m-%d}"}},
+                                           upsert=True)
+        except PyMongoError as e:
+            logger.warning("Compteurs non mis à jour (%s, %s) : %s", totals, daily, e)
+            self._count("errors")
+
+    def reconcile(self, now):
+        """Recalculer les totaux depuis les collections sources. Retourne les totaux."""
+        counts = {name: collection.count_documents(query) for name, (collection, query) in self.sources.items()}
+        self.collection.update_one({"_id": TOTALS_ID}, {"$set": {**counts, "reconciled_at": now}}, upsert=True)
+        self._count("reconciled")
+        logger.info("Compteurs réconciliés : %s", counts)
+        return counts
+
+    def claim_reconcile(self, now):
+        """Réserver la prochaine réconciliation ; faux si un autre worker l'a déjà faite pour cette période."""
+        try:
+            self.collection.update_one(
+                {"_id": TOTALS_ID, "$or": [{"reconcile_after": {"$exists": False}},
+                                           {"reconcile_after": {"$lte": now}}]},
+                {"$set": {"reconcile_after": now + timedelta(seconds=self.reconcile_interval)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Document existant mais période non échue : l'upsert tente une insertion en double
+            return False
+        return True
+
+    def run_once(self, now):
+        """Réconcilier si la période est échue. Retourne vrai si la réconciliation a eu lieu."""
+        if not self.claim_reconcile(now):
+            return False
+        self.reconcile(now)
+        return True
+
+    def totals(self, now):
+        """Totaux courants ; calculés une fois si la collection `stats` est encore vide."""
+        totals = self.collection.find_one({"_id": TOTALS_ID})
+        if totals is None or not all(name in totals for name in self.sources):
+            return self.reconcile(now)
+        return {name: totals[name] for name in self.sources}
+
+    def daily(self, today, days=30):
+        """Série des `days` derniers jours (jusqu'à `today` inclus), jours sans activité à zéro."""
+        first = today - timedelta(days=days - 1)
+        found = {doc["_id"]: doc for doc in self.collection.find(
+            {"_id": {"$gte": day_key(first), "$lte": day_key(today)}})}
+        series = []
+        for offset in range(days):
+            day = first + timedelta(days=offset)
+            doc = found.get(day_key(day), {})
+            series.append({"date": f"{day:%Y-%m-%d}", **{field: doc.get(field, 0) for field in DAILY_FIELDS}})
+        return series
+
+    def start(self, clock):
+        """Réconcilier périodiquement dans un thread ; `clock` retourne l'heure courante."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(clock,), name="stats", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        self._stop.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self, clock):
+        while not self._stop.is_set():
+            try:
+                self.run_once(clock())
+            except Exception as e:
+                logger.warning("Erreur de la réconciliation des compteurs : %s", e)
+                self._count("errors")
+            self._stop.wait(self.reconcile_interval)
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
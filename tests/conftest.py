@@ -1,11 +1,18 @@
 import pytest
 import os
+import mongomock
 from unittest.mock import patch, MagicMock
 
+from resilience import CircuitBreaker, ResilientCaller
+
 # Définir les variables d'environnement avant d'importer l'app
 os.environ.setdefault('SECRET_KEY', 'test-secret-key-for-testing-only')
 os.environ.setdefault('MONGO_URI', 'mongodb://localhost:27017/chatbot_test')
 os.environ.setdefault('DEBUG', 'False')
+# PDF et mots de passe traités dans le thread de la requête : les collections et fonctions
+# simulées ne sont pas visibles d'un autre processus
+os.environ.setdefault('PDF_RENDER_WORKERS', '0')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
 
 
 @pytest.fixture
@@ -41,10 +48,24 @@ def app():
         mock_spacy.return_value = MagicMock()
         mock_genai.Client.return_value = MagicMock()
 
-        from app import app as flask_app
+        from app import (app as flask_app, answer_cache, gemini_sessions, history_counts, limiter, stats_counters,
+                         topic_analytics, user_cache)
+        # Repartir de caches vides : chaque test fournit ses propres réponses
+        answer_cache.clear()
+        gemini_sessions.clear()
+        history_counts.clear()
+        user_cache.clear()
+        # Compteurs du rate limiter et budgets de jetons Gemini remis à zéro
+        limiter.reset()
         flask_app.config['TESTING'] = True
         flask_app.config['WTF_CSRF_ENABLED'] = False
-        yield flask_app
+        # Compteurs et sujets du panel d'administration dans une base simulée vide
+        admin_db = mongomock.MongoClient()['chatbot']
+        # Disjoncteur et latences Gemini propres à chaque test
+        with patch('app.gemini_caller', ResilientCaller(deadline=5, hedge_after=1, breaker=CircuitBreaker())), \
+             patch.object(stats_counters, 'collection', admin_db['stats']), \
+             patch.object(topic_analytics, 'collection', admin_db['analytics']):
+            yield flask_app
 
 
 @pytest.fixture
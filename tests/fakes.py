@@ -0,0 +1,419 @@
+"""
+Faux clients externes (Gemini, Twilio, collections MongoDB) utilisés par les tests et les benchmarks.
+"""
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from types import SimpleNamespace
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+class FakeChat:
+    """Session de chat factice : découpe une réponse fixe en fragments."""
+
+    def __init__(self, client, history):
+        self.client = client
+        self.history = history
+
+    def _chunks(self):
+        reply = self.client.reply
+        size = self.client.chunk_size
+        return [reply[i:i + size] for i in range(0, len(reply), size)]
+
+    def send_message(self, message):
+        self.client.sent_messages.append(message)
+        if self.client.error:
+            raise self.client.error
+        # Le mode bloquant attend la génération complète
+        time.sleep(self.client.first_chunk_delay + self.client.chunk_delay * len(self._chunks()))
+        return SimpleNamespace(text=self.client.reply)
+
+    def send_message_stream(self, message):
+        self.client.sent_messages.append(message)
+        if self.client.error and self.client.error_after is None:
+            raise self.client.error
+        time.sleep(self.client.first_chunk_delay)
+        for i, chunk in enumerate(self._chunks()):
+            if i == self.client.error_after:
+                raise self.client.error
+            if i:
+                time.sleep(self.client.chunk_delay)
+            yield SimpleNamespace(text=chunk)
+
+
+class FakeAsyncChat(FakeChat):
+    """Équivalent de FakeChat pour le client asynchrone (`client.aio`)."""
+
+    async def send_message(self, message):
+        self.client.sent_messages.append(message)
+        if self.client.error:
+            raise self.client.error
+        await asyncio.sleep(self.client.first_chunk_delay + self.client.chunk_delay * len(self._chunks()))
+        return SimpleNamespace(text=self.client.reply)
+
+
+class FakeGeminiClient:
+    """Remplace genai.Client : `chats.create()` retourne une FakeChat.
+
+    `first_chunk_delay` simule la latence avant le premier token et
+    `chunk_delay` le temps de génération de chaque fragment suivant.
+    Comme l'API réelle pour un prompt court, la création d'un cache de contexte
+    échoue sauf si `context_cache` est activé.
+    Avec `error_after`, le flux lève `error` après ce nombre de fragments.
+    """
+
+    def __init__(self, reply="Réponse simulée de Gemini.", chunk_size=8,
+                 first_chunk_delay=0.0, chunk_delay=0.0, error=None, context_cache=False, error_after=None):
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.error = error
+        self.error_after = error_after
+        self.context_cache = context_cache
+        self.sent_messages = []
+        self.created_chats = []
+        self.chats = SimpleNamespace(create=self._create_chat)
+        self.aio = SimpleNamespace(chats=SimpleNamespace(create=self._create_async_chat))
+        self.caches = SimpleNamespace(create=self._create_cache)
+
+    def _create_chat(self, model=None, config=None, history=None):
+        chat = FakeChat(self, history or [])
+        self.created_chats.append(chat)
+        return chat
+
+    def _create_async_chat(self, model=None, config=None, history=None):
+        chat = FakeAsyncChat(self, history or [])
+        self.created_chats.append(chat)
+        return chat
+
+    def _create_cache(self, model=None, config=None):
+        if not self.context_cache:
+            raise RuntimeError("Contenu trop petit pour le cache de contexte")
+        return SimpleNamespace(name="cachedContents/fake")
+
+
+class FlakyChat(FakeChat):
+    """Session de chat dont chaque appel subit la panne tirée par FlakyGeminiClient."""
+
+    def send_message(self, message):
+        self.client.sent_messages.append(message)
+        delay, error = self.client.next_fault()
+        time.sleep(delay)
+        if error:
+            raise error
+        return SimpleNamespace(text=self.client.reply)
+
+    def send_message_stream(self, message):
+        self.client.sent_messages.append(message)
+        delay, error = self.client.next_fault()
+        time.sleep(delay)
+        if error:
+            raise error
+        for chunk in self._chunks():
+            yield SimpleNamespace(text=chunk)
+
+
+class FlakyAsyncChat(FlakyChat):
+    async def send_message(self, message):
+        self.client.sent_messages.append(message)
+        delay, error = self.client.next_fault()
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return SimpleNamespace(text=self.client.reply)
+
+
+class FlakyGeminiClient(FakeGeminiClient):
+    """FakeGeminiClient avec injection de pannes : chaque appel dure `latency` secondes,
+    sauf une proportion `slow_rate` qui dure `slow_delay` (service ralenti) et une
+    proportion `error_rate` qui échoue. `outage` ('hang' ou 'error') simule une panne
+    totale : tous les appels restent bloqués `slow_delay` secondes ou échouent.
+    `timeout` reproduit le timeout HTTP du client : un appel plus long échoue à ce délai.
+    """
+
+    def __init__(self, latency=0.0, slow_rate=0.0, slow_delay=30.0, error_rate=0.0, outage=None, seed=0,
+                 timeout=None, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.error_rate = error_rate
+        self.outage = outage
+        self.timeout = timeout
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_fault(self):
+        """(durée de l'appel, exception à lever ou None)."""
+        if self.outage == 'error':
+            return 0.0, RuntimeError("503 UNAVAILABLE")
+        with self._lock:
+            draw = self._random.random()
+        if draw < self.error_rate:
+            return self.latency, RuntimeError("503 UNAVAILABLE")
+        delay = self.slow_delay if self.outage == 'hang' or draw < self.error_rate + self.slow_rate else self.latency
+        if self.timeout is not None and delay > self.timeout:
+            return self.timeout, TimeoutError("délai de lecture dépassé")
+        return delay, None
+
+    def _create_chat(self, model=None, config=None, history=None):
+        chat = FlakyChat(self, history or [])
+        self.created_chats.append(chat)
+        return chat
+
+    def _create_async_chat(self, model=None, config=None, history=None):
+        chat = FlakyAsyncChat(self, history or [])
+        self.created_chats.append(chat)
+        return chat
+
+
+class InMemoryCursor(list):
+    """Résultat de `InMemoryCollection.find` : liste triable et tronquable comme un curseur."""
+
+    def sort(self, key, direction=1):
+        keys = [(key, direction)] if isinstance(key, str) else key
+        for field, order in reversed(keys):
+            super().sort(key=lambda d: d.get(field), reverse=order < 0)
+        return self
+
+    def limit(self, count):
+        return InMemoryCursor(self[:count] if count else self)
+
+
+class InMemoryCollection:
+    """Collection MongoDB minimale en mémoire, à opérations atomiques (verrou global).
+
+    Ne comprend que les filtres d'égalité et les opérateurs $in, $lt, $lte, $gt, $gte, $exists,
+    et les mises à jour $set / $inc / $unset : de quoi faire tourner les files de travaux.
+    `unique` liste les champs soumis à un index unique (documents sans le champ exclus).
+    """
+
+    OPERATORS = {
+        "$in": lambda value, arg: value in arg,
+        "$lt": lambda value, arg: value is not None and value < arg,
+        "$lte": lambda value, arg: value is not None and value <= arg,
+        "$gt": lambda value, arg: value is not None and value > arg,
+        "$gte": lambda value, arg: value is not None and value >= arg,
+        "$exists": lambda value, arg: (value is not None) == arg,
+    }
+
+    def __init__(self, unique=()):
+        self.documents = {}
+        self.unique = unique
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _matches(self, document, query):
+        for field, condition in query.items():
+            value = document.get(field)
+            if isinstance(condition, dict):
+                if not all(self.OPERATORS[op](value, arg) for op, arg in condition.items()):
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def _apply(self, document, update):
+        document.update(update.get("$set", {}))
+        for field, amount in update.get("$inc", {}).items():
+            document[field] = document.get(field, 0) + amount
+        for field in update.get("$unset", {}):
+            document.pop(field, None)
+
+    def _insert(self, document):
+        for field in self.unique:
+            if field in document and any(d.get(field) == document[field] for d in self.documents.values()):
+                return False
+        document.setdefault("_id", next(self._ids))
+        self.documents[document["_id"]] = dict(document)
+        return True
+
+    def insert_one(self, document):
+        with self._lock:
+            if not self._insert(document):
+                raise DuplicateKeyError("E11000 duplicate key")
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    def insert_many(self, documents, ordered=True):
+        with self._lock:
+            errors = [{"index": i, "code": 11000} for i, d in enumerate(documents) if not self._insert(d)]
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(documents) - len(errors)})
+        return SimpleNamespace(inserted_ids=[d["_id"] for d in documents])
+
+    def find(self, query=None, projection=None):
+        with self._lock:
+            return InMemoryCursor(dict(d) for d in self.documents.values() if self._matches(d, query or {}))
+
+    def count_documents(self, query):
+        return len(self.find(query))
+
+    def update_one(self, query, update):
+        with self._lock:
+            for document in self.documents.values():
+                if self._matches(document, query):
+                    self._apply(document, update)
+                    return SimpleNamespace(matched_count=1, modified_count=1)
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+    def update_many(self, query, update):
+        with self._lock:
+            matched = [d for d in self.documents.values() if self._matches(d, query)]
+            for document in matched:
+                self._apply(document, update)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    def find_one_and_update(self, query, update, sort=None, return_document=None):
+        with self._lock:
+            candidates = InMemoryCursor(d for d in self.documents.values() if self._matches(d, query))
+            if not candidates:
+                return None
+            document = candidates.sort(sort or [])[0]
+            self._apply(document, update)
+            return dict(document)
+
+
+class FakeTwilioServer:
+    """Serveur HTTP local imitant l'API Messages de Twilio (keep-alive HTTP/1.1).
+
+    `latency` simule le temps de réponse, `connect_delay` le coût d'établissement d'une
+    connexion (TCP + TLS), `fail_every` fait échouer un envoi sur n (erreur 500).
+    `connections` compte les connexions TCP ouvertes par les clients.
+    """
+
+    def __init__(self, latency=0.0, fail_every=0, connect_delay=0.0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.connect_delay = connect_delay
+        self.messages = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+                if server.connect_delay:
+                    time.sleep(server.connect_delay)
+
+            def do_POST(self):
+                fields = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.messages.append({k: v[0] for k, v in fields.items()})
+                    count = len(server.messages)
+                if server.fail_every and count % server.fail_every == 0:
+                    status, body = 500, {"code": 20500, "message": "Erreur simulée", "status": 500}
+                else:
+                    status, body = 201, {"sid": f"SM{count:032d}", "status": "queued",
+                                         "to": fields.get("To", [""])[0], "body": fields.get("Body", [""])[0]}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeGeminiServer:
+    """Serveur HTTP local imitant l'API REST de Gemini (generateContent, streamGenerateContent).
+
+    Utilisé via GEMINI_API_BASE_URL pour les tests de charge : les workers gunicorn appellent
+    ce serveur avec le vrai SDK google-genai. `latency` simule le temps avant la réponse (ou le
+    premier fragment), `chunk_delay` le temps entre deux fragments du flux. Comme l'API réelle
+    pour un prompt court, la création d'un cache de contexte est refusée (400).
+    """
+
+    def __init__(self, reply="Réponse simulée de Gemini.", latency=0.0, chunk_size=40, chunk_delay=0.0):
+        self.reply = reply
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        def candidate(text, finished):
+            result = {"content": {"role": "model", "parts": [{"text": text}]}}
+            if finished:
+                result["finishReason"] = "STOP"
+            return {"candidates": [result],
+                    "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": len(server.reply) // 4,
+                                      "totalTokenCount": 100 + len(server.reply) // 4}}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, payload, content_type="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with server._lock:
+                    server.requests += 1
+                if self.path.split('?')[0].endswith('/cachedContents'):
+                    error = {"error": {"code": 400, "message": "Cached content is too small", "status": "INVALID_ARGUMENT"}}
+                    return self._send(400, json.dumps(error).encode())
+                if server.latency:
+                    time.sleep(server.latency)
+                if ':streamGenerateContent' not in self.path:
+                    return self._send(200, json.dumps(candidate(server.reply, True)).encode())
+                # Flux SSE en fragments (fin de la réponse signalée par la fermeture de la connexion)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                chunks = [server.reply[i:i + server.chunk_size] for i in range(0, len(server.reply), server.chunk_size)]
+                for i, chunk in enumerate(chunks):
+                    if i and server.chunk_delay:
+                        time.sleep(server.chunk_delay)
+                    event = json.dumps(candidate(chunk, i == len(chunks) - 1))
+                    self.wfile.write(f"data: {event}\r\n\r\n".encode())
+                    self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
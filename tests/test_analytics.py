@@ -0,0 +1,154 @@
+"""
+Tests de l'analyse incrémentale des sujets (analytics.py).
+Exécuter avec : pytest tests/ -v
+"""
+import os
+from datetime import date, datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+import app as app_module
+from analytics import EPOCH, STATE_ID, TopicAnalytics, intent_expression
+
+NOW = datetime(2026, 10, 17, 10, 0)
+MESSAGES = [
+    "Quels sont les SIGNES DE DANGER ?",
+    "alimentation du bébé et allaitement",
+    "Mon bébé a 6 mois",
+    "je voudrais des visites prénatales",
+    "Symptômes au premier trimestre",
+    "Bonjour",
+]
+
+
+@pytest.fixture
+def analytics():
+    return TopicAnalytics(mongomock.MongoClient()['chatbot']['analytics'], MagicMock(), MagicMock(),
+                          app_module.FALLBACK_KEYWORDS_BY_PRIORITY, lag=300, lease=600)
+
+
+def _match(aggregate):
+    """Filtre $match de la dernière agrégation lancée."""
+    return aggregate.call_args[0][0][0]["$match"]
+
+
+class TestIntentExpression:
+    """Tests du classement dans MongoDB, équivalent à detect_intent."""
+
+    def test_same_intent_as_detect_intent(self):
+        collection = mongomock.MongoClient()['chatbot']['messages']
+        collection.insert_many([{"text": text, "rank": i} for i, text in enumerate(MESSAGES)])
+        expression = intent_expression(app_module.FALLBACK_KEYWORDS_BY_PRIORITY)
+        classified = [doc["intent"] for doc in collection.aggregate(
+            [{"$sort": {"rank": 1}}, {"$project": {"intent": expression}}])]
+        assert classified == [app_module.detect_intent(text.lower()) for text in MESSAGES]
+
+    def test_keywords_of_one_intent_grouped(self):
+        branches = intent_expression([("a", "x"), ("b", "x"), ("c", "y")])["$switch"]["branches"]
+        assert [b["then"] for b in branches] == ["x", "y"]
+        assert branches[0]["case"]["$regexMatch"]["regex"] == "a|b"
+
+
+class TestTopicAnalytics:
+    """Tests du filigrane et des reprises de TopicAnalytics."""
+
+    def test_first_run_processes_everything_up_to_lag(self, analytics):
+        assert analytics.run_once(NOW) == (EPOCH, NOW - timedelta(seconds=300))
+        assert _match(analytics.messages.aggregate)["timestamp"] == {"$gt": EPOCH, "$lte": NOW - timedelta(seconds=300)}
+        assert _match(analytics.conversations.aggregate)["date"] == {"$gt": EPOCH}
+        state = analytics.collection.find_one({"_id": STATE_ID})
+        assert state["watermark"] == NOW - timedelta(seconds=300)
+        assert "pending" not in state and "lease_until" not in state
+
+    def test_next_run_starts_at_watermark(self, analytics):
+        analytics.run_once(NOW)
+        later = NOW + timedelta(minutes=10)
+        assert analytics.run_once(later) == (NOW - timedelta(seconds=300), later - timedelta(seconds=300))
+        assert _match(analytics.conversations.aggregate)["date"] == {"$gt": NOW - timedelta(seconds=300)}
+
+    def test_nothing_new(self, analytics):
+        analytics.run_once(NOW)
+        analytics.messages.aggregate.reset_mock()
+        assert analytics.run_once(NOW) is None
+        analytics.messages.aggregate.assert_not_called()
+
+    def test_interrupted_window_replayed_identically(self, analytics):
+        analytics.messages.aggregate.side_effect = PyMongoError("panne")
+        with pytest.raises(PyMongoError):
+            analytics.run_once(NOW)
+        failed = analytics.messages.aggregate.call_args[0][0]
+        analytics.messages.aggregate.side_effect = None
+        # Même fenêtre et même identifiant de fenêtre, quelle que soit l'heure de la reprise
+        assert analytics.run_once(NOW + timedelta(hours=1)) == (EPOCH, NOW - timedelta(seconds=300))
+        assert analytics.messages.aggregate.call_args[0][0] == failed
+
+    def test_lease_prevents_concurrent_runs(self, analytics):
+        analytics.collection.insert_one({"_id": STATE_ID, "lease_until": NOW + timedelta(minutes=5)})
+        assert analytics.run_once(NOW) is None
+        assert analytics.stats()["skipped"] == 1
+        assert analytics.run_once(NOW + timedelta(minutes=6)) is not None
+
+    def test_topics_sums_days(self, analytics):
+        analytics.collection.insert_many([
+            {"_id": "2026-10-16:allaitement", "day": "2026-10-16", "intent": "allaitement", "count": 2},
+            {"_id": "2026-10-17:allaitement", "day": "2026-10-17", "intent": "allaitement", "count": 3},
+            {"_id": "2026-10-17:signes_danger", "day": "2026-10-17", "intent": "signes_danger", "count": 4},
+            {"_id": "2026-09-01:inconnu", "day": "2026-09-01", "intent": "inconnu", "count": 9},
+        ])
+        assert analytics.topics(date(2026, 10, 17), days=7) == [("allaitement", 5), ("signes_danger", 4)]
+
+    def test_admin_shows_topics(self, admin_client):
+        app_module.stats_counters.collection.insert_one(
+            {"_id": "totals", "users": 1, "users_confirmed": 1, "conversations": 0, "reminders": 0})
+        app_module.topic_analytics.collection.insert_one(
+            {"_id": f"{datetime.now():%Y-%m-%d}:signes_danger", "intent": "signes_danger", "count": 7})
+        with patch('app.users_collection') as mock_users:
+            mock_users.find_one.return_value = {'_id': ObjectId('507f1f77bcf86cd799439012'), 'is_admin': True}
+            mock_users.find.return_value.sort.return_value.limit.return_value = []
+            response = admin_client.get('/admin')
+        assert 'Signes danger' in response.get_data(as_text=True)
+
+
+@pytest.fixture(scope="module")
+def mongo_db():
+    client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017'), serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        pytest.skip("serveur MongoDB indisponible")
+    db = client['chatbot_analytics_test']
+    client.drop_database(db.name)
+    yield db
+    client.drop_database(db.name)
+    client.close()
+
+
+class TestTopicAnalyticsMongo:
+    """Tests des pipelines $merge sur un serveur MongoDB."""
+
+    def test_incremental_and_idempotent(self, mongo_db):
+        day = NOW - timedelta(hours=1)
+        mongo_db.conversations.insert_one({"date": day, "messages": [
+            {"user": "awa", "text": "signes de danger ?", "timestamp": day},
+            {"user": "Bot", "text": "signes de danger : ...", "timestamp": day},
+        ]})
+        mongo_db.messages.insert_one({"conversation_id": ObjectId(), "user": "awa", "text": "Allaitement",
+                                      "timestamp": day})
+        analytics = TopicAnalytics(mongo_db.analytics, mongo_db.conversations, mongo_db.messages,
+                                   app_module.FALLBACK_KEYWORDS_BY_PRIORITY, lag=300)
+        analytics.run_once(NOW)
+        # Reprise de la même fenêtre (passage interrompu avant l'avancée du filigrane) : rien compté deux fois
+        mongo_db.analytics.update_one({"_id": STATE_ID}, {"$set": {"watermark": EPOCH,
+                                                                   "pending": {"low": EPOCH, "high": NOW}}})
+        analytics.run_once(NOW)
+        assert dict(analytics.topics(NOW.date())) == {"signes_danger": 1, "allaitement": 1}
+
+        mongo_db.messages.insert_one({"conversation_id": ObjectId(), "user": "awa", "text": "allaitement",
+                                      "timestamp": NOW + timedelta(minutes=1)})
+        analytics.run_once(NOW + timedelta(minutes=10))
+        assert dict(analytics.topics(NOW.date())) == {"signes_danger": 1, "allaitement": 2}
@@ -0,0 +1,82 @@
+"""
+Tests unitaires du cache sémantique des réponses.
+Exécuter avec : pytest tests/ -v
+"""
+import numpy as np
+
+from answer_cache import SemanticAnswerCache, normalize_question
+
+VOCABULARY = ["signes", "danger", "grossesse", "alimentation", "vaccin", "bébé", "pendant", "quels"]
+
+
+def bag_of_words(text):
+    """Encodage déterministe pour les tests : un axe par mot du vocabulaire."""
+    words = text.split()
+    return np.array([float(words.count(w)) for w in VOCABULARY])
+
+
+class TestSemanticAnswerCache:
+    """Tests pour SemanticAnswerCache."""
+
+    def test_normalize_question(self):
+        assert normalize_question("  Quels sont les SIGNES de danger ?! ") == "quels sont les signes de danger"
+
+    def test_exact_hit_after_normalization(self):
+        cache = SemanticAnswerCache(embed=bag_of_words)
+        cache.store("Signes de danger ?", "Consultez un médecin.")
+        assert cache.lookup("signes de DANGER") == "Consultez un médecin."
+        assert cache.stats()['hits'] == 1
+
+    def test_similar_question_hits(self):
+        cache = SemanticAnswerCache(embed=bag_of_words, threshold=0.8)
+        cache.store("signes de danger pendant la grossesse", "Consultez un médecin.")
+        assert cache.lookup("quels signes de danger pendant grossesse ?") == "Consultez un médecin."
+        assert cache.stats()['semantic_hits'] == 1
+
+    def test_different_question_misses(self):
+        cache = SemanticAnswerCache(embed=bag_of_words, threshold=0.8)
+        cache.store("signes de danger pendant la grossesse", "Consultez un médecin.")
+        assert cache.lookup("vaccin du bébé") is None
+        assert cache.stats()['misses'] == 1
+
+    def test_close_vector_without_shared_words_misses(self):
+        """Une similarité vectorielle seule ne suffit pas sans mots en commun."""
+        cache = SemanticAnswerCache(embed=lambda text: np.ones(4), threshold=0.5)
+        cache.store("alimentation pendant la grossesse", "Mangez équilibré.")
+        assert cache.lookup("vaccin du bébé") is None
+
+    def test_embedding_error_falls_back_to_exact_match(self):
+        def broken(text):
+            raise RuntimeError("modèle indisponible")
+        cache = SemanticAnswerCache(embed=broken)
+        cache.store("allaitement", "Allaitez à la demande.")
+        assert cache.lookup("Allaitement ?") == "Allaitez à la demande."
+        assert cache.lookup("allaitement exclusif") is None
+
+    def test_question_citing_a_person_is_neither_stored_nor_served(self):
+        """Le cache est partagé : le nom et la situation d'une utilisatrice ne doivent pas fuiter."""
+        persons = lambda text: [name for name in ("Awa", "Fatou") if name in text]
+        cache = SemanticAnswerCache(embed=lambda text: np.ones(4), threshold=0.5, min_overlap=0.0, persons=persons)
+        cache.store("Je suis Awa, saignements pendant la grossesse", "Awa, consultez vite.")
+        assert cache.stats()['size'] == 0
+        cache.store("saignements pendant la grossesse", "Consultez vite.")
+        assert cache.lookup("Je suis Fatou, saignements pendant la grossesse") is None
+        assert cache.stats()['personal'] == 1
+
+    def test_question_citing_a_number_is_neither_stored_nor_served(self):
+        """« 2 mois » ne doit pas recevoir la réponse donnée pour « 9 mois »."""
+        cache = SemanticAnswerCache(embed=lambda text: np.ones(4), threshold=0.5, min_overlap=0.0)
+        cache.store("bébé de 9 mois a de la fièvre", "À 9 mois, ...")
+        cache.store("enceinte de vingt semaines", "À 20 semaines, ...")
+        assert cache.stats()['size'] == 0
+        cache.store("bébé a de la fièvre", "Réponse générale")
+        assert cache.lookup("bébé de 2 mois a de la fièvre") is None
+        assert cache.lookup("enceinte de trente-deux semaines") is None
+        assert cache.lookup("un bébé a de la fièvre") == "Réponse générale"
+
+    def test_person_detection_error_skips_cache(self):
+        def broken(text):
+            raise RuntimeError("NER indisponible")
+        cache = SemanticAnswerCache(embed=bag_of_words, persons=broken)
+        cache.store("allaitement", "Allaitez à la demande.")
+        assert cache.lookup("allaitement") is None
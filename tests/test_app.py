@@ -5,9 +5,12 @@ Exécuter avec : pytest tests/ -v
 import pytest
 from unittest.mock import patch, MagicMock
 from datetime import datetime
+import json
 from bson import ObjectId
 import os
 
+from tests.fakes import FakeGeminiClient
+
 # Variables d'environnement pour les tests
 os.environ['SECRET_KEY'] = 'test-secret-key-for-testing-only'
 os.environ['MONGO_URI'] = 'mongodb://localhost:27017/chatbot_test'
@@ -182,12 +185,359 @@ class TestChatAPI:
         data = response.get_json()
         assert 'message' in data
 
+    @patch('app.conversations_collection')
+    def test_chat_stream_sends_chunks_and_persists(self, mock_conv, logged_in_client):
+        """POST /chat_stream doit envoyer la réponse en fragments SSE puis la sauvegarder."""
+        mock_conv.insert_one.return_value.inserted_id = ObjectId()
+        fake = FakeGeminiClient(reply="Bonjour, comment allez-vous ?", chunk_size=7)
+
+        with patch('app.gemini_client', fake):
+            response = logged_in_client.post('/chat_stream',
+                json={'message': 'Bonjour'},
+                content_type='application/json')
+            body = response.get_data(as_text=True)
+
+        assert response.status_code == 200
+        assert 'text/event-stream' in response.content_type
+        events = [json.loads(line[6:]) for line in body.split('\n\n') if line.startswith('data: ')]
+        deltas = [e['delta'] for e in events if 'delta' in e]
+        assert len(deltas) > 1
+        assert ''.join(deltas) == "Bonjour, comment allez-vous ?"
+        assert events[-1] == {'done': True}
+
+        pushed = mock_conv.update_one.call_args[0][1]['$push']['messages']['$each']
+        assert pushed[1]['text'] == "Bonjour, comment allez-vous ?"
+
+    @patch('app.get_fallback_response')
+    @patch('app.conversations_collection')
+    def test_chat_stream_falls_back_on_error(self, mock_conv, mock_fallback, logged_in_client):
+        """Si Gemini échoue, /chat_stream doit envoyer la réponse locale."""
+        mock_conv.insert_one.return_value.inserted_id = ObjectId()
+        mock_fallback.return_value = "Réponse locale"
+
+        with patch('app.gemini_client', FakeGeminiClient(error=RuntimeError("indisponible"))):
+            response = logged_in_client.post('/chat_stream',
+                json={'message': 'Bonjour'},
+                content_type='application/json')
+            body = response.get_data(as_text=True)
+
+        assert 'Réponse locale' in body
+        assert mock_conv.update_one.called
+
+    @patch('app.conversations_collection')
+    def test_chat_stream_error_after_first_chunk(self, mock_conv, logged_in_client):
+        """Flux coupé en cours de route : événement d'erreur, réponse tronquée marquée incomplète."""
+        import app as app_module
+        mock_conv.insert_one.return_value.inserted_id = ObjectId()
+        fake = FakeGeminiClient(reply="Bonjour, comment allez-vous ?", chunk_size=7,
+                                error=RuntimeError("connexion coupée"), error_after=1)
+
+        with patch('app.gemini_client', fake):
+            response = logged_in_client.post('/chat_stream',
+                json={'message': 'Bonjour'},
+                content_type='application/json')
+            body = response.get_data(as_text=True)
+
+        events = [json.loads(line[6:]) for line in body.split('\n\n') if line.startswith('data: ')]
+        assert [e['delta'] for e in events if 'delta' in e] == ["Bonjour"]
+        assert 'error' in events[-2] and events[-1] == {'done': True}
+        pushed = mock_conv.update_one.call_args[0][1]['$push']['messages']['$each']
+        assert pushed[1]['text'] == "Bonjour" and pushed[1]['incomplete'] is True
+        assert app_module.answer_cache.lookup('Bonjour') is None
+
+    @patch('app.get_fallback_response', return_value="Réponse locale")
+    @patch('app.conversations_collection')
+    def test_chat_stream_error_before_first_chunk(self, mock_conv, mock_fallback, logged_in_client):
+        """Échec à la création de la session : réponse locale, sans événement d'erreur."""
+        mock_conv.insert_one.return_value.inserted_id = ObjectId()
+        fake = FakeGeminiClient()
+        fake.chats.create = MagicMock(side_effect=RuntimeError("service indisponible"))
+
+        with patch('app.gemini_client', fake):
+            response = logged_in_client.post('/chat_stream',
+                json={'message': 'Bonjour'},
+                content_type='application/json')
+            body = response.get_data(as_text=True)
+
+        events = [json.loads(line[6:]) for line in body.split('\n\n') if line.startswith('data: ')]
+        assert events == [{'delta': "Réponse locale"}, {'done': True}]
+        pushed = mock_conv.update_one.call_args[0][1]['$push']['messages']['$each']
+        assert pushed[1]['text'] == "Réponse locale" and 'incomplete' not in pushed[1]
+
+    def test_chat_stream_requires_message(self, logged_in_client):
+        """POST /chat_stream sans message doit retourner 400."""
+        response = logged_in_client.post('/chat_stream',
+            json={},
+            content_type='application/json')
+        assert response.status_code == 400
+
+    @patch('app.get_gemini_response')
+    @patch('app.conversations_collection')
+    def test_chat_serves_cached_answer_for_repeated_question(self, mock_conv, mock_gemini, logged_in_client):
+        """Une question déjà posée en début de conversation ne doit pas rappeler Gemini."""
+        mock_gemini.return_value = "Réponse sur les signes de danger"
+        mock_conv.find_one.return_value = None
+        mock_conv.insert_one.return_value.inserted_id = ObjectId()
+
+        for _ in range(2):
+            logged_in_client.post('/new_chat')
+            response = logged_in_client.post('/chat',
+                json={'message': 'Quels sont les signes de danger ?'},
+                content_type='application/json')
+            assert response.get_json()['message'] == "Réponse sur les signes de danger"
+
+        assert mock_gemini.call_count == 1
+
+    @patch('app.get_gemini_response')
+    @patch('app.conversations_collection')
+    def test_chat_bypasses_answer_cache_with_history(self, mock_conv, mock_gemini, logged_in_client):
+        """Avec un historique, la réponse dépend du contexte : le cache est ignoré."""
+        import app as app_module
+        app_module.answer_cache.store('Et pour le bébé ?', "Réponse en cache")
+        mock_gemini.return_value = "Réponse contextuelle"
+        mock_conv.find_one.return_value = {
+            'user_id': '507f1f77bcf86cd799439011',
+            'messages': [{'user': 'testuser', 'text': 'Bonjour', 'timestamp': datetime.now()}]
+        }
+        with logged_in_client.session_transaction() as sess:
+            sess['conversation_id'] = '507f1f77bcf86cd799439099'
+
+        response = logged_in_client.post('/chat',
+            json={'message': 'Et pour le bébé ?'},
+            content_type='application/json')
+        assert response.get_json()['message'] == "Réponse contextuelle"
+
     def test_new_chat(self, logged_in_client):
         """POST /new_chat doit retourner 200."""
         response = logged_in_client.post('/new_chat')
         assert response.status_code == 200
 
 
+class TestGeminiSessions:
+    """Tests pour la réutilisation des sessions de chat Gemini."""
+
+    def _history(self, timestamp):
+        return [
+            {'user': 'testuser', 'text': 'Bonjour', 'timestamp': timestamp},
+            {'user': 'Bot', 'text': 'Réponse', 'timestamp': timestamp}
+        ]
+
+    def test_session_reused_between_turns(self, app):
+        """Le tour suivant doit réutiliser la session sans la reconstruire."""
+        import app as app_module
+        app_module.gemini_sessions.clear()
+        fake = FakeGeminiClient(reply="Réponse")
+        first_turn = datetime(2026, 1, 1, 10, 0, 0, 123456)
+
+        with patch('app.gemini_client', fake):
+            app_module.get_gemini_response("Bonjour", [], 'conv-1', first_turn)
+            # MongoDB tronque les dates à la milliseconde
+            history = self._history(first_turn.replace(microsecond=123000))
+            app_module.get_gemini_response("Et ensuite ?", history, 'conv-1', datetime.now())
+
+        assert len(fake.created_chats) == 1
+        assert fake.sent_messages == ["Bonjour", "Et ensuite ?"]
+
+    def test_session_rebuilt_when_history_changed_elsewhere(self, app):
+        """Si un autre worker a traité un tour, la session doit être reconstruite."""
+        import app as app_module
+        app_module.gemini_sessions.clear()
+        fake = FakeGeminiClient(reply="Réponse")
+
+        with patch('app.gemini_client', fake):
+            app_module.get_gemini_response("Bonjour", [], 'conv-2', datetime(2026, 1, 1, 10, 0))
+            history = self._history(datetime(2026, 1, 1, 10, 5))
+            app_module.get_gemini_response("Et ensuite ?", history, 'conv-2', datetime.now())
+
+        assert len(fake.created_chats) == 2
+        assert len(fake.created_chats[1].history) == 2
+
+    def test_reused_session_keeps_the_rebuilt_window(self, app):
+        """Une session réutilisée ne transmet jamais plus de contexte qu'une session reconstruite."""
+        import app as app_module
+        app_module.gemini_sessions.clear()
+        fake = FakeGeminiClient(reply="Réponse")
+        messages = []
+
+        with patch('app.gemini_client', fake):
+            for turn in range(7):
+                now = datetime(2026, 1, 1, 10, turn)
+                history = messages[-app_module.GEMINI_HISTORY_MESSAGES:]
+                entry = app_module._acquire_gemini_session('conv-4', history)
+                assert entry["history"] == len(history)
+                app_module._release_gemini_session('conv-4', entry, f"Question {turn}", "Réponse", now)
+                messages += [{'user': 'testuser', 'text': f"Question {turn}", 'timestamp': now},
+                             {'user': 'Bot', 'text': "Réponse", 'timestamp': now}]
+
+        assert [len(chat.history) for chat in fake.created_chats] == [0, app_module.GEMINI_HISTORY_MESSAGES]
+
+    def test_failed_turn_is_not_cached(self, app):
+        """Une session dont l'appel a échoué ne doit pas être remise en cache."""
+        import app as app_module
+        app_module.gemini_sessions.clear()
+
+        with patch('app.gemini_client', FakeGeminiClient(error=RuntimeError("indisponible"))):
+            assert app_module.get_gemini_response("Bonjour", [], 'conv-3', datetime.now()) is None
+
+        assert app_module.gemini_sessions.get('conv-3') is None
+
+
+class TestFallbackResponses:
+    """Tests pour les réponses du mode fallback (sans Gemini)."""
+
+    def test_most_specific_intent_wins(self, app):
+        """'alimentation du bébé' doit l'emporter sur 'alimentation' et 'bébé'."""
+        from app import detect_intent
+        assert detect_intent("quelle alimentation du bébé ?") == "alimentation_bebe"
+        assert detect_intent("alimentation pendant la grossesse") == "alimentation"
+
+    def test_pregnancy_keywords_take_precedence(self, app):
+        """Les mots-clés de grossesse passent avant les suggestions personnalisées."""
+        from app import detect_intent
+        assert detect_intent("mon bébé et les signes de danger") == "signes_danger"
+        assert detect_intent("le yoga prénatal pour mon enfant") == "grossesse"
+
+    def test_nested_keyword(self, app):
+        """'enfant' contenu dans 'âge de l'enfant' doit être reconnu."""
+        from app import detect_intent
+        assert detect_intent("quel est l'âge de l'enfant ?") == "enfant"
+        assert detect_intent("à quel âge ?") == "suggestions"
+
+    def test_personalized_responses_use_user_data(self, app):
+        """Les réponses dépendent des semaines de grossesse extraites."""
+        from app import handle_user_message
+        assert handle_user_message({'weeks_pregnant': 30}, "Mon trimestre").startswith("Troisième trimestre")
+        assert handle_user_message({}, "Mon trimestre").startswith("Premier trimestre")
+        assert "Awa" in handle_user_message({'name': 'Awa', 'weeks_pregnant': 20}, "Mes symptômes")
+
+    def test_unknown_message(self, app):
+        """Un message sans mot-clé reçoit l'invitation à reformuler."""
+        from app import handle_user_message
+        assert handle_user_message({}, "Il fait chaud").startswith("Je ne suis pas sûr de comprendre")
+
+
+class TestSpacyLoading:
+    """Tests pour le chargement paresseux du modèle SpaCy."""
+
+    def test_model_loaded_once_with_slim_pipeline(self, app):
+        """Le modèle n'est chargé qu'au premier appel, sans les composants inutiles."""
+        import app as app_module
+        with patch.object(app_module, '_nlp', None), \
+             patch('app.spacy.load') as mock_load:
+            app_module.get_nlp()
+            app_module.get_nlp()
+        mock_load.assert_called_once_with('fr_core_news_sm', exclude=app_module.SPACY_EXCLUDED_COMPONENTS)
+        assert 'parser' in app_module.SPACY_EXCLUDED_COMPONENTS
+
+
+class TestUserDataBackfill:
+    """Tests pour l'extraction par lots des données utilisateur stockées."""
+
+    @patch('app.extract_user_data_batch')
+    @patch('app.conversations_collection')
+    def test_backfill_sets_user_data_on_pending_messages(self, mock_conv, mock_batch, app):
+        """Seuls les messages utilisateur sans user_data sont analysés et mis à jour."""
+        import app as app_module
+        conversation_id = ObjectId()
+        mock_conv.find.return_value = [{
+            '_id': conversation_id,
+            'messages': [
+                {'user': 'testuser', 'text': 'Je suis Awa', 'user_data': {'name': 'Awa'}},
+                {'user': 'Bot', 'text': 'Bonjour Awa'},
+                {'user': 'testuser', 'text': 'enceinte de 12 semaines'},
+            ]
+        }]
+        mock_batch.side_effect = lambda items, batch_size, n_process: (
+            ({'weeks_pregnant': 12}, context) for text, context in items
+        )
+
+        assert app_module.backfill_user_data() == 1
+        operations = mock_conv.bulk_write.call_args[0][0]
+        assert len(operations) == 1
+        assert operations[0]._filter == {'_id': conversation_id}
+        assert operations[0]._doc == {'$set': {'messages.2.user_data': {'weeks_pregnant': 12}}}
+
+
+class TestMessageStorage:
+    """Tests pour le stockage des messages dans une collection séparée (MESSAGES_STORAGE=collection)."""
+
+    @patch('app.get_gemini_response')
+    @patch('app.messages_collection')
+    @patch('app.conversations_collection')
+    def test_new_conversation_keeps_only_metadata(self, mock_conv, mock_messages, mock_gemini, app, logged_in_client):
+        """La conversation ne contient que ses métadonnées, les messages vont dans `messages`."""
+        mock_gemini.return_value = "Réponse du bot"
+        conversation_id = ObjectId()
+        mock_conv.insert_one.return_value.inserted_id = conversation_id
+
+        with patch.dict(app.config, {'MESSAGES_STORAGE': 'collection'}):
+            response = logged_in_client.post('/chat', json={'message': 'Bonjour'})
+
+        assert response.status_code == 200
+        document = mock_conv.insert_one.call_args[0][0]
+        assert 'messages' not in document
+        assert document['message_count'] == 2
+        stored = mock_messages.insert_many.call_args[0][0]
+        assert [m['text'] for m in stored] == ['Bonjour', 'Réponse du bot']
+        assert all(m['conversation_id'] == conversation_id for m in stored)
+
+    @patch('app.messages_collection')
+    @patch('app.conversations_collection')
+    def test_append_updates_count_without_push(self, mock_conv, mock_messages, app):
+        """L'ajout de messages incrémente le compteur sans réécrire de tableau."""
+        import app as app_module
+        conversation_id = ObjectId()
+        with patch.dict(app.config, {'MESSAGES_STORAGE': 'collection'}):
+            app_module._append_messages(str(conversation_id), [{'user': 'Bot', 'text': 'Salut'}], datetime.now())
+
+        update = mock_conv.update_one.call_args[0][1]
+        assert '$push' not in update
+        assert update['$inc'] == {'message_count': 1}
+        assert mock_messages.insert_many.call_args[0][0][0]['conversation_id'] == conversation_id
+
+    @patch('app.messages_collection')
+    @patch('app.conversations_collection')
+    def test_get_chat_reads_messages_collection(self, mock_conv, mock_messages, app, logged_in_client):
+        """GET /get_chat lit les messages intégrés non migrés puis ceux de la collection."""
+        import app as app_module
+        mock_conv.find_one.return_value = {
+            '_id': ObjectId('507f1f77bcf86cd799439011'),
+            'title': 'Test', 'date': datetime.now(),
+            'user_id': '507f1f77bcf86cd799439011',
+            'messages': [{'user': 'testuser', 'text': 'Ancien', 'timestamp': datetime(2024, 1, 1)}]
+        }
+        mock_messages.find.return_value.sort.return_value = [
+            {'user': 'testuser', 'text': 'Nouveau', 'timestamp': datetime(2024, 2, 1)}
+        ]
+
+        with patch.dict(app.config, {'MESSAGES_STORAGE': 'collection'}):
+            response = logged_in_client.get('/get_chat/507f1f77bcf86cd799439011')
+
+        assert [m['text'] for m in response.get_json()['messages']] == ['Ancien', 'Nouveau']
+        mock_messages.find.return_value.sort.assert_called_once_with(app_module.MESSAGE_SORT)
+
+    @patch('app.messages_collection')
+    @patch('app.conversations_collection')
+    def test_migrate_messages_is_restartable(self, mock_conv, mock_messages, app):
+        """La migration remplace les copies partielles et met à jour le compteur."""
+        import app as app_module
+        conversation_id = ObjectId()
+        mock_conv.find.return_value = [{
+            '_id': conversation_id,
+            'messages': [{'user': 'testuser', 'text': 'Bonjour'}, {'user': 'Bot', 'text': 'Salut'}]
+        }]
+        mock_messages.count_documents.return_value = 3
+
+        assert app_module.migrate_messages() == (1, 2)
+        mock_messages.delete_many.assert_called_once_with(
+            {'conversation_id': conversation_id, 'legacy_index': {'$exists': True}})
+        inserted = mock_messages.insert_many.call_args[0][0]
+        assert [m['legacy_index'] for m in inserted] == [0, 1]
+        mock_conv.update_one.assert_called_once_with(
+            {'_id': conversation_id},
+            {'$unset': {'messages': ''}, '$set': {'message_count': 3}})
+
+
 class TestAdminRoutes:
     """Tests pour les routes admin."""
 
@@ -228,6 +578,73 @@ class TestHistoryAPI:
         assert 'page' in data
         assert 'total_pages' in data
 
+    @staticmethod
+    def _conversations(count, start=datetime(2024, 5, 1, 12, 0)):
+        return [{'_id': ObjectId(), 'title': f'Conversation {i}', 'date': start.replace(minute=i),
+                 'last_message': {'user': 'Bot', 'text': 'Bonjour'}} for i in range(count)]
+
+    @patch('app.conversations_collection')
+    def test_get_conversations_first_page(self, mock_conv, logged_in_client):
+        """GET /get_conversations renvoie les métadonnées et un curseur, sans compter les documents."""
+        chats = self._conversations(3)
+        mock_conv.find.return_value.sort.return_value.limit.return_value = chats
+
+        response = logged_in_client.get('/get_conversations?limit=2')
+        data = response.get_json()
+
+        assert response.status_code == 200
+        assert [c['title'] for c in data['conversations']] == ['Conversation 0', 'Conversation 1']
+        assert data['conversations'][0]['last_message'] == {'user': 'Bot', 'text': 'Bonjour'}
+        assert data['next_cursor'] == f"{chats[1]['date'].isoformat()}_{chats[1]['_id']}"
+        assert 'total' not in data
+        mock_conv.find.return_value.sort.assert_called_once_with([('date', -1), ('_id', -1)])
+        mock_conv.find.return_value.sort.return_value.limit.assert_called_once_with(3)
+        mock_conv.count_documents.assert_not_called()
+
+    @patch('app.conversations_collection')
+    def test_get_conversations_next_page_uses_keyset(self, mock_conv, logged_in_client):
+        """La page suivante filtre sur (date, _id) au lieu de sauter des documents."""
+        mock_conv.find.return_value.sort.return_value.limit.return_value = []
+        oid = ObjectId()
+
+        response = logged_in_client.get(f'/get_conversations?cursor=2024-05-01T12:01:00_{oid}')
+
+        assert response.get_json() == {'conversations': [], 'next_cursor': None}
+        query = mock_conv.find.call_args[0][0]
+        assert query['$or'] == [{'date': {'$lt': datetime(2024, 5, 1, 12, 1)}},
+                                {'date': datetime(2024, 5, 1, 12, 1), '_id': {'$lt': oid}}]
+
+    @patch('app.conversations_collection')
+    def test_get_conversations_invalid_cursor(self, mock_conv, logged_in_client):
+        """Un curseur illisible doit retourner 400."""
+        response = logged_in_client.get('/get_conversations?cursor=n-importe-quoi')
+        assert response.status_code == 400
+
+    @patch('app.conversations_collection')
+    def test_get_conversations_total_is_cached(self, mock_conv, logged_in_client):
+        """Le total, demandé explicitement, n'est compté qu'une fois."""
+        mock_conv.find.return_value.sort.return_value.limit.return_value = []
+        mock_conv.count_documents.return_value = 42
+
+        for _ in range(2):
+            data = logged_in_client.get('/get_conversations?with_total=true').get_json()
+
+        assert data['total'] == 42
+        assert mock_conv.count_documents.call_count == 1
+
+    @patch('app.conversations_collection')
+    def test_get_conversations_legacy_preview(self, mock_conv, logged_in_client):
+        """Sans aperçu stocké, le dernier message du tableau intégré est utilisé."""
+        mock_conv.find.return_value.sort.return_value.limit.return_value = [{
+            '_id': ObjectId(), 'title': 'Ancienne', 'date': datetime.now(),
+            'messages': [{'user': 'Bot', 'text': 'a' * 200}]
+        }]
+
+        data = logged_in_client.get('/get_conversations').get_json()
+        preview = data['conversations'][0]['last_message']
+        assert preview['user'] == 'Bot'
+        assert len(preview['text']) == 80 and preview['text'].endswith('…')
+
     @patch('app.conversations_collection')
     def test_get_chat_invalid_id(self, mock_conv, logged_in_client):
         """GET /get_chat avec un ID invalide doit retourner 400."""
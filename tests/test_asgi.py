@@ -0,0 +1,220 @@
+"""
+Tests du point d'entrée ASGI (route /chat asynchrone).
+Exécuter avec : pytest tests/ -v
+"""
+import asyncio
+import threading
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import pytest
+from bson import ObjectId
+
+from tests.fakes import FakeGeminiClient
+
+
+@pytest.fixture
+def asgi_module(app):
+    import asgi
+    return asgi
+
+
+def _session_cookie(flask_app, data):
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    return {flask_app.config['SESSION_COOKIE_NAME']: serializer.dumps(data)}
+
+
+def _post(asgi_module, path, cookies=None, **kwargs):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi_module.app, client=('10.0.0.1', 1234))
+        async with httpx.AsyncClient(transport=transport, base_url='http://test', cookies=cookies) as client:
+            return await client.post(path, **kwargs)
+    return asyncio.run(run())
+
+
+def _fake_conversations():
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=None)
+    collection.update_one = AsyncMock()
+    collection.insert_one = AsyncMock(return_value=MagicMock(inserted_id=ObjectId()))
+    return collection
+
+
+class TestAsgiChat:
+    """Tests pour la route /chat servie en asynchrone."""
+
+    def test_chat_requires_login(self, asgi_module):
+        """Sans session, /chat doit rediriger vers la connexion."""
+        response = _post(asgi_module, '/chat', json={'message': 'Bonjour'})
+        assert response.status_code == 302
+        assert response.headers['location'] == '/login'
+
+    def test_chat_rejects_empty_message(self, app, asgi_module):
+        """Un message vide doit retourner 400."""
+        cookies = _session_cookie(app, {'user_id': '507f1f77bcf86cd799439011', 'username': 'testuser'})
+        response = _post(asgi_module, '/chat', cookies=cookies, json={'message': '   '})
+        assert response.status_code == 400
+
+    def test_chat_rejects_oversized_body(self, app, asgi_module):
+        """Corps au-delà de MAX_CONTENT_LENGTH : 413, comme la route Flask."""
+        cookies = _session_cookie(app, {'user_id': '507f1f77bcf86cd799439011', 'username': 'testuser'})
+        with patch.dict(app.config, {'MAX_CONTENT_LENGTH': 1024}):
+            response = _post(asgi_module, '/chat', cookies=cookies, json={'message': 'x' * 2048})
+        assert response.status_code == 413
+
+    def test_read_body_stops_past_limit(self, asgi_module):
+        """La lecture s'arrête au premier fragment qui dépasse la limite."""
+        received = []
+
+        async def receive():
+            received.append(1)
+            return {'type': 'http.request', 'body': b'x' * 600, 'more_body': True}
+
+        assert asyncio.run(asgi_module._read_body(receive, 1000)) is None
+        assert len(received) == 2
+
+    def test_chat_creates_conversation(self, app, asgi_module):
+        """Un premier message doit créer la conversation et l'enregistrer dans la session."""
+        conversations = _fake_conversations()
+        cookies = _session_cookie(app, {'user_id': '507f1f77bcf86cd799439011', 'username': 'testuser'})
+
+        with patch.object(asgi_module, 'get_conversations_collection', return_value=conversations), \
+             patch('app.gemini_client', FakeGeminiClient(reply="Réponse asynchrone")):
+            response = _post(asgi_module, '/chat', cookies=cookies, json={'message': 'Bonjour'})
+
+        assert response.status_code == 200
+        assert response.json() == {'message': 'Réponse asynchrone'}
+        assert response.headers['x-content-type-options'] == 'nosniff'
+        inserted = conversations.insert_one.call_args[0][0]
+        assert inserted['messages'][1]['text'] == 'Réponse asynchrone'
+        session = asgi_module._load_session({b'cookie': response.headers['set-cookie'].encode()})
+        assert session['conversation_id'] == str(conversations.insert_one.return_value.inserted_id)
+
+    def test_chat_uses_fallback(self, app, asgi_module):
+        """Sans Gemini, la réponse locale doit être utilisée."""
+        conversations = _fake_conversations()
+        conversation_id = str(ObjectId())
+        conversations.find_one.return_value = {
+            '_id': ObjectId(conversation_id),
+            'user_id': '507f1f77bcf86cd799439011',
+            'messages': []
+        }
+        cookies = _session_cookie(app, {
+            'user_id': '507f1f77bcf86cd799439011',
+            'username': 'testuser',
+            'conversation_id': conversation_id
+        })
+
+        with patch.object(asgi_module, 'get_conversations_collection', return_value=conversations), \
+             patch('app.gemini_client', None), \
+             patch('app.get_fallback_response', return_value="Réponse locale"):
+            response = _post(asgi_module, '/chat', cookies=cookies, json={'message': 'Bonjour'})
+
+        assert response.json() == {'message': 'Réponse locale'}
+        assert conversations.update_one.await_count == 1
+        assert 'set-cookie' not in response.headers
+
+    def test_chat_reads_and_writes_messages_collection(self, app, asgi_module):
+        """En mode `collection`, l'historique et les nouveaux messages passent par `messages`."""
+        conversations = _fake_conversations()
+        conversation_id = ObjectId()
+        conversations.find_one.return_value = {'_id': conversation_id, 'user_id': '507f1f77bcf86cd799439011'}
+        messages = MagicMock()
+        messages.insert_many = AsyncMock()
+        cursor = messages.find.return_value.sort.return_value.limit.return_value
+        cursor.to_list = AsyncMock(return_value=[{'user': 'Bot', 'text': 'Bonjour'}])
+        cookies = _session_cookie(app, {
+            'user_id': '507f1f77bcf86cd799439011',
+            'username': 'testuser',
+            'conversation_id': str(conversation_id)
+        })
+
+        with patch.object(asgi_module, 'get_conversations_collection', return_value=conversations), \
+             patch.object(asgi_module, 'get_messages_collection', return_value=messages), \
+             patch.dict(app.config, {'MESSAGES_STORAGE': 'collection'}), \
+             patch('app.gemini_client', None), \
+             patch('app.get_fallback_response', return_value="Réponse locale"):
+            response = _post(asgi_module, '/chat', cookies=cookies, json={'message': 'Merci'})
+
+        assert response.json() == {'message': 'Réponse locale'}
+        stored = messages.insert_many.call_args[0][0]
+        assert [m['conversation_id'] for m in stored] == [conversation_id, conversation_id]
+        assert '$push' not in conversations.update_one.call_args[0][1]
+
+    def test_chat_allowed_when_shared_rate_limit_storage_is_down(self, app, asgi_module):
+        """Stockage partagé du rate limiter injoignable : la requête passe quand même."""
+        import app as app_module
+        cookies = _session_cookie(app, {'user_id': '507f1f77bcf86cd799439011', 'username': 'testuser'})
+
+        with patch.dict(app.config, {'RATELIMIT_STORAGE_URI': 'mongodb://limits:27017'}), \
+             patch.object(app_module.limiter.limiter, 'hit', side_effect=ConnectionError) as mock_hit:
+            response = _post(asgi_module, '/chat', cookies=cookies, json={'message': '   '})
+
+        assert response.status_code == 400
+        mock_hit.assert_called_once()
+
+    def test_chat_updates_admin_counters(self, app, asgi_module):
+        """Comme la route Flask : une conversation ouverte, puis un échange du jour par message."""
+        import app as app_module
+        conversations = _fake_conversations()
+        cookies = _session_cookie(app, {'user_id': '507f1f77bcf86cd799439011', 'username': 'testuser'})
+
+        with patch.object(asgi_module, 'get_conversations_collection', return_value=conversations), \
+             patch('app.gemini_client', FakeGeminiClient(reply="Réponse")):
+            response = _post(asgi_module, '/chat', cookies=cookies, json={'message': 'Bonjour'})
+            conversation_id = str(conversations.insert_one.return_value.inserted_id)
+            conversations.find_one.return_value = {'_id': ObjectId(conversation_id),
+                                                   'user_id': '507f1f77bcf86cd799439011', 'messages': []}
+            cookies = _session_cookie(app, {'user_id': '507f1f77bcf86cd799439011', 'username': 'testuser',
+                                            'conversation_id': conversation_id})
+            _post(asgi_module, '/chat', cookies=cookies, json={'message': 'Encore'})
+
+        assert response.status_code == 200
+        counters = app_module.stats_counters
+        assert counters.collection.find_one({"_id": "totals"})["conversations"] == 1
+        assert counters.daily(datetime.now().date(), days=1)[0]["chats"] == 2
+
+    def test_server_timing_for_admin_account(self, app, asgi_module):
+        """L'en-tête de débogage est honoré d'après le compte chargé, pas d'après la session."""
+        import app as app_module
+        admin_id = '507f1f77bcf86cd799439012'
+        cookies = _session_cookie(app, {'user_id': admin_id, 'username': 'admin'})
+
+        with patch('app.users_collection') as mock_users:
+            mock_users.find_one.return_value = {'_id': ObjectId(admin_id), 'is_admin': True}
+            response = _post(asgi_module, '/chat', cookies=cookies, json={'message': '   '},
+                             headers={'X-Debug-Timing': '1'})
+            assert 'total;dur=' in response.headers['server-timing']
+
+            mock_users.find_one.return_value = {'_id': ObjectId(admin_id)}
+            app_module.user_cache.clear()
+            response = _post(asgi_module, '/chat', cookies=cookies, json={'message': '   '},
+                             headers={'X-Debug-Timing': '1'})
+            assert 'server-timing' not in response.headers
+
+    def test_flask_routes_served_concurrently(self, app, asgi_module):
+        """Les routes déléguées ne partagent pas un seul thread : un flux long ne bloque pas les autres."""
+        barrier = threading.Barrier(2, timeout=5)
+
+        def slow_login_form():
+            barrier.wait()
+            return 'ok'
+
+        async def run():
+            transport = httpx.ASGITransport(app=asgi_module.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                return await asyncio.gather(client.get('/login'), client.get('/login'))
+
+        with patch.dict(app.view_functions, {'show_login_form': slow_login_form}):
+            responses = asyncio.run(run())
+        assert [r.status_code for r in responses] == [200, 200]
+
+    def test_other_routes_served_by_flask(self, asgi_module):
+        """Les autres routes doivent être servies par l'application Flask."""
+        async def run():
+            transport = httpx.ASGITransport(app=asgi_module.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                return await client.get('/login')
+        response = asyncio.run(run())
+        assert response.status_code == 200
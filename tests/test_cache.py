@@ -0,0 +1,49 @@
+"""
+Tests unitaires du cache mémoire TTL/LRU.
+Exécuter avec : pytest tests/ -v
+"""
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    """Tests pour TTLCache."""
+
+    def test_get_set_counts_hits_and_misses(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        assert cache.get('a') is None
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=30, clock=clock)
+        cache.set('a', 1)
+        clock.now = 31
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.stats()['evictions'] == 1
+
+    def test_pop_removes_entry(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set('a', 1)
+        assert cache.pop('a') == 1
+        assert cache.pop('a') is None
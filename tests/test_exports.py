@@ -0,0 +1,174 @@
+"""
+Tests des exports en flux (exports.py) et des routes /export_chat et /export_chats.
+Exécuter avec : pytest tests/ -v
+"""
+import io
+import os
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo.errors import ServerSelectionTimeoutError
+
+from exports import PdfRenderer, iter_messages, text_chunks, zip_stream
+
+USER_ID = '507f1f77bcf86cd799439011'
+
+
+def _messages(count, start=datetime(2026, 3, 1, 8, 0)):
+    return [{"user": "Bot" if i % 2 else "testuser", "text": f"Message {i}",
+             "timestamp": start + timedelta(minutes=i)} for i in range(count)]
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()['chatbot']
+
+
+def _conversation(db, count, user_id=USER_ID):
+    document = {"_id": ObjectId(), "title": "Vaccins", "date": datetime(2026, 3, 1, 8, 0), "user_id": user_id,
+                "messages": _messages(count)}
+    db.conversations.insert_one(document)
+    return document["_id"]
+
+
+class TestIterMessages:
+    """Tests pour iter_messages."""
+
+    def test_embedded_pages(self, db):
+        oid = _conversation(db, 10)
+        with patch.object(db.conversations, 'find_one', wraps=db.conversations.find_one) as find_one:
+            texts = [m["text"] for m in iter_messages(db.conversations, db.messages, oid, False, batch_size=3)]
+        assert texts == [f"Message {i}" for i in range(10)]
+        assert find_one.call_count == 4
+
+    def test_collection_after_unmigrated(self, db):
+        oid = _conversation(db, 2)
+        db.messages.insert_many([dict(m, text=f"Stocké {i}", conversation_id=oid)
+                                 for i, m in enumerate(reversed(_messages(3, datetime(2026, 3, 2))))])
+        texts = [m["text"] for m in iter_messages(db.conversations, db.messages, oid, True, batch_size=2)]
+        assert texts == ["Message 0", "Message 1", "Stocké 2", "Stocké 1", "Stocké 0"]
+
+    def test_lazy_until_read(self, db):
+        with patch.object(db.conversations, 'find_one') as find_one:
+            iter_messages(db.conversations, db.messages, ObjectId(), False)
+        find_one.assert_not_called()
+
+
+class TestStreams:
+    """Tests de text_chunks et zip_stream."""
+
+    def test_text_chunks(self):
+        chat = {"title": "Vaccins", "date": datetime(2026, 3, 1, 8, 0)}
+        chunks = list(text_chunks(chat, _messages(2)))
+        text = b''.join(chunks).decode('utf-8')
+        assert "  Vaccins\n  Date: 2026-03-01 08:00\n" in text
+        assert text.endswith("[08:01] Bot:\nMessage 1\n\n")
+
+    def test_zip_is_streamed_and_valid(self):
+        big = [f"{i} ".encode() * 20000 for i in range(5)]
+        entries = [("a.txt", datetime(2026, 3, 1), iter(big)), ("b.txt", datetime(2026, 3, 2), iter([b"court"]))]
+        chunks = list(zip_stream(entries))
+        assert len([c for c in chunks if c]) > 3
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            assert archive.namelist() == ["a.txt", "b.txt"]
+            assert archive.read("a.txt") == b''.join(big)
+            assert archive.getinfo("b.txt").date_time[:3] == (2026, 3, 2)
+
+
+class TestPdfRenderer:
+    """Tests pour PdfRenderer."""
+
+    chat = {"_id": ObjectId(), "title": "Vaccins", "date": datetime(2026, 3, 1)}
+
+    def test_inline(self):
+        path = PdfRenderer('mongodb://localhost:27017', workers=0).render(self.chat, False, iter(_messages(30)))
+        with open(path, 'rb') as f:
+            assert f.read(5) == b'%PDF-'
+        os.remove(path)
+
+    def test_worker_error_propagates_and_cleans_up(self, tmp_path):
+        renderer = PdfRenderer('mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=200', workers=1, directory=tmp_path)
+        try:
+            with pytest.raises(ServerSelectionTimeoutError):
+                renderer.render(self.chat, False, iter([]))
+        finally:
+            renderer.shutdown()
+        assert os.listdir(tmp_path) == []
+
+    def test_timeout_leaves_no_file(self, tmp_path):
+        """Délai dépassé pendant l'écriture : le processus de rendu reste seul maître de son fichier."""
+        renderer = PdfRenderer('mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=1500', workers=1, timeout=0.5,
+                               directory=tmp_path)
+        try:
+            with pytest.raises(TimeoutError):
+                renderer.render(self.chat, False, iter([]))
+            renderer._executor.shutdown(wait=True)
+        finally:
+            renderer.shutdown()
+        assert os.listdir(tmp_path) == []
+
+    def test_file_rendered_after_timeout_removed(self, tmp_path):
+        """Rendu terminé après l'abandon de la requête : son fichier est supprimé à la fin."""
+        running = Future()
+        running.set_running_or_notify_cancel()
+        renderer = PdfRenderer('mongodb://localhost:27017', workers=1, timeout=0.01, directory=tmp_path)
+        renderer._executor = MagicMock(submit=MagicMock(return_value=running))
+        with pytest.raises(TimeoutError):
+            renderer.render(self.chat, False, iter([]))
+        late = tmp_path / 'export_late.pdf'
+        late.write_bytes(b'%PDF-')
+        running.set_result(str(late))
+        assert os.listdir(tmp_path) == []
+
+
+class TestExportRoutes:
+    """Tests des routes d'export."""
+
+    def test_txt_export_streams_from_batches(self, logged_in_client, db):
+        oid = _conversation(db, 7)
+        with patch('app.conversations_collection', db.conversations), \
+             patch.dict('app.app.config', EXPORT_BATCH_SIZE=3):
+            response = logged_in_client.get(f'/export_chat/{oid}?format=txt')
+            assert response.is_streamed
+            body = response.get_data(as_text=True)
+        assert body.count("Message ") == 7
+        assert response.headers['Content-Disposition'] == f'attachment; filename="conversation_{oid}.txt"'
+
+    def test_export_refused_for_other_user(self, logged_in_client, db):
+        oid = _conversation(db, 2, user_id='autre')
+        with patch('app.conversations_collection', db.conversations):
+            response = logged_in_client.get(f'/export_chat/{oid}')
+        assert response.status_code == 302
+
+    def test_pdf_render_failure_redirects(self, logged_in_client, db):
+        oid = _conversation(db, 2)
+        with patch('app.conversations_collection', db.conversations), \
+             patch('app.pdf_renderer.render', side_effect=TimeoutError):
+            response = logged_in_client.get(f'/export_chat/{oid}?format=pdf')
+        assert response.status_code == 302
+
+    def test_pdf_killed_worker_asks_to_retry(self, logged_in_client, db):
+        oid = _conversation(db, 2)
+        with patch('app.conversations_collection', db.conversations), \
+             patch('app.pdf_renderer.render', side_effect=BrokenProcessPool):
+            response = logged_in_client.get(f'/export_chat/{oid}?format=pdf')
+        assert response.status_code == 302
+        with logged_in_client.session_transaction() as sess:
+            assert 'très sollicité' in sess['_flashes'][-1][1]
+
+    def test_zip_of_user_conversations(self, logged_in_client, db):
+        mine = [_conversation(db, 3), _conversation(db, 0)]
+        _conversation(db, 2, user_id='autre')
+        with patch('app.conversations_collection', db.conversations):
+            response = logged_in_client.get('/export_chats')
+            data = response.get_data()
+        assert response.mimetype == 'application/zip'
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert sorted(archive.namelist()) == sorted(f"conversation_{oid}.txt" for oid in mine)
+            assert archive.read(f"conversation_{mine[0]}.txt").decode().count("Message ") == 3
@@ -0,0 +1,139 @@
+"""
+Tests des index MongoDB : déclaration, création et plans d'exécution des requêtes des routes.
+Les tests explain() nécessitent un serveur MongoDB (MONGO_URI) et sont ignorés sinon.
+Exécuter avec : pytest tests/ -v
+"""
+import os
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError, PyMongoError, ServerSelectionTimeoutError
+
+from indexes import INDEXES, ensure_indexes
+
+# (route, collection, filtre, tri) : requêtes servies par les routes de app.py
+ROUTE_QUERIES = [
+    ("register", "users", {"email": "awa@example.com"}, None),
+    ("login", "users", {"username": "awa", "confirmed": True}, None),
+    ("forgot_password", "users", {"email": "awa@example.com", "confirmed": True}, None),
+    ("update_profile", "users", {"username": "awa", "_id": {"$ne": ObjectId()}}, None),
+    ("admin_panel", "users", {}, [("registration_date", -1)]),
+    ("get_history", "conversations", {"user_id": "u1"}, [("date", -1)]),
+    ("get_conversations", "conversations", {"user_id": "u1"}, [("date", -1), ("_id", -1)]),
+    ("get_conversations (page suivante)", "conversations",
+     {"user_id": "u1", "$or": [{"date": {"$lt": datetime(2024, 5, 1)}},
+                               {"date": datetime(2024, 5, 1), "_id": {"$lt": ObjectId()}}]},
+     [("date", -1), ("_id", -1)]),
+    ("get_chat (collection messages)", "messages", {"conversation_id": ObjectId()}, [("timestamp", 1), ("_id", 1)]),
+    ("get_history (collection messages)", "messages",
+     {"conversation_id": {"$in": [ObjectId(), ObjectId()]}}, [("timestamp", 1), ("_id", 1)]),
+    ("rappels du jour", "reminders", {"reminder_date": "2024-05-01"}, None),
+    ("planificateur de rappels", "reminders", {"status": "pending", "fire_at": {"$lte": datetime(2024, 5, 1)}},
+     [("fire_at", 1)]),
+    ("baux expirés des rappels", "reminders", {"status": "claimed", "lease_until": {"$lte": datetime(2024, 5, 1)}},
+     None),
+    ("file de notifications", "notifications",
+     {"status": {"$in": ["queued", "processing"]}, "run_at": {"$lte": datetime(2024, 5, 1)}}, [("run_at", 1)]),
+]
+
+
+def _stages(plan):
+    """Toutes les étapes d'un plan d'exécution (winningPlan), récursivement."""
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+@pytest.fixture(scope="module")
+def mongo_db():
+    client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017'), serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        pytest.skip("serveur MongoDB indisponible")
+    db = client['chatbot_index_test']
+    client.drop_database(db.name)
+    ensure_indexes(db)
+    # Quelques documents : le planificateur choisit un index dès qu'il en existe un adapté
+    db.users.insert_many([{"email": f"u{i}@example.com", "username": f"u{i}", "confirmed": True,
+                           "registration_date": datetime.now()} for i in range(50)])
+    yield db
+    client.drop_database(db.name)
+    client.close()
+
+
+class TestIndexDeclarations:
+    """Tests pour la création des index déclarés."""
+
+    def test_ensure_indexes_creates_declared_models(self):
+        db = MagicMock()
+        ensure_indexes(db)
+        for name, models in INDEXES.items():
+            for model in models:
+                db[name].create_indexes.assert_any_call([model])
+
+    def test_failed_index_does_not_stop_the_others(self, caplog):
+        """Doublons existants : l'index unique sur username échoue, tous les autres sont créés."""
+        db = mongomock.MongoClient()['chatbot']
+        db.users.insert_many([{"email": "a@example.com", "username": "awa"},
+                              {"email": "b@example.com", "username": "awa"}])
+        created = ensure_indexes(db)
+        assert "username_1" not in created["users"]
+        assert {"email_1", "registration_date_-1"} <= set(created["users"])
+        for name in ("conversations", "messages", "reminders", "notifications"):
+            assert created[name] == [m.document["name"] for m in INDEXES[name]]
+        assert "key_1" in db.notifications.index_information()
+        assert "users.username_1" in caplog.text
+
+    def test_connection_failure_interrupts(self):
+        db = MagicMock()
+        db.__getitem__.return_value.create_indexes.side_effect = ServerSelectionTimeoutError("injoignable")
+        with pytest.raises(ServerSelectionTimeoutError):
+            ensure_indexes(db)
+        assert db.__getitem__.return_value.create_indexes.call_count == 1
+
+    def test_ensure_indexes_filters_collections(self):
+        db = MagicMock()
+        assert list(ensure_indexes(db, ['messages'])) == ['messages']
+
+    def test_email_and_username_are_unique(self):
+        unique = {tuple(m.document['key'].keys()) for m in INDEXES['users'] if m.document.get('unique')}
+        assert unique == {('email',), ('username',)}
+
+    def test_init_indexes_survives_mongo_errors(self, app):
+        import app as app_module
+        with patch.object(app_module, 'ensure_indexes', side_effect=PyMongoError("injoignable")):
+            app_module.init_indexes()
+
+    @patch('app.users_collection')
+    def test_register_duplicate_username(self, mock_users, app, client):
+        """Un doublon refusé par l'index unique doit renvoyer vers l'inscription."""
+        import app as app_module
+        mock_users.find_one.return_value = None
+        mock_users.insert_one.side_effect = DuplicateKeyError("E11000 duplicate key")
+        with patch.object(app_module.limiter, 'enabled', False):
+            response = client.post('/register', data={
+                'username': 'awa', 'email': 'awa@example.com',
+                'password': 'motdepasse1', 'confirm_password': 'motdepasse1'
+            }, follow_redirects=False)
+        assert response.status_code == 302
+        assert '/register' in response.headers['Location']
+
+
+class TestQueryPlans:
+    """Aucune requête des routes ne doit parcourir toute la collection."""
+
+    @pytest.mark.parametrize("route, collection, query, sort", ROUTE_QUERIES, ids=[q[0] for q in ROUTE_QUERIES])
+    def test_route_query_uses_index(self, mongo_db, route, collection, query, sort):
+        cursor = mongo_db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.limit(20).explain()["queryPlanner"]["winningPlan"]
+        assert "COLLSCAN" not in set(_stages(plan)), f"{route} : parcours complet de {collection}"
@@ -0,0 +1,207 @@
+"""
+Tests de l'ordonnanceur des appels Gemini (plafond, file équitable, budget de jetons).
+Exécuter avec : pytest tests/ -v
+"""
+import asyncio
+import threading
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from bson import ObjectId
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+
+import pytest
+
+from llm_scheduler import BUDGET, BUSY, TIMEOUT, HedgeRefused, LLMScheduler, TokenBudget
+from tests.fakes import FakeGeminiClient
+
+
+def _budget(limit):
+    strategy = FixedWindowRateLimiter(MemoryStorage())
+    return TokenBudget(lambda: strategy, limit)
+
+
+def _grant_order(scheduler, requests):
+    """Ordre de service de `requests` ((user_id, weight), mis en file dans cet ordre), un créneau à la fois."""
+    async def run():
+        holder = scheduler.acquire('occupant')
+        order = []
+
+        async def one(user_id, weight):
+            ticket = await scheduler.acquire_async(user_id, weight=weight)
+            order.append(user_id)
+            await asyncio.sleep(0)
+            scheduler.release(ticket)
+
+        tasks = []
+        for user_id, weight in requests:
+            tasks.append(asyncio.create_task(one(user_id, weight)))
+            await asyncio.sleep(0)
+        scheduler.release(holder)
+        await asyncio.gather(*tasks)
+        return order
+    return asyncio.run(run())
+
+
+class TestLLMScheduler:
+    """Tests pour LLMScheduler."""
+
+    def test_admits_up_to_max_in_flight(self):
+        scheduler = LLMScheduler(max_in_flight=2, max_queue=0)
+        tickets = [scheduler.acquire('u1'), scheduler.acquire('u2')]
+        assert all(tickets)
+        assert scheduler.acquire('u3') is None
+        scheduler.release(tickets[0])
+        assert scheduler.acquire('u3') is not None
+        assert scheduler.stats()[BUSY] == 1
+
+    def test_queued_request_gets_released_slot(self):
+        scheduler = LLMScheduler(max_in_flight=1, max_wait=5)
+        holder = scheduler.acquire('u1')
+        result = {}
+        waiter = threading.Thread(target=lambda: result.update(ticket=scheduler.acquire('u2')))
+        waiter.start()
+        while scheduler.stats()['queue_depth'] == 0:
+            pass
+        scheduler.release(holder)
+        waiter.join()
+        assert result['ticket'].user_id == 'u2'
+        assert scheduler.stats()['queued'] == 1
+
+    def test_wait_times_out_to_fallback(self):
+        scheduler = LLMScheduler(max_in_flight=1, max_wait=0.05)
+        scheduler.acquire('u1')
+        assert scheduler.acquire('u2') is None
+        stats = scheduler.stats()
+        assert stats[TIMEOUT] == 1 and stats['queue_depth'] == 0 and stats['users_waiting'] == 0
+
+    def test_long_expected_wait_falls_back_immediately(self):
+        """Appels récents lents : inutile d'attendre, la décision est immédiate."""
+        clock = SimpleNamespace(now=0.0)
+        scheduler = LLMScheduler(max_in_flight=1, max_wait=2, clock=lambda: clock.now)
+        ticket = scheduler.acquire('u1')
+        clock.now = 10.0
+        scheduler.release(ticket)
+        scheduler.acquire('u1')
+        assert scheduler.acquire('u2') is None
+        assert scheduler.stats()[BUSY] == 1
+
+    def test_round_robin_between_users(self):
+        """Un utilisateur qui envoie beaucoup de requêtes ne passe pas devant les autres."""
+        scheduler = LLMScheduler(max_in_flight=1, max_wait=5)
+        order = _grant_order(scheduler, [('lourd', 1)] * 3 + [('leger', 1)])
+        assert order == ['lourd', 'leger', 'lourd', 'lourd']
+
+    def test_weight_grants_consecutive_turns(self):
+        scheduler = LLMScheduler(max_in_flight=1, max_wait=5)
+        order = _grant_order(scheduler, [('prioritaire', 2)] * 3 + [('normal', 1)] * 2)
+        assert order == ['prioritaire', 'prioritaire', 'normal', 'prioritaire', 'normal']
+
+    def test_token_budget_per_user(self):
+        scheduler = LLMScheduler(budget=_budget("1000 per hour"))
+        scheduler.release(scheduler.acquire('u1', tokens=600), tokens=700)
+        assert scheduler.acquire('u1', tokens=600) is None
+        assert scheduler.acquire('u2', tokens=600) is not None
+        assert scheduler.stats()[BUDGET] == 1
+
+    def test_budget_storage_errors_do_not_block(self):
+        def broken():
+            raise ConnectionError("stockage injoignable")
+        scheduler = LLMScheduler(budget=TokenBudget(broken, "10 per hour"))
+        ticket = scheduler.acquire('u1', tokens=100)
+        assert ticket is not None
+        scheduler.release(ticket)
+
+    def test_wait_metrics(self):
+        scheduler = LLMScheduler(max_in_flight=1, max_wait=5)
+        _grant_order(scheduler, [('u1', 1), ('u2', 1)])
+        stats = scheduler.stats()
+        assert stats['admitted'] == 3 and stats['max_queue_depth'] == 2
+        assert stats['wait_p95_ms'] >= stats['wait_p50_ms'] >= 0
+
+    def test_hedge_counts_against_max_in_flight(self):
+        scheduler = LLMScheduler(max_in_flight=2)
+        ticket = scheduler.acquire('u1')
+        hedge = scheduler.acquire_hedge(ticket)
+        assert scheduler.stats()['in_flight'] == 2
+        with pytest.raises(HedgeRefused):
+            scheduler.acquire_hedge(ticket)
+        scheduler.release(hedge)
+        scheduler.release(ticket)
+        stats = scheduler.stats()
+        assert stats['in_flight'] == 0 and stats['hedged'] == 1 and stats['hedge_refused'] == 1
+
+    def test_hedge_charged_to_token_budget(self):
+        scheduler = LLMScheduler(budget=_budget("150 per hour"))
+        ticket = scheduler.acquire('u1', tokens=100)
+        # Après une première requête doublée (100 jetons comptés), une seconde dépasserait le budget
+        scheduler.release(scheduler.acquire_hedge(ticket), tokens=100)
+        with pytest.raises(HedgeRefused):
+            scheduler.acquire_hedge(ticket)
+        scheduler.release(ticket)
+
+
+class TestGeminiScheduling:
+    """Tests de l'ordonnanceur devant get_gemini_response."""
+
+    def test_saturated_scheduler_uses_fallback(self, app):
+        import app as app_module
+        fake = FakeGeminiClient()
+        with patch('app.gemini_client', fake), \
+             patch.object(app_module.llm_scheduler, 'acquire', return_value=None):
+            assert app_module.get_gemini_response("Bonjour", [], user_id='u1') is None
+        assert fake.sent_messages == []
+
+    def test_ticket_released_for_user(self, app):
+        import app as app_module
+        with patch('app.gemini_client', FakeGeminiClient()), \
+             patch.object(app_module.llm_scheduler, 'release') as mock_release:
+            assert app_module.get_gemini_response("Bonjour", [], user_id='u1')
+        assert mock_release.call_args[0][0].user_id == 'u1'
+
+    def test_hedge_refused_when_saturated_keeps_first_attempt(self, app):
+        """Plafond atteint : pas de requête doublée, le premier essai (lent) répond quand même."""
+        import app as app_module
+        from resilience import ResilientCaller
+        fake = FakeGeminiClient(reply="Réponse", first_chunk_delay=0.2)
+        with patch('app.gemini_client', fake), \
+             patch('app.gemini_caller', ResilientCaller(deadline=2, hedge_after=0.01)), \
+             patch('app.llm_scheduler', LLMScheduler(max_in_flight=1)):
+            assert app_module.get_gemini_response("Bonjour", [], user_id='u1') == "Réponse"
+            stats = app_module.llm_scheduler.stats()
+        assert len(fake.created_chats) == 1
+        assert stats['hedge_refused'] == 1 and stats['in_flight'] == 0
+
+    def test_async_hedge_refused_when_saturated(self, app):
+        import app as app_module
+        import asgi
+        from resilience import ResilientCaller
+        fake = FakeGeminiClient(reply="Réponse", first_chunk_delay=0.2)
+        with patch('app.gemini_client', fake), \
+             patch('app.gemini_caller', ResilientCaller(deadline=2, hedge_after=0.01)), \
+             patch('app.llm_scheduler', LLMScheduler(max_in_flight=1)):
+            assert asyncio.run(asgi.get_gemini_response_async("Bonjour", [], 'u1')) == "Réponse"
+            stats = app_module.llm_scheduler.stats()
+        assert fake.sent_messages == ["Bonjour"]
+        assert stats['hedge_refused'] == 1 and stats['in_flight'] == 0
+
+    def test_tokens_read_from_usage_metadata(self, app):
+        import app as app_module
+        response = SimpleNamespace(text="Réponse", usage_metadata=SimpleNamespace(total_token_count=321))
+        assert app_module.gemini_tokens_used(response) == 321
+        assert app_module.gemini_tokens_used(SimpleNamespace(text="Réponse")) is None
+
+    def test_budget_exhausted_user_gets_fallback(self, app, logged_in_client):
+        import app as app_module
+        with patch('app.gemini_client', FakeGeminiClient(reply="Réponse Gemini")), \
+             patch('app.conversations_collection') as mock_conversations, \
+             patch('app.get_fallback_response', return_value="Réponse locale"), \
+             patch.dict(app.config, {'ANSWER_CACHE_ENABLED': False}), \
+             patch.object(app_module.llm_scheduler, 'budget', _budget("600 per hour")):
+            mock_conversations.insert_one.return_value.inserted_id = ObjectId()
+            first = logged_in_client.post('/chat', json={'message': 'Bonjour'})
+            logged_in_client.post('/new_chat')
+            second = logged_in_client.post('/chat', json={'message': 'Bonjour'})
+        assert first.get_json() == {'message': 'Réponse Gemini'}
+        assert second.get_json() == {'message': 'Réponse locale'}
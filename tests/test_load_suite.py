@@ -0,0 +1,92 @@
+"""
+Tests de la suite de charge (benchmarks/bench_load.py) : serveur Gemini factice appelé par le vrai
+SDK, données de charge, détection des régressions, et export PDF servi en bytes.
+Exécuter avec : pytest tests/ -v
+"""
+from datetime import datetime
+from unittest.mock import patch
+
+import mongomock
+from bson import ObjectId
+from google import genai
+from google.genai import types
+
+from benchmarks.bench_load import _stats, conversation_id, regressions, seed, user_id
+from tests.fakes import FakeGeminiServer
+
+
+class TestFakeGeminiServer:
+    """Tests pour FakeGeminiServer avec le SDK google-genai."""
+
+    def test_generate_and_stream(self):
+        with FakeGeminiServer(reply="Consultez un agent de santé rapidement.", chunk_size=10) as server:
+            client = genai.Client(api_key='fake', http_options=types.HttpOptions(base_url=server.url))
+            response = client.models.generate_content(model='gemini-2.0-flash', contents='Bonjour')
+            chunks = [chunk.text for chunk in
+                      client.models.generate_content_stream(model='gemini-2.0-flash', contents='Bonjour')]
+        assert response.text == "Consultez un agent de santé rapidement."
+        assert len(chunks) == 4 and ''.join(chunks) == response.text
+        assert server.requests == 2
+
+
+class TestLoadData:
+    """Tests du remplissage de la base de charge."""
+
+    def test_seed_embedded(self, app):
+        db = mongomock.MongoClient()['chatbot']
+        seed(db, users=2, conversations=3, length=5)
+        user = db.users.find_one({"username": "loadtest1"})
+        assert user["_id"] == user_id(1) and user["confirmed"]
+        chat = db.conversations.find_one({"_id": conversation_id(1, 2)})
+        assert chat["user_id"] == str(user_id(1))
+        assert len(chat["messages"]) == chat["message_count"] == 5
+        assert db.conversations.count_documents({}) == 6
+
+    def test_seed_collection(self, app):
+        db = mongomock.MongoClient()['chatbot']
+        with patch.dict(app.config, MESSAGES_STORAGE='collection'):
+            seed(db, users=1, conversations=2, length=4)
+        assert "messages" not in db.conversations.find_one()
+        assert db.messages.count_documents({"conversation_id": conversation_id(0, 1)}) == 4
+
+    def test_ids_are_distinct(self):
+        ids = {conversation_id(i, j) for i in range(50) for j in range(50)}
+        assert len(ids) == 2500 and all(ObjectId.is_valid(str(oid)) for oid in ids)
+
+
+class TestRegressions:
+    """Tests de la comparaison aux références."""
+
+    reference = {"chat": {"requests": 500, "rps": 20.0, "error_rate": 0.0,
+                          "p50_ms": 100.0, "p95_ms": 200.0, "p99_ms": 300.0}}
+
+    def test_within_tolerance(self):
+        current = {"chat": dict(self.reference["chat"], p95_ms=250.0, rps=15.0)}
+        assert regressions(current, self.reference, tolerance=0.3) == []
+
+    def test_slower_and_failing(self):
+        current = {"chat": dict(self.reference["chat"], p95_ms=300.0, rps=10.0, error_rate=0.05)}
+        assert len(regressions(current, self.reference, tolerance=0.3)) == 3
+
+    def test_rare_routes_only_checked_for_errors(self):
+        current = {"chat": dict(self.reference["chat"], requests=50, p95_ms=900.0, rps=1.0)}
+        assert regressions(current, self.reference, tolerance=0.3) == []
+
+    def test_stats_counts_errors(self):
+        stats = _stats([(200, 10.0), (200, 20.0), (500, 30.0), (200, 40.0)], duration=2)
+        assert stats["rps"] == 2.0 and stats["error_rate"] == 0.25 and stats["p50_ms"] == 25.0
+
+
+class TestPdfExport:
+    """L'export PDF doit être servi en bytes (gunicorn refuse un bytearray)."""
+
+    def test_pdf_body_is_bytes(self, logged_in_client):
+        chat = {"_id": ObjectId(), "title": "Vaccins", "user_id": "507f1f77bcf86cd799439011",
+                "date": datetime(2026, 1, 5, 9, 30),
+                "messages": [{"user": "Bot", "text": "Bonjour", "timestamp": datetime(2026, 1, 5, 9, 30)}]}
+        with patch('app.conversations_collection') as mock_conversations:
+            mock_conversations.find_one.return_value = chat
+            response = logged_in_client.get(f"/export_chat/{chat['_id']}?format=pdf")
+        assert response.status_code == 200
+        assert response.data.startswith(b'%PDF')
+        assert all(type(part) is bytes for part in response.response)
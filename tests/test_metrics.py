@@ -0,0 +1,153 @@
+"""
+Tests des métriques Prometheus (/metrics, instrumentation des routes et des appels externes).
+Exécuter avec : pytest tests/ -v
+"""
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytest.importorskip('prometheus_client')
+
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess  # noqa: E402
+
+import metrics  # noqa: E402
+from tests.fakes import FakeGeminiClient, FlakyGeminiClient  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestMetricsEndpoint:
+    """Tests de la route /metrics."""
+
+    def test_exposes_route_latency(self, client):
+        before = _value('http_request_duration_seconds_count', method='GET', route='/login', status='200')
+        client.get('/login')
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain')
+        assert b'http_request_duration_seconds_bucket' in response.data
+        assert _value('http_request_duration_seconds_count', method='GET', route='/login', status='200') == before + 1
+
+    def test_route_label_uses_rule_not_path(self, logged_in_client):
+        with patch('app.conversations_collection') as mock_conversations:
+            mock_conversations.find_one.return_value = None
+            logged_in_client.get('/get_chat/507f1f77bcf86cd799439099')
+        assert _value('http_request_duration_seconds_count', method='GET', route='/get_chat/<chat_id>',
+                      status='404') >= 1
+
+    def test_token_required_when_configured(self, app, client):
+        with patch.dict(app.config, {'METRICS_TOKEN': 'secret'}):
+            assert client.get('/metrics').status_code == 401
+            assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+    def test_not_rate_limited(self, client):
+        for _ in range(60):
+            assert client.get('/metrics').status_code == 200
+
+    def test_rate_limit_rejections_counted(self, client):
+        before = _value('rate_limit_rejections_total', route='/login')
+        with patch('app.users_collection') as mock_users:
+            mock_users.find_one.return_value = None
+            for _ in range(6):
+                client.post('/login', data={'username': 'x', 'password': 'y'})
+        assert _value('rate_limit_rejections_total', route='/login') > before
+
+
+class TestHotPathMetrics:
+    """Tests de l'instrumentation de Gemini, du fallback, de la NER, de MongoDB et des envois."""
+
+    def test_gemini_success_and_error(self, app):
+        import app as app_module
+        ok = _value('gemini_calls_total', mode='unary', outcome='ok')
+        errors = _value('gemini_calls_total', mode='unary', outcome='error')
+        answers = _value('chat_answers_total', source='gemini')
+        with patch('app.gemini_client', FakeGeminiClient(reply="Réponse")):
+            assert app_module.get_gemini_response("Bonjour", []) == "Réponse"
+        with patch('app.gemini_client', FlakyGeminiClient(outage='error')):
+            assert app_module.get_gemini_response("Bonjour", []) is None
+        assert _value('gemini_calls_total', mode='unary', outcome='ok') == ok + 1
+        assert _value('gemini_calls_total', mode='unary', outcome='error') == errors + 1
+        assert _value('chat_answers_total', source='gemini') == answers + 1
+        assert _value('gemini_call_duration_seconds_count', mode='unary', outcome='ok') >= 1
+
+    def test_fallback_and_ner_time(self, app):
+        import app as app_module
+        fallbacks = _value('chat_answers_total', source='fallback')
+        ner = _value('spacy_ner_duration_seconds_count')
+        with patch('app.get_nlp', return_value=MagicMock(return_value=MagicMock(ents=[]))):
+            app_module.get_fallback_response("Bonjour")
+        assert _value('chat_answers_total', source='fallback') == fallbacks + 1
+        assert _value('spacy_ner_duration_seconds_count') == ner + 1
+
+    def test_mongo_command_latency_per_collection(self):
+        listener = metrics.MongoCommandMetrics()
+        before = _value('mongodb_command_duration_seconds_count', collection='users', command='find', outcome='ok')
+        listener.started(SimpleNamespace(command_name='find', command={'find': 'users'}, connection_id=('h', 1),
+                                         request_id=7))
+        listener.succeeded(SimpleNamespace(command_name='find', connection_id=('h', 1), request_id=7,
+                                           duration_micros=1500))
+        # Commande d'administration : ignorée
+        listener.started(SimpleNamespace(command_name='ping', command={'ping': 1}, connection_id=('h', 1),
+                                         request_id=8))
+        listener.succeeded(SimpleNamespace(command_name='ping', connection_id=('h', 1), request_id=8,
+                                           duration_micros=100))
+        assert _value('mongodb_command_duration_seconds_count', collection='users', command='find',
+                      outcome='ok') == before + 1
+        assert listener._pending == {}
+
+    def test_mongo_pool_checkout_wait(self):
+        listener = metrics.MongoPoolMetrics()
+        ok = _value('mongodb_pool_checkout_seconds_count', outcome='ok')
+        timeout = _value('mongodb_pool_checkout_seconds_count', outcome='timeout')
+        created = _value('mongodb_pool_connections_total', event='created')
+        listener.connection_created(SimpleNamespace(address=('h', 1), connection_id=1))
+        listener.connection_checked_out(SimpleNamespace(address=('h', 1), connection_id=1, duration=0.002))
+        listener.connection_check_out_failed(SimpleNamespace(address=('h', 1), reason='timeout', duration=5.0))
+        assert _value('mongodb_pool_checkout_seconds_count', outcome='ok') == ok + 1
+        assert _value('mongodb_pool_checkout_seconds_count', outcome='timeout') == timeout + 1
+        assert _value('mongodb_pool_connections_total', event='created') == created + 1
+
+    def test_llm_scheduler_queue_and_refusals(self):
+        from llm_scheduler import LLMScheduler
+        scheduler = LLMScheduler(max_in_flight=1, max_queue=0, listener=metrics.LLMSchedulerMetrics())
+        admitted = _value('llm_scheduler_decisions_total', decision='admitted')
+        busy = _value('llm_scheduler_decisions_total', decision='busy')
+        ticket = scheduler.acquire('u1')
+        assert _value('llm_scheduler_in_flight') == 1
+        assert scheduler.acquire('u2') is None
+        scheduler.release(ticket)
+        assert _value('llm_scheduler_decisions_total', decision='admitted') == admitted + 1
+        assert _value('llm_scheduler_decisions_total', decision='busy') == busy + 1
+        assert _value('llm_scheduler_in_flight') == 0 and _value('llm_scheduler_queue_depth') == 0
+
+    def test_notification_send_latency(self):
+        failing = metrics.timed_transport('sms', MagicMock(side_effect=ConnectionError("Twilio")))
+        before = _value('notification_send_duration_seconds_count', channel='sms', outcome='error')
+        with pytest.raises(ConnectionError):
+            failing({"to": "+22600000000", "body": "Rappel"})
+        assert _value('notification_send_duration_seconds_count', channel='sms', outcome='error') == before + 1
+
+
+class TestMultiprocess:
+    """Agrégation des valeurs de plusieurs workers (PROMETHEUS_MULTIPROC_DIR)."""
+
+    def test_values_from_all_workers_are_summed(self, tmp_path, monkeypatch):
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', "import metrics; metrics.RATE_LIMITED.labels('/chat').inc(3)"],
+                           cwd=ROOT, env=env, check=True)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=str(tmp_path))
+        assert registry.get_sample_value('rate_limit_rejections_total', {'route': '/chat'}) == 6
+
+        monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+        body, _ = metrics.render()
+        assert b'rate_limit_rejections_total{route="/chat"} 6.0' in body
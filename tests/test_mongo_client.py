@@ -0,0 +1,80 @@
+"""
+Tests du client MongoDB : options du groupe de connexions et nouveau client par worker après le fork.
+Exécuter avec : pytest tests/ -v
+"""
+import os
+from unittest.mock import patch
+
+import pytest
+
+import app as app_module
+
+MODULE_STATE = ('client', 'db', 'users_collection', 'reminders_collection', 'conversations_collection',
+                'messages_collection', 'notifications_collection')
+
+
+@pytest.fixture
+def restore_mongo():
+    """Remettre en place le client du module et les collections des tâches de fond après le test."""
+    state = {name: getattr(app_module, name) for name in MODULE_STATE}
+    bound = (app_module.notification_queue.collection, app_module.reminder_scheduler.collection,
+             app_module.stats_counters.collection, app_module.stats_counters.sources,
+             app_module.topic_analytics.collection, app_module.topic_analytics.conversations,
+             app_module.topic_analytics.messages)
+    yield
+    for name, value in state.items():
+        setattr(app_module, name, value)
+    (app_module.notification_queue.collection, app_module.reminder_scheduler.collection,
+     app_module.stats_counters.collection, app_module.stats_counters.sources,
+     app_module.topic_analytics.collection, app_module.topic_analytics.conversations,
+     app_module.topic_analytics.messages) = bound
+
+
+class TestMongoClient:
+    """Tests de create_mongo_client et init_mongo."""
+
+    def test_pool_options_from_config(self, app):
+        with patch.dict(app.config, MONGO_MAX_POOL_SIZE=7, MONGO_MAX_IDLE_TIME_MS=1000, MONGO_SOCKET_TIMEOUT_MS=0), \
+             patch('app.MongoClient') as mock_client:
+            app_module.create_mongo_client()
+        kwargs = mock_client.call_args.kwargs
+        assert kwargs['connect'] is False
+        assert kwargs['maxPoolSize'] == 7 and kwargs['maxIdleTimeMS'] == 1000
+        assert kwargs['socketTimeoutMS'] is None
+        assert kwargs['waitQueueTimeoutMS'] == app.config['MONGO_WAIT_QUEUE_TIMEOUT_MS']
+
+    def test_init_mongo_rebinds_collections_and_background_jobs(self, restore_mongo):
+        with patch('app.MongoClient') as mock_client:
+            client = app_module.init_mongo()
+        db = mock_client.return_value['chatbot']
+        assert client is mock_client.return_value and app_module.db is db
+        assert app_module.users_collection is db['users']
+        assert app_module.notification_queue.collection is db['notifications']
+        assert app_module.reminder_scheduler.collection is db['reminders']
+        assert app_module.stats_counters.sources['users'][0] is db['users']
+        assert app_module.topic_analytics.messages is db['messages']
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason="fork indisponible")
+    # Threads laissés par d'autres tests : le fils ne fait que créer un client (aucun verrou partagé)
+    @pytest.mark.filterwarnings("ignore:This process .* is multi-threaded:DeprecationWarning")
+    def test_worker_gets_its_own_client_after_fork(self, restore_mongo):
+        parent = app_module.client
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Processus fils (worker gunicorn) : même enchaînement que post_fork
+            ok = False
+            try:
+                client = app_module.init_mongo()
+                ok = (client is not parent and app_module.conversations_collection.database.client is client
+                      and app_module.notification_queue.collection.database.client is client)
+                client.close()
+            finally:
+                os.write(write_end, b'1' if ok else b'0')
+                os._exit(0)
+        os.close(write_end)
+        result = os.read(read_end, 1)
+        os.close(read_end)
+        os.waitpid(pid, 0)
+        assert result == b'1'
+        assert app_module.client is parent
@@ -0,0 +1,121 @@
+"""
+Tests de la file d'envoi des notifications.
+Exécuter avec : pytest tests/ -v
+"""
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+
+from notifications import FAILED, QUEUED, SENT, FakeTransport, NotificationQueue, utcnow
+from tests.fakes import InMemoryCollection
+
+
+def _queue(transport, **kwargs):
+    kwargs.setdefault('workers', 0)
+    return NotificationQueue(InMemoryCollection(), {"sms": transport}, **kwargs)
+
+
+class TestNotificationQueue:
+    """Tests pour NotificationQueue."""
+
+    def test_enqueue_persists_job(self):
+        queue = _queue(FakeTransport())
+        job_id = queue.enqueue('sms', {"to": "+22600000000", "body": "Bonjour"})
+        job = queue.collection.documents[job_id]
+        assert job['status'] == QUEUED and job['attempts'] == 0
+
+    def test_unknown_channel_is_rejected(self):
+        with pytest.raises(ValueError):
+            _queue(FakeTransport()).enqueue('fax', {})
+
+    def test_successful_send(self):
+        transport = FakeTransport()
+        queue = _queue(transport)
+        job_id = queue.enqueue('sms', {"to": "+22600000000", "body": "Bonjour"})
+
+        assert queue.process_one() is True
+        assert queue.process_one() is False
+        assert transport.sent == [{"to": "+22600000000", "body": "Bonjour"}]
+        assert queue.collection.documents[job_id]['status'] == SENT
+
+    def test_failure_is_retried_later_with_backoff(self):
+        queue = _queue(FakeTransport(failure_rate=1.0), backoff_base=30)
+        job_id = queue.enqueue('sms', {"to": "+22600000000", "body": "Bonjour"})
+
+        queue.process_one()
+        job = queue.collection.documents[job_id]
+        assert job['status'] == QUEUED
+        assert job['run_at'] > utcnow() + timedelta(seconds=10)
+        assert queue.process_one() is False  # pas encore dû
+        assert queue.backoff(4) > queue.backoff(1) * 2
+
+    def test_job_fails_after_max_attempts(self):
+        queue = _queue(FakeTransport(failure_rate=1.0), max_attempts=2, backoff_base=0)
+        job_id = queue.enqueue('sms', {"to": "+22600000000", "body": "Bonjour"})
+
+        while queue.process_one():
+            pass
+        job = queue.collection.documents[job_id]
+        assert job['status'] == FAILED and job['attempts'] == 2
+        assert queue.stats() == {"enqueued": 1, "sent": 0, "retried": 1, "failed": 1}
+
+    def test_expired_lease_is_reclaimed(self):
+        """Un travail réclamé par un worker disparu est repris après expiration du bail."""
+        transport = FakeTransport()
+        queue = _queue(transport, lease=0)
+        queue.enqueue('sms', {"to": "+22600000000", "body": "Bonjour"})
+        stale = queue.claim()
+
+        assert queue.process_one() is True
+        # Le premier worker revient trop tard : son résultat est ignoré
+        queue.process(stale)
+        assert len(transport.sent) == 2
+        assert queue.stats()['sent'] == 1
+
+    def test_workers_drain_queue(self):
+        transport = FakeTransport(latency=0.01)
+        queue = _queue(transport, workers=4, poll_interval=0.05)
+        for i in range(20):
+            queue.enqueue('sms', {"to": f"+2260000{i:04d}", "body": "Campagne"})
+
+        deadline = time.monotonic() + 5
+        while queue.stats()['sent'] < 20 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        queue.stop()
+        assert len(transport.sent) == 20
+
+
+class TestNotificationRoutes:
+    """Les routes mettent les envois en file au lieu de les faire elles-mêmes."""
+
+    @patch('app.notification_queue')
+    def test_contact_advisor_enqueues_sms(self, mock_queue, app, logged_in_client):
+        import app as app_module
+        with patch.object(app_module.limiter, 'enabled', False):
+            response = logged_in_client.post('/contact_advisor', json={
+                'phone_number': '+22670000000', 'name': 'Awa',
+                'email': 'awa@example.com', 'message': 'Besoin de conseils'
+            })
+        assert response.status_code == 200
+        channel, payload = mock_queue.enqueue.call_args[0]
+        assert channel == 'sms' and payload['to'] == app.config['ADVISOR_PHONE_NUMBER']
+
+    @patch('app.notification_queue')
+    @patch('app.users_collection')
+    def test_forgot_password_enqueues_email(self, mock_users, mock_queue, app, client):
+        import app as app_module
+        mock_users.find_one.return_value = {'username': 'awa', 'email': 'awa@example.com'}
+        with patch.object(app_module.limiter, 'enabled', False):
+            response = client.post('/forgot_password', data={'email': 'awa@example.com'})
+        assert response.status_code == 302
+        channel, payload = mock_queue.enqueue.call_args[0]
+        assert channel == 'email' and payload['recipients'] == ['awa@example.com']
+        assert '/reset_password/' in payload['body']
+
+    @patch('app.notification_queue')
+    def test_enqueue_failure_is_reported(self, mock_queue, app):
+        import app as app_module
+        mock_queue.enqueue.side_effect = RuntimeError("MongoDB indisponible")
+        assert app_module.send_sms('+22670000000', 'Bonjour') is False
@@ -0,0 +1,165 @@
+"""
+Tests du hachage des mots de passe (passwords.py) et de sa mise à jour à la connexion.
+Exécuter avec : pytest tests/ -v
+"""
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from werkzeug.security import generate_password_hash
+
+from passwords import PasswordHasher, normalize_method
+
+FAST = 'pbkdf2:sha256:1000'
+
+
+class TestNormalizeMethod:
+    """Tests pour normalize_method."""
+
+    def test_defaults_expanded(self):
+        assert normalize_method('scrypt') == 'scrypt:32768:8:1'
+        assert normalize_method('pbkdf2:sha512').startswith('pbkdf2:sha512:')
+
+    def test_matches_werkzeug_prefix(self):
+        for method in ('scrypt:1024:8:1', 'pbkdf2:sha256:1000'):
+            assert generate_password_hash('x', method).split('$')[0] == normalize_method(method)
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            normalize_method('md5')
+
+
+class TestPasswordHasher:
+    """Tests pour PasswordHasher."""
+
+    def test_hash_and_verify_inline(self):
+        hasher = PasswordHasher(FAST, workers=0)
+        pwhash = hasher.hash('motdepasse1')
+        assert hasher.verify(pwhash, 'motdepasse1')
+        assert not hasher.verify(pwhash, 'autre')
+        assert not hasher.needs_rehash(pwhash)
+
+    def test_needs_rehash_when_cost_changes(self):
+        old = generate_password_hash('motdepasse1', 'scrypt:1024:8:1')
+        hasher = PasswordHasher('scrypt:2048:8:1', workers=0)
+        assert hasher.verify(old, 'motdepasse1')
+        assert hasher.needs_rehash(old)
+
+    def test_process_pool(self):
+        hasher = PasswordHasher(FAST, workers=1)
+        try:
+            pwhash = hasher.hash('motdepasse1')
+            assert hasher.verify(pwhash, 'motdepasse1')
+            assert hasher._executor is not None
+        finally:
+            hasher.shutdown()
+
+    def test_timeout_cancels_queued_hash(self):
+        """Requête abandonnée : son calcul ne reste pas dans la file du groupe."""
+        hasher = PasswordHasher(FAST, workers=1, timeout=0.01)
+        queued = Future()
+        hasher._executor = MagicMock(submit=MagicMock(return_value=queued))
+        with pytest.raises(TimeoutError):
+            hasher.hash('motdepasse1')
+        assert queued.cancelled()
+
+
+class TestLoginRehash:
+    """Tests de la connexion avec des hachages d'anciens paramètres."""
+
+    def _user(self, method):
+        return {'_id': ObjectId(), 'username': 'awa', 'confirmed': True,
+                'password': generate_password_hash('motdepasse1', method)}
+
+    def test_old_hash_upgraded(self, client):
+        user = self._user('pbkdf2:sha256:500')
+        with patch('app.users_collection') as mock_users, \
+             patch('app.password_hasher', PasswordHasher(FAST, workers=0)):
+            mock_users.find_one.return_value = user
+            response = client.post('/login', data={'username': 'awa', 'password': 'motdepasse1'})
+        assert response.status_code == 302 and response.location.endswith('/')
+        query, update = mock_users.update_one.call_args[0]
+        assert query == {'_id': user['_id'], 'password': user['password']}
+        assert update['$set']['password'].startswith(FAST + '$')
+
+    def test_current_hash_untouched(self, client):
+        with patch('app.users_collection') as mock_users, \
+             patch('app.password_hasher', PasswordHasher(FAST, workers=0)):
+            mock_users.find_one.return_value = self._user(FAST)
+            client.post('/login', data={'username': 'awa', 'password': 'motdepasse1'})
+        mock_users.update_one.assert_not_called()
+
+    def test_wrong_password_not_upgraded(self, client):
+        with patch('app.users_collection') as mock_users, \
+             patch('app.password_hasher', PasswordHasher(FAST, workers=0)):
+            mock_users.find_one.return_value = self._user('pbkdf2:sha256:500')
+            response = client.post('/login', data={'username': 'awa', 'password': 'mauvais'})
+        assert response.location.endswith('/login')
+        mock_users.update_one.assert_not_called()
+
+    def test_saturated_pool(self, client):
+        with patch('app.users_collection') as mock_users, \
+             patch('app.password_hasher.verify', side_effect=TimeoutError):
+            mock_users.find_one.return_value = self._user(FAST)
+            response = client.post('/login', data={'username': 'awa', 'password': 'motdepasse1'})
+        assert response.location.endswith('/login')
+        with client.session_transaction() as sess:
+            assert 'user_id' not in sess
+
+    def test_killed_worker(self, client):
+        """Processus de hachage tué : même message d'attente qu'une file pleine, pas d'erreur 500."""
+        with patch('app.users_collection') as mock_users, \
+             patch('app.password_hasher.verify', side_effect=BrokenProcessPool):
+            mock_users.find_one.return_value = self._user(FAST)
+            response = client.post('/login', data={'username': 'awa', 'password': 'motdepasse1'})
+        assert response.location.endswith('/login')
+        with client.session_transaction() as sess:
+            assert 'user_id' not in sess
+            assert 'très sollicité' in sess['_flashes'][-1][1]
+
+
+class TestSaturatedPool:
+    """File de hachage pleine : message d'attente au lieu d'une erreur 500, rien n'est écrit."""
+
+    def test_register(self, client):
+        with patch('app.users_collection') as mock_users, \
+             patch('app.password_hasher.hash', side_effect=TimeoutError):
+            mock_users.find_one.return_value = None
+            response = client.post('/register', data={'username': 'awa', 'email': 'awa@example.com',
+                                                      'password': 'motdepasse1', 'confirm_password': 'motdepasse1'})
+        assert response.status_code == 302 and response.location.endswith('/register')
+        mock_users.insert_one.assert_not_called()
+
+    def test_register_killed_worker(self, client):
+        with patch('app.users_collection') as mock_users, \
+             patch('app.password_hasher.hash', side_effect=BrokenProcessPool):
+            mock_users.find_one.return_value = None
+            response = client.post('/register', data={'username': 'awa', 'email': 'awa@example.com',
+                                                      'password': 'motdepasse1', 'confirm_password': 'motdepasse1'})
+        assert response.status_code == 302 and response.location.endswith('/register')
+        mock_users.insert_one.assert_not_called()
+
+    def test_reset_password(self, client):
+        import app as app_module
+        token = app_module.ts.dumps('awa@example.com', salt='password-reset-key')
+        with patch('app.users_collection') as mock_users, \
+             patch('app.password_hasher.hash', side_effect=TimeoutError):
+            response = client.post(f'/reset_password/{token}',
+                                   data={'password': 'motdepasse1', 'confirm_password': 'motdepasse1'})
+        assert response.status_code == 200
+        assert 'très sollicité' in response.get_data(as_text=True)
+        mock_users.find_one_and_update.assert_not_called()
+
+    def test_change_password(self, logged_in_client):
+        user = {'_id': ObjectId('507f1f77bcf86cd799439011'), 'username': 'testuser',
+                'password': generate_password_hash('motdepasse1', FAST)}
+        with patch('app.users_collection') as mock_users, \
+             patch('app.password_hasher.verify', side_effect=TimeoutError):
+            mock_users.find_one.return_value = user
+            response = logged_in_client.post('/profile', data={
+                'action': 'change_password', 'current_password': 'motdepasse1',
+                'new_password': 'nouveaumdp1', 'confirm_password': 'nouveaumdp1'})
+        assert response.status_code == 302 and response.location.endswith('/profile')
+        mock_users.update_one.assert_not_called()
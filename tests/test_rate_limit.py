@@ -0,0 +1,68 @@
+"""
+Tests du stockage des compteurs du rate limiter : deux workers doivent partager la même limite.
+Le test MongoDB nécessite un serveur (MONGO_URI) et est ignoré sinon.
+Exécuter avec : pytest tests/ -v
+"""
+import os
+
+import pytest
+from flask import Flask
+from flask_limiter import Limiter
+from limits.storage import MemoryStorage
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
+
+
+def _worker(storage_uri, strategy='fixed-window'):
+    """Un worker gunicorn : sa propre application et son propre Limiter, comme dans app.py."""
+    worker = Flask(__name__)
+    limiter = Limiter(app=worker, key_func=lambda: '10.0.0.1', storage_uri=storage_uri,
+                      storage_options={'database_name': 'chatbot_limits_test'}, strategy=strategy)
+
+    @worker.route('/chat', methods=['POST'])
+    @limiter.limit("3 per minute")
+    def chat():
+        return 'ok'
+
+    limiter.reset()
+    client = worker.test_client()
+    # L'application ne garde qu'une référence faible au Limiter
+    client.limiter = limiter
+    return client
+
+
+def _accepted(workers, requests):
+    """Envoyer les requêtes à tour de rôle aux workers ; retourne le nombre de réponses 200."""
+    return sum(workers[i % len(workers)].post('/chat').status_code == 200 for i in range(requests))
+
+
+@pytest.fixture(scope="module")
+def mongo_uri():
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        pytest.skip("serveur MongoDB indisponible")
+    finally:
+        client.close()
+    return MONGO_URI
+
+
+class TestRateLimitStorage:
+    """Tests pour le stockage configurable du rate limiter."""
+
+    def test_default_storage_is_in_memory(self, app):
+        import app as app_module
+        assert isinstance(app_module.limiter.storage, MemoryStorage)
+        assert app.config['RATELIMIT_STRATEGY'] == 'fixed-window'
+
+    def test_memory_storage_limits_each_worker_separately(self):
+        """Comportement par défaut : chaque worker accorde sa propre limite."""
+        assert _accepted([_worker('memory://'), _worker('memory://')], 10) == 6
+
+    @pytest.mark.parametrize('strategy', ['fixed-window', 'sliding-window-counter', 'moving-window'])
+    def test_mongodb_storage_shares_limit_between_workers(self, mongo_uri, strategy):
+        workers = [_worker(mongo_uri, strategy), _worker(mongo_uri, strategy)]
+        assert _accepted(workers, 10) == 3
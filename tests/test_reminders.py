@@ -0,0 +1,139 @@
+"""
+Tests du planificateur de rappels.
+Exécuter avec : pytest tests/ -v
+"""
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import mongomock
+import pytest
+
+from notifications import FakeTransport, NotificationQueue
+from reminders import CLAIMED, DISPATCHED, PENDING, ReminderScheduler, parse_fire_at
+from tests.fakes import InMemoryCollection
+
+NOW = datetime(2024, 5, 1, 8, 0)
+
+
+def _reminders(count, fire_at=NOW - timedelta(minutes=1)):
+    collection = InMemoryCollection()
+    for i in range(count):
+        collection.insert_one({"phone_number": f"+2267{i:07d}", "message": "Rappel", "fire_at": fire_at,
+                               "status": PENDING})
+    return collection
+
+
+class TestParseFireAt:
+    """Tests pour la conversion des dates saisies en UTC."""
+
+    def test_local_time_converted_to_utc(self):
+        assert parse_fire_at('2024-05-01', '08:30', 'Europe/Paris') == datetime(2024, 5, 1, 6, 30)
+
+    def test_default_time(self):
+        assert parse_fire_at('2024-05-01', '', 'Africa/Ouagadougou') == datetime(2024, 5, 1, 8, 0)
+
+    def test_invalid_date(self):
+        with pytest.raises(ValueError):
+            parse_fire_at('01/05/2024', '08:00', 'Africa/Ouagadougou')
+
+
+class TestReminderScheduler:
+    """Tests pour ReminderScheduler."""
+
+    def test_only_due_reminders_are_dispatched(self):
+        collection = _reminders(3)
+        collection.insert_one({"phone_number": "+22670000000", "message": "Plus tard",
+                               "fire_at": NOW + timedelta(days=1), "status": PENDING})
+        dispatch = MagicMock()
+
+        assert ReminderScheduler(collection, dispatch).run_once(NOW) == 3
+        assert len(dispatch.call_args[0][0]) == 3
+        assert collection.count_documents({"status": DISPATCHED}) == 3
+        assert collection.count_documents({"status": PENDING}) == 1
+
+    def test_batches_drain_all_due_reminders(self):
+        collection = _reminders(25)
+        dispatch = MagicMock()
+
+        assert ReminderScheduler(collection, dispatch, batch_size=10).run_once(NOW) == 25
+        assert [len(c[0][0]) for c in dispatch.call_args_list] == [10, 10, 5]
+
+    def test_failed_dispatch_is_retried_after_lease(self):
+        collection = _reminders(2)
+        scheduler = ReminderScheduler(collection, MagicMock(side_effect=ConnectionError), lease=60)
+
+        assert scheduler.run_once(NOW) == 0
+        assert collection.count_documents({"status": CLAIMED}) == 2
+        scheduler.dispatch = MagicMock()
+        assert scheduler.run_once(NOW + timedelta(seconds=30)) == 0
+        assert scheduler.run_once(NOW + timedelta(seconds=61)) == 2
+
+    def test_concurrent_schedulers_do_not_double_send(self):
+        """Plusieurs workers réclament les mêmes rappels : chacun n'est transmis qu'une fois."""
+        collection = _reminders(200)
+        dispatched = []
+        lock = threading.Lock()
+
+        def dispatch(batch):
+            with lock:
+                dispatched.extend(r["_id"] for r in batch)
+
+        schedulers = [ReminderScheduler(collection, dispatch, batch_size=7) for _ in range(4)]
+        threads = [threading.Thread(target=s.run_once, args=(NOW,)) for s in schedulers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(dispatched) == sorted(collection.documents)
+
+    def test_replayed_batch_is_queued_once(self):
+        """Un lot rejoué après expiration du bail n'ajoute pas de SMS en double."""
+        queue = NotificationQueue(InMemoryCollection(unique=("key",)), {"sms": FakeTransport()}, workers=0)
+        payloads = [{"to": "+22670000000", "body": "Rappel"}]
+        assert queue.enqueue_many('sms', payloads, keys=["reminder:1"]) == 1
+        assert queue.enqueue_many('sms', payloads, keys=["reminder:1"]) == 0
+
+
+class TestReminderRoutes:
+    """Tests pour l'enregistrement des rappels."""
+
+    @patch('app.notification_queue')
+    @patch('app.reminders_collection')
+    def test_set_reminder_stores_fire_at(self, mock_reminders, mock_queue, app, logged_in_client):
+        response = logged_in_client.post('/set_reminder', json={
+            'name': 'Awa', 'type': 'vaccination', 'date': '2030-01-15', 'time': '08:00', 'phone': '+22670000000'
+        })
+        assert response.status_code == 200
+        reminder = mock_reminders.insert_one.call_args[0][0]
+        assert reminder['fire_at'] == datetime(2030, 1, 15, 8, 0)
+        assert reminder['status'] == PENDING
+        assert 'vaccination' in reminder['message']
+
+    @patch('app.reminders_collection')
+    def test_set_reminder_rejects_invalid_date(self, mock_reminders, app, logged_in_client):
+        response = logged_in_client.post('/set_reminder', json={
+            'name': 'Awa', 'type': 'vaccination', 'date': 'demain', 'time': '08:00', 'phone': '+22670000000'
+        })
+        assert response.status_code == 400
+        mock_reminders.insert_one.assert_not_called()
+
+    @patch('app.notification_queue')
+    def test_dispatch_uses_reminder_keys(self, mock_queue, app):
+        import app as app_module
+        app_module.dispatch_reminders([{"_id": 7, "phone_number": "+22670000000", "message": "Rappel"}])
+        assert mock_queue.enqueue_many.call_args[1]['keys'] == ["reminder:7"]
+
+    def test_normalize_keeps_reminder_type(self, app):
+        import app as app_module
+        collection = mongomock.MongoClient()['chatbot']['reminders']
+        collection.insert_many([
+            {"name": "Awa", "appointment_date": "2099-01-15", "reminder_date": "2099-01-15",
+             "reminder_time": "08:00", "reminder_type": "vaccination"},
+            {"name": "Ali", "appointment_date": "2099-01-16", "reminder_date": "2099-01-16",
+             "reminder_time": "08:00", "type": "rappel"},
+        ])
+        with patch('app.reminders_collection', collection):
+            assert app_module.normalize_reminders(NOW) == (2, 0)
+        messages = [r["message"] for r in collection.find().sort("name")]
+        assert "(rappel)" in messages[0] and "(vaccination)" in messages[1]
@@ -0,0 +1,195 @@
+"""
+Tests des appels résilients (délai maximal, hedging, disjoncteur) avec un faux Gemini à pannes injectées.
+Exécuter avec : pytest tests/ -v
+"""
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, DeadlineExceeded, ResilientCaller
+from tests.fakes import FlakyGeminiClient
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _slow(seconds, value):
+    def call():
+        time.sleep(seconds)
+        return value
+    return call
+
+
+class TestCircuitBreaker:
+    """Tests pour CircuitBreaker."""
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=FakeClock())
+        for _ in range(2):
+            breaker.record_failure()
+        breaker.record_success()
+        for _ in range(3):
+            assert breaker.allow()
+            breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+        assert breaker.stats()['short_circuited'] == 1
+
+    def test_half_open_single_probe_then_close(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        assert breaker.state == HALF_OPEN and breaker.available()
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CLOSED
+
+    def test_failed_probe_reopens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        clock.now = 15
+        assert not breaker.available()
+        assert breaker.stats()['opened'] == 2
+
+
+class TestResilientCaller:
+    """Tests pour ResilientCaller."""
+
+    def test_deadline_bounds_hanging_call(self):
+        release = threading.Event()
+        caller = ResilientCaller(deadline=0.1)
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            caller.call(release.wait)
+        assert time.monotonic() - started < 0.5
+        release.set()
+        assert caller.stats()['deadline_exceeded'] == 1
+
+    def test_hedge_wins_when_first_attempt_is_slow(self):
+        caller = ResilientCaller(deadline=2, hedge_after=0.05)
+        assert caller.call(_slow(1, 'premier'), _slow(0, 'second')) == 'second'
+        stats = caller.stats()
+        assert stats['hedged'] == 1 and stats['hedge_won'] == 1
+
+    def test_fast_call_is_not_hedged(self):
+        hedge = MagicMock()
+        caller = ResilientCaller(deadline=2, hedge_after=0.5)
+        assert caller.call(lambda: 'ok', hedge) == 'ok'
+        hedge.assert_not_called()
+
+    def test_hedge_delay_follows_observed_p95(self):
+        caller = ResilientCaller(deadline=10, hedge_after=5)
+        assert caller.hedge_delay() == 5
+        for _ in range(20):
+            caller.call(_slow(0.01, 'ok'))
+        assert 0.01 <= caller.hedge_delay() < 0.5
+
+    def test_error_is_raised_without_hedging(self):
+        hedge = MagicMock()
+        caller = ResilientCaller(deadline=2, hedge_after=0.5)
+        with pytest.raises(RuntimeError):
+            caller.call(MagicMock(side_effect=RuntimeError("503")), hedge)
+        hedge.assert_not_called()
+
+    def test_open_circuit_skips_call(self):
+        caller = ResilientCaller(deadline=1, breaker=CircuitBreaker(failure_threshold=2))
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                caller.call(MagicMock(side_effect=RuntimeError("503")))
+        attempt = MagicMock()
+        with pytest.raises(CircuitOpen):
+            caller.call(attempt)
+        attempt.assert_not_called()
+        assert not caller.available()
+
+    def test_call_async_hedges_and_cancels_loser(self):
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return 'premier'
+
+        async def fast():
+            return 'second'
+
+        attempts = iter([slow, fast])
+        caller = ResilientCaller(deadline=2, hedge_after=0.05)
+
+        async def run():
+            result = await caller.call_async(lambda: next(attempts)(), lambda: next(attempts)())
+            await asyncio.sleep(0)
+            return result
+
+        assert asyncio.run(run()) == 'second'
+        assert cancelled == [True]
+
+    def test_call_async_deadline(self):
+        caller = ResilientCaller(deadline=0.05)
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(caller.call_async(lambda: asyncio.sleep(1)))
+
+    def test_stream_chunk_deadline(self):
+        def chunks():
+            yield 'a'
+            time.sleep(1)
+            yield 'b'
+
+        caller = ResilientCaller(deadline=0.1, breaker=CircuitBreaker(failure_threshold=1))
+        received = []
+        with pytest.raises(DeadlineExceeded):
+            for chunk in caller.stream(chunks):
+                received.append(chunk)
+        assert received == ['a']
+        assert caller.breaker.state == OPEN
+
+
+class TestGeminiResilience:
+    """Tests de get_gemini_response face à un Gemini en panne."""
+
+    def test_hanging_gemini_falls_back_within_deadline(self, app):
+        import app as app_module
+        caller = ResilientCaller(deadline=0.2, breaker=CircuitBreaker())
+        with patch('app.gemini_client', FlakyGeminiClient(outage='hang', slow_delay=2)), \
+             patch('app.gemini_caller', caller):
+            started = time.monotonic()
+            assert app_module.get_gemini_response("Bonjour", []) is None
+        assert time.monotonic() - started < 1
+
+    def test_open_circuit_goes_straight_to_fallback(self, app):
+        import app as app_module
+        fake = FlakyGeminiClient(outage='error')
+        with patch('app.gemini_client', fake), \
+             patch('app.gemini_caller', ResilientCaller(deadline=1, breaker=CircuitBreaker(failure_threshold=3))):
+            for _ in range(5):
+                assert app_module.get_gemini_response("Bonjour", [], user_id='u1') is None
+            assert len(fake.sent_messages) == 3
+            assert app_module.gemini_caller.breaker.state == OPEN
+
+    def test_hedged_session_is_kept(self, app):
+        """La session de la requête doublée gagnante est remise en cache pour le tour suivant."""
+        import app as app_module
+        # Graine 1 : premier appel lent, second rapide
+        fake = FlakyGeminiClient(slow_rate=0.5, slow_delay=1, seed=1, reply="Réponse")
+        with patch('app.gemini_client', fake), \
+             patch('app.gemini_caller', ResilientCaller(deadline=2, hedge_after=0.05)):
+            assert app_module.get_gemini_response("Bonjour", [], 'conv-h') == "Réponse"
+        assert app_module.gemini_sessions.get('conv-h')['chat'] is fake.created_chats[1]
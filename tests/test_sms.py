@@ -0,0 +1,83 @@
+"""
+Tests de l'envoi des SMS (client Twilio partagé) contre un serveur Twilio factice.
+Exécuter avec : pytest tests/ -v
+"""
+import pytest
+from twilio.base.exceptions import TwilioRestException
+
+from sms import SmsTransport, TokenBucket
+from tests.fakes import FakeTwilioServer
+
+ACCOUNT_SID = 'AC' + '0' * 32
+
+
+def _transport(server, **kwargs):
+    kwargs.setdefault('rate', 1000)
+    return SmsTransport(ACCOUNT_SID, 'token', '+15550000000', base_url=server.url, **kwargs)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket:
+    """Tests pour TokenBucket."""
+
+    def test_burst_then_throttle(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock, sleep=clock.sleep)
+        waits = [bucket.acquire() for _ in range(4)]
+        assert waits[:2] == [0.0, 0.0]
+        assert waits[2] == pytest.approx(0.5)
+        assert clock.now == pytest.approx(1.0)
+
+    def test_tokens_refill_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, capacity=1, clock=clock, sleep=clock.sleep)
+        bucket.acquire()
+        clock.now += 5
+        assert bucket.acquire() == 0.0
+
+
+class TestSmsTransport:
+    """Tests pour SmsTransport."""
+
+    def test_send_reuses_connection(self):
+        with FakeTwilioServer() as server:
+            transport = _transport(server)
+            sids = [transport.send('+22670000000', f'Message {i}') for i in range(5)]
+        assert len(set(sids)) == 5
+        assert server.connections == 1
+        assert server.messages[0]['To'] == '+22670000000'
+        assert transport.stats()['sent'] == 5
+
+    def test_send_raises_on_provider_error(self):
+        with FakeTwilioServer(fail_every=1) as server:
+            transport = _transport(server)
+            with pytest.raises(TwilioRestException):
+                transport.send('+22670000000', 'Bonjour')
+        assert transport.stats()['failed'] == 1
+
+    def test_send_many_bounded_concurrency(self):
+        with FakeTwilioServer(latency=0.02, fail_every=5) as server:
+            transport = _transport(server, pool_size=4)
+            results = transport.send_many([(f'+2267000{i:04d}', 'Campagne') for i in range(20)], concurrency=3)
+        assert [r['to'] for r in results] == [f'+2267000{i:04d}' for i in range(20)]
+        assert sum(1 for r in results if r['error']) == 4
+        assert server.connections <= 3
+        stats = transport.stats()
+        assert stats['sent'] == 16 and stats['failed'] == 4 and 'p95_ms' in stats
+
+    def test_rate_limit_is_respected(self):
+        with FakeTwilioServer() as server:
+            transport = _transport(server, rate=50, burst=1)
+            transport.send_many([('+22670000000', 'Bonjour')] * 6, concurrency=6)
+        # 5 envois au-delà du premier jeton, à 50 par seconde
+        assert transport.stats()['throttled_s'] >= 0.2
@@ -0,0 +1,118 @@
+"""
+Tests des compteurs du panel d'administration (stats.py) et de leur mise à jour par les routes.
+Exécuter avec : pytest tests/ -v
+"""
+from datetime import date, datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+import app as app_module
+from stats import TOTALS_ID, StatsCounters
+
+NOW = datetime(2026, 10, 17, 10, 30)
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()['chatbot']
+
+
+@pytest.fixture
+def counters(db):
+    return StatsCounters(db.stats, {"users": (db.users, {}), "users_confirmed": (db.users, {"confirmed": True})},
+                         reconcile_interval=60)
+
+
+class TestStatsCounters:
+    """Tests pour StatsCounters."""
+
+    def test_record_increments_totals_and_day(self, counters, db):
+        counters.record(NOW, totals={"users": 1}, daily={"signups": 1})
+        counters.record(NOW, totals={"users": 1, "users_confirmed": 1}, daily={"signups": 1})
+        assert db.stats.find_one({"_id": TOTALS_ID}) == {"_id": TOTALS_ID, "users": 2, "users_confirmed": 1}
+        assert db.stats.find_one({"_id": "day:2026-10-17"})["signups"] == 2
+
+    def test_record_error_does_not_raise(self, counters):
+        counters.collection = MagicMock()
+        counters.collection.update_one.side_effect = PyMongoError("panne")
+        counters.record(NOW, totals={"users": 1})
+        assert counters.stats()["errors"] == 1
+
+    def test_reconcile_corrects_drift(self, counters, db):
+        db.users.insert_many([{"confirmed": True}, {"confirmed": False}])
+        counters.record(NOW, totals={"users": 5, "users_confirmed": 5})
+        assert counters.reconcile(NOW) == {"users": 2, "users_confirmed": 1}
+        assert counters.totals(NOW) == {"users": 2, "users_confirmed": 1}
+
+    def test_totals_computed_once_when_missing(self, counters, db):
+        db.users.insert_one({"confirmed": True})
+        assert counters.totals(NOW) == {"users": 1, "users_confirmed": 1}
+        db.users.insert_one({"confirmed": True})
+        # Les totaux enregistrés sont lus tels quels : plus de comptage à l'affichage
+        assert counters.totals(NOW) == {"users": 1, "users_confirmed": 1}
+
+    def test_reconcile_claimed_once_per_interval(self, counters, db):
+        other = StatsCounters(db.stats, counters.sources, reconcile_interval=60)
+        assert counters.run_once(NOW)
+        assert not other.run_once(NOW + timedelta(seconds=10))
+        assert other.run_once(NOW + timedelta(seconds=61))
+
+    def test_daily_series_filled_with_zeros(self, counters):
+        counters.record(NOW, daily={"chats": 3})
+        counters.record(NOW - timedelta(days=2), daily={"reminders": 1})
+        series = counters.daily(date(2026, 10, 17), days=3)
+        assert [day["date"] for day in series] == ["2026-10-15", "2026-10-16", "2026-10-17"]
+        assert [(day["chats"], day["reminders"], day["signups"]) for day in series] == [(0, 1, 0), (0, 0, 0), (3, 0, 0)]
+
+
+class TestStatsRecording:
+    """Tests de la mise à jour des compteurs par les routes."""
+
+    def _totals(self):
+        return app_module.stats_counters.collection.find_one({"_id": TOTALS_ID}) or {}
+
+    def _today(self):
+        return app_module.stats_counters.daily(datetime.now().date(), days=1)[0]
+
+    def test_register(self, client):
+        with patch('app.users_collection') as mock_users:
+            mock_users.find_one.return_value = None
+            client.post('/register', data={'username': 'awa', 'email': 'awa@example.com', 'password': 'motdepasse1',
+                                           'confirm_password': 'motdepasse1'})
+        assert self._totals()["users"] == 1 and self._totals()["users_confirmed"] == 1
+        assert self._today()["signups"] == 1
+
+    def test_chat_new_conversation(self, logged_in_client):
+        with patch('app.conversations_collection') as mock_conv, \
+             patch('app.get_gemini_response', return_value="Réponse"):
+            mock_conv.insert_one.return_value.inserted_id = ObjectId()
+            logged_in_client.post('/chat', json={'message': 'Bonjour'})
+            logged_in_client.post('/chat', json={'message': 'Encore'})
+        assert self._totals()["conversations"] == 1
+        assert self._today()["chats"] == 2
+
+    def test_set_reminder(self, logged_in_client):
+        with patch('app.reminders_collection'), patch('app.send_sms', return_value=True):
+            logged_in_client.post('/set_reminder', json={'name': 'Awa', 'type': 'vaccination', 'date': '2099-01-01',
+                                                         'time': '09:00', 'phone': '+22670000000'})
+        assert self._totals()["reminders"] == 1
+        assert self._today()["reminders"] == 1
+
+    def test_admin_reads_counters(self, admin_client):
+        app_module.stats_counters.collection.insert_one(
+            {"_id": TOTALS_ID, "users": 12, "users_confirmed": 10, "conversations": 40, "reminders": 3})
+        with patch('app.users_collection') as mock_users, \
+             patch('app.conversations_collection') as mock_conv, \
+             patch('app.reminders_collection') as mock_reminders:
+            mock_users.find_one.return_value = {'_id': ObjectId('507f1f77bcf86cd799439012'), 'is_admin': True}
+            mock_users.find.return_value.sort.return_value.limit.return_value = []
+            response = admin_client.get('/admin')
+        assert response.status_code == 200
+        assert b'40' in response.data and b'Inscriptions' in response.data
+        mock_users.count_documents.assert_not_called()
+        mock_conv.count_documents.assert_not_called()
+        mock_reminders.count_documents.assert_not_called()
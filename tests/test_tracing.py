@@ -0,0 +1,211 @@
+"""
+Tests du traçage des requêtes (spans, échantillonnage, identifiant de requête, Server-Timing, export).
+Exécuter avec : pytest tests/ -v
+"""
+import json
+import logging
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from bson import ObjectId
+
+import tracing
+from tracing import BatchExporter, MongoCommandSpans, Tracer, jsonl_writer, otlp_payload
+from tests.fakes import FakeGeminiClient
+
+
+class _Collected:
+    """Exporteur qui garde les traces en mémoire."""
+
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+
+def _traced(sample_rate=1.0):
+    exporter = _Collected()
+    return Tracer(sample_rate=sample_rate, exporter=exporter), exporter
+
+
+class TestTracer:
+    """Tests pour Tracer."""
+
+    def test_nested_spans(self):
+        tracer, exporter = _traced()
+        trace = tracer.start('POST /chat')
+        with tracer.span('gemini') as gemini:
+            with tracer.span('spacy.ner'):
+                pass
+        tracer.record('mongo.users.find', 0.002, **{"db.collection": "users"})
+        tracer.finish(trace)
+
+        root, gemini_span, ner, mongo = exporter.traces[0].spans
+        assert gemini_span is gemini and gemini.parent_id == root.span_id
+        assert ner.parent_id == gemini.span_id
+        assert mongo.parent_id == root.span_id and 1.5 < mongo.duration_ms < 3
+        assert all(span.end_ns for span in exporter.traces[0].spans)
+
+    def test_unsampled_request_only_gets_request_id(self):
+        tracer, exporter = _traced(sample_rate=0.0)
+        trace = tracer.start('GET /', request_id='abc-123')
+        assert tracer.span('gemini') is tracing._NOOP
+        assert tracing.current_request_id() == 'abc-123'
+        tracer.finish(trace)
+        assert exporter.traces == []
+        assert tracing.current_request_id() is None
+
+    def test_no_exporter_disables_sampling(self):
+        assert Tracer(sample_rate=1.0).sample_rate == 0.0
+
+    def test_traceparent_decides_sampling(self):
+        tracer, exporter = _traced(sample_rate=0.0)
+        trace_id, parent_id = 'a' * 32, 'b' * 16
+        tracer.finish(tracer.start('GET /', traceparent=f'00-{trace_id}-{parent_id}-01'))
+        tracer.finish(tracer.start('GET /', traceparent=f'00-{trace_id}-{parent_id}-00'))
+        assert len(exporter.traces) == 1
+        assert exporter.traces[0].trace_id == trace_id
+        assert exporter.traces[0].root.parent_id == parent_id
+
+    def test_invalid_request_id_replaced(self):
+        tracer = Tracer()
+        trace = tracer.start('GET /', request_id='<script>')
+        assert trace.request_id != '<script>' and len(trace.request_id) == 16
+        tracer.finish(trace)
+
+    def test_wrap_root_starts_background_trace(self):
+        tracer, exporter = _traced()
+
+        @tracer.wrap('twilio.sms', root=True)
+        def send(payload):
+            with tracer.span('http'):
+                return payload
+
+        assert send('ok') == 'ok'
+        assert [span.name for span in exporter.traces[0].spans] == ['twilio.sms', 'http']
+
+    def test_server_timing_groups_repeated_spans(self):
+        tracer = Tracer()
+        trace = tracer.start('POST /chat', debug=True)
+        for _ in range(2):
+            tracer.record('mongo.messages.insert', 0.001)
+        with tracer.span('gemini'):
+            pass
+        header = tracer.response_headers()['Server-Timing']
+        tracer.finish(trace)
+        assert 'mongo.messages.insert;dur=2.0;desc="2 appels"' in header
+        assert 'gemini;dur=' in header and 'total;dur=' in header
+
+
+class TestMongoCommandSpans:
+    """Tests pour MongoCommandSpans."""
+
+    def test_span_per_command_with_collection(self):
+        tracer, exporter = _traced()
+        listener = MongoCommandSpans(tracer)
+        trace = tracer.start('POST /chat')
+        listener.started(SimpleNamespace(command_name='find', command={'find': 'conversations'},
+                                         connection_id=('h', 1), request_id=1))
+        listener.succeeded(SimpleNamespace(command_name='find', connection_id=('h', 1), request_id=1,
+                                           duration_micros=2500))
+        tracer.finish(trace)
+        mongo = exporter.traces[0].spans[1]
+        assert mongo.name == 'mongo.conversations.find'
+        assert mongo.attributes['db.collection'] == 'conversations'
+
+    def test_ignored_outside_trace(self):
+        listener = MongoCommandSpans(Tracer())
+        listener.started(SimpleNamespace(command_name='find', command={'find': 'users'},
+                                         connection_id=('h', 1), request_id=2))
+        assert listener._pending == {}
+
+
+class TestExport:
+    """Tests des exporteurs JSONL et OTLP."""
+
+    def test_jsonl_file(self, tmp_path):
+        path = tmp_path / 'traces.jsonl'
+        exporter = BatchExporter(jsonl_writer(str(path)))
+        tracer = Tracer(sample_rate=1.0, exporter=exporter)
+        trace = tracer.start('POST /chat', request_id='req-1')
+        with tracer.span('gemini'):
+            pass
+        tracer.finish(trace)
+        exporter.flush()
+        line = json.loads(path.read_text(encoding='utf-8'))
+        assert line['request_id'] == 'req-1'
+        assert [span['name'] for span in line['spans']] == ['POST /chat', 'gemini']
+
+    def test_otlp_payload(self):
+        tracer, exporter = _traced()
+        trace = tracer.start('POST /chat')
+        try:
+            with tracer.span('gemini'):
+                raise RuntimeError("503")
+        except RuntimeError:
+            pass
+        tracer.finish(trace)
+        payload = otlp_payload(exporter.traces, 'chatbot')
+        spans = payload['resourceSpans'][0]['scopeSpans'][0]['spans']
+        assert spans[0]['kind'] == 2 and 'parentSpanId' not in spans[0]
+        assert spans[1]['parentSpanId'] == spans[0]['spanId']
+        assert spans[1]['status'] == {'code': 2, 'message': 'RuntimeError: 503'}
+        assert len(spans[0]['traceId']) == 32
+
+    def test_full_queue_drops_traces(self):
+        exporter = BatchExporter(MagicMock(), max_queue=1)
+        with patch.object(exporter, '_start'):
+            exporter.export('t1')
+            exporter.export('t2')
+        assert exporter.dropped == 1
+
+
+class TestRequestTracing:
+    """Tests du traçage des routes Flask."""
+
+    def test_request_id_echoed(self, client):
+        response = client.get('/login', headers={'X-Request-ID': 'req-42'})
+        assert response.headers['X-Request-ID'] == 'req-42'
+        assert 'Server-Timing' not in response.headers
+
+    def test_request_id_in_logs_during_request(self, logged_in_client, caplog):
+        def fallback(message):
+            logging.getLogger('app').info("réponse locale")
+            return "Réponse locale"
+
+        with patch('app.conversations_collection') as mock_conversations, \
+             patch('app.get_fallback_response', side_effect=fallback), \
+             patch('app.gemini_client', None), \
+             caplog.at_level(logging.INFO):
+            mock_conversations.insert_one.return_value.inserted_id = ObjectId()
+            logged_in_client.post('/chat', json={'message': 'Bonjour'}, headers={'X-Request-ID': 'req-7'})
+        record = next(r for r in caplog.records if r.getMessage() == "réponse locale")
+        assert record.request_id == 'req-7'
+
+    def test_server_timing_for_admin(self, admin_client):
+        with patch('app.conversations_collection') as mock_conversations, \
+             patch('app.users_collection') as mock_users, \
+             patch('app.gemini_client', FakeGeminiClient(reply="Réponse")):
+            mock_users.find_one.return_value = {'_id': ObjectId('507f1f77bcf86cd799439012'), 'is_admin': True}
+            mock_conversations.insert_one.return_value.inserted_id = ObjectId()
+            response = admin_client.post('/chat', json={'message': 'Bonjour'}, headers={'X-Debug-Timing': '1'})
+        timing = response.headers['Server-Timing']
+        for stage in ('history.create', 'chat_title', 'gemini', 'total'):
+            assert f'{stage};dur=' in timing
+
+    def test_server_timing_for_admin_account_without_debug(self, app, client):
+        """Connexion ordinaire (la session ne porte pas `is_admin`) : le compte admin suffit."""
+        assert not app.debug
+        with client.session_transaction() as sess:
+            sess['user_id'] = '507f1f77bcf86cd799439012'
+        with patch('app.users_collection') as mock_users:
+            mock_users.find_one.return_value = {'_id': ObjectId('507f1f77bcf86cd799439012'), 'is_admin': True}
+            response = client.get('/ask', headers={'X-Debug-Timing': '1'})
+        assert 'total;dur=' in response.headers['Server-Timing']
+
+    def test_server_timing_refused_for_users(self, logged_in_client):
+        with patch('app.users_collection') as mock_users:
+            mock_users.find_one.return_value = {'_id': ObjectId('507f1f77bcf86cd799439011'), 'username': 'testuser'}
+            response = logged_in_client.get('/ask', headers={'X-Debug-Timing': '1'})
+        assert 'Server-Timing' not in response.headers
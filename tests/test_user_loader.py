@@ -0,0 +1,63 @@
+"""
+Tests du chargement de l'utilisateur connecté (g.user) et du cache des documents utilisateur.
+Exécuter avec : pytest tests/ -v
+"""
+from unittest.mock import patch
+
+from bson import ObjectId
+
+import app as app_module
+
+ADMIN = {'_id': ObjectId('507f1f77bcf86cd799439012'), 'username': 'admin', 'email': 'admin@example.com',
+         'is_admin': True}
+USER = {'_id': ObjectId('507f1f77bcf86cd799439011'), 'username': 'testuser', 'email': 'test@example.com',
+        'password': 'pbkdf2:sha256:1000$x$y'}
+
+
+class TestCurrentUser:
+    """Tests de current_user et du cache user_cache."""
+
+    def test_admin_loaded_once_then_cached(self, admin_client):
+        # Vue admin réduite au décorateur : seul admin_required lit l'utilisateur
+        view = app_module.admin_required(lambda: 'ok')
+        with patch('app.users_collection') as mock_users, \
+             patch.dict(app_module.app.view_functions, admin_panel=view):
+            mock_users.find_one.return_value = ADMIN
+            for _ in range(3):
+                assert admin_client.get('/admin').status_code == 200
+        assert mock_users.find_one.call_count == 1
+
+    def test_login_required_does_not_load_user(self, logged_in_client):
+        with patch('app.users_collection') as mock_users:
+            logged_in_client.get('/ask')
+        mock_users.find_one.assert_not_called()
+
+    def test_unknown_user_not_cached(self, logged_in_client):
+        from app import user_cache
+        with patch('app.users_collection') as mock_users:
+            mock_users.find_one.return_value = None
+            logged_in_client.get('/profile')
+            logged_in_client.get('/profile')
+        assert mock_users.find_one.call_count == 2
+        assert len(user_cache) == 0
+
+    def test_profile_update_invalidates(self, logged_in_client):
+        from app import user_cache
+        with patch('app.users_collection') as mock_users:
+            mock_users.find_one.side_effect = lambda query, *args: USER if '_id' in query and \
+                not isinstance(query['_id'], dict) else None
+            logged_in_client.get('/profile')
+            assert user_cache.get(str(USER['_id'])) is USER
+            logged_in_client.post('/profile', data={'action': 'update_info', 'username': 'awa',
+                                                    'email': 'awa@example.com'})
+            assert user_cache.get(str(USER['_id'])) is None
+            mock_users.update_one.assert_called_once()
+
+    def test_password_reset_invalidates(self, client):
+        from app import ts, user_cache
+        user_cache.set(str(USER['_id']), USER)
+        token = ts.dumps(USER['email'], salt='password-reset-key')
+        with patch('app.users_collection') as mock_users:
+            mock_users.find_one_and_update.return_value = {'_id': USER['_id']}
+            client.post(f'/reset_password/{token}', data={'password': 'nouveau-mdp', 'confirm_password': 'nouveau-mdp'})
+        assert user_cache.get(str(USER['_id'])) is None
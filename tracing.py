@@ -0,0 +1,408 @@
+"""
+Traçage des requêtes : spans imbriqués (MongoDB, Gemini, SpaCy, Twilio...) rattachés à la requête
+en cours par des variables de contexte, identifiant de requête ajouté aux logs, échantillonnage
+décidé au début de la requête (les requêtes non tracées ne coûtent qu'une lecture de variable)
+et export en arrière-plan vers un fichier JSONL ou un collecteur OTLP (HTTP/JSON).
+Un en-tête de débogage renvoie le détail au navigateur dans Server-Timing.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from functools import wraps
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# En-tête demandant le détail des durées (Server-Timing) dans la réponse
+DEBUG_HEADER = 'X-Debug-Timing'
+
+_trace = ContextVar('trace', default=None)
+_span = ContextVar('span', default=None)
+_request_id = ContextVar('request_id', default=None)
+
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def install_log_request_id():
+    """Ajouter `request_id` à tous les enregistrements de log ('-' hors requête)."""
+    factory = logging.getLogRecordFactory()
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.request_id = _request_id.get() or '-'
+        return record
+    logging.setLogRecordFactory(record_factory)
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name, parent_id, attributes, start_ns=None):
+        self.name = name
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {"name": self.name, "span_id": self.span_id, "parent_id": self.parent_id,
+                "start_ns": self.start_ns, "end_ns": self.end_ns, "duration_ms": round(self.duration_ms, 3),
+                "attributes": self.attributes, "error": self.error}
+
+
+class Trace:
+    """Spans d'une requête (ou d'un travail en arrière-plan) tracée."""
+
+    __slots__ = ('trace_id', 'request_id', 'debug', 'root', 'spans', '_tokens')
+
+    def __init__(self, trace_id, request_id, debug=False):
+        self.trace_id = trace_id
+        self.request_id = request_id
+        self.debug = debug
+        self.root = None
+        self.spans = []
+        self._tokens = ()
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "request_id": self.request_id,
+                "spans": [span.to_dict() for span in self.spans]}
+
+
+class _NoopSpan:
+    """Span sans effet, hors requête tracée."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _SpanScope:
+    __slots__ = ('trace', 'span', 'token')
+
+    def __init__(self, trace, span):
+        self.trace = trace
+        self.span = span
+
+    def __enter__(self):
+        self.trace.spans.append(self.span)
+        self.token = _span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end_ns = time.time_ns()
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _span.reset(self.token)
+        return False
+
+
+class Tracer:
+    """Traceur du processus.
+
+    `sample_rate` : part des requêtes tracées et exportées (décidée au début de la requête,
+    ou reprise de l'en-tête `traceparent` W3C de l'appelant). Une requête de débogage est
+    toujours tracée, pour son en-tête Server-Timing.
+    """
+
+    def __init__(self, sample_rate=0.0, exporter=None):
+        self.sample_rate = sample_rate if exporter else 0.0
+        self.exporter = exporter
+
+    def start(self, name, request_id=None, traceparent=None, debug=False, **attributes):
+        """Commencer la trace d'une requête ; retourne la trace à passer à `finish`.
+
+        Les requêtes non échantillonnées ne reçoivent que leur identifiant (pour les logs).
+        """
+        if not request_id or not REQUEST_ID_RE.match(request_id):
+            request_id = '%016x' % random.getrandbits(64)
+        match = TRACEPARENT_RE.match(traceparent or '')
+        if match:
+            trace_id, parent_id = match.group(1), match.group(2)
+            sampled = bool(self.exporter) and bool(int(match.group(3), 16) & 1)
+        else:
+            trace_id, parent_id = '%032x' % random.getrandbits(128), None
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        trace = Trace(trace_id, request_id, debug)
+        tokens = [_request_id.set(request_id)]
+        if sampled or debug:
+            trace.root = Span(name, parent_id, dict(attributes, request_id=request_id))
+            trace.spans.append(trace.root)
+            tokens += [_trace.set(trace), _span.set(trace.root)]
+        trace._tokens = tokens
+        return trace
+
+    def finish(self, trace, error=None):
+        """Terminer la trace de la requête et l'exporter si elle a été échantillonnée."""
+        for token in reversed(trace._tokens):
+            try:
+                token.var.reset(token)
+            except ValueError:
+                # Terminée dans un autre contexte que celui où elle a commencé
+                token.var.set(None)
+        trace._tokens = ()
+        if trace.root is None:
+            return
+        trace.root.end_ns = time.time_ns()
+        if error is not None:
+            trace.root.error = f"{type(error).__name__}: {error}"
+        if self.exporter:
+            self.exporter.export(trace)
+
+    def span(self, name, **attributes):
+        """Span enfant du span courant (`with tracer.span('gemini'): ...`), sans effet hors trace."""
+        trace = _trace.get()
+        if trace is None:
+            return _NOOP
+        parent = _span.get()
+        return _SpanScope(trace, Span(name, parent.span_id if parent else None, attributes))
+
+    def record(self, name, duration, **attributes):
+        """Ajouter un span déjà terminé, d'une durée `duration` (s), au span courant."""
+        trace = _trace.get()
+        if trace is None:
+            return
+        parent = _span.get()
+        end_ns = time.time_ns()
+        span = Span(name, parent.span_id if parent else None, attributes, start_ns=end_ns - int(duration * 1e9))
+        span.end_ns = end_ns
+        trace.spans.append(span)
+
+    def wrap(self, name, root=False):
+        """Décorateur : span autour de chaque appel de la fonction.
+
+        `root` : hors requête (threads d'envoi des notifications), l'appel démarre sa propre trace.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if root and _trace.get() is None and _request_id.get() is None:
+                    trace, error = self.start(name), None
+                    try:
+                        return fn(*args, **kwargs)
+                    except Exception as e:
+                        error = e
+                        raise
+                    finally:
+                        self.finish(trace, error)
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def response_headers(self):
+        """En-têtes à ajouter à la réponse : identifiant de requête, et Server-Timing en débogage."""
+        headers = {}
+        request_id = _request_id.get()
+        if request_id:
+            headers['X-Request-ID'] = request_id
+        trace = _trace.get()
+        if trace is not None and trace.debug:
+            headers['Server-Timing'] = server_timing(trace)
+        return headers
+
+
+def server_timing(trace):
+    """Valeur Server-Timing : durée cumulée par nom de span (appels répétés regroupés), puis le total."""
+    totals = {}
+    for span in trace.spans[1:]:
+        if span.end_ns is None:
+            continue
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', span.name)
+        duration, count = totals.get(name, (0.0, 0))
+        totals[name] = (duration + span.duration_ms, count + 1)
+    entries = [f'{name};dur={duration:.1f}' + (f';desc="{count} appels"' if count > 1 else '')
+               for name, (duration, count) in totals.items()]
+    entries.append(f'total;dur={trace.root.duration_ms:.1f}')
+    return ', '.join(entries)
+
+
+class MongoCommandSpans(monitoring.CommandListener):
+    """Span par commande MongoDB de la requête tracée (nom : mongo.<collection>.<commande>)."""
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if _trace.get() is None:
+            return
+        target = event.command.get('collection' if event.command_name == 'getMore' else event.command_name)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = target if isinstance(target, str) else None
+
+    def succeeded(self, event):
+        self._record(event, None)
+
+    def failed(self, event):
+        self._record(event, getattr(event, 'failure', None))
+
+    def _record(self, event, failure):
+        if not self._pending:
+            return
+        with self._lock:
+            key = (event.connection_id, event.request_id)
+            if key not in self._pending:
+                return
+            collection = self._pending.pop(key)
+        name = f"mongo.{collection}.{event.command_name}" if collection else f"mongo.{event.command_name}"
+        attributes = {"db.operation": event.command_name}
+        if collection:
+            attributes["db.collection"] = collection
+        if failure is not None:
+            attributes["error"] = str(failure)
+        self.tracer.record(name, event.duration_micros / 1e6, **attributes)
+
+
+class BatchExporter:
+    """Export des traces terminées par un thread d'arrière-plan, par lots.
+
+    La file est bornée : si l'export ne suit pas, les traces en trop sont abandonnées plutôt que
+    de ralentir les requêtes. Le thread est (re)démarré dans chaque processus (après le fork).
+    """
+
+    def __init__(self, send, max_queue=2048, batch_size=128, interval=2.0):
+        self.send = send
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._pid = None
+        self.dropped = 0
+
+    def export(self, trace):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="trace-exporter", daemon=True).start()
+
+    def flush(self):
+        """Exporter immédiatement les traces en attente (tests, arrêt)."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._send(batch)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self._send(batch)
+
+    def _send(self, batch):
+        try:
+            self.send(batch)
+        except Exception as e:
+            logger.warning("Export de %d traces impossible : %s", len(batch), e)
+
+
+def jsonl_writer(path):
+    """Écrit chaque trace sur une ligne JSON du fichier `path` (ajout, partagé entre workers)."""
+    def send(batch):
+        lines = ''.join(json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + '\n' for trace in batch)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+    return send
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_payload(batch, service_name):
+    """Traces au format OTLP/JSON (ExportTraceServiceRequest)."""
+    spans = []
+    for trace in batch:
+        for span in trace.spans:
+            item = {
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                # 2 : SERVER pour la requête, 1 : INTERNAL pour ses étapes
+                "kind": 2 if span is trace.root else 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            spans.append(item)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+    }]}
+
+
+def otlp_sender(endpoint, service_name='chatbot', timeout=5.0):
+    """Envoie les traces à un collecteur OTLP/HTTP (ex. http://localhost:4318/v1/traces)."""
+    def send(batch):
+        body = json.dumps(otlp_payload(batch, service_name)).encode('utf-8')
+        req = urllib.request.Request(endpoint, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+    return send
+
+
+def exporter_from_config(kind, path=None, endpoint=None, service_name='chatbot'):
+    """Exporteur selon TRACE_EXPORTER : '' (aucun), 'file' ou 'otlp'."""
+    if kind == 'file':
+        return BatchExporter(jsonl_writer(path))
+    if kind == 'otlp':
+        return BatchExporter(otlp_sender(endpoint, service_name))
+    if kind:
+        logger.warning("TRACE_EXPORTER inconnu (%s) : traces non exportées", kind)
+    return None
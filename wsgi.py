@@ -2,7 +2,9 @@
 Point d'entrée WSGI pour le déploiement en production.
 Usage: gunicorn -c gunicorn_config.py wsgi:app
 """
-from app import app
+from app import app, init_indexes
+
+init_indexes()
 
 if __name__ == "__main__":
     app.run()